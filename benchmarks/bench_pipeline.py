@@ -0,0 +1,238 @@
+"""Benchmarks every stage of the predictor pipeline on synthetic data.
+
+Synthetic AdH point sets, barrier networks and mask grids of increasing size
+are generated with `benchmarks.synthetic` and pushed through the non-arcpy code
+paths of the pipeline: ingestion, filtering, barrier preprocessing,
+interpolation, masking, each derived predictor, writing, a derived predictor
+read, calculated and written in pipelined tiles, and copying. For each stage
+the wall time, the throughput (nodes/s, segments/s or cells/s) and the peak
+memory allocated are reported and compared against the stored baselines; a
+stage that is slower than its baseline by more than the tolerance fails the
+run.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --sizes 10k 100k 1M 10M
+    python -m benchmarks.bench_pipeline --update-baselines
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+import numpy as np
+# Imported up front so that import time is not counted as stage time
+import scipy.interpolate  # noqa: F401
+import scipy.ndimage  # noqa: F401
+
+from benchmarks import synthetic
+from nybem_tools import (barriers as barrier_tools, filters, interpolate,
+                         kernels, pipeline, points, raster_io, utils)
+
+
+# name: (AdH nodes, mask rows and columns, barrier polylines)
+SIZES = OrderedDict([("10k", (10000, 256, 20)),
+                     ("100k", (100000, 512, 50)),
+                     ("1M", (1000000, 2048, 200)),
+                     ("10M", (10000000, 8192, 1000))])
+DEFAULT_SIZES = ["10k", "100k"]
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "baselines.json")
+
+
+def measure(func):
+    """Times a function and records the peak memory it allocates.
+
+    :param: func:  callable; The function to run, without arguments.
+
+    :return:  tuple; The function's result, the elapsed seconds and the peak
+              traced memory in bytes.
+    """
+    tracemalloc.start()
+    start = timer()
+    result = func()
+    seconds = timer() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def stages(size, workspace):
+    """Builds the benchmark stages for one problem size.
+
+    Inputs are generated up front so that only the stage itself is timed.
+
+    :param: size:       string; A key of `SIZES`.
+    :param: workspace:  string; Scratch folder for files written by stages.
+
+    :return:  list; `(stage, unit, count, func)` tuples, where count is the
+              number of nodes or cells the stage processes.
+    """
+    n_nodes, n_cells, n_barriers = SIZES[size]
+    grid, mask = synthetic.mask_grid(n_cells)
+    cells = grid.nrows * grid.ncols
+    columns = synthetic.adh_points(n_nodes, grid)
+    barriers = synthetic.barrier_network(n_barriers, grid)
+    n_segments = sum(len(line) - 1 for line in barriers)
+    rasters = synthetic.predictor_rasters(grid)
+    utils.add_message(f"# {size}: {n_nodes} nodes, {cells} cells, "
+                      f"{n_segments} barrier segments")
+
+    points_path = os.path.join(workspace, "wse.npz")
+    points.write_points(columns, points_path)
+    wse_fields = synthetic.WSE_FIELDS
+    copy_from = os.path.join(workspace, "from")
+    copy_to = os.path.join(workspace, "to")
+    os.makedirs(copy_from)
+    os.makedirs(copy_to)
+    raster_io.write_array(rasters["MHHW"], grid,
+                          os.path.join(copy_from, "mhhw.npy"))
+    tiled_inputs = {}
+    for name, key in [("wse_mtl", "Mean_WSE"), ("bed_elevation", "Elevation")]:
+        tiled_inputs[name] = os.path.join(workspace, name + ".npy")
+        raster_io.write_array(rasters[key], grid, tiled_inputs[name])
+    depth = kernels.depth(rasters["Mean_WSE"], rasters["Elevation"])
+
+    wse_columns = points.read_points(points_path, wse_fields)
+
+    def filtering():
+        filters.clear_cache()
+        return [filters.filter_mask(points_path,
+                                    f"{field} > -3 AND {field} < 3",
+                                    wse_columns)
+                for field in wse_fields]
+
+    def barrier_regions():
+        segs = barrier_tools.preprocess(barriers, grid.cell_size / 2,
+                                        grid.cell_size / 10)
+        return barrier_tools.label_regions(segs, grid, mask)
+
+    def interpolation():
+        return interpolate.points_to_grid(columns["x"], columns["y"],
+                                          columns["MHHW"], grid)
+
+    return [
+        ("ingestion", "nodes", n_nodes,
+         lambda: points.read_points(points_path, wse_fields)),
+        ("filtering", "nodes", n_nodes * len(wse_fields), filtering),
+        ("barriers", "segments", n_segments, barrier_regions),
+        ("interpolation", "cells", cells, interpolation),
+        ("masking", "cells", cells, lambda: rasters["MHHW"] * mask),
+        ("depth", "cells", cells,
+         lambda: kernels.depth(rasters["Mean_WSE"], rasters["Elevation"])),
+        ("pla", "cells", cells, lambda: kernels.per_light_available(depth)),
+        ("esd", "cells", cells,
+         lambda: kernels.epi_sed_dep(rasters["MHHW"], rasters["wse_50"],
+                                     rasters["wse_100"])),
+        ("exp_dur", "cells", cells,
+         lambda: kernels.expo_dur(rasters["wse_100"], rasters["wse_0"],
+                                  rasters["MHHW"], rasters["MLLW"])),
+        ("rel_velocity", "cells", cells,
+         lambda: kernels.rel_velocity(rasters["vel_90"],
+                                      rasters["vel_50"])),
+        ("writing", "cells", cells,
+         lambda: raster_io.write_array(
+             depth, grid, os.path.join(workspace, "depth.npy"))),
+        ("tiled_depth", "cells", cells,
+         lambda: pipeline.derive("depth", workspace, "depth_tiled",
+                                 tile_size=512, **tiled_inputs)),
+        ("copying", "cells", cells,
+         lambda: utils.copy_tif(copy_from, copy_to, "mhhw*")),
+    ]
+
+
+def run(sizes):
+    """Runs the benchmark stages for each problem size.
+
+    :param: sizes:  list; Keys of `SIZES`.
+
+    :return:  list; One result dict per size and stage.
+    """
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as workspace:
+            for stage, unit, count, func in stages(size, workspace):
+                _, seconds, peak = measure(func)
+                results.append({"size": size, "stage": stage,
+                                "seconds": seconds,
+                                "throughput": count / max(seconds, 1e-9),
+                                "unit": f"{unit}/s",
+                                "peak_mb": peak / 2 ** 20})
+    return results
+
+
+def regressions(results, baselines, tolerance=0.5, min_seconds=0.05):
+    """Finds stages that are slower than their baseline.
+
+    :param: results:      list; Results from `run`.
+    :param: baselines:    dict; Baseline seconds by size and stage.
+    :param: tolerance:    float; Allowed slowdown as a fraction of the
+                          baseline.
+    :param: min_seconds:  float; Slowdowns smaller than this are ignored as
+                          timer noise.
+
+    :return:  list; Messages describing each regression.
+    """
+    messages = []
+    for result in results:
+        baseline = baselines.get(result["size"], {}).get(result["stage"])
+        if baseline is None:
+            continue
+        if (result["seconds"] > baseline * (1 + tolerance) and
+                result["seconds"] - baseline > min_seconds):
+            messages.append(f"{result['size']} {result['stage']}: "
+                            f"{result['seconds']:.3f} s, baseline "
+                            f"{baseline:.3f} s")
+    return messages
+
+
+def report(results):
+    """Prints the results as a table."""
+    print(f"{'size':>5} {'stage':<14} {'seconds':>9} {'throughput':>16} "
+          f"{'peak MB':>9}")
+    for result in results:
+        print(f"{result['size']:>5} {result['stage']:<14} "
+              f"{result['seconds']:>9.4f} "
+              f"{result['throughput']:>10.3g} {result['unit']:<7} "
+              f"{result['peak_mb']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES),
+                        default=DEFAULT_SIZES)
+    parser.add_argument("--baselines", default=BASELINES)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args(argv)
+
+    np.seterr(all="ignore")
+    results = run(args.sizes)
+    report(results)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    if args.update_baselines:
+        for result in results:
+            baselines.setdefault(result["size"], {})[result["stage"]] = \
+                round(result["seconds"], 4)
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        return 0
+
+    failures = regressions(results, baselines, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""This module generates synthetic AdH point sets, barrier networks and mask
+grids for benchmarking.
+
+The synthetic domain is a square estuary with a smooth tide, velocity and
+salinity field, so that every stage of the predictor pipeline sees plausible
+values (e.g. the water surface percentiles are ordered and stay within the
+±3 m `sql_select` filters used by `update_AdH_predictors`).
+"""
+import numpy as np
+
+from nybem_tools import raster_io
+
+
+WSE_FIELDS = ["MLLW", "MHHW", "Mean_WSE", "wse_0", "wse_50", "wse_100"]
+VELOCITY_FIELDS = ["vel_10", "vel_50", "vel_90"]
+SALINITY_FIELDS = ["sal_0", "sal_10", "Mean_Depth"]
+
+
+def mask_grid(size, cell_size=10.0):
+    """Creates a square mask grid with an elliptical wet area.
+
+    :param: size:       int; Number of rows and columns.
+    :param: cell_size:  float; Cell size in map units.
+
+    :return:  tuple; The Grid and a 2D mask array of 1 (wet) and NaN.
+    """
+    grid = raster_io.Grid(0.0, 0.0, cell_size, size, size, None)
+    rows, cols = np.mgrid[0:size, 0:size]
+    inside = (((rows - size / 2) / (0.48 * size)) ** 2 +
+              ((cols - size / 2) / (0.45 * size)) ** 2) <= 1
+    return grid, np.where(inside, 1.0, np.nan)
+
+
+def _fields(xs, ys, extent):
+    """Evaluates the synthetic hydrodynamic fields at coordinates."""
+    u = xs / extent
+    v = ys / extent
+    tide = 0.9 + 0.3 * np.sin(np.pi * u) * np.cos(np.pi * v)
+    mean_wse = 0.1 * np.sin(2 * np.pi * u)
+    speed = 0.2 + 0.8 * np.exp(-((u - 0.5) ** 2 + (v - 0.3) ** 2) / 0.05)
+    salinity = 35 * u * (0.8 + 0.2 * v)
+    return {"Elevation": -12 * np.sin(np.pi * u) * np.sin(np.pi * v) + 1,
+            "MLLW": mean_wse - tide,
+            "MHHW": mean_wse + tide,
+            "Mean_WSE": mean_wse,
+            "wse_0": mean_wse - 1.3 * tide,
+            "wse_50": mean_wse + 0.05 * tide,
+            "wse_100": mean_wse + 1.6 * tide,
+            "vel_10": 0.3 * speed,
+            "vel_50": speed,
+            "vel_90": 1.7 * speed,
+            "sal_0": 0.7 * salinity,
+            "sal_10": 0.8 * salinity,
+            "Mean_Depth": salinity}
+
+
+def adh_points(n_nodes, grid, seed=0):
+    """Creates a synthetic AdH mesh node point set covering a grid.
+
+    :param: n_nodes:  int; Number of mesh nodes.
+    :param: grid:     Grid; The grid the nodes are scattered over.
+    :param: seed:     int; Random seed.
+
+    :return:  dict; Column name to 1D array, including "x" and "y".
+    """
+    rng = np.random.RandomState(seed)
+    extent = grid.ncols * grid.cell_size
+    xs = grid.x_min + rng.uniform(0, extent, n_nodes)
+    ys = grid.y_min + rng.uniform(0, grid.nrows * grid.cell_size, n_nodes)
+    columns = {"x": xs, "y": ys}
+    for name, values in _fields(xs - grid.x_min, ys - grid.y_min,
+                                extent).items():
+        columns[name] = values + rng.normal(0, 0.001, n_nodes)
+    return columns
+
+
+def predictor_rasters(grid):
+    """Evaluates the synthetic fields at the cell centers of a grid.
+
+    These stand in for interpolated rasters when benchmarking the derived
+    predictor stages, so those do not depend on an interpolation.
+
+    :param: grid:  Grid; The grid.
+
+    :return:  dict; Field name to 2D array.
+    """
+    col_xs, row_ys = raster_io.cell_centers(grid)
+    xs, ys = np.meshgrid(col_xs - grid.x_min, row_ys - grid.y_min)
+    return _fields(xs, ys, grid.ncols * grid.cell_size)
+
+
+def barrier_network(n_barriers, grid, seed=0):
+    """Creates random barrier polylines across a grid.
+
+    :param: n_barriers:  int; Number of barrier polylines.
+    :param: grid:        Grid; The grid the barriers are placed on.
+    :param: seed:        int; Random seed.
+
+    :return:  list; Polylines as (n_vertices, 2) arrays of coordinates.
+    """
+    rng = np.random.RandomState(seed)
+    extent = np.array([grid.ncols, grid.nrows]) * grid.cell_size
+    origin = np.array([grid.x_min, grid.y_min])
+    lines = []
+    for _ in range(n_barriers):
+        n_vertices = rng.randint(2, 12)
+        start = rng.uniform(0, 1, 2) * extent
+        steps = rng.normal(0, 0.02, (n_vertices - 1, 2)) * extent
+        vertices = np.vstack([start, start + np.cumsum(steps, axis=0)])
+        lines.append(origin + np.clip(vertices, 0, extent))
+    return lines
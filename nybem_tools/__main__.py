@@ -0,0 +1,8 @@
+"""Runs the NYBEM command line interface, see `nybem_tools.cli`.
+"""
+import sys
+
+from .cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,287 @@
+"""This module contains functions for aligning rasters to a target grid.
+
+Derived predictors combine rasters cell by cell, e.g. the alternative `mtl`
+with the `bed_elevation` copied from the FWOP, or the alternative velocity
+with the FWOP velocity. When the grids of the inputs differ, map algebra
+resamples them implicitly; here the mismatch is detected and the inputs are
+resampled onto the target grid explicitly, window by window.
+
+Grids in the same coordinate system are axis aligned, so the source row of a
+target cell depends only on its row and the source column only on its
+column. Resampling is then a gather with two 1D index maps (and weights, for
+bilinear resampling), which are cached per source grid, target grid and
+method: aligning another raster on the same pair of grids, e.g. the same
+predictor of the next scenario, only gathers. Rasters in another coordinate
+system are first projected with arcpy to a raster of the target coordinate
+system and cell size, then gathered the same way.
+"""
+import functools
+import hashlib
+import json
+import os
+
+import numpy as np
+
+try:
+    from . import raster_io
+    from .journal import file_state
+    from .utils import partial_path
+except ImportError:
+    import raster_io
+    from journal import file_state
+    from utils import partial_path
+
+
+METHODS = ("nearest", "bilinear")
+# arcpy resampling types of the methods
+ARCPY_RESAMPLING = {"nearest": "NEAREST", "bilinear": "BILINEAR"}
+ALIGNED_FOLDER = ".aligned"
+
+
+def axis_map(positions, size, method="nearest"):
+    """Maps target cells to source cells along one axis.
+
+    :param: positions:  numpy.ndarray; The positions of the target cell
+                        centers in source cells, cell `i` spanning
+                        `[i, i + 1)`.
+    :param: size:       int; Number of source cells along the axis.
+    :param: method:     string; "nearest" or "bilinear".
+
+    :return:  tuple; For "nearest" the source index of each target cell; for
+              "bilinear" the lower and upper source index and the weight of
+              the upper one. Indexes are -1 outside the source.
+    """
+    outside = (positions < 0) | (positions >= size)
+    if method == "nearest":
+        index = np.floor(positions).astype(np.int64)
+        index[outside] = -1
+        return (index,)
+    centers = np.floor(positions - 0.5).astype(np.int64)
+    weight = positions - 0.5 - centers
+    # Half a cell from the edge, the edge cell is used on both sides
+    lower = np.clip(centers, 0, size - 1)
+    upper = np.clip(centers + 1, 0, size - 1)
+    lower[outside] = -1
+    upper[outside] = -1
+    return lower, upper, weight
+
+
+@functools.lru_cache(maxsize=32)
+def index_maps(source, target, method="nearest"):
+    """Maps the cells of a target grid to the cells of a source grid.
+
+    :param: source:  Grid; The grid of the raster being aligned.
+    :param: target:  Grid; The grid it is aligned to, in the same coordinate
+                     system.
+    :param: method:  string; "nearest" or "bilinear".
+
+    :return:  tuple; The row map and column map, see `axis_map`. The arrays
+              are shared with the cache and must not be modified.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown resampling method: {method}")
+    xs, ys = raster_io.cell_centers(target)
+    source_y_max = source.y_min + source.nrows * source.cell_size
+    row_map = axis_map((source_y_max - ys) / source.cell_size,
+                       source.nrows, method)
+    col_map = axis_map((xs - source.x_min) / source.cell_size,
+                       source.ncols, method)
+    for array in row_map + col_map:
+        array.flags.writeable = False
+    return row_map, col_map
+
+
+@functools.lru_cache(maxsize=256)
+def _grid(raster, state):
+    return raster_io.read_grid(raster)
+
+
+def read_grid(raster):
+    """Reads the grid of a raster, through a cache."""
+    return _grid(str(raster), tuple(file_state(str(raster)) or ()))
+
+
+def same_coordinate_system(grid_a, grid_b):
+    """Tests whether two grids are in the same coordinate system. Grids
+    without a spatial reference (e.g. `.npy` rasters written without one)
+    are taken to be in any."""
+    system_a = raster_io.coordinate_system(grid_a.spatial_reference)
+    system_b = raster_io.coordinate_system(grid_b.spatial_reference)
+    return not system_a or not system_b or system_a == system_b
+
+
+def needs_alignment(raster, target):
+    """Tests whether a raster is not on a target grid."""
+    return not raster_io.same_grid(read_grid(raster), target)
+
+
+def gather(block, row_map, col_map):
+    """Resamples a block of source cells with index maps.
+
+    :param: block:    numpy.ndarray; The source cells the maps index.
+    :param: row_map:  tuple; Row map of the target rows, see `axis_map`,
+                      relative to the block.
+    :param: col_map:  tuple; Column map of the target columns.
+
+    :return:  numpy.ndarray; The target cells, NaN outside the source.
+    """
+    rows, cols = row_map[0] >= 0, col_map[0] >= 0
+    result = np.full((len(rows), len(cols)), np.nan)
+    if not rows.any() or not cols.any():
+        return result
+    if len(row_map) == 1:
+        result[np.ix_(rows, cols)] = block[np.ix_(row_map[0][rows],
+                                                  col_map[0][cols])]
+        return result
+
+    lower, upper, row_weight = (part[rows] for part in row_map)
+    left, right, col_weight = (part[cols] for part in col_map)
+    col_weight = col_weight[None]
+    top = (block[np.ix_(lower, left)] * (1 - col_weight) +
+           block[np.ix_(lower, right)] * col_weight)
+    bottom = (block[np.ix_(upper, left)] * (1 - col_weight) +
+              block[np.ix_(upper, right)] * col_weight)
+    row_weight = row_weight[:, None]
+    result[np.ix_(rows, cols)] = top * (1 - row_weight) + bottom * row_weight
+    return result
+
+
+def read_aligned(raster, target, window=None, method="nearest"):
+    """Reads raster cell values resampled onto a target grid.
+
+    Only the source cells the window needs are read.
+
+    :param: raster:  string; Path to a raster in the coordinate system of the
+                     target grid.
+    :param: target:  Grid; The grid to read the values on.
+    :param: window:  tuple; Optional `(row_off, col_off, nrows, ncols)`
+                     window of the target grid. The whole grid if omitted.
+    :param: method:  string; "nearest" or "bilinear".
+
+    :return:  numpy.ndarray; A 2D float array with NoData cells, and cells
+              outside the raster, set to NaN.
+    """
+    source = read_grid(raster)
+    if window is None:
+        window = (0, 0, target.nrows, target.ncols)
+    if raster_io.same_grid(source, target):
+        return raster_io.read_array(raster, window)
+    if not same_coordinate_system(source, target):
+        raise ValueError(f"{raster} is not in the coordinate system of the "
+                         f"target grid; project it with `align`.")
+    row, col, nrows, ncols = window
+    row_map, col_map = index_maps(source, target, method)
+    row_map = tuple(part[row:row + nrows] for part in row_map)
+    col_map = tuple(part[col:col + ncols] for part in col_map)
+    rows = np.concatenate(row_map[:2])
+    cols = np.concatenate(col_map[:2])
+    rows, cols = rows[rows >= 0], cols[cols >= 0]
+    if not rows.size or not cols.size:
+        return np.full((nrows, ncols), np.nan)
+
+    # Read the source cells under the window only, and index them from there
+    top, left = int(rows.min()), int(cols.min())
+    block = raster_io.read_array(raster, (top, left, int(rows.max()) - top + 1,
+                                          int(cols.max()) - left + 1))
+
+    def shift(axis_map_, offset):
+        return tuple(np.where(part >= 0, part - offset, -1)
+                     for part in axis_map_[:2]) + tuple(axis_map_[2:])
+
+    return gather(block, shift(row_map, top), shift(col_map, left))
+
+
+def project(raster, target, output_path, method="nearest"):
+    """Projects a raster to the coordinate system and cell size of a target
+    grid with arcpy.
+
+    :return:  None. Accomplishes the side effect of writing the raster.
+    """
+    import arcpy
+
+    spatial_reference = arcpy.SpatialReference()
+    spatial_reference.loadFromString(target.spatial_reference)
+    with raster_io._arcpy_lock:
+        arcpy.env.overwriteOutput = True
+        arcpy.ProjectRaster_management(str(raster), output_path,
+                                       spatial_reference,
+                                       ARCPY_RESAMPLING[method],
+                                       target.cell_size)
+
+
+def align(raster, target, output_path, method="nearest", tile_size=1024):
+    """Writes a raster resampled onto a target grid.
+
+    The raster keeps its storage profile.
+
+    :param: raster:       string; Path to the raster.
+    :param: target:       Grid; The grid to align to.
+    :param: output_path:  string; Path of the aligned raster, see
+                          `raster_io.write_array`.
+    :param: method:       string; "nearest" or "bilinear".
+    :param: tile_size:    int; Edge length of the windows in cells.
+
+    :return:  None. Accomplishes the side effect of writing the raster.
+    """
+    projected = None
+    if not same_coordinate_system(read_grid(raster), target):
+        # Projected next to the output, so it is on the same drive
+        projected = partial_path(os.path.splitext(output_path)[0] +
+                                 "_projected.tif")
+        project(raster, target, projected, method)
+        raster = projected
+    profile = raster_io.read_profile(raster) or "float32"
+    output = raster_io.open_output(output_path, target, profile)
+    for window in raster_io.windows(target, tile_size):
+        raster_io.write_window(
+            output, read_aligned(raster, target, window, method), window)
+    raster_io.close_output(output)
+    if projected is not None:
+        import arcpy
+
+        with raster_io._arcpy_lock:
+            arcpy.Delete_management(projected)
+
+
+def aligned(raster, target, folder, method="nearest"):
+    """Returns a raster on a target grid, aligning it if needed.
+
+    Aligned rasters are kept in a `.aligned` subfolder, named by the state
+    of the source raster, the target grid and the method, and reused while
+    the source is unchanged.
+
+    :param: raster:  string; Path to the raster.
+    :param: target:  Grid; The grid to align to.
+    :param: folder:  string; Folder holding the `.aligned` subfolder.
+    :param: method:  string; "nearest" or "bilinear".
+
+    :return:  string; The path of the raster, or of its aligned copy.
+    """
+    if not needs_alignment(raster, target):
+        return raster
+    key = hashlib.sha1(json.dumps(
+        [file_state(str(raster)), list(target), method]).encode())
+    stem, ext = os.path.splitext(os.path.basename(str(raster)))
+    path = os.path.join(folder, ALIGNED_FOLDER,
+                        f"{stem}_{key.hexdigest()[:12]}{ext}")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        align(raster, target, path, method)
+    return path
+
+
+def aligned_inputs(folder, *rasters, method="nearest"):
+    """Aligns rasters to the grid of the first.
+
+    The first raster of the derived predictors (see `utils`) is always a
+    raster interpolated for the alternative, so it is on the mask grid.
+
+    :param: folder:   string; Folder holding the `.aligned` subfolder.
+    :param: rasters:  string; Paths to the rasters.
+    :param: method:   string; "nearest" or "bilinear".
+
+    :return:  list; The paths of the rasters on the grid of the first.
+    """
+    target = read_grid(rasters[0])
+    return [rasters[0]] + [aligned(raster, target, folder, method)
+                           for raster in rasters[1:]]
@@ -0,0 +1,551 @@
+"""This module contains functions for preprocessing interpolation barriers.
+
+The barrier lines are read once, simplified to a tolerance below the mask cell
+size, snapped so that nearly touching vertices coincide, and split into
+segments. A grid of segment buckets answers "does this line cross a barrier"
+queries without testing every segment, and the mask grid is split into
+regions of cells that can be reached from each other without crossing a
+barrier. Locations in different regions are always separated, but an
+open-ended barrier (a jetty or a breakwater) does not split its region, so
+the numpy interpolation also leaves out the nodes it hides: those whose line
+of sight to the cell passes through a barrier cell (see `blocked`).
+
+The preprocessed barriers are cached on disk, keyed by a hash of the barrier
+vertices, the mask and the tolerances, and reused by every variable and
+scenario that shares them. The regions serve the numpy interpolation (see
+`interpolate`); `SplineWithBarriers` takes the barrier lines themselves, and
+is only given the simplified lines when the `NYBEM_SIMPLIFY_BARRIERS`
+environment variable is set (see `prepared_feature_class`), since they
+change its output.
+
+Barriers are feature classes read through arcpy, or `.npz` archives holding
+the vertices of all lines and the offsets of each line's first vertex (see
+`write_barriers`), which is what the headless code paths use.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+try:
+    from . import raster_io
+    from .utils import commit_output, partial_path
+except ImportError:
+    import raster_io
+    from utils import commit_output, partial_path
+
+
+SIMPLIFY_ENV = "NYBEM_SIMPLIFY_BARRIERS"
+# Prefix of the cache entries, see `prepare`
+CACHE_PREFIX = "barriers_"
+
+
+def is_numpy_barriers(barriers):
+    """Tests whether barriers use the numpy (`.npz`) backend."""
+    return str(barriers).lower().endswith(".npz")
+
+
+def read_barriers(barriers):
+    """Reads barrier polylines.
+
+    :param: barriers:  string; Path to a line feature class or a `.npz`
+                       archive.
+
+    :return:  list; Polylines as (n_vertices, 2) arrays of coordinates. Each
+              part of a multipart feature is a separate polyline.
+    """
+    if is_numpy_barriers(barriers):
+        with np.load(str(barriers)) as archive:
+            vertices, offsets = archive["vertices"], archive["offsets"]
+        return [vertices[start:end]
+                for start, end in zip(offsets[:-1], offsets[1:])]
+
+    import arcpy
+
+    lines = []
+    with arcpy.da.SearchCursor(str(barriers), ["SHAPE@"]) as cursor:
+        for shape, in cursor:
+            for part in shape:
+                lines.append(np.array([(point.X, point.Y) for point in part
+                                       if point is not None]))
+    return lines
+
+
+def write_barriers(lines, output_path):
+    """Writes barrier polylines to a `.npz` archive.
+
+    :param: lines:        list; Polylines as (n_vertices, 2) arrays.
+    :param: output_path:  string; Path of the output archive.
+
+    :return:  None. Accomplishes the side effect of saving the archive.
+    """
+    offsets = np.cumsum([0] + [len(line) for line in lines])
+    vertices = (np.vstack(lines) if lines else np.empty((0, 2)))
+    np.savez(str(output_path), vertices=vertices, offsets=offsets)
+
+
+def simplify(line, tolerance):
+    """Simplifies a polyline with the Douglas-Peucker algorithm.
+
+    :param: line:       numpy.ndarray; (n_vertices, 2) coordinates.
+    :param: tolerance:  float; Largest distance a removed vertex may lie from
+                        the simplified line.
+
+    :return:  numpy.ndarray; The kept vertices, including both ends.
+    """
+    if len(line) < 3:
+        return line
+    keep = np.zeros(len(line), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(line) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = line[first], line[last]
+        direction = end - start
+        length = np.hypot(*direction)
+        inner = line[first + 1:last] - start
+        if length == 0:
+            distance = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distance = np.abs(direction[0] * inner[:, 1] -
+                              direction[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.extend([(first, split), (split, last)])
+    return line[keep]
+
+
+def snap(lines, tolerance):
+    """Snaps vertices to a lattice so that nearly touching lines meet.
+
+    :param: lines:      list; Polylines as (n_vertices, 2) arrays.
+    :param: tolerance:  float; Spacing of the lattice.
+
+    :return:  list; The snapped polylines, without repeated vertices.
+    """
+    snapped = []
+    for line in lines:
+        line = np.round(line / tolerance) * tolerance
+        repeated = np.r_[False, (np.diff(line, axis=0) == 0).all(axis=1)]
+        line = line[~repeated]
+        if len(line) > 1:
+            snapped.append(line)
+    return snapped
+
+
+def segments(lines):
+    """Splits polylines into segments.
+
+    :param: lines:  list; Polylines as (n_vertices, 2) arrays.
+
+    :return:  numpy.ndarray; (n_segments, 4) array of x0, y0, x1, y1.
+    """
+    parts = [np.hstack([line[:-1], line[1:]]) for line in lines
+             if len(line) > 1]
+    if not parts:
+        return np.empty((0, 4))
+    return np.vstack(parts)
+
+
+def preprocess(lines, simplify_tolerance, snap_tolerance):
+    """Simplifies, snaps and segments barrier polylines.
+
+    :return:  numpy.ndarray; (n_segments, 4) array of x0, y0, x1, y1.
+    """
+    lines = [simplify(np.asarray(line, dtype=float), simplify_tolerance)
+             for line in lines if len(line) > 1]
+    return segments(snap(lines, snap_tolerance))
+
+
+def build_index(segs, bucket_size):
+    """Builds a grid of segment buckets.
+
+    Every segment is listed in each bucket its bounding box overlaps.
+
+    :param: segs:         numpy.ndarray; (n_segments, 4) segments.
+    :param: bucket_size:  float; Edge length of a bucket in map units.
+
+    :return:  dict; The index: the bucket origin and size, the number of
+              bucket columns and rows, and the segment ids of every bucket as
+              `starts` offsets into `ids`, bucket by bucket in row-major
+              order.
+    """
+    x_min = min(segs[:, 0].min(), segs[:, 2].min()) if len(segs) else 0.0
+    y_min = min(segs[:, 1].min(), segs[:, 3].min()) if len(segs) else 0.0
+    x_max = max(segs[:, 0].max(), segs[:, 2].max()) if len(segs) else 0.0
+    y_max = max(segs[:, 1].max(), segs[:, 3].max()) if len(segs) else 0.0
+    nx = int((x_max - x_min) // bucket_size) + 1
+    ny = int((y_max - y_min) // bucket_size) + 1
+
+    col0 = ((np.minimum(segs[:, 0], segs[:, 2]) - x_min) //
+            bucket_size).astype(int)
+    col1 = ((np.maximum(segs[:, 0], segs[:, 2]) - x_min) //
+            bucket_size).astype(int)
+    row0 = ((np.minimum(segs[:, 1], segs[:, 3]) - y_min) //
+            bucket_size).astype(int)
+    row1 = ((np.maximum(segs[:, 1], segs[:, 3]) - y_min) //
+            bucket_size).astype(int)
+
+    buckets, ids = [], []
+    for seg_id in range(len(segs)):
+        rows, cols = np.mgrid[row0[seg_id]:row1[seg_id] + 1,
+                              col0[seg_id]:col1[seg_id] + 1]
+        buckets.append((rows * nx + cols).ravel())
+        ids.append(np.full(rows.size, seg_id))
+    buckets = np.concatenate(buckets) if buckets else np.empty(0, int)
+    ids = np.concatenate(ids) if ids else np.empty(0, int)
+    order = np.argsort(buckets, kind="stable")
+    starts = np.searchsorted(buckets[order], np.arange(nx * ny + 1))
+    return {"x_min": x_min, "y_min": y_min, "bucket_size": bucket_size,
+            "nx": nx, "ny": ny, "starts": starts, "ids": ids[order]}
+
+
+def _candidates(index, x0, y0, x1, y1):
+    """Returns the ids of the segments in the buckets a box overlaps."""
+    size = index["bucket_size"]
+    col0 = max(int((min(x0, x1) - index["x_min"]) // size), 0)
+    col1 = min(int((max(x0, x1) - index["x_min"]) // size), index["nx"] - 1)
+    row0 = max(int((min(y0, y1) - index["y_min"]) // size), 0)
+    row1 = min(int((max(y0, y1) - index["y_min"]) // size), index["ny"] - 1)
+    if col0 > col1 or row0 > row1:
+        return np.empty(0, int)
+    found = [index["ids"][index["starts"][row * index["nx"] + col0]:
+                          index["starts"][row * index["nx"] + col1 + 1]]
+             for row in range(row0, row1 + 1)]
+    return np.unique(np.concatenate(found))
+
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    return np.sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+
+
+def crosses(index, segs, start, end):
+    """Tests whether a line crosses any barrier segment.
+
+    :param: index:  dict; Segment index from `build_index`.
+    :param: segs:   numpy.ndarray; The indexed segments.
+    :param: start:  tuple; (x, y) of the start of the line.
+    :param: end:    tuple; (x, y) of the end of the line.
+
+    :return:  bool; True if the line intersects a segment.
+    """
+    (x0, y0), (x1, y1) = start, end
+    ids = _candidates(index, x0, y0, x1, y1)
+    if not len(ids):
+        return False
+    s = segs[ids]
+    d1 = _orientation(s[:, 0], s[:, 1], s[:, 2], s[:, 3], x0, y0)
+    d2 = _orientation(s[:, 0], s[:, 1], s[:, 2], s[:, 3], x1, y1)
+    d3 = _orientation(x0, y0, x1, y1, s[:, 0], s[:, 1])
+    d4 = _orientation(x0, y0, x1, y1, s[:, 2], s[:, 3])
+    return bool(np.any((d1 * d2 <= 0) & (d3 * d4 <= 0)))
+
+
+def rasterize(segs, grid):
+    """Marks the cells of a grid that barrier segments pass through.
+
+    Segments are sampled at half the cell size, so the marked cells of a
+    segment are connected through their edges or corners and cannot be
+    passed between by moving from edge neighbour to edge neighbour.
+
+    :param: segs:  numpy.ndarray; (n_segments, 4) segments.
+    :param: grid:  Grid; The grid.
+
+    :return:  numpy.ndarray; A 2D boolean array, True on barrier cells.
+    """
+    cells = np.zeros((grid.nrows, grid.ncols), dtype=bool)
+    if not len(segs):
+        return cells
+    length = np.hypot(segs[:, 2] - segs[:, 0], segs[:, 3] - segs[:, 1])
+    samples = np.ceil(length / (grid.cell_size / 2)).astype(int) + 1
+    seg_ids = np.repeat(np.arange(len(segs)), samples)
+    first = np.repeat(np.cumsum(samples) - samples, samples)
+    t = (np.arange(seg_ids.size) - first) / np.maximum(samples[seg_ids] - 1,
+                                                       1)
+    xs = segs[seg_ids, 0] + t * (segs[seg_ids, 2] - segs[seg_ids, 0])
+    ys = segs[seg_ids, 1] + t * (segs[seg_ids, 3] - segs[seg_ids, 1])
+    rows, cols = raster_io.cell_index(grid, xs, ys)
+    inside = (rows >= 0) & (rows < grid.nrows) & (cols >= 0) & \
+        (cols < grid.ncols)
+    cells[rows[inside], cols[inside]] = True
+    return cells
+
+
+def label_regions(segs, grid, mask=None):
+    """Splits a grid into regions separated by barriers.
+
+    :param: segs:  numpy.ndarray; (n_segments, 4) segments.
+    :param: grid:  Grid; The grid.
+    :param: mask:  numpy.ndarray; Optional 2D array, NaN outside the area to
+                   label.
+
+    :return:  numpy.ndarray; A 2D int32 array of region labels starting at
+              1. Barrier cells and cells outside the mask are 0.
+    """
+    from scipy import ndimage
+
+    open_cells = ~rasterize(segs, grid)
+    if mask is not None:
+        open_cells &= ~np.isnan(mask)
+    labels, _ = ndimage.label(open_cells)
+    return labels.astype(np.int32)
+
+
+def summed_area(cells):
+    """Returns the summed area table of barrier cells: entry `(r, c)` counts
+    the barrier cells above row r and left of column c."""
+    table = np.zeros((cells.shape[0] + 1, cells.shape[1] + 1),
+                     dtype=np.int32)
+    np.cumsum(np.cumsum(cells, axis=0, dtype=np.int32), axis=1,
+              out=table[1:, 1:])
+    return table
+
+
+def blocked(prepared, starts, ends, samples=2 ** 22):
+    """Tests whether the lines between pairs of locations pass through a
+    barrier cell.
+
+    Lines are sampled at half the cell size on the barrier cells of
+    `rasterize`, like the barriers are when the regions are labelled, so a
+    line across a barrier is blocked whether or not the barrier encloses a
+    region. Only lines whose bounding box holds a barrier cell are sampled.
+
+    :param: prepared:  dict; Barriers from `prepare`.
+    :param: starts:    numpy.ndarray; (n, 2) coordinates of the line starts.
+    :param: ends:      numpy.ndarray; (n, 2) coordinates of the line ends.
+    :param: samples:   int; Largest number of samples taken at once.
+
+    :return:  numpy.ndarray; A boolean array, True where a line passes
+              through a barrier cell.
+    """
+    grid, cells, table = prepared["grid"], prepared["cells"], \
+        prepared["table"]
+    starts, ends = np.asarray(starts), np.asarray(ends)
+    result = np.zeros(len(starts), dtype=bool)
+    if not len(starts):
+        return result
+    row0, col0 = raster_io.cell_index(grid, starts[:, 0], starts[:, 1])
+    row1, col1 = raster_io.cell_index(grid, ends[:, 0], ends[:, 1])
+    top = np.clip(np.minimum(row0, row1), 0, grid.nrows)
+    bottom = np.clip(np.maximum(row0, row1) + 1, 0, grid.nrows)
+    left = np.clip(np.minimum(col0, col1), 0, grid.ncols)
+    right = np.clip(np.maximum(col0, col1) + 1, 0, grid.ncols)
+    count = table[bottom, right] - table[top, right] - \
+        table[bottom, left] + table[top, left]
+    candidates = np.flatnonzero(count > 0)
+    if not candidates.size:
+        return result
+
+    delta = ends[candidates] - starts[candidates]
+    steps = np.ceil(np.hypot(delta[:, 0], delta[:, 1]) /
+                    (grid.cell_size / 2)).astype(int) + 1
+    size = max(1, samples // int(steps.max()))
+    for start in range(0, candidates.size, size):
+        batch = slice(start, start + size)
+        n = steps[batch]
+        t = np.minimum(np.arange(n.max())[None] /
+                       np.maximum(n - 1, 1)[:, None], 1.0)
+        origin = starts[candidates[batch]]
+        xs = origin[:, :1] + t * delta[batch, :1]
+        ys = origin[:, 1:] + t * delta[batch, 1:]
+        rows, cols = raster_io.cell_index(grid, xs, ys)
+        inside = (rows >= 0) & (rows < grid.nrows) & (cols >= 0) & \
+            (cols < grid.ncols)
+        hit = np.zeros(rows.shape, dtype=bool)
+        hit[inside] = cells[rows[inside], cols[inside]]
+        result[candidates[batch]] = hit.any(axis=1)
+    return result
+
+
+def point_regions(regions, grid, xs, ys):
+    """Returns the region label at coordinates.
+
+    :param: regions:  numpy.ndarray; Labels from `label_regions`.
+    :param: grid:     Grid; The grid of the labels.
+    :param: xs:       array; x coordinates.
+    :param: ys:       array; y coordinates.
+
+    :return:  numpy.ndarray; The labels, 0 outside the grid.
+    """
+    rows, cols = raster_io.cell_index(grid, xs, ys)
+    inside = (rows >= 0) & (rows < grid.nrows) & (cols >= 0) & \
+        (cols < grid.ncols)
+    labels = np.zeros(rows.shape, dtype=np.int32)
+    labels[inside] = regions[rows[inside], cols[inside]]
+    return labels
+
+
+def cache_key(lines, grid, mask, simplify_tolerance, snap_tolerance):
+    """Hashes the barrier vertices, the mask and the tolerances."""
+    digest = hashlib.sha1()
+    for line in lines:
+        digest.update(np.ascontiguousarray(line, dtype=np.float64).tobytes())
+        digest.update(b"|")
+    digest.update(repr(tuple(grid)).encode("utf-8"))
+    digest.update(np.isnan(mask).tobytes())
+    digest.update(repr((simplify_tolerance, snap_tolerance)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def default_cache_folder(mask):
+    """Returns the default cache folder: `.barrier_cache` next to the mask."""
+    return os.path.join(os.path.dirname(os.path.abspath(str(mask))),
+                        ".barrier_cache")
+
+
+def prepare(barriers, mask, cache_folder=None, simplify_tolerance=None,
+            snap_tolerance=None):
+    """Preprocesses barriers on a mask grid, reusing a cached result.
+
+    :param: barriers:            string; Path to a line feature class or a
+                                 `.npz` archive.
+    :param: mask:                string; Path to the mask raster.
+    :param: cache_folder:        string; Folder of the cache. Defaults to a
+                                 `.barrier_cache` folder next to the mask.
+    :param: simplify_tolerance:  float; Defaults to half the mask cell size.
+    :param: snap_tolerance:      float; Defaults to a tenth of the mask cell
+                                 size.
+
+    :return:  dict; The "key" and "path" of the cache entry, the
+              preprocessed "segments", the segment "index", the region labels
+              ("regions"), the barrier "cells" and their `summed_area`
+              ("table") and the "grid" they are on. Barriers written by
+              `prepared_feature_class` and cache entries are already
+              preprocessed; the entry is returned as it is, on the grid it
+              was prepared on.
+    """
+    grid = raster_io.read_grid(mask)
+    stem = os.path.splitext(str(barriers))[0]
+    if os.path.basename(stem).startswith(CACHE_PREFIX) and \
+            os.path.exists(stem + ".npz"):
+        with np.load(stem + ".npz") as archive:
+            segs, regions = archive["segments"], archive["regions"]
+            # Entries name the grid they were prepared on, which may be
+            # larger than the mask (see `decompose`)
+            if "grid" in archive.files:
+                x_min, y_min, cell_size, nrows, ncols = \
+                    archive["grid"].tolist()
+                grid = raster_io.Grid(x_min, y_min, cell_size, int(nrows),
+                                      int(ncols), grid.spatial_reference)
+        if regions.shape == (grid.nrows, grid.ncols):
+            return _prepared(os.path.basename(stem)[len(CACHE_PREFIX):],
+                             segs, regions, grid, stem + ".npz")
+    mask_array = raster_io.read_array(mask)
+    if simplify_tolerance is None:
+        simplify_tolerance = grid.cell_size / 2
+    if snap_tolerance is None:
+        snap_tolerance = grid.cell_size / 10
+    cache_folder = cache_folder or default_cache_folder(mask)
+
+    lines = read_barriers(barriers)
+    key = cache_key(lines, grid, mask_array, simplify_tolerance,
+                    snap_tolerance)
+    cache_path = os.path.join(cache_folder, f"{CACHE_PREFIX}{key}.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as archive:
+            segs, regions = archive["segments"], archive["regions"]
+    else:
+        segs = preprocess(lines, simplify_tolerance, snap_tolerance)
+        regions = label_regions(segs, grid, mask_array)
+        partial = partial_path(cache_path)
+        np.savez(partial, segments=segs, regions=regions,
+                 grid=np.array(grid[:5], dtype=np.float64))
+        commit_output(partial, cache_path)
+    return _prepared(key, segs, regions, grid, cache_path)
+
+
+def _prepared(key, segs, regions, grid, path):
+    """Returns the result of `prepare` for preprocessed barriers."""
+    cells = rasterize(segs, grid)
+    return {"key": key, "path": path, "segments": segs,
+            "index": build_index(segs, grid.cell_size * 16),
+            "regions": regions, "cells": cells, "table": summed_area(cells),
+            "grid": grid}
+
+
+def grid_regions(prepared, grid):
+    """Returns the region labels of the cells of a grid.
+
+    :param: prepared:  dict; Barriers from `prepare`.
+    :param: grid:      Grid; The grid, either the one the barriers were
+                       prepared on or a window of it.
+
+    :return:  numpy.ndarray; A 2D array of region labels on the grid.
+    """
+    if tuple(grid[:5]) == tuple(prepared["grid"][:5]):
+        return prepared["regions"]
+    xs, ys = np.meshgrid(*raster_io.cell_centers(grid))
+    return point_regions(prepared["regions"], prepared["grid"], xs, ys)
+
+
+def write_feature_class(segs, template, output_path):
+    """Writes preprocessed barrier segments as a line shapefile.
+
+    Consecutive segments that share a vertex are joined into polylines.
+
+    :param: segs:         numpy.ndarray; (n_segments, 4) segments.
+    :param: template:     string; The original barriers, whose spatial
+                          reference is used.
+    :param: output_path:  string; Path of the output `.shp`.
+
+    :return:  string; The output path.
+    """
+    import arcpy
+
+    spatial_reference = arcpy.Describe(str(template)).spatialReference
+    partial = partial_path(output_path)
+    arcpy.CreateFeatureclass_management(
+        os.path.dirname(partial), os.path.basename(partial), "POLYLINE",
+        spatial_reference=spatial_reference)
+    with arcpy.da.InsertCursor(partial, ["SHAPE@"]) as cursor:
+        line = []
+        for x0, y0, x1, y1 in segs:
+            if line and line[-1] != (x0, y0):
+                cursor.insertRow([arcpy.Polyline(arcpy.Array(
+                    [arcpy.Point(*xy) for xy in line]), spatial_reference)])
+                line = []
+            if not line:
+                line.append((x0, y0))
+            line.append((x1, y1))
+        if line:
+            cursor.insertRow([arcpy.Polyline(arcpy.Array(
+                [arcpy.Point(*xy) for xy in line]), spatial_reference)])
+    commit_output(partial, output_path)
+    return output_path
+
+
+def prepared_feature_class(barriers, mask, cache_folder=None,
+                           simplify=None):
+    """Returns the barriers to give `SplineWithBarriers`.
+
+    Simplified and snapped barriers have fewer segments, but change the
+    spline output, so they are opt-in. The simplified copy is written to the
+    cache once, next to its `prepare` entry, and reused by every call with
+    the same barriers and mask.
+
+    :param: barriers:      string; Path to the barrier line feature class.
+    :param: mask:          string; Path to the mask raster.
+    :param: cache_folder:  string; Folder of the cache. Defaults to a
+                           `.barrier_cache` folder next to the mask.
+    :param: simplify:      bool; Whether to simplify the barriers. Defaults
+                           to True if the `NYBEM_SIMPLIFY_BARRIERS`
+                           environment variable is set.
+
+    :return:  string; Path to the prepared barrier shapefile, or the
+              barriers unchanged.
+    """
+    if simplify is None:
+        simplify = bool(os.environ.get(SIMPLIFY_ENV))
+    if not simplify or not barriers:
+        return barriers
+    cache_folder = cache_folder or default_cache_folder(mask)
+    prepared = prepare(barriers, mask, cache_folder)
+    output_path = os.path.join(cache_folder,
+                               f"{CACHE_PREFIX}{prepared['key']}.shp")
+    if not os.path.exists(output_path):
+        write_feature_class(prepared["segments"], barriers, output_path)
+    return output_path
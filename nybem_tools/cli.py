@@ -0,0 +1,245 @@
+"""Command line interface for the NYBEM tools.
+
+Runs the toolbox tools without ArcGIS Pro: one tool per invocation, a batch of
+jobs from a job file, or a persistent worker that reads jobs from standard
+input. The worker pays the interpreter, import and license checkout costs once
+and can then run any number of jobs, which is how a cluster scheduler should
+drive large batches.
+
+    python -m nybem_tools create-scenario --path-to-alt D:/alts/alt_1
+    python -m nybem_tools run-scenario --path-to-fwop D:/fwop ...
+    python -m nybem_tools run-jobs jobs.jsonl
+    python -m nybem_tools worker < jobs.jsonl
+    python -m nybem_tools queue-worker --queue //server/runs/queue.sqlite
+
+A job is a JSON object naming a tool and the arguments of its `main` function:
+
+    {"id": "alt_1", "tool": "create-scenario",
+     "args": {"path_to_alt": "D:/alts/alt_1"}}
+
+Job files hold one job per line, or a JSON list of jobs. For every job one
+JSON result line is written to standard output; messages from the tools go to
+standard error.
+
+Jobs can also be spread over several machines through a queue on a shared
+filesystem (see `work_queue`): `queue-submit` adds the jobs of a job file,
+`queue-scenario` the steps of a scenario, and `queue-worker` runs jobs from
+the queue on each machine until it is empty.
+"""
+import argparse
+import ast
+import contextlib
+import importlib
+import importlib.util
+import json
+import sys
+import traceback
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+from . import utils
+
+
+# tool: (module, parameters of its main function, needs arcpy extensions)
+TOOLS = OrderedDict([
+    ("create-scenario", ("create_new_scenario", ["path_to_alt"], False)),
+    ("copy-static", ("copy_static_predictors",
+                     ["path_to_fwop", "path_to_alt"], False)),
+    ("run-scenario", ("update_AdH_predictors",
+                      ["path_to_fwop", "path_to_alt", "adh_velocity",
+                       "adh_salinity", "adh_wse", "barriers", "mask"], True)),
+    ("preview", ("preview",
+                 ["path_to_fwop", "path_to_alt", "adh_velocity",
+                  "adh_salinity", "adh_wse", "barriers", "mask", "cell_size"],
+                 True)),
+    ("footprint", ("footprint",
+                   ["path_to_fwop", "path_to_alt", "adh_velocity",
+                    "adh_salinity", "adh_wse", "fwop_velocity",
+                    "fwop_salinity", "fwop_wse", "barriers", "mask",
+                    "tolerance", "halo"], True)),
+    ("interpolate", ("create_adh_raster",
+                     ["output_folder", "output_name", "adh_points",
+                      "variable", "sql_select", "barriers", "mask",
+                      "method"], True)),
+    ("compare", ("compare_to_fwop",
+                 ["path_to_fwop", "path_to_alt", "output_folder"], False)),
+    ("ensemble", ("ensemble",
+                   ["path_to_alt", "output_folder", "n_members",
+                    "attenuation_sd", "level_sd"], False)),
+    ("sample", ("sampling", ["sample_points", "scenarios", "output_csv"],
+                False)),
+    ("slr-sweep", ("slr_sweep", ["path_to_alt", "offsets", "output_folder"],
+                   False)),
+    ("stack", ("stack", ["path_to_scenario"], False)),
+    ("store-mesh", ("mesh_store", ["adh_points", "store"], False)),
+    ("serve-tiles", ("tiles", ["scenarios_folder", "port"], False)),
+    ("add-to-datacube", ("datacube",
+                         ["path_to_cube", "path_to_alt", "scenario_name"],
+                         False)),
+    ("queue-scenario", ("work_queue",
+                        ["queue_path", "path_to_fwop", "path_to_alt",
+                         "adh_velocity", "adh_salinity", "adh_wse",
+                         "barriers", "mask"], False)),
+])
+
+# Parameters that may be omitted on the command line, with their defaults
+OPTIONAL = {"sql_select": "", "scenario_name": "", "port": "",
+            "method": "", "tolerance": "", "halo": ""}
+
+
+def run_job(job):
+    """Runs one job.
+
+    :param: job:  dict; A job with the keys "tool", "args" and optionally
+                  "id".
+
+    :return:  dict; The job result with the keys "id", "tool", "status"
+              ("ok" or "error"), "seconds" and, for failed jobs, "error".
+    """
+    result = {"id": job.get("id"), "tool": job.get("tool")}
+    start = timer()
+    try:
+        if job.get("tool") not in TOOLS:
+            raise ValueError(f"Unknown tool: {job.get('tool')}")
+        module_name, _, needs_arcpy = TOOLS[job["tool"]]
+        module = importlib.import_module("." + module_name, __package__)
+        if needs_arcpy:
+            utils.check_out_extensions()
+        module.main(**job.get("args", {}))
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        traceback.print_exc(file=sys.stderr)
+    result["seconds"] = round(timer() - start, 3)
+    return result
+
+
+def read_jobs(job_file):
+    """Reads jobs from a job file.
+
+    :param: job_file:  string; Path to a file holding one JSON job per line or
+                       a JSON list of jobs.
+
+    :return:  list; The jobs.
+    """
+    with open(job_file) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def run_jobs(jobs, output=None):
+    """Runs jobs one after another, writing a result line for each.
+
+    Messages written by the tools are redirected to standard error so that
+    the output only holds results.
+
+    :param: jobs:    iterable; Jobs, or JSON strings of jobs.
+    :param: output:  file; Where result lines are written. Defaults to
+                     standard output.
+
+    :return:  int; The number of failed jobs.
+    """
+    output = output or sys.stdout
+    failures = 0
+    for job in jobs:
+        if isinstance(job, str):
+            if not job.strip():
+                continue
+            try:
+                job = json.loads(job)
+            except ValueError as e:
+                # Reported as is; there is no job to run
+                job = None
+                result = {"id": None, "tool": None, "status": "error",
+                          "error": f"{type(e).__name__}: {e}",
+                          "seconds": 0.0}
+        if job is not None:
+            with contextlib.redirect_stdout(sys.stderr):
+                result = run_job(job)
+        failures += result["status"] != "ok"
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+    return failures
+
+
+def summary(module_name):
+    """Returns the first paragraph of the docstring of a tool module, read
+    from its source so the module (and arcpy, numpy or scipy with it) is only
+    imported when the tool runs."""
+    spec = importlib.util.find_spec("." + module_name, __package__)
+    with open(spec.origin, encoding="utf-8") as f:
+        docstring = ast.get_docstring(ast.parse(f.read())) or ""
+    return " ".join(docstring.split("\n\n")[0].split())
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="nybem_tools",
+        description="Run the NYBEM tools from the command line.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    for tool, (module_name, parameters, _) in TOOLS.items():
+        command = commands.add_parser(tool, help=summary(module_name))
+        for parameter in parameters:
+            command.add_argument("--" + parameter.replace("_", "-"),
+                                 dest=parameter,
+                                 required=parameter not in OPTIONAL,
+                                 default=OPTIONAL.get(parameter))
+
+    run_jobs_command = commands.add_parser(
+        "run-jobs", help="Run every job in a job file.")
+    run_jobs_command.add_argument("job_file")
+
+    commands.add_parser(
+        "worker", help="Run jobs read from standard input, one per line, "
+                       "until the input is closed.")
+
+    queue_submit = commands.add_parser(
+        "queue-submit", help="Add every job in a job file to a queue. Jobs "
+                             "may list the ids of jobs they depend on in "
+                             "\"depends_on\".")
+    queue_submit.add_argument("--queue", required=True)
+    queue_submit.add_argument("job_file")
+
+    queue_worker = commands.add_parser(
+        "queue-worker", help="Run jobs from a queue until none are pending "
+                             "or running.")
+    queue_worker.add_argument("--queue", required=True)
+    queue_worker.add_argument("--lease", type=float, default=60.0,
+                              help="Seconds a job is leased for between "
+                                   "heartbeats of the worker.")
+
+    queue_status = commands.add_parser(
+        "queue-status", help="Count the jobs of a queue by status.")
+    queue_status.add_argument("--queue", required=True)
+    return parser
+
+
+def main(argv=None):
+    args = vars(build_parser().parse_args(argv))
+    command = args.pop("command")
+
+    if command == "run-jobs":
+        failures = run_jobs(read_jobs(args["job_file"]))
+    elif command == "worker":
+        failures = run_jobs(sys.stdin)
+    elif command.startswith("queue-") and command not in TOOLS:
+        from . import work_queue
+
+        if command == "queue-submit":
+            added = work_queue.submit(args["queue"],
+                                      read_jobs(args["job_file"]))
+            utils.add_message(f"Queued {len(added)} jobs.")
+            failures = 0
+        elif command == "queue-worker":
+            failures = work_queue.work(args["queue"], lease=args["lease"])
+        else:
+            print(json.dumps(work_queue.status(args["queue"])))
+            failures = 0
+    else:
+        failures = run_jobs([{"tool": command, "args": args}])
+    return 1 if failures else 0
@@ -0,0 +1,249 @@
+"""Compare the predictor rasters of an alternative with the existing condition
+scenario.
+
+Every predictor raster of the alternative (the rasters in the alternative root
+folder and in each model's `predictors` folder) is read next to its
+counterpart in the existing condition scenario, straight from `path_to_fwop`.
+For each pair a difference raster and a percent change raster are written, and
+summary statistics are collected for each raster and for each model folder.
+Rasters are processed in tiles on a pool of threads, so every input is read
+exactly once, and each tile is written to the outputs as it completes.
+
+:param: path_to_fwop:   string; Path to the parent folder of the existing
+                        condition scenario (aka, future without project, FWOP).
+:param: path_to_alt:    string; Path to the parent folder of the alternative
+                        to be compared.
+:param: output_folder:  string; Path to the folder where the comparison
+                        rasters and the `fwop_comparison.csv` summary will be
+                        written.
+
+:return:    Difference (`<name>_diff`) and percent change (`<name>_pct`)
+            rasters for every predictor, written to a subfolder of the output
+            folder named after the model, and a summary table.
+"""
+import csv
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from . import align, raster_io
+    from .stack import STACK_NAME
+    from .utils import MODEL_NAMES, add_message
+except ImportError:
+    import align
+    import raster_io
+    from stack import STACK_NAME
+    from utils import MODEL_NAMES, add_message
+
+
+RASTER_EXTENSIONS = (".tif", ".npy")
+SUMMARY_FIELDS = ["model", "predictor", "valid_cells", "changed_cells",
+                  "mean_delta", "min_delta", "max_delta"]
+
+
+def predictor_pairs(path_to_fwop, path_to_alt):
+    """Lists the predictor rasters an alternative shares with the FWOP.
+
+    Masks, predictor stacks and the `fwop_*` copies made by earlier versions
+    of `update_AdH_predictors` are skipped.
+
+    :param: path_to_fwop:  string; Path to the FWOP scenario folder.
+    :param: path_to_alt:   string; Path to the alternative scenario folder.
+
+    :return:  list; `(model, subfolder, file_name)` tuples, where model is
+              "alt" for rasters in the scenario root.
+    """
+    folders = [("alt", "")]
+    folders += [(model_name, os.path.join(model_name, "predictors"))
+                for model_name in MODEL_NAMES]
+
+    pairs = []
+    for model, subfolder in folders:
+        alt_folder = os.path.join(path_to_alt, subfolder)
+        if not os.path.isdir(alt_folder):
+            continue
+        for file_name in sorted(os.listdir(alt_folder)):
+            stem, ext = os.path.splitext(file_name)
+            if ext.lower() not in RASTER_EXTENSIONS:
+                continue
+            if (stem.startswith("fwop_") or stem.startswith("mask")
+                    or file_name == STACK_NAME):
+                continue
+            if os.path.exists(os.path.join(path_to_fwop, subfolder,
+                                           file_name)):
+                pairs.append((model, subfolder, file_name))
+    return pairs
+
+
+def difference_tile(alt, fwop, tolerance=0.0):
+    """Calculates the difference and percent change of one tile.
+
+    PercentChange = ((value_alt − value_fwop) / value_fwop) ∗ 100
+
+    :param: alt:        numpy.ndarray; Alternative values.
+    :param: fwop:       numpy.ndarray; FWOP values.
+    :param: tolerance:  float; Absolute difference above which a cell is
+                        counted as changed.
+
+    :return:  tuple; The difference array, the percent change array and a
+              dict of partial statistics for the tile.
+    """
+    diff = alt - fwop
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = diff / fwop * 100
+    pct[~np.isfinite(pct)] = np.nan
+
+    delta = diff[~np.isnan(diff)]
+    stats = {"valid_cells": int(delta.size),
+             "changed_cells": int(np.count_nonzero(np.abs(delta) > tolerance)),
+             "sum_delta": float(delta.sum()),
+             "min_delta": float(delta.min()) if delta.size else math.inf,
+             "max_delta": float(delta.max()) if delta.size else -math.inf}
+    return diff, pct, stats
+
+
+def merge_stats(stats_a, stats_b):
+    """Combines the partial statistics of two tiles or rasters.
+
+    :param: stats_a:  dict; Partial statistics.
+    :param: stats_b:  dict; Partial statistics.
+
+    :return:  dict; The combined statistics.
+    """
+    return {"valid_cells": stats_a["valid_cells"] + stats_b["valid_cells"],
+            "changed_cells": (stats_a["changed_cells"] +
+                              stats_b["changed_cells"]),
+            "sum_delta": stats_a["sum_delta"] + stats_b["sum_delta"],
+            "min_delta": min(stats_a["min_delta"], stats_b["min_delta"]),
+            "max_delta": max(stats_a["max_delta"], stats_b["max_delta"])}
+
+
+def summary_row(model, predictor, stats):
+    """Formats partial statistics as a row of the summary table."""
+    valid = stats["valid_cells"]
+    return {"model": model,
+            "predictor": predictor,
+            "valid_cells": valid,
+            "changed_cells": stats["changed_cells"],
+            "mean_delta": stats["sum_delta"] / valid if valid else math.nan,
+            "min_delta": stats["min_delta"] if valid else math.nan,
+            "max_delta": stats["max_delta"] if valid else math.nan}
+
+
+def compare_raster(alt_raster, fwop_raster, diff_raster, pct_raster,
+                   executor, tile_size=1024, tolerance=0.0):
+    """Compares one alternative raster with its FWOP counterpart.
+
+    :param: alt_raster:   string; Path to the alternative raster.
+    :param: fwop_raster:  string; Path to the FWOP raster.
+    :param: diff_raster:  string; Path of the output difference raster.
+    :param: pct_raster:   string; Path of the output percent change raster.
+    :param: executor:     concurrent.futures.Executor; Pool the tiles are
+                          processed on.
+    :param: tile_size:    int; Edge length of a tile in cells.
+    :param: tolerance:    float; Absolute difference above which a cell is
+                          counted as changed.
+
+    :return:  dict; Statistics of the difference raster, or None if the two
+              rasters are not in the same coordinate system. A FWOP raster
+              on another grid is resampled onto the grid of the alternative
+              (see `align`).
+    """
+    grid = align.read_grid(alt_raster)
+    if not align.same_coordinate_system(grid, align.read_grid(fwop_raster)):
+        add_message(f"Skipped {alt_raster}, coordinate system differs from "
+                    f"the FWOP.")
+        return None
+
+    # Tiles are written to the outputs as they complete
+    diff = raster_io.open_output(diff_raster, grid)
+    pct = raster_io.open_output(pct_raster, grid)
+
+    def process(window):
+        tile_diff, tile_pct, tile_stats = difference_tile(
+            raster_io.read_array(alt_raster, window),
+            align.read_aligned(fwop_raster, grid, window), tolerance)
+        raster_io.write_window(diff, tile_diff, window)
+        raster_io.write_window(pct, tile_pct, window)
+        return tile_stats
+
+    stats = {"valid_cells": 0, "changed_cells": 0, "sum_delta": 0.0,
+             "min_delta": math.inf, "max_delta": -math.inf}
+    for tile_stats in executor.map(process,
+                                   raster_io.windows(grid, tile_size)):
+        stats = merge_stats(stats, tile_stats)
+
+    raster_io.close_output(diff)
+    raster_io.close_output(pct)
+    return stats
+
+
+def compare_scenarios(path_to_fwop, path_to_alt, output_folder,
+                      tile_size=1024, workers=None, tolerance=0.0):
+    """Compares every predictor raster of an alternative with the FWOP.
+
+    :param: path_to_fwop:   string; Path to the FWOP scenario folder.
+    :param: path_to_alt:    string; Path to the alternative scenario folder.
+    :param: output_folder:  string; Path to the folder where the comparison
+                            rasters and summary table will be written.
+    :param: tile_size:      int; Edge length of a tile in cells.
+    :param: workers:        int; Number of threads. Defaults to the number of
+                            processors.
+    :param: tolerance:      float; Absolute difference above which a cell is
+                            counted as changed.
+
+    :return:  list; Summary rows for each raster, followed by one row per
+              model folder with the predictor "*".
+    """
+    rows = []
+    model_stats = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for model, subfolder, file_name in predictor_pairs(path_to_fwop,
+                                                           path_to_alt):
+            stem, ext = os.path.splitext(file_name)
+            model_output = (output_folder if model == "alt"
+                            else os.path.join(output_folder, model))
+            os.makedirs(model_output, exist_ok=True)
+
+            add_message(f"## {model}: {stem}")
+            stats = compare_raster(
+                os.path.join(path_to_alt, subfolder, file_name),
+                os.path.join(path_to_fwop, subfolder, file_name),
+                os.path.join(model_output, f"{stem}_diff{ext}"),
+                os.path.join(model_output, f"{stem}_pct{ext}"),
+                executor, tile_size, tolerance)
+            if stats is None:
+                continue
+            rows.append(summary_row(model, stem, stats))
+            if model in model_stats:
+                stats = merge_stats(model_stats[model], stats)
+            model_stats[model] = stats
+
+    rows += [summary_row(model, "*", stats)
+             for model, stats in model_stats.items()]
+
+    os.makedirs(output_folder, exist_ok=True)
+    with open(os.path.join(output_folder, "fwop_comparison.csv"), "w",
+              newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def main(path_to_fwop, path_to_alt, output_folder):
+    compare_scenarios(path_to_fwop, path_to_alt, output_folder)
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    path_to_fwop = arcpy.GetParameterAsText(0)
+    path_to_alt = arcpy.GetParameterAsText(1)
+    output_folder = arcpy.GetParameterAsText(2)
+
+    main(path_to_fwop, path_to_alt, output_folder)
@@ -14,18 +14,21 @@ the existing condition scenario into the folder structure of a new scenario.
             alternative folder.
 """
 import os
-import arcpy
-from utils import copy_tif
 
+try:
+    from .utils import add_message, copy_tif
+except ImportError:
+    from utils import add_message, copy_tif
 
-def main():
+
+def main(path_to_fwop, path_to_alt):
     # alt root -----------------------------------------------------------------
-    arcpy.AddMessage("# ALT")
+    add_message("# ALT")
     copy_tif(path_to_fwop, path_to_alt, "bed_elevation*")
     copy_tif(path_to_fwop, path_to_alt, "mask*")
 
     # est_int ------------------------------------------------------------------
-    arcpy.AddMessage("# EST_INT")
+    add_message("# EST_INT")
     from_est_int = os.path.join(path_to_fwop, "est_int", "predictors")
     to_est_int = os.path.join(path_to_alt, "est_int", "predictors")
 
@@ -34,7 +37,7 @@ def main():
     copy_tif(from_est_int, to_est_int, "veg_50_per*")
 
     # est_sub_hard -------------------------------------------------------------
-    arcpy.AddMessage("# EST_SUB_HARD")
+    add_message("# EST_SUB_HARD")
     from_est_sub_hard = os.path.join(path_to_fwop, "est_sub_hard", "predictors")
     to_est_sub_hard = os.path.join(path_to_alt, "est_sub_hard", "predictors")
 
@@ -43,7 +46,7 @@ def main():
     # copy_tif(from_est_sub_hard, to_est_sub_hard, "est_sub_hard*")
 
     # est_sub_soft_clam --------------------------------------------------------
-    arcpy.AddMessage("# EST_SUB_SOFT_CLAM")
+    add_message("# EST_SUB_SOFT_CLAM")
     from_est_sub_soft_clam = os.path.join(path_to_fwop, "est_sub_soft_clam", "predictors")
     to_est_sub_soft_clam = os.path.join(path_to_alt, "est_sub_soft_clam", "predictors")
 
@@ -52,7 +55,7 @@ def main():
     # copy_tif(from_est_sub_soft_clam, to_est_sub_soft_clam, "est_sub_soft.*")
 
     # est_sub_soft_sav ---------------------------------------------------------
-    arcpy.AddMessage("# EST_SUB_SOFT_SAV")
+    add_message("# EST_SUB_SOFT_SAV")
     from_est_sub_soft_sav = os.path.join(path_to_fwop, "est_sub_soft_sav", "predictors")
     to_est_sub_soft_sav = os.path.join(path_to_alt, "est_sub_soft_sav", "predictors")
 
@@ -61,21 +64,21 @@ def main():
     copy_tif(from_est_sub_soft_sav, to_est_sub_soft_sav, "vessel_density*")
 
     # fresh_tid ----------------------------------------------------------------
-    arcpy.AddMessage("# FRESH_TID")
+    add_message("# FRESH_TID")
     from_fresh_tid = os.path.join(path_to_fwop, "fresh_tid", "predictors")
     to_fresh_tid = os.path.join(path_to_alt, "fresh_tid", "predictors")
 
     copy_tif(from_fresh_tid, to_fresh_tid, "veg_50_per*")
 
     # mar_deep -----------------------------------------------------------------
-    arcpy.AddMessage("# MAR_DEEP")
+    add_message("# MAR_DEEP")
     from_mar_deep = os.path.join(path_to_fwop, "mar_deep", "predictors")
     to_mar_deep = os.path.join(path_to_alt, "mar_deep", "predictors")
 
     copy_tif(from_mar_deep, to_mar_deep, "vessel_density*")
 
     # mar_int ------------------------------------------------------------------
-    arcpy.AddMessage("# MAR_INT")
+    add_message("# MAR_INT")
     from_mar_int = os.path.join(path_to_fwop, "mar_int", "predictors")
     to_mar_int = os.path.join(path_to_alt, "mar_int", "predictors")
 
@@ -84,7 +87,7 @@ def main():
     copy_tif(from_mar_int, to_mar_int, "slope_per*")
 
     # mar_sub ------------------------------------------------------------------
-    arcpy.AddMessage("# MAR_SUB")
+    add_message("# MAR_SUB")
     from_mar_sub = os.path.join(path_to_fwop, "mar_sub", "predictors")
     to_mar_sub = os.path.join(path_to_alt, "mar_sub", "predictors")
 
@@ -93,8 +96,10 @@ def main():
 
 
 if __name__ == "__main__":
+    import arcpy
+
     # Get input parameters
     path_to_fwop = arcpy.GetParameterAsText(0)
     path_to_alt = arcpy.GetParameterAsText(1)
 
-    main()
+    main(path_to_fwop, path_to_alt)
@@ -19,25 +19,31 @@ converts an AdH model point variable to a raster.
 :param: mask:           raster; A raster used to determine the
                        characteristics (dimensions, extent, cell size,
                        coordinate system, mask, snap) of the output raster.
+:param: method:         string; "spline" (the default) for
+                       `SplineWithBarriers`, or "idw" or "linear" for the
+                       fast numpy interpolation (see `interpolate`).
 
 :return:   A raster of the specified AdH variable interpolated across the
           extent of the mask raster.
 """
-import arcpy
-import utils
-import importlib
+try:
+    from . import utils
+except ImportError:
+    import utils
 
-# Ensure changes are reloaded during interactive development session
-importlib.reload(arcpy)
-importlib.reload(utils)
+# Set NYBEM_DEV_RELOAD to pick up changes during interactive development
+utils.dev_reload(utils)
 
 
-def main():
+def main(output_folder, output_name, adh_points, variable, sql_select,
+         barriers, mask, method=""):
     utils.adh2raster(output_folder, output_name, adh_points, variable,
-                     sql_select, barriers, mask)
+                     sql_select, barriers, mask, method or "spline")
 
 
 if __name__ == "__main__":
+    import arcpy
+
     # Get input parameters
     output_folder = arcpy.GetParameterAsText(0)
     output_name = arcpy.GetParameterAsText(1)
@@ -46,5 +52,7 @@ if __name__ == "__main__":
     sql_select = arcpy.GetParameterAsText(4)
     barriers = arcpy.GetParameterAsText(5)
     mask = arcpy.GetParameterAsText(6)
+    method = arcpy.GetParameterAsText(7)
 
-    main()
+    main(output_folder, output_name, adh_points, variable, sql_select,
+         barriers, mask, method)
@@ -11,16 +11,17 @@ required folder structure for a new model scenario.
 :return:  A prescribed folder structure is written to the path provided.
 """
 import os
-import arcpy
 
+try:
+    from .utils import MODEL_NAMES
+except ImportError:
+    from utils import MODEL_NAMES
 
-def main():
-    model_names = ["est_int", "est_sub", "est_sub_hard",
-                   "est_sub_soft_clam", "est_sub_soft_sav",
-                   "fresh_tid", "mar_deep", "mar_int", "mar_sub"]
+
+def main(path_to_alt):
     model_components = ["hsi", "predictors", "siv"]
 
-    for model_name in model_names:
+    for model_name in MODEL_NAMES:
         os.makedirs(os.path.join(path_to_alt, model_name),
                     exist_ok=True)
         for model_component in model_components:
@@ -29,7 +30,9 @@ def main():
 
 
 if __name__ == "__main__":
+    import arcpy
+
     # Get input parameters
     path_to_alt = arcpy.GetParameterAsText(0)
 
-    main()
+    main(path_to_alt)
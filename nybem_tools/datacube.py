@@ -0,0 +1,316 @@
+"""Add the predictor rasters of a scenario to a multi-scenario datacube.
+
+The datacube holds the predictors of many scenarios on a common grid, so that
+questions across alternatives (e.g. which alternative has the highest mean
+salinity in a zone) can be answered without opening every scenario's rasters.
+Scenarios are added one at a time as they finish.
+
+A datacube is a folder with a `datacube.json` index (grid, tile size, band
+names and scenario names) and one folder per band, named like the bands of a
+predictor stack (e.g. `mhhw` or `est_int/wse_median`). Each band folder holds
+one `.npy` file per tile of shape `(capacity, tile_rows, tile_cols)` with a
+slot for every scenario. A map of one scenario reads a contiguous slab of each
+tile, and the values of one cell across all scenarios are read from a single
+file per band. Summaries across scenarios are computed tile by tile for all
+scenarios at once.
+
+:param: path_to_cube:   string; Path to the datacube folder. It is created
+                        when the first scenario is added.
+:param: path_to_alt:    string; Path to the parent folder of the scenario.
+:param: scenario_name:  string; Name of the scenario in the datacube. Defaults
+                        to the name of the scenario folder.
+
+:return:    None. The scenario's predictors are written to the datacube,
+            replacing any earlier version of the same scenario.
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+try:
+    from . import raster_io
+    from .stack import scenario_rasters
+    from .utils import add_message, commit_output, partial_path
+except ImportError:
+    import raster_io
+    from stack import scenario_rasters
+    from utils import add_message, commit_output, partial_path
+
+
+INDEX_NAME = "datacube.json"
+STATISTICS = ("mean", "min", "max", "sum", "count")
+
+
+def read_index(path_to_cube):
+    """Reads the index of a datacube.
+
+    :param: path_to_cube:  string; Path to the datacube folder.
+
+    :return:  dict; The index, or None if the datacube does not exist yet.
+    """
+    index_path = os.path.join(path_to_cube, INDEX_NAME)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def write_index(path_to_cube, index):
+    """Writes the index of a datacube, committing it once complete."""
+    index_path = os.path.join(path_to_cube, INDEX_NAME)
+    partial = partial_path(index_path)
+    with open(partial, "w") as f:
+        json.dump(index, f, indent=2)
+    commit_output(partial, index_path)
+
+
+def cube_grid(index):
+    """Returns the Grid of a datacube."""
+    return raster_io.Grid(**index["grid"])
+
+
+def tile_path(path_to_cube, band, window):
+    """Returns the path of the file holding one tile of a band."""
+    row, col = window[:2]
+    return os.path.join(path_to_cube, *band.split("/"), f"{row}_{col}.npy")
+
+
+def create_tiles(path_to_cube, index, band, capacity, previous=None):
+    """Creates the tile files of a band, filled with NoData.
+
+    :param: path_to_cube:  string; Path to the datacube folder.
+    :param: index:         dict; The datacube index.
+    :param: band:          string; Name of the band.
+    :param: capacity:      int; Number of scenario slots.
+    :param: previous:      int; If given, the existing tiles are grown to the
+                           new capacity, keeping their first `previous`
+                           slots.
+
+    :return:  None.
+    """
+    grid = cube_grid(index)
+    for window in raster_io.windows(grid, index["tile_size"]):
+        path = tile_path(path_to_cube, band, window)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = partial_path(path)
+        tile = np.lib.format.open_memmap(
+            partial, mode="w+", dtype=np.float32,
+            shape=(capacity, window[2], window[3]))
+        tile[:] = np.nan
+        if previous:
+            tile[:previous] = np.load(path, mmap_mode="r")[:previous]
+        tile.flush()
+        del tile
+        commit_output(partial, path)
+
+
+def add_scenario(path_to_cube, path_to_alt, scenario_name=None,
+                 tile_size=256, capacity=16):
+    """Adds the predictors of a scenario to a datacube.
+
+    Only one process should add scenarios to a datacube at a time. The index
+    is written last, so a scenario that was interrupted while being added is
+    not listed and can simply be added again.
+
+    :param: path_to_cube:   string; Path to the datacube folder.
+    :param: path_to_alt:    string; Path to the scenario folder.
+    :param: scenario_name:  string; Name of the scenario. Defaults to the
+                            name of the scenario folder.
+    :param: tile_size:      int; Edge length of a tile in cells, used when
+                            the datacube is created.
+    :param: capacity:       int; Initial number of scenario slots, used when
+                            the datacube is created. The slots are doubled
+                            whenever they run out.
+
+    :return:  list; The bands written for the scenario.
+    """
+    scenario_name = scenario_name or os.path.basename(
+        os.path.normpath(path_to_alt))
+    rasters = scenario_rasters(path_to_alt)
+    if not rasters:
+        raise ValueError(f"No predictor rasters in {path_to_alt}.")
+
+    index = read_index(path_to_cube)
+    if index is None:
+        os.makedirs(path_to_cube, exist_ok=True)
+        grid = raster_io.read_grid(rasters[0][1])
+        index = {"grid": dict(grid._asdict()), "tile_size": tile_size,
+                 "capacity": capacity, "bands": [], "scenarios": []}
+    grid = cube_grid(index)
+
+    if scenario_name in index["scenarios"]:
+        slot = index["scenarios"].index(scenario_name)
+    else:
+        slot = len(index["scenarios"])
+    if slot >= index["capacity"]:
+        capacity = index["capacity"] * 2
+        for band in index["bands"]:
+            create_tiles(path_to_cube, index, band, capacity,
+                         previous=index["capacity"])
+        index["capacity"] = capacity
+
+    written = []
+    for band, path in rasters:
+        if not raster_io.same_grid(grid, raster_io.read_grid(path)):
+            add_message(f"Skipped {path}, grid differs from the datacube.")
+            continue
+        if band not in index["bands"]:
+            create_tiles(path_to_cube, index, band, index["capacity"])
+            index["bands"].append(band)
+        for window in raster_io.windows(grid, index["tile_size"]):
+            tile = np.load(tile_path(path_to_cube, band, window),
+                           mmap_mode="r+")
+            tile[slot] = raster_io.read_array(path, window)
+            tile.flush()
+        written.append(band)
+
+    # Clear bands an earlier version of the scenario had but this one lacks
+    for band in index["bands"]:
+        if band in written or slot >= len(index["scenarios"]):
+            continue
+        for window in raster_io.windows(grid, index["tile_size"]):
+            tile = np.load(tile_path(path_to_cube, band, window),
+                           mmap_mode="r+")
+            tile[slot] = np.nan
+            tile.flush()
+
+    if slot == len(index["scenarios"]):
+        index["scenarios"].append(scenario_name)
+    write_index(path_to_cube, index)
+    return written
+
+
+def read_map(path_to_cube, scenario_name, band, window=None):
+    """Reads a band of one scenario.
+
+    :param: path_to_cube:   string; Path to the datacube folder.
+    :param: scenario_name:  string; Name of the scenario.
+    :param: band:           string; Name of the band.
+    :param: window:         tuple; Optional `(row_off, col_off, nrows,
+                            ncols)` window. The full band is read if omitted.
+
+    :return:  numpy.ndarray; A 2D float32 array with NaN for NoData.
+    """
+    index = read_index(path_to_cube)
+    slot = index["scenarios"].index(scenario_name)
+    grid = cube_grid(index)
+    row, col, nrows, ncols = window or (0, 0, grid.nrows, grid.ncols)
+    array = np.full((nrows, ncols), np.nan, dtype=np.float32)
+    for tile_window in raster_io.windows(grid, index["tile_size"]):
+        t_row, t_col, t_nrows, t_ncols = tile_window
+        r0, r1 = max(row, t_row), min(row + nrows, t_row + t_nrows)
+        c0, c1 = max(col, t_col), min(col + ncols, t_col + t_ncols)
+        if r0 >= r1 or c0 >= c1:
+            continue
+        tile = np.load(tile_path(path_to_cube, band, tile_window),
+                       mmap_mode="r")
+        array[r0 - row:r1 - row, c0 - col:c1 - col] = \
+            tile[slot, r0 - t_row:r1 - t_row, c0 - t_col:c1 - t_col]
+    return array
+
+
+def read_cell(path_to_cube, band, row, col):
+    """Reads the value of one cell in every scenario.
+
+    :param: path_to_cube:  string; Path to the datacube folder.
+    :param: band:          string; Name of the band.
+    :param: row:           int; Row of the cell, 0 at the top.
+    :param: col:           int; Column of the cell.
+
+    :return:  dict; Scenario name to the cell value (NaN for NoData).
+    """
+    index = read_index(path_to_cube)
+    tile_size = index["tile_size"]
+    window = (row - row % tile_size, col - col % tile_size)
+    tile = np.load(tile_path(path_to_cube, band, window), mmap_mode="r")
+    values = tile[:len(index["scenarios"]), row % tile_size, col % tile_size]
+    return dict(zip(index["scenarios"], values.tolist()))
+
+
+def summarize(path_to_cube, band, zone=None):
+    """Summarizes a band in every scenario.
+
+    :param: path_to_cube:  string; Path to the datacube folder.
+    :param: band:          string; Name of the band.
+    :param: zone:          numpy.ndarray; Optional boolean array on the
+                           datacube grid selecting the cells to summarize.
+                           All cells are summarized if omitted.
+
+    :return:  dict; Scenario name to a dict of the statistics in
+              `STATISTICS`, computed over the cells that are not NoData.
+    """
+    index = read_index(path_to_cube)
+    grid = cube_grid(index)
+    n = len(index["scenarios"])
+    count = np.zeros(n)
+    total = np.zeros(n)
+    lowest = np.full(n, math.inf)
+    highest = np.full(n, -math.inf)
+    for window in raster_io.windows(grid, index["tile_size"]):
+        values = np.load(tile_path(path_to_cube, band, window),
+                         mmap_mode="r")[:n].reshape(n, -1)
+        if zone is not None:
+            row, col, nrows, ncols = window
+            selected = zone[row:row + nrows, col:col + ncols].ravel()
+            if not selected.any():
+                continue
+            values = values[:, selected]
+        values = values.astype(np.float64)
+        valid = ~np.isnan(values)
+        count += valid.sum(axis=1)
+        total += np.where(valid, values, 0.0).sum(axis=1)
+        lowest = np.minimum(lowest,
+                            np.where(valid, values, math.inf).min(axis=1))
+        highest = np.maximum(highest,
+                             np.where(valid, values, -math.inf).max(axis=1))
+
+    summary = {}
+    for i, scenario_name in enumerate(index["scenarios"]):
+        valid = count[i] > 0
+        summary[scenario_name] = {
+            "mean": total[i] / count[i] if valid else math.nan,
+            "min": lowest[i] if valid else math.nan,
+            "max": highest[i] if valid else math.nan,
+            "sum": total[i],
+            "count": int(count[i])}
+    return summary
+
+
+def rank(path_to_cube, band, statistic="mean", zone=None, descending=True):
+    """Ranks the scenarios by a statistic of a band.
+
+    :param: path_to_cube:  string; Path to the datacube folder.
+    :param: band:          string; Name of the band.
+    :param: statistic:     string; One of `STATISTICS`.
+    :param: zone:          numpy.ndarray; Optional boolean array selecting
+                           the cells to summarize.
+    :param: descending:    bool; Whether the highest value ranks first.
+
+    :return:  list; `(scenario_name, value)` tuples in rank order. Scenarios
+              without valid cells are ranked last.
+    """
+    if statistic not in STATISTICS:
+        raise ValueError(f"Unknown statistic: {statistic}")
+    summary = summarize(path_to_cube, band, zone)
+    values = [(name, stats[statistic]) for name, stats in summary.items()]
+    valid = sorted([item for item in values if not math.isnan(item[1])],
+                   key=lambda item: item[1], reverse=descending)
+    return valid + [item for item in values if math.isnan(item[1])]
+
+
+def main(path_to_cube, path_to_alt, scenario_name=""):
+    bands = add_scenario(path_to_cube, path_to_alt, scenario_name or None)
+    add_message(f"Added {len(bands)} predictors to the datacube.")
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    path_to_cube = arcpy.GetParameterAsText(0)
+    path_to_alt = arcpy.GetParameterAsText(1)
+    scenario_name = arcpy.GetParameterAsText(2)
+
+    main(path_to_cube, path_to_alt, scenario_name)
@@ -0,0 +1,321 @@
+"""This module contains functions for interpolating an AdH variable over
+spatial subdomains in parallel.
+
+A single interpolation over a production mesh and the 10 m mask is a serial
+floor on the time of a predictor. Here the mask grid is split into
+subdomains (see `subdomains`), which can be grown by a halo of cells on the
+sides they share with their neighbours. Every subdomain is interpolated on
+its own, in a pool of processes, by `utils.adh2raster` on a copy of the mask
+cropped to it and the nodes its cells can reach (see `crop_points`), so each
+process solves only the cells of its subdomain from a part of the mesh. The
+solutions are then blended across the seams: within its halo the weight of
+a subdomain ramps down linearly with the distance from its core, and every
+cell is the weighted mean of the subdomains covering it (see
+`blend_window`).
+
+Inverse distance weighting is split with or without barriers (see
+`halo_cells`). A cell is estimated from its nearest nodes, so every
+subdomain given the nodes its cells can reach matches a single solve
+exactly and needs no halo. The barriers are prepared once on the whole
+mask and every subdomain uses that entry (see `barriers.prepare`), so a
+subdomain sees the regions and the barrier cells beyond its window as a
+single solve does. The spline has global support: a subdomain is fitted to
+the nodes within its window and a halo beyond it, and the subdomains are
+blended over a halo of `SPLINE_HALO_CELLS` cells, which keeps them within
+a tolerance of a single solve rather than matching it. The triangles of
+"linear" interpolation can span the whole mesh, so it is interpolated in
+one piece.
+
+The number of processes is set with the `NYBEM_INTERPOLATION_PROCESSES`
+environment variable ("auto" for one per core); without it, every variable
+is interpolated in one piece.
+"""
+import os
+import shutil
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    from . import barriers as barriers_
+    from . import interpolate as interpolate_, points, raster_io
+    from .utils import add_message
+except ImportError:
+    import barriers as barriers_
+    import interpolate as interpolate_
+    import points
+    import raster_io
+    from utils import add_message
+
+
+PROCESSES_ENV = "NYBEM_INTERPOLATION_PROCESSES"
+# Halo of the spline subdomains in cells: each is fitted to the nodes up to
+# this far beyond its window and blended with its neighbours over it
+SPLINE_HALO_CELLS = 32
+SUBDOMAIN_FOLDER = ".subdomains"
+# Cells sampled along the longer edge of a window for its reach
+REACH_SAMPLES = 64
+
+# The windows of a subdomain, as `(row_off, col_off, nrows, ncols)`: its core
+# (the subdomains' cores tile the grid) and the core grown by the halo
+Subdomain = namedtuple("Subdomain", ["core", "window"])
+
+
+def process_count():
+    """Returns the number of interpolation processes set in the environment,
+    1 if it is not set."""
+    value = os.environ.get(PROCESSES_ENV, "").strip().lower()
+    if not value:
+        return 1
+    if value == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(value))
+
+
+def halo_cells(method):
+    """Returns the halo of the subdomains of an interpolation method in
+    cells: 0 for inverse distance weighting, whose subdomains match a single
+    solve, `SPLINE_HALO_CELLS` for the spline and None for methods that are
+    interpolated in one piece."""
+    if method == "idw":
+        return 0
+    if not method or method == "spline":
+        return SPLINE_HALO_CELLS
+    return None
+
+
+def layout(grid, parts):
+    """Returns the number of subdomain rows and columns for at least `parts`
+    subdomains as close to square as the grid allows."""
+    rows = int(round(np.sqrt(parts * grid.nrows / grid.ncols)))
+    rows = min(max(rows, 1), parts, grid.nrows)
+    cols = min(-(-parts // rows), grid.ncols)
+    return rows, cols
+
+
+def subdomains(grid, parts, halo=0):
+    """Splits a grid into subdomains with overlapping halos.
+
+    :param: grid:   Grid; The grid to split.
+    :param: parts:  int; Smallest number of subdomains.
+    :param: halo:   int; Number of cells each subdomain extends into its
+                    neighbours.
+
+    :return:  list; The `Subdomain`s, in row-major order.
+    """
+    rows, cols = layout(grid, parts)
+    row_edges = np.linspace(0, grid.nrows, rows + 1).round().astype(int)
+    col_edges = np.linspace(0, grid.ncols, cols + 1).round().astype(int)
+    domains = []
+    for top, bottom in zip(row_edges[:-1], row_edges[1:]):
+        for left, right in zip(col_edges[:-1], col_edges[1:]):
+            window_top = max(top - halo, 0)
+            window_left = max(left - halo, 0)
+            domains.append(Subdomain(
+                (int(top), int(left), int(bottom - top), int(right - left)),
+                (int(window_top), int(window_left),
+                 int(min(bottom + halo, grid.nrows) - window_top),
+                 int(min(right + halo, grid.ncols) - window_left))))
+    return domains
+
+
+def ramp(start, size, core_start, core_size, halo):
+    """Returns the blending weights of the cells of a window along one axis:
+    1 in the core, falling linearly over the halo."""
+    index = np.arange(start, start + size)
+    distance = np.maximum(np.maximum(core_start - index,
+                                     index - (core_start + core_size - 1)), 0)
+    return 1.0 - distance / (halo + 1.0)
+
+
+def weights(domain, halo=0):
+    """Returns the blending weights of the cells of a subdomain window."""
+    row, col, nrows, ncols = domain.window
+    core_row, core_col, core_nrows, core_ncols = domain.core
+    return (ramp(row, nrows, core_row, core_nrows, halo)[:, None] *
+            ramp(col, ncols, core_col, core_ncols, halo)[None])
+
+
+def overlap(window_a, window_b):
+    """Returns the intersection of two windows, or None."""
+    top = max(window_a[0], window_b[0])
+    left = max(window_a[1], window_b[1])
+    bottom = min(window_a[0] + window_a[2], window_b[0] + window_b[2])
+    right = min(window_a[1] + window_a[3], window_b[1] + window_b[3])
+    if bottom <= top or right <= left:
+        return None
+    return top, left, bottom - top, right - left
+
+
+def blend_window(window, domains, rasters, halo=0):
+    """Blends the subdomain solutions over a window of the grid.
+
+    :param: window:   tuple; `(row_off, col_off, nrows, ncols)` window of
+                      the grid.
+    :param: domains:  list; The `Subdomain`s.
+    :param: rasters:  list; Path to the solution of each subdomain, on the
+                      grid of its window.
+    :param: halo:     int; The halo of the subdomains in cells.
+
+    :return:  numpy.ndarray; The weighted mean of the solutions covering
+              each cell, NaN where none has a value.
+    """
+    total = np.zeros(window[2:])
+    weight = np.zeros(window[2:])
+    for domain, raster in zip(domains, rasters):
+        shared = overlap(window, domain.window)
+        if shared is None:
+            continue
+        row, col, nrows, ncols = shared
+        inner = (row - domain.window[0], col - domain.window[1], nrows, ncols)
+        values = raster_io.read_array(raster, inner)
+        domain_weight = weights(domain, halo)[
+            inner[0]:inner[0] + nrows, inner[1]:inner[1] + ncols]
+        valid = ~np.isnan(values)
+        target = (slice(row - window[0], row - window[0] + nrows),
+                  slice(col - window[1], col - window[1] + ncols))
+        total[target] += np.where(valid, values * domain_weight, 0.0)
+        weight[target] += np.where(valid, domain_weight, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(weight > 0, total / weight, np.nan)
+
+
+def crop_points(adh_points, variable, sql_select, grid, window, output_path,
+                neighbours=interpolate_.NEIGHBOURS, margin=0.0):
+    """Writes the selected nodes that are among the nearest nodes of the
+    cells of a window.
+
+    The distance from a cell to its farthest nearest node is found on at
+    most `REACH_SAMPLES` cells along each edge of the window and widened by
+    the distance to the cells between them; the nodes within that distance
+    (and the margin) of the window are written.
+
+    :param: adh_points:   string; Path to a point feature class or a `.npz`
+                          archive.
+    :param: variable:     string; The column to interpolate.
+    :param: sql_select:   string; A where-clause selecting the nodes.
+    :param: grid:         Grid; The grid of the mask.
+    :param: window:       tuple; `(row_off, col_off, nrows, ncols)` window
+                          of the grid.
+    :param: output_path:  string; Path of the `.npz` archive written, with
+                          the coordinates and the variable of the nodes.
+    :param: neighbours:   int; Number of nearest nodes of an estimate.
+    :param: margin:       float; Distance the nodes are kept beyond the
+                          reach of the window.
+
+    :return:  int; The number of nodes written.
+    """
+    tree, nodes = interpolate_.node_tree(adh_points, variable, sql_select)
+    sub = raster_io.window_grid(grid, window)
+    factor = max(1, -(-max(sub.nrows, sub.ncols) // REACH_SAMPLES))
+    coarse = raster_io.coarsen_grid(sub, factor)
+    col_xs, row_ys = raster_io.cell_centers(coarse)
+    xy = np.column_stack([np.tile(col_xs, coarse.nrows),
+                          np.repeat(row_ys, coarse.ncols)])
+    k = min(neighbours, tree.n)
+    farthest = tree.query(xy, k=k)[0]
+    reach = (farthest.max() if tree.n else 0.0) + \
+        factor * sub.cell_size / np.sqrt(2) + margin
+    x_max = sub.x_min + sub.ncols * sub.cell_size
+    y_max = sub.y_min + sub.nrows * sub.cell_size
+    keep = ((nodes["x"] >= sub.x_min - reach) &
+            (nodes["x"] <= x_max + reach) &
+            (nodes["y"] >= sub.y_min - reach) &
+            (nodes["y"] <= y_max + reach))
+    points.write_points({"x": nodes["x"][keep], "y": nodes["y"][keep],
+                         variable: nodes["values"][keep]}, output_path)
+    return int(keep.sum())
+
+
+def solve(output_folder, output_name, adh_points, variable, sql_select,
+          barriers, mask, method):
+    """Interpolates one subdomain; runs in a pool process.
+
+    :return:  string; Path of the raster written.
+    """
+    try:
+        from . import utils
+    except ImportError:
+        import utils
+
+    if not method or method == "spline":
+        utils.check_out_extensions()
+    utils.adh2raster(output_folder, output_name, adh_points, variable,
+                     sql_select, barriers, mask, method, processes=1)
+    path = os.path.join(output_folder, str(output_name) + ".npy")
+    return path if os.path.exists(path) else path[:-len(".npy")] + ".tif"
+
+
+def interpolate(output_folder, output_name, adh_points, variable, sql_select,
+                barriers, mask, method="spline", processes=None, halo=None):
+    """Interpolates an AdH point variable over subdomains in parallel.
+
+    Takes the arguments of `utils.adh2raster`. Methods without a
+    `halo_cells` are solved in one piece.
+
+    :param: processes:  int; Number of processes, and of subdomains.
+                        Defaults to `process_count`.
+    :param: halo:       int; Number of cells each subdomain extends into its
+                        neighbours. Defaults to `halo_cells`.
+
+    :return:  string; Path of the raster written, in the format of the mask.
+    """
+    if halo_cells(method) is None:
+        add_message(f"{method} interpolation is not split into subdomains; "
+                    f"{output_name} is interpolated in one piece.")
+        return solve(output_folder, output_name, adh_points, variable,
+                     sql_select, barriers, mask, method)
+    if halo is None:
+        halo = halo_cells(method)
+    processes = processes or process_count()
+    grid = raster_io.read_grid(mask)
+    domains = subdomains(grid, processes, halo)
+    folder = os.path.join(output_folder, SUBDOMAIN_FOLDER, str(output_name))
+    os.makedirs(folder, exist_ok=True)
+    ext = ".npy" if raster_io.is_numpy_raster(mask) else ".tif"
+
+    # The subdomains of "idw" share the barriers prepared on the whole mask,
+    # and may look as far as `idw` does for cells with every nearest node
+    # across a barrier. The spline takes the barrier lines themselves and is
+    # fitted to the nodes a halo beyond its window.
+    neighbours, margin = interpolate_.NEIGHBOURS, 0.0
+    if method == "idw" and barriers:
+        barriers = barriers_.prepare(barriers, mask)["path"]
+        neighbours *= interpolate_.RETRY
+    elif method != "idw":
+        margin = halo * grid.cell_size
+
+    # Each subdomain is interpolated on the mask cells of its window, from
+    # the nodes they can reach
+    masks, nodes = [], []
+    for index, domain in enumerate(domains):
+        path = os.path.join(folder, f"mask_{index}{ext}")
+        raster_io.write_array(
+            raster_io.read_array(mask, domain.window),
+            raster_io.window_grid(grid, domain.window), path)
+        masks.append(path)
+        nodes.append(os.path.join(folder, f"points_{index}.npz"))
+        crop_points(adh_points, variable, sql_select, grid, domain.window,
+                    nodes[-1], neighbours, margin)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        rasters = list(pool.map(
+            solve, [folder] * len(domains),
+            [f"{output_name}_{index}" for index in range(len(domains))],
+            nodes, [variable] * len(domains), [""] * len(domains),
+            [barriers] * len(domains), masks, [method] * len(domains)))
+    add_message(f"Interpolated {len(domains)} subdomains in {processes} "
+                f"processes.")
+
+    output_path = os.path.join(output_folder, str(output_name) + ext)
+    output = raster_io.open_output(output_path, grid,
+                                   raster_io.storage_profile(output_name))
+    for domain in domains:
+        raster_io.write_window(output, blend_window(domain.core, domains,
+                                                    rasters, halo),
+                               domain.core)
+    raster_io.close_output(output)
+    for raster in rasters + masks:
+        raster_io.delete_raster(raster)
+    shutil.rmtree(folder, ignore_errors=True)
+    return output_path
@@ -0,0 +1,231 @@
+"""Calculate ensemble statistics of the derived predictors of a scenario.
+
+The derived predictors (depth, percent light available, episodic sediment
+deposition and exposure duration, and optionally a habitat suitability index)
+are evaluated for many draws of their uncertain parameters and inputs: the
+light attenuation coefficient of `pla`, and an error added to each water level
+and to the bed elevation. Input errors are drawn once per member and applied
+to the whole raster, so each member is a consistently biased version of the
+scenario.
+
+The rasters are processed in tiles sized so that the members of one tile fit
+in the memory budget, and members are evaluated in vectorized batches. For
+every cell only the statistics are kept: mean, standard deviation and the
+requested quantiles (exact, from the members of the tile), written to the
+statistics rasters tile by tile. No raster is ever written or held for an
+individual member.
+
+:param: path_to_alt:     string; Path to the parent folder of the scenario.
+:param: output_folder:   string; Path to the folder the statistics rasters
+                         are written to.
+:param: n_members:       string; Number of ensemble members.
+:param: attenuation_sd:  string; Standard deviation of the light attenuation
+                         coefficient, around 1.39.
+:param: level_sd:        string; Standard deviation of the error of each water
+                         level and of the bed elevation, in map units.
+
+:return:    `<predictor>_mean`, `<predictor>_std` and `<predictor>_q<percent>`
+            rasters written to the output folder.
+"""
+import os
+
+import numpy as np
+
+try:
+    from . import kernels, raster_io
+    from .slr_sweep import WATER_LEVELS, find_raster
+    from .utils import add_message
+except ImportError:
+    import kernels
+    import raster_io
+    from slr_sweep import WATER_LEVELS, find_raster
+    from utils import add_message
+
+
+PREDICTORS = ["depth", "pla", "esd", "exp_dur"]
+INPUTS = list(WATER_LEVELS) + ["bed_elevation"]
+
+
+def member_draws(n_members, attenuation=(1.39, 0.0), errors=None, seed=0):
+    """Draws the parameters and input errors of the ensemble members.
+
+    :param: n_members:    int; Number of members.
+    :param: attenuation:  tuple; Mean and standard deviation of the light
+                          attenuation coefficient.
+    :param: errors:       dict; Input name (see `INPUTS`) to the standard
+                          deviation of its error.
+    :param: seed:         int; Random seed.
+
+    :return:  dict; "attenuation" and every input with an error, to a 1D
+              array with a value per member.
+    """
+    rng = np.random.RandomState(seed)
+    draws = {"attenuation": rng.normal(attenuation[0], attenuation[1],
+                                       n_members)}
+    for name, sd in sorted((errors or {}).items()):
+        draws[name] = rng.normal(0.0, sd, n_members)
+    return draws
+
+
+def evaluate_members(inputs, draws, hsi=None):
+    """Evaluates the derived predictors for a batch of members.
+
+    :param: inputs:  dict; Input name to a 1D array of cell values.
+    :param: draws:   dict; Member draws, see `member_draws`, for the batch.
+    :param: hsi:     callable; Optional function of the dict of predictor
+                     arrays returning a habitat suitability index array.
+
+    :return:  dict; Predictor name to a `(members, cells)` array.
+    """
+    n_members = len(draws["attenuation"])
+
+    def value(name):
+        error = draws.get(name)
+        if error is None:
+            return np.broadcast_to(inputs[name], (n_members,
+                                                  inputs[name].size))
+        return inputs[name][None] + error[:, None]
+
+    depth_m = kernels.depth(value("mtl"), value("bed_elevation"))
+    predictors = {
+        "depth": depth_m,
+        "pla": kernels.per_light_available(
+            depth_m, draws["attenuation"][:, None]),
+        "esd": kernels.epi_sed_dep(value("mhhw"), value("wse_median"),
+                                   value("wse_100")),
+        "exp_dur": kernels.expo_dur(value("wse_100"), value("wse_0"),
+                                    value("mhhw"), value("mllw"))}
+    if hsi is not None:
+        predictors["hsi"] = hsi(predictors)
+    return predictors
+
+
+def nan_quantiles(samples, quantiles):
+    """Calculates quantiles along the first axis, ignoring NaN.
+
+    Linear interpolation between the sorted valid values, as in
+    `numpy.quantile`, vectorized over columns with different numbers of valid
+    values.
+
+    :param: samples:    numpy.ndarray; A `(members, cells)` array.
+    :param: quantiles:  list; Quantiles between 0 and 1.
+
+    :return:  numpy.ndarray; A `(quantiles, cells)` array, NaN for cells
+              without valid values.
+    """
+    ordered = np.sort(samples, axis=0)
+    valid = np.count_nonzero(~np.isnan(samples), axis=0)
+    result = np.full((len(quantiles), samples.shape[1]), np.nan)
+    has_data = valid > 0
+    for i, quantile in enumerate(quantiles):
+        position = quantile * (valid - 1)
+        below = np.floor(position).astype(int)
+        above = np.minimum(below + 1, np.maximum(valid - 1, 0))
+        fraction = position - below
+        low = np.take_along_axis(ordered, below[None], axis=0)[0]
+        high = np.take_along_axis(ordered, above[None], axis=0)[0]
+        result[i, has_data] = (low + (high - low) * fraction)[has_data]
+    return result
+
+
+def tile_statistics(samples, quantiles):
+    """Returns the mean, standard deviation and quantiles of each cell."""
+    valid = ~np.isnan(samples)
+    count = valid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, samples, 0.0).sum(axis=0) / count
+        squares = np.where(valid, (samples - mean) ** 2, 0.0).sum(axis=0)
+        std = np.sqrt(squares / count)
+    return mean, std, nan_quantiles(samples, quantiles)
+
+
+def tile_size_for(n_members, n_outputs, memory_budget):
+    """Returns the edge length of tiles whose members fit the budget."""
+    cells = memory_budget // (n_members * n_outputs * 8)
+    return max(16, int(np.sqrt(cells)))
+
+
+def ensemble(path_to_alt, output_folder, n_members=100,
+             attenuation=(1.39, 0.0), errors=None, quantiles=(0.05, 0.5, 0.95),
+             hsi=None, memory_budget=2 ** 29, batch_size=64, seed=0):
+    """Calculates ensemble statistics of the derived predictors.
+
+    :param: path_to_alt:    string; Path to the scenario folder.
+    :param: output_folder:  string; Folder the statistics are written to.
+    :param: n_members:      int; Number of ensemble members.
+    :param: attenuation:    tuple; Mean and standard deviation of the light
+                            attenuation coefficient.
+    :param: errors:         dict; Input name (see `INPUTS`) to the standard
+                            deviation of its error.
+    :param: quantiles:      tuple; Quantiles to calculate, between 0 and 1.
+    :param: hsi:            callable; Optional habitat suitability index, see
+                            `evaluate_members`.
+    :param: memory_budget:  int; Bytes available for the members of a tile.
+    :param: batch_size:     int; Number of members evaluated at once.
+    :param: seed:           int; Random seed.
+
+    :return:  list; Paths of the rasters written, also recorded in the run
+              manifest of the output folder.
+    """
+    paths = {name: find_raster(os.path.join(path_to_alt, folder), name)
+             for name, folder in WATER_LEVELS.items()}
+    paths["bed_elevation"] = find_raster(path_to_alt, "bed_elevation")
+    ext = os.path.splitext(paths["mtl"])[1]
+    grid = raster_io.read_grid(paths["mtl"])
+
+    draws = member_draws(n_members, attenuation, errors, seed)
+    names = PREDICTORS + (["hsi"] if hsi is not None else [])
+    statistics = ["mean", "std"] + [f"q{round(q * 100):02d}"
+                                    for q in quantiles]
+    # Each tile's statistics are written as they are calculated
+    os.makedirs(output_folder, exist_ok=True)
+    outputs = {(name, stat): raster_io.open_output(
+                   os.path.join(output_folder, f"{name}_{stat}{ext}"), grid)
+               for name in names for stat in statistics}
+
+    tile_size = tile_size_for(n_members, len(names), memory_budget)
+    for window in raster_io.windows(grid, tile_size):
+        _, _, nrows, ncols = window
+        inputs = {name: raster_io.read_array(path, window).ravel()
+                  for name, path in paths.items()}
+        samples = {name: np.empty((n_members, nrows * ncols))
+                   for name in names}
+        for start in range(0, n_members, batch_size):
+            batch = {key: values[start:start + batch_size]
+                     for key, values in draws.items()}
+            for name, values in evaluate_members(inputs, batch, hsi).items():
+                samples[name][start:start + batch_size] = values
+
+        for name in names:
+            mean, std, quantile_values = tile_statistics(samples[name],
+                                                         quantiles)
+            tile_values = [mean, std] + list(quantile_values)
+            for stat, values in zip(statistics, tile_values):
+                raster_io.write_window(outputs[(name, stat)],
+                                       values.reshape(nrows, ncols), window)
+
+    with raster_io.manifest(output_folder):
+        for output in outputs.values():
+            raster_io.close_output(output)
+    return [output.path for output in outputs.values()]
+
+
+def main(path_to_alt, output_folder, n_members, attenuation_sd, level_sd):
+    level_sd = float(level_sd or 0)
+    written = ensemble(path_to_alt, output_folder, int(n_members),
+                       attenuation=(1.39, float(attenuation_sd or 0)),
+                       errors={name: level_sd for name in INPUTS})
+    add_message(f"Wrote {len(written)} ensemble statistics rasters.")
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    path_to_alt = arcpy.GetParameterAsText(0)
+    output_folder = arcpy.GetParameterAsText(1)
+    n_members = arcpy.GetParameterAsText(2)
+    attenuation_sd = arcpy.GetParameterAsText(3)
+    level_sd = arcpy.GetParameterAsText(4)
+
+    main(path_to_alt, output_folder, n_members, attenuation_sd, level_sd)
@@ -0,0 +1,260 @@
+"""This module contains functions for filtering AdH mesh node points with
+vectorized numpy masks.
+
+`update_AdH_predictors` selects the nodes to interpolate with simple SQL
+where-clauses such as "MHHW > -3 AND MHHW < 3" or "vel_90 > -1". These are
+parsed into `(field, operator, value)` predicates and evaluated as boolean
+masks over point columns (see `points.read_points`). Masks of repeated
+predicates are cached, and the minimum and maximum of each column are used to
+skip predicates that every node satisfies, which is the usual case.
+
+Only conjunctions (AND) of comparisons between a field and a number are
+supported; `parse` raises ValueError for anything else, so callers can fall
+back to the database.
+"""
+import functools
+import os
+import re
+
+import numpy as np
+
+try:
+    from . import points
+    from .journal import file_state
+except ImportError:
+    import points
+    from journal import file_state
+
+
+OPERATORS = {">": np.greater, ">=": np.greater_equal,
+             "<": np.less, "<=": np.less_equal,
+             "=": np.equal, "<>": np.not_equal, "!=": np.not_equal}
+# Operator with its sides swapped, for "value op field" predicates
+_SWAPPED = {">": "<", ">=": "<=", "<": ">", "<=": ">=", "=": "=",
+            "<>": "<>", "!=": "!="}
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_FIELD = r"[A-Za-z_]\w*"
+_OPERATOR = r">=|<=|<>|!=|=|>|<"
+_FIELD_FIRST = re.compile(
+    rf"^\s*({_FIELD})\s*({_OPERATOR})\s*({_NUMBER})\s*$")
+_VALUE_FIRST = re.compile(
+    rf"^\s*({_NUMBER})\s*({_OPERATOR})\s*({_FIELD})\s*$")
+_AND = re.compile(r"\s+AND\s+", re.IGNORECASE)
+
+
+class _Uncached:
+    """Passes a value through `functools.lru_cache` without it being part of
+    the key, e.g. columns already read from the point set of the key."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return 0
+
+    def __eq__(self, other):
+        return isinstance(other, _Uncached)
+
+
+def parse(sql_select):
+    """Parses a where-clause into predicates.
+
+    :param: sql_select:  string; A where-clause, e.g. "MHHW > -3 AND
+                         MHHW < 3". An empty clause selects every point.
+
+    :return:  tuple; Sorted `(field, operator, value)` predicates.
+    """
+    predicates = []
+    if not sql_select or not sql_select.strip():
+        return ()
+    for term in _AND.split(sql_select.strip()):
+        match = _FIELD_FIRST.match(term)
+        if match:
+            field, operator, value = match.groups()
+        else:
+            match = _VALUE_FIRST.match(term)
+            if not match:
+                raise ValueError(f"Unsupported filter: {sql_select}")
+            value, operator, field = match.groups()
+            operator = _SWAPPED[operator]
+        predicates.append((field, operator, float(value)))
+    return tuple(sorted(predicates))
+
+
+def column_stats(values):
+    """Returns the minimum and maximum of a column and whether it has NaNs."""
+    values = np.asarray(values, dtype=np.float64)
+    nodata = np.isnan(values)
+    if nodata.all():
+        return np.nan, np.nan, bool(values.size)
+    return (float(np.nanmin(values)), float(np.nanmax(values)),
+            bool(nodata.any()))
+
+
+def holds_for_range(predicate, stats):
+    """Tests whether a predicate holds for every value in a column.
+
+    :param: predicate:  tuple; A `(field, operator, value)` predicate.
+    :param: stats:      tuple; `column_stats` of the field.
+
+    :return:  bool; True if the predicate is known to select every value.
+    """
+    _, operator, value = predicate
+    lowest, highest, has_nan = stats
+    if has_nan:
+        # NaN (NULL) fails every comparison
+        return False
+    if operator == ">":
+        return lowest > value
+    if operator == ">=":
+        return lowest >= value
+    if operator == "<":
+        return highest < value
+    if operator == "<=":
+        return highest <= value
+    if operator == "=":
+        return lowest == highest == value
+    return value < lowest or value > highest
+
+
+def evaluate(predicates, columns, stats=None):
+    """Evaluates predicates as a boolean mask.
+
+    :param: predicates:  tuple; Predicates from `parse`.
+    :param: columns:     dict; Column name to 1D array.
+    :param: stats:       dict; Optional field to `column_stats`. Predicates
+                         that hold for the whole range of their field are not
+                         evaluated.
+
+    :return:  numpy.ndarray; Boolean mask of the selected rows, or None if
+              every row is selected.
+    """
+    mask = None
+    for predicate in predicates:
+        field, operator, value = predicate
+        if stats is not None and holds_for_range(predicate, stats[field]):
+            continue
+        with np.errstate(invalid="ignore"):
+            selected = OPERATORS[operator](columns[field], value)
+        if operator in ("<>", "!="):
+            selected &= ~np.isnan(columns[field])
+        mask = selected if mask is None else mask & selected
+    return mask
+
+
+def point_source(adh_points):
+    """Returns a key identifying the current content of a point set.
+
+    The key changes when the point set is modified; for shapefiles, whose
+    attributes live in the `.dbf`, when any of its files is.
+    """
+    path = str(adh_points)
+    return os.path.abspath(path), tuple(file_state(path) or ())
+
+
+@functools.lru_cache(maxsize=256)
+def _column_stats(source, field, columns):
+    columns = columns.value
+    if columns is None or field not in columns:
+        columns = points.read_points(source[0], [field])
+    return column_stats(columns[field])
+
+
+def point_stats(adh_points, fields, columns=None):
+    """Returns the `column_stats` of point fields, through a cache.
+
+    :param: adh_points:  string; Path to a point feature class or a `.npz`
+                         archive.
+    :param: fields:      list; Names of the fields.
+    :param: columns:     dict; Columns already read from the point set.
+
+    :return:  dict; Field to `column_stats`.
+    """
+    source = point_source(adh_points)
+    return {field: _column_stats(source, field, _Uncached(columns))
+            for field in fields}
+
+
+def selects_all(adh_points, sql_select):
+    """Tests whether a where-clause selects every point of a point set.
+
+    :param: adh_points:  string; Path to a point feature class or a `.npz`
+                         archive.
+    :param: sql_select:  string; A where-clause.
+
+    :return:  bool; True if the clause is known to select every point. False
+              if it does not, or if it cannot be parsed or evaluated here.
+    """
+    try:
+        predicates = parse(sql_select)
+        stats = point_stats(adh_points, sorted({p[0] for p in predicates}))
+    except (KeyError, ValueError, RuntimeError):
+        # e.g. an unknown field; leave the clause to the database
+        return False
+    return all(holds_for_range(predicate, stats[predicate[0]])
+               for predicate in predicates)
+
+
+@functools.lru_cache(maxsize=32)
+def _filter_mask(source, predicates, columns):
+    fields = sorted({predicate[0] for predicate in predicates})
+    columns = columns.value
+    if columns is None or not set(fields) <= set(columns):
+        columns = points.read_points(source[0], fields)
+    stats = {field: _column_stats(source, field, _Uncached(columns))
+             for field in fields}
+    return evaluate(predicates, columns, stats)
+
+
+def filter_mask(adh_points, sql_select, columns=None):
+    """Returns the mask of the points a where-clause selects.
+
+    Masks are cached by point set and predicates, so repeated filters on the
+    same points are free.
+
+    :param: adh_points:  string; Path to a point feature class or a `.npz`
+                         archive.
+    :param: sql_select:  string; A where-clause.
+    :param: columns:     dict; Columns already read from the point set. The
+                         fields of the clause are read if omitted.
+
+    :return:  numpy.ndarray; Boolean mask of the selected points, or None if
+              every point is selected.
+    """
+    return _filter_mask(point_source(adh_points), parse(sql_select),
+                        _Uncached(columns))
+
+
+def clear_cache():
+    """Forgets all cached column statistics and masks."""
+    _column_stats.cache_clear()
+    _filter_mask.cache_clear()
+
+
+def write_selection(adh_points, variable, sql_select, output_path,
+                    spatial_reference):
+    """Writes the points a where-clause selects to a point feature class.
+
+    The selection is the vectorized `filter_mask`, so arcpy tools such as
+    `SplineWithBarriers` read only the selected points instead of
+    evaluating the clause in a feature layer.
+
+    :param: adh_points:         string; Path to a point feature class or a
+                                `.npz` archive.
+    :param: variable:           string; The column written with the points.
+    :param: sql_select:         string; A where-clause, see `parse`.
+    :param: output_path:        string; Path of the feature class.
+    :param: spatial_reference:  arcpy.SpatialReference; The coordinate
+                                system of the points.
+
+    :return:  string; The path of the feature class.
+    """
+    fields = sorted({variable} | {field for field, _, _ in
+                                  parse(sql_select)})
+    columns = points.read_points(adh_points, fields)
+    selected = filter_mask(adh_points, sql_select, columns)
+    columns = {name: columns[name] for name in ("x", "y", variable)}
+    if selected is not None:
+        columns = {name: column[selected] for name, column in columns.items()}
+    return points.write_feature_class(columns, output_path,
+                                      spatial_reference)
@@ -0,0 +1,579 @@
+"""Calculate the AdH rasters of an alternative near its project footprint.
+
+An alternative (a breakwater, a marsh restoration, a channel deepening)
+usually changes the hydrodynamics only near its footprint, yet
+`update_AdH_predictors` interpolates every predictor over the whole domain.
+Here the AdH node values of the alternative are compared to the FWOP exports
+on the same mesh, and only the tiles of the mask grid within a halo of the
+nodes that changed by more than a tolerance (the region of influence, see
+`find_region`) are calculated. Every other cell is taken from the FWOP
+raster of the same predictor.
+
+Interpolated and derived predictors are calculated on a region mask covering
+those tiles (see `footprint_steps`) and merged with the FWOP raster; copied
+predictors are copied as usual. The halo has to cover the reach of the
+interpolation, so a changed node does not alter cells outside the region. It
+is derived from the mesh (see `interpolation_reach`): the distance from a
+mask cell to its farthest nearest node for inverse distance weighting, the
+longest triangle edge at a changed node for linear interpolation. The spline
+has global support, but the effect of a changed node fades with distance:
+spline steps take a fixed halo of `SPLINE_HALO_CELLS` cells, and are fitted
+to the nodes up to that halo beyond the region (see `calculate_region`),
+which keeps them within a tolerance of a full run rather than matching it.
+Barrier regions are found within the bounding box of the region, so water
+connected around a barrier only outside that box is treated as separated.
+Predictors without a FWOP raster are calculated in full.
+
+:param: path_to_fwop:   string; Path to the parent folder of the existing
+                        condition scenario (aka, Future WithOut Project,
+                        FWOP).
+:param: path_to_alt:    string; Path to the parent folder of the alternative.
+:param: adh_velocity:   string; Path to the AdH velocity results of the
+                        alternative.
+:param: adh_salinity:   string; Path to the AdH salinity results of the
+                        alternative.
+:param: adh_wse:        string; Path to the AdH water surface elevation
+                        results of the alternative.
+:param: fwop_velocity:  string; Path to the AdH velocity results of the FWOP,
+                        on the same mesh.
+:param: fwop_salinity:  string; Path to the AdH salinity results of the FWOP.
+:param: fwop_wse:       string; Path to the AdH water surface elevation
+                        results of the FWOP.
+:param: barriers:       line feature class; A line feature class
+                        representing barriers used during interpolation.
+:param: mask:           raster; The mask raster the FWOP was calculated on.
+:param: tolerance:      string; Smallest change of a node value that counts,
+                        in the units of the variable. Defaults to
+                        `TOLERANCE`.
+:param: halo:           string; Distance in map units around the changed
+                        nodes that is recalculated. Defaults to the reach of
+                        the interpolation.
+
+:return:    None. AdH rasters for the alternative written to the appropriate
+            subfolder for each model.
+"""
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+
+try:
+    from . import (align, decompose, filters, interpolate, points, preflight,
+                   raster_io, staging, utils)
+    from .barriers import prepared_feature_class
+    from .journal import file_state
+    from .update_AdH_predictors import run_steps, scenario_steps, step_outputs
+except ImportError:
+    import align
+    import decompose
+    import filters
+    import interpolate
+    import points
+    import preflight
+    import raster_io
+    import staging
+    import utils
+    from barriers import prepared_feature_class
+    from journal import file_state
+    from update_AdH_predictors import run_steps, scenario_steps, step_outputs
+
+
+TOLERANCE = 0.001
+TILE_SIZE = 256
+# Mask cells sampled for the reach of inverse distance weighting
+REACH_SAMPLES = 2 ** 20
+FOOTPRINT_FOLDER = ".footprint"
+# Halo of the spline steps in cells: the region reaches this far from the
+# changed nodes, and the spline is fitted to the nodes this far beyond it
+SPLINE_HALO_CELLS = 64
+# Steps calculated on the region mask; others (copies) run as usual
+FOOTPRINT_FUNCTIONS = ("adh2raster", "rel_velocity", "epi_sed_dep", "depth",
+                       "per_light_available", "expo_dur")
+
+
+def is_local(step):
+    """Tests whether a changed node alters only the cells within a reach of
+    it in the interpolation of a step; not so for the spline, which is
+    limited to a fixed halo instead (see `SPLINE_HALO_CELLS`)."""
+    return step["function"] != "adh2raster" or \
+        step["args"].get("method", "spline") != "spline"
+
+
+def export_fields(steps):
+    """Returns the AdH exports the steps interpolate and the columns read
+    from each (the variables and the columns of the where-clauses)."""
+    fields = {}
+    for step in steps:
+        if step["function"] != "adh2raster":
+            continue
+        args = step["args"]
+        fields.setdefault(args["adh_points"], set()).update(
+            {args["variable"]} |
+            {field for field, _, _ in filters.parse(args["sql_select"])})
+    return {adh_points: sorted(names) for adh_points, names in fields.items()}
+
+
+def changed_nodes(adh_points, fwop_points, fields, tolerance=TOLERANCE):
+    """Finds the nodes whose values differ between two exports of a mesh.
+
+    :param: adh_points:   string; Path to the export of the alternative.
+    :param: fwop_points:  string; Path to the export of the FWOP.
+    :param: fields:       list; Names of the columns to compare.
+    :param: tolerance:    float; Smallest difference that counts.
+
+    :return:  tuple; The x and y coordinates of the changed nodes.
+    """
+    alt = points.read_points(adh_points, fields)
+    fwop = points.read_points(fwop_points, fields)
+    if len(alt["x"]) != len(fwop["x"]) or \
+            not np.allclose(alt["x"], fwop["x"]) or \
+            not np.allclose(alt["y"], fwop["y"]):
+        raise ValueError(f"{adh_points} and {fwop_points} are not on the "
+                         f"same AdH mesh; update the predictors in full.")
+    changed = np.zeros(len(alt["x"]), dtype=bool)
+    for field in fields:
+        changed |= ~np.isclose(np.asarray(alt[field], dtype=np.float64),
+                               np.asarray(fwop[field], dtype=np.float64),
+                               rtol=0.0, atol=tolerance, equal_nan=True)
+    return alt["x"][changed], alt["y"][changed]
+
+
+def region_windows(grid, xs, ys, halo, tile_size=TILE_SIZE):
+    """Returns the tiles of a grid within a distance of points.
+
+    :param: grid:       Grid; The grid.
+    :param: xs:         array; x coordinates of the points.
+    :param: ys:         array; y coordinates of the points.
+    :param: halo:       float; The distance in map units.
+    :param: tile_size:  int; Edge length of the tiles in cells.
+
+    :return:  list; The `(row_off, col_off, nrows, ncols)` windows of the
+              tiles, see `raster_io.windows`.
+    """
+    tile_rows = -(-grid.nrows // tile_size)
+    tile_cols = -(-grid.ncols // tile_size)
+    reach = int(math.ceil(halo / grid.cell_size))
+    rows, cols = raster_io.cell_index(grid, xs, ys)
+    near = ((rows + reach >= 0) & (rows - reach < grid.nrows) &
+            (cols + reach >= 0) & (cols - reach < grid.ncols))
+    rows, cols = rows[near], cols[near]
+
+    # Each point marks the rectangle of tiles within its reach; the
+    # rectangles are summed with a 2D difference array
+    top = np.clip((rows - reach) // tile_size, 0, tile_rows - 1)
+    bottom = np.clip((rows + reach) // tile_size, 0, tile_rows - 1) + 1
+    left = np.clip((cols - reach) // tile_size, 0, tile_cols - 1)
+    right = np.clip((cols + reach) // tile_size, 0, tile_cols - 1) + 1
+    marks = np.zeros((tile_rows + 1, tile_cols + 1), dtype=np.int64)
+    np.add.at(marks, (top, left), 1)
+    np.add.at(marks, (top, right), -1)
+    np.add.at(marks, (bottom, left), -1)
+    np.add.at(marks, (bottom, right), 1)
+    touched = marks.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0
+    return [window for window in raster_io.windows(grid, tile_size)
+            if touched[window[0] // tile_size, window[1] // tile_size]]
+
+
+def cell_reach(tree, mask, xs, ys, neighbours,
+               sample_cells=REACH_SAMPLES):
+    """Returns the distance within which nodes are among the nearest nodes
+    of the mask cells.
+
+    A node is one of the `neighbours` nearest nodes of a cell only if it is
+    no farther from the cell than the farthest of them. The distance to the
+    farthest nearest node is found on the centers of a coarse grid of at
+    most `sample_cells` cells, and widened by the distance from a center to
+    the fine cells around it.
+
+    :param: tree:          cKDTree; Tree of the nodes.
+    :param: mask:          string; Path to the mask raster.
+    :param: xs:            array; x coordinates of the changed nodes.
+    :param: ys:            array; y coordinates of the changed nodes.
+    :param: neighbours:    int; Number of nearest nodes of a cell.
+    :param: sample_cells:  int; Most coarse cells sampled.
+
+    :return:  float; The distance in map units, 0 without changed nodes
+              near the mask.
+    """
+    from scipy.spatial import cKDTree
+
+    if not len(xs):
+        return 0.0
+    grid = raster_io.read_grid(mask)
+    factor = max(1, int(math.ceil(math.sqrt(grid.nrows * grid.ncols /
+                                            sample_cells))))
+    coarse = raster_io.coarsen_grid(grid, factor)
+    covered = np.zeros((coarse.nrows, coarse.ncols), dtype=bool)
+    for row, col, nrows, ncols in raster_io.windows(grid, factor * 128):
+        block = ~np.isnan(raster_io.aggregate(
+            raster_io.read_array(mask, (row, col, nrows, ncols)), factor,
+            "max"))
+        covered[row // factor:row // factor + block.shape[0],
+                col // factor:col // factor + block.shape[1]] = block
+    rows, cols = np.nonzero(covered)
+    col_xs, row_ys = raster_io.cell_centers(coarse)
+    xy = np.column_stack([col_xs[cols], row_ys[rows]])
+    k = min(neighbours, tree.n)
+    farthest = tree.query(xy, k=k)[0]
+    if k > 1:
+        farthest = farthest[:, -1]
+    changed = cKDTree(np.column_stack([xs, ys])).query(xy)[0]
+    slack = factor * grid.cell_size / math.sqrt(2)
+    # Coarse cells with a fine cell that may have a changed nearest node
+    near = changed <= farthest + 2 * slack
+    return float(farthest[near].max() + slack) if near.any() else 0.0
+
+
+def triangle_reach(tree, xs, ys):
+    """Returns the longest edge of the triangles of the nodes at the changed
+    nodes, the farthest a cell of such a triangle is from a changed node.
+
+    :param: tree:  cKDTree; Tree of the nodes.
+    :param: xs:    array; x coordinates of the changed nodes.
+    :param: ys:    array; y coordinates of the changed nodes.
+
+    :return:  float; The distance in map units.
+    """
+    from scipy.spatial import Delaunay
+
+    distance, nodes = tree.query(np.column_stack([xs, ys]))
+    nodes = nodes[distance == 0]
+    if not nodes.size or tree.n < 3:
+        return 0.0
+    indptr, indices = Delaunay(tree.data).vertex_neighbor_vertices
+    counts = indptr[nodes + 1] - indptr[nodes]
+    if not counts.sum():
+        return 0.0
+    ends = np.concatenate([indices[indptr[node]:indptr[node + 1]]
+                           for node in nodes])
+    starts = np.repeat(nodes, counts)
+    return float(np.hypot(*(tree.data[ends] - tree.data[starts]).T).max())
+
+
+def interpolation_reach(steps, fwop_exports, mask, changed):
+    """Returns the distance from the changed nodes within which they alter
+    the cells interpolated by the steps.
+
+    The reach is that of the nodes of the alternative and of the FWOP, so it
+    covers a node entering or leaving the where-clause. Spline steps reach
+    `SPLINE_HALO_CELLS` cells, see `is_local`.
+
+    :param: steps:         list; Steps from `scenario_steps`.
+    :param: fwop_exports:  dict; Path to each AdH export of the alternative
+                           to the FWOP export of the same results.
+    :param: mask:          string; Path to the mask raster.
+    :param: changed:       dict; Path to each AdH export of the alternative
+                           to the x and y coordinates of its changed nodes.
+
+    :return:  float; The distance in map units.
+    """
+    reach = 0.0
+    for step in steps:
+        args = step["args"]
+        if step["function"] != "adh2raster" or \
+                not len(changed.get(args["adh_points"], ((), ()))[0]):
+            continue
+        if not is_local(step):
+            reach = max(reach, SPLINE_HALO_CELLS *
+                        raster_io.read_grid(mask).cell_size)
+            continue
+        xs, ys = changed[args["adh_points"]]
+        for adh_points in (args["adh_points"],
+                           fwop_exports[args["adh_points"]]):
+            tree, _ = interpolate.node_tree(adh_points, args["variable"],
+                                            args["sql_select"])
+            if args["method"] == "linear":
+                reach = max(reach, triangle_reach(tree, xs, ys))
+                continue
+            # With barriers, cells take their nodes from further candidates
+            neighbours = interpolate.NEIGHBOURS * (
+                interpolate.RETRY if args.get("barriers") else 1)
+            reach = max(reach, cell_reach(tree, mask, xs, ys, neighbours))
+    return reach
+
+
+def write_region_mask(mask, windows, folder):
+    """Writes the mask cells of tiles to a raster on their bounding box.
+
+    The raster is named by the state of the mask and the tiles, and reused
+    while they are unchanged, so the steps reading it resume.
+
+    :param: mask:     string; Path to the mask raster.
+    :param: windows:  list; The tiles, see `region_windows`.
+    :param: folder:   string; Folder of the region mask.
+
+    :return:  string; Path to the region mask, or "" without tiles.
+    """
+    if not windows:
+        return ""
+    key = hashlib.sha1(json.dumps([file_state(str(mask)),
+                                   windows]).encode("utf-8"))
+    ext = ".npy" if raster_io.is_numpy_raster(mask) else ".tif"
+    path = os.path.join(folder, f"region_{key.hexdigest()[:12]}{ext}")
+    if os.path.exists(path):
+        return path
+
+    top = min(row for row, _, _, _ in windows)
+    left = min(col for _, col, _, _ in windows)
+    bottom = max(row + nrows for row, _, nrows, _ in windows)
+    right = max(col + ncols for _, col, _, ncols in windows)
+    array = np.full((bottom - top, right - left), np.nan, dtype=np.float32)
+    for row, col, nrows, ncols in windows:
+        array[row - top:row - top + nrows, col - left:col - left + ncols] = \
+            raster_io.read_array(mask, (row, col, nrows, ncols))
+    os.makedirs(folder, exist_ok=True)
+    raster_io.write_array(array, raster_io.window_grid(
+        raster_io.read_grid(mask), (top, left, bottom - top, right - left)),
+        path)
+    return path
+
+
+def find_region(steps, fwop_exports, mask, folder, tolerance=TOLERANCE,
+                halo=None, tile_size=TILE_SIZE):
+    """Finds the region of influence of an alternative.
+
+    :param: steps:         list; Steps from `scenario_steps`.
+    :param: fwop_exports:  dict; Path to each AdH export of the alternative
+                           to the FWOP export of the same results.
+    :param: mask:          string; Path to the mask raster.
+    :param: folder:        string; Folder of the region mask.
+    :param: tolerance:     float; Smallest change of a node value that
+                           counts.
+    :param: halo:          float; Distance in map units around the changed
+                           nodes. Defaults to the reach of the
+                           interpolation, see `interpolation_reach`.
+    :param: tile_size:     int; Edge length of the tiles in cells.
+
+    :return:  string; Path to the region mask, see `write_region_mask`.
+    """
+    grid = raster_io.read_grid(mask)
+    changed = {}
+    for adh_points, fields in export_fields(steps).items():
+        changed[adh_points] = changed_nodes(
+            adh_points, fwop_exports[adh_points], fields, tolerance)
+        utils.add_message(f"{len(changed[adh_points][0])} nodes of "
+                          f"{adh_points} changed.")
+    # A cell is as far as a cell size from the cell of a node it reaches
+    reach = interpolation_reach(steps, fwop_exports, mask, changed) + \
+        grid.cell_size
+    if halo is None:
+        halo = reach
+        utils.add_message(f"The interpolation reaches {halo:g} map units "
+                          f"from the changed nodes.")
+    elif halo < reach:
+        utils.add_message(f"WARNING: The halo of {halo:g} map units is "
+                          f"shorter than the reach of the interpolation, "
+                          f"{reach:g}; cells outside the region may differ "
+                          f"from a full run.")
+    xs = [x for x, _ in changed.values()]
+    ys = [y for _, y in changed.values()]
+    windows = region_windows(grid, np.concatenate(xs or [[]]),
+                             np.concatenate(ys or [[]]), halo, tile_size)
+    utils.add_message(f"{len(windows)} of "
+                      f"{len(raster_io.windows(grid, tile_size))} tiles are "
+                      f"recalculated.")
+    return write_region_mask(mask, windows, folder)
+
+
+def fwop_raster(step, path_to_fwop, path_to_alt):
+    """Returns the FWOP raster of the predictor a step writes, or None."""
+    output = os.path.relpath(step_outputs(step)[0], path_to_alt)
+    stem = os.path.join(path_to_fwop, os.path.splitext(output)[0])
+    for ext in (".tif", ".npy"):
+        if os.path.exists(stem + ext):
+            return stem + ext
+    return None
+
+
+def footprint_steps(steps, path_to_fwop, path_to_alt, region_mask):
+    """Turns interpolated and derived predictor steps into steps calculating
+    the region of influence only (see `utils.footprint_raster`).
+
+    Steps without a FWOP raster and the steps deriving predictors from their
+    outputs are left to run in full.
+
+    :param: steps:         list; Steps from `scenario_steps`.
+    :param: path_to_fwop:  string; Path to the FWOP folder.
+    :param: path_to_alt:   string; Path to the alternative folder.
+    :param: region_mask:   string; Path to the region mask, "" if no node
+                           changed.
+
+    :return:  list; The updated steps.
+    """
+    updated = []
+    # Outputs calculated in full, which predictors derived from them are too
+    full = set()
+    for step in steps:
+        fwop = fwop_raster(step, path_to_fwop, path_to_alt)
+        # Rasters by path without extension, `.tif` or `.npy`
+        inputs = {os.path.splitext(os.path.abspath(value))[0]
+                  for value in step["args"].values()
+                  if isinstance(value, str) and value}
+        if step["function"] not in FOOTPRINT_FUNCTIONS:
+            updated.append(step)
+            continue
+        if fwop is None or inputs & full:
+            full.update(os.path.splitext(os.path.abspath(path))[0]
+                        for path in step_outputs(step))
+            updated.append(step)
+            continue
+        args = dict(step["args"], function=step["function"],
+                    region_mask=region_mask, fwop_raster=fwop)
+        updated.append(dict(step, function="footprint_raster", args=args))
+    return updated
+
+
+def calculate_region(function, region_mask, folder, output_name, **args):
+    """Calculates a predictor on a region mask.
+
+    The spline is fitted to the nodes within `SPLINE_HALO_CELLS` cells of
+    the bounding box of the region.
+
+    :return:  string; Path of the raster written, on the grid of the region
+              mask.
+    """
+    try:
+        from . import pipeline
+    except ImportError:
+        import pipeline
+
+    if function == "adh2raster":
+        nodes = ""
+        if not is_local({"function": function, "args": args}):
+            grid = raster_io.read_grid(region_mask)
+            nodes = os.path.join(folder, f"{output_name}_points.npz")
+            decompose.crop_points(
+                args["adh_points"], args["variable"], args["sql_select"],
+                grid, (0, 0, grid.nrows, grid.ncols), nodes,
+                margin=SPLINE_HALO_CELLS * grid.cell_size)
+            args = dict(args, adh_points=nodes, sql_select="")
+        try:
+            utils.adh2raster(folder, output_name,
+                             **dict(args, mask=region_mask))
+        finally:
+            if nodes and os.path.exists(nodes):
+                os.remove(nodes)
+    elif all(raster_io.is_numpy_raster(raster) for raster in args.values()):
+        pipeline.derive(function, folder, output_name,
+                        grid=raster_io.read_grid(region_mask), **args)
+    else:
+        import arcpy
+
+        with arcpy.EnvManager(extent=region_mask, snapRaster=region_mask):
+            getattr(utils, function)(folder, output_name, **args)
+    path = os.path.join(folder, str(output_name) + ".npy")
+    return path if os.path.exists(path) else path[:-len(".npy")] + ".tif"
+
+
+def merge(calculated, fwop_raster, region_mask, output_path, profile,
+          tile_size=1024):
+    """Writes a raster from the cells of the region mask of one raster and
+    the other cells of another.
+
+    :param: calculated:   string; Path to the raster calculated on the
+                          region mask, or None.
+    :param: fwop_raster:  string; Path to the FWOP raster, whose grid the
+                          output has.
+    :param: region_mask:  string; Path to the region mask.
+    :param: output_path:  string; Path of the output raster.
+    :param: profile:      string; Storage profile of the output.
+    :param: tile_size:    int; Edge length of the windows in cells.
+
+    :return:  None. Accomplishes the side effect of writing the raster.
+    """
+    grid = align.read_grid(fwop_raster)
+    output = raster_io.open_output(output_path, grid, profile)
+    for window in raster_io.windows(grid, tile_size):
+        values = align.read_aligned(fwop_raster, grid, window)
+        if calculated:
+            inside = ~np.isnan(align.read_aligned(region_mask, grid, window))
+            if inside.any():
+                values = np.where(inside, align.read_aligned(
+                    calculated, grid, window), values)
+        raster_io.write_window(output, values, window)
+    raster_io.close_output(output)
+
+
+def recompute(function, region_mask, fwop_raster, output_folder,
+              output_name, **args):
+    """Calculates a predictor on the region of influence and takes its other
+    cells from the FWOP raster.
+
+    :param: function:       string; Name of the `utils` function of the
+                            predictor.
+    :param: region_mask:    string; Path to the region mask, or "".
+    :param: fwop_raster:    string; Path to the FWOP raster of the
+                            predictor.
+    :param: output_folder:  string; Path to the output folder.
+    :param: output_name:    string; Name of the output raster.
+    :param: args:           Further arguments of the `utils` function.
+
+    :return:  string; Path of the raster written. It is a `.npy` raster if
+              the predictor is calculated as one.
+    """
+    calculated = None
+    if region_mask:
+        folder = os.path.join(output_folder, FOOTPRINT_FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        calculated = calculate_region(function, region_mask, folder,
+                                      output_name, **args)
+    ext = os.path.splitext(calculated or fwop_raster)[1]
+    output_path = os.path.join(output_folder, str(output_name) + ext)
+    merge(calculated, fwop_raster, region_mask, output_path,
+          raster_io.storage_profile(output_name))
+    if calculated:
+        raster_io.delete_raster(calculated)
+    return output_path
+
+
+def main(path_to_fwop, path_to_alt, adh_velocity, adh_salinity, adh_wse,
+         fwop_velocity, fwop_salinity, fwop_wse, barriers, mask,
+         tolerance="", halo="", resume=True):
+    import arcpy
+
+    arcpy.env.compression = "LZW"
+    arcpy.env.overwriteOutput = True
+
+    preflight.require_valid(
+        scenario_steps(path_to_fwop, path_to_alt, adh_velocity, adh_salinity,
+                       adh_wse, barriers, mask), mask)
+    barriers = prepared_feature_class(barriers, mask)
+    steps = scenario_steps(path_to_fwop, path_to_alt, adh_velocity,
+                           adh_salinity, adh_wse, barriers, mask)
+
+    region_mask = find_region(
+        steps, {adh_velocity: fwop_velocity, adh_salinity: fwop_salinity,
+                adh_wse: fwop_wse},
+        mask, os.path.join(path_to_alt, FOOTPRINT_FOLDER),
+        float(tolerance) if tolerance else TOLERANCE,
+        float(halo) if halo else None)
+    steps = footprint_steps(steps, path_to_fwop, path_to_alt, region_mask)
+    scratch = staging.scratch_folder()
+    if scratch:
+        staging.run_staged(steps, path_to_fwop, path_to_alt, scratch, resume)
+    else:
+        run_steps(steps, path_to_alt, resume)
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    path_to_fwop = arcpy.GetParameterAsText(0)
+    path_to_alt = arcpy.GetParameterAsText(1)
+    adh_velocity = arcpy.GetParameterAsText(2)
+    adh_salinity = arcpy.GetParameterAsText(3)
+    adh_wse = arcpy.GetParameterAsText(4)
+    fwop_velocity = arcpy.GetParameterAsText(5)
+    fwop_salinity = arcpy.GetParameterAsText(6)
+    fwop_wse = arcpy.GetParameterAsText(7)
+    barriers = arcpy.GetParameterAsText(8)
+    mask = arcpy.GetParameterAsText(9)
+    tolerance = arcpy.GetParameterAsText(10)
+    halo = arcpy.GetParameterAsText(11)
+
+    main(path_to_fwop, path_to_alt, adh_velocity, adh_salinity, adh_wse,
+         fwop_velocity, fwop_salinity, fwop_wse, barriers, mask, tolerance,
+         halo)
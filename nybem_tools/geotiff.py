@@ -0,0 +1,395 @@
+"""This module contains functions for writing and reading tiled GeoTIFFs with
+numpy alone.
+
+ArcGIS writes a GeoTIFF in one piece from an array or a raster dataset, and
+builds its pyramids and statistics in passes of its own over the finished
+file. Here a raster is written tile by tile as its values become available:
+tiles of `TILE_SIZE` cells are compressed with Deflate (the standard library
+has no LZW encoder) and appended to the file, and the image file directories
+(IFDs) are written last. Overviews are written as further reduced resolution
+IFDs of the same file, the internal overviews that ArcGIS and GDAL use as
+pyramids.
+
+The georeferencing is the corner and cell size of the grid
+(`ModelTiepoint` and `ModelPixelScale`) and the GeoKeys of the coordinate
+system (see `geo_keys`), NoData is recorded in the `GDAL_NODATA` tag and files
+that may grow past 4 GB are written as BigTIFF. Coordinate systems without an
+EPSG code are only named in the GeoKeys; their full definition is written to
+the `.aux.xml` by `raster_io.close_output`.
+"""
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+
+TILE_SIZE = 256
+# Uncompressed size above which a file is written as BigTIFF, leaving room
+# for overviews and incompressible tiles below the 4 GB offsets of TIFF
+BIGTIFF_SIZE = 2 ** 31
+# NoData of float rasters, which cannot be NaN in ArcGIS
+FLOAT_NODATA = float(np.finfo(np.float32).min)
+
+# TIFF field types: code to numpy type
+TYPES = {1: "u1", 2: "S1", 3: "<u2", 4: "<u4", 6: "i1", 8: "<i2",
+         9: "<i4", 11: "<f4", 12: "<f8", 16: "<u8", 17: "<i8"}
+# SampleFormat of numpy kinds
+SAMPLE_FORMATS = {"u": 1, "i": 2, "f": 3}
+COMPRESSION_NONE = 1
+COMPRESSION_DEFLATE = 8
+
+# A TIFF being written, see `open_tiff`. `levels` holds the `Level` of the
+# full resolution image followed by those of its overviews.
+Writer = namedtuple("Writer", ["file", "dtype", "nodata", "tile_size",
+                               "bigtiff", "geo", "wkt", "levels", "lock"])
+# An image of a TIFF: its shape, the `(offset, byte count)` of each written
+# tile by `(tile row, tile column)`, and tiles partly written so far as
+# `[values, cells still to write]`
+Level = namedtuple("Level", ["nrows", "ncols", "tiles", "pending"])
+
+
+def open_tiff(path, nrows, ncols, dtype, nodata=None, geo=None,
+              tile_size=TILE_SIZE, wkt=None):
+    """Creates a tiled TIFF that is written block by block.
+
+    :param: path:       string; Path of the file.
+    :param: nrows:      int; Number of rows of the image.
+    :param: ncols:      int; Number of columns of the image.
+    :param: dtype:      string; Cell type of the image.
+    :param: nodata:     number; The NoData value. NaN values of float images
+                        are stored as `FLOAT_NODATA`.
+    :param: geo:        tuple; Optional `(x_min, y_max, cell_size)` of the
+                        upper left corner and cell size of the image.
+    :param: tile_size:  int; Edge length of the tiles, a multiple of 16.
+    :param: wkt:        string; Optional well-known text of the coordinate
+                        system, encoded as GeoKeys with `geo`.
+
+    :return:  Writer; The open TIFF.
+    """
+    dtype = np.dtype(dtype).newbyteorder("<")
+    if nodata is None and dtype.kind == "f":
+        nodata = FLOAT_NODATA
+    bigtiff = nrows * ncols * dtype.itemsize > BIGTIFF_SIZE
+    f = open(path, "wb")
+    # The offset of the first IFD is filled in by `close_tiff`
+    if bigtiff:
+        f.write(b"II" + struct.pack("<HHHQ", 43, 8, 0, 0))
+    else:
+        f.write(b"II" + struct.pack("<HI", 42, 0))
+    return Writer(f, dtype, nodata, tile_size, bigtiff, geo, wkt,
+                  [Level(nrows, ncols, {}, {})], threading.Lock())
+
+
+def _write_tile(writer, level, tile, values):
+    """Compresses a tile and appends it to the file."""
+    data = zlib.compress(np.ascontiguousarray(values).tobytes(), 6)
+    with writer.lock:
+        writer.file.seek(0, os.SEEK_END)
+        offset = writer.file.tell()
+        writer.file.write(data)
+        writer.levels[level].tiles[tile] = (offset, len(data))
+
+
+def write_block(writer, array, row=0, col=0, level=0):
+    """Writes a block of cells of an image.
+
+    Tiles covered by the block are compressed and written at once, the
+    cells of other tiles are held until the rest of the tile is written.
+    Blocks that do not overlap can be written from several threads at once;
+    every cell is to be written once.
+
+    :param: writer:  Writer; The TIFF from `open_tiff`.
+    :param: array:   numpy.ndarray; The cell values.
+    :param: row:     int; Row of the image of the first row of the block.
+    :param: col:     int; Column of the image of the first column.
+    :param: level:   int; Index of the image, 0 for full resolution.
+
+    :return:  None.
+    """
+    size = writer.tile_size
+    image = writer.levels[level]
+    array = np.asarray(array).astype(writer.dtype)
+    if writer.dtype.kind == "f":
+        array = np.where(np.isnan(array), writer.dtype.type(writer.nodata),
+                         array)
+    nrows, ncols = array.shape
+    for tile_row in range(row // size, -(-(row + nrows) // size)):
+        for tile_col in range(col // size, -(-(col + ncols) // size)):
+            top, left = tile_row * size, tile_col * size
+            # The block cells within this tile, in tile coordinates
+            rows = slice(max(row, top) - top,
+                         min(row + nrows, top + size) - top)
+            cols = slice(max(col, left) - left,
+                         min(col + ncols, left + size) - left)
+            values = array[rows.start + top - row:rows.stop + top - row,
+                           cols.start + left - col:cols.stop + left - col]
+            tile = (tile_row, tile_col)
+            full = (min(size, image.nrows - top) *
+                    min(size, image.ncols - left))
+            if values.size == full and values.shape == (size, size):
+                _write_tile(writer, level, tile, values)
+                continue
+            with writer.lock:
+                if tile not in image.pending:
+                    image.pending[tile] = [
+                        np.full((size, size), writer.nodata or 0,
+                                dtype=writer.dtype), full]
+                pending = image.pending[tile]
+                pending[0][rows, cols] = values
+                pending[1] -= values.size
+                done = pending[1] == 0
+                if done:
+                    del image.pending[tile]
+            if done:
+                _write_tile(writer, level, tile, pending[0])
+
+
+def add_overview(writer, array):
+    """Writes an overview of the image, coarsest last.
+
+    :param: writer:  Writer; The TIFF from `open_tiff`.
+    :param: array:   numpy.ndarray; The cell values of the overview.
+
+    :return:  None.
+    """
+    writer.levels.append(Level(array.shape[0], array.shape[1], {}, {}))
+    write_block(writer, array, level=len(writer.levels) - 1)
+
+
+def _entry(tag, type_, values):
+    """Returns a tag as `(tag, type, count, value bytes)`."""
+    if type_ == 2:
+        data = values.encode("ascii") + b"\0"
+        return tag, type_, len(data), data
+    data = np.asarray(values, dtype=TYPES[type_]).tobytes()
+    return tag, type_, len(data) // np.dtype(TYPES[type_]).itemsize, data
+
+
+def geo_keys(wkt=None):
+    """Returns the GeoKeys of a coordinate system.
+
+    The keys give the model type (projected or geographic), the cells as
+    areas, the name of the coordinate system as its citation and its EPSG
+    code if the well-known text holds one (the `AUTHORITY` or `ID` of the
+    coordinate system itself, which comes last in the text).
+
+    :param: wkt:  string; Well-known text (OGC or Esri) of the coordinate
+                  system, or None for the cell keys alone.
+
+    :return:  tuple; The `GeoKeyDirectory` values and the `GeoAsciiParams`
+              text.
+    """
+    # `(key, tag holding the value or 0, count, value or offset)`
+    keys = [(1025, 0, 1, 1)]
+    citation = ""
+    match = re.match(r"\s*(\w+)\[\s*[\"']([^\"']*)", wkt or "")
+    if match:
+        kind, name = match.groups()
+        model = {"PROJCS": 1, "PROJCRS": 1, "PROJECTEDCRS": 1,
+                 "GEOGCS": 2, "GEOGCRS": 2,
+                 "GEOGRAPHICCRS": 2}.get(kind.upper())
+        citation = name + "|"
+        keys.append((1026, 34737, len(citation), 0))
+        codes = re.findall(r"(?:AUTHORITY|ID)\[\s*[\"']EPSG[\"']\s*,"
+                           r"\s*[\"']?(\d+)", wkt, re.IGNORECASE)
+        if model:
+            keys.append((1024, 0, 1, model))
+            # Larger codes do not fit a key and are not EPSG codes anyway
+            if codes and int(codes[-1]) < 32767:
+                keys.append((3072 if model == 1 else 2048, 0, 1,
+                             int(codes[-1])))
+    keys.sort()
+    # Version 1.1.0
+    directory = [1, 1, 0, len(keys)]
+    for key in keys:
+        directory += key
+    return directory, citation
+
+
+def _tags(writer, index):
+    """Returns the tags of an image of a TIFF."""
+    image = writer.levels[index]
+    size = writer.tile_size
+    tiles_down = -(-image.nrows // size)
+    tiles_across = -(-image.ncols // size)
+    offsets = np.zeros(tiles_down * tiles_across, dtype=np.uint64)
+    counts = np.zeros(offsets.shape, dtype=np.uint64)
+    for (tile_row, tile_col), (offset, count) in image.tiles.items():
+        offsets[tile_row * tiles_across + tile_col] = offset
+        counts[tile_row * tiles_across + tile_col] = count
+    offset_type = 16 if writer.bigtiff else 4
+    tags = [_entry(254, 4, [1 if index else 0]),
+            _entry(256, 4, [image.ncols]),
+            _entry(257, 4, [image.nrows]),
+            _entry(258, 3, [writer.dtype.itemsize * 8]),
+            _entry(259, 3, [COMPRESSION_DEFLATE]),
+            _entry(262, 3, [1]),
+            _entry(277, 3, [1]),
+            _entry(284, 3, [1]),
+            _entry(322, 3, [size]),
+            _entry(323, 3, [size]),
+            _entry(324, offset_type, offsets),
+            _entry(325, offset_type, counts),
+            _entry(339, 3, [SAMPLE_FORMATS[writer.dtype.kind]])]
+    if index == 0 and writer.geo is not None:
+        x_min, y_max, cell_size = writer.geo
+        directory, citation = geo_keys(writer.wkt)
+        tags += [_entry(33550, 12, [cell_size, cell_size, 0.0]),
+                 _entry(33922, 12, [0.0, 0.0, 0.0, x_min, y_max, 0.0]),
+                 _entry(34735, 3, directory)]
+        if citation:
+            tags.append(_entry(34737, 2, citation))
+    if writer.nodata is not None:
+        tags.append(_entry(42113, 2, repr(writer.nodata)
+                           if writer.dtype.kind == "f"
+                           else str(int(writer.nodata))))
+    return tags
+
+
+def _write_ifd(f, tags, bigtiff):
+    """Appends an IFD and the values that do not fit in it.
+
+    :return:  tuple; The offset of the IFD and of its next IFD offset.
+    """
+    inline = 8 if bigtiff else 4
+    entries = []
+    for tag, type_, count, data in tags:
+        if len(data) > inline:
+            f.seek(0, os.SEEK_END)
+            if f.tell() % 2:
+                f.write(b"\0")
+            offset = f.tell()
+            f.write(data)
+            data = struct.pack("<Q" if bigtiff else "<I", offset)
+        entries.append((tag, type_, count, data.ljust(inline, b"\0")))
+    f.seek(0, os.SEEK_END)
+    if f.tell() % 2:
+        f.write(b"\0")
+    position = f.tell()
+    f.write(struct.pack("<Q" if bigtiff else "<H", len(entries)))
+    for tag, type_, count, data in entries:
+        f.write(struct.pack("<HHQ" if bigtiff else "<HHI", tag, type_, count)
+                + data)
+    next_offset = f.tell()
+    f.write(struct.pack("<Q" if bigtiff else "<I", 0))
+    return position, next_offset
+
+
+def close_tiff(writer):
+    """Writes the IFDs of a TIFF and closes it.
+
+    :param: writer:  Writer; The TIFF from `open_tiff`, with every cell of
+                     every image written.
+
+    :return:  None.
+    """
+    f = writer.file
+    try:
+        for image in writer.levels:
+            if image.pending:
+                raise ValueError(f"{len(image.pending)} tiles of {f.name} "
+                                 f"were not completely written.")
+        # The header points to the first IFD, every IFD to the next one
+        previous = 8 if writer.bigtiff else 4
+        for index in range(len(writer.levels)):
+            position, next_offset = _write_ifd(f, _tags(writer, index),
+                                               writer.bigtiff)
+            f.seek(previous)
+            f.write(struct.pack("<Q" if writer.bigtiff else "<I", position))
+            previous = next_offset
+    finally:
+        f.close()
+
+
+def _read_ifds(f):
+    """Returns the tags of every IFD of an open TIFF as dicts of arrays."""
+    header = f.read(16)
+    if header[:2] != b"II":
+        raise ValueError("Only little-endian TIFFs are read.")
+    version = struct.unpack("<H", header[2:4])[0]
+    bigtiff = version == 43
+    if version not in (42, 43):
+        raise ValueError("Not a TIFF.")
+    offset = struct.unpack("<Q" if bigtiff else "<I",
+                           header[8:16] if bigtiff else header[4:8])[0]
+    inline = 8 if bigtiff else 4
+    entry_size = 20 if bigtiff else 12
+    ifds = []
+    while offset:
+        f.seek(offset)
+        count = struct.unpack("<Q" if bigtiff else "<H",
+                              f.read(8 if bigtiff else 2))[0]
+        raw = f.read(count * entry_size)
+        tags = {}
+        for index in range(count):
+            entry = raw[index * entry_size:(index + 1) * entry_size]
+            tag, type_ = struct.unpack("<HH", entry[:4])
+            number = struct.unpack("<Q" if bigtiff else "<I",
+                                   entry[4:4 + inline])[0]
+            if type_ not in TYPES:
+                continue
+            size = number * np.dtype(TYPES[type_]).itemsize
+            data = entry[4 + inline:]
+            if size > inline:
+                position = f.tell()
+                f.seek(struct.unpack("<Q" if bigtiff else "<I", data)[0])
+                data = f.read(size)
+                f.seek(position)
+            tags[tag] = np.frombuffer(data[:size], dtype=TYPES[type_])
+        ifds.append(tags)
+        offset = struct.unpack("<Q" if bigtiff else "<I",
+                               f.read(8 if bigtiff else 4))[0]
+    return ifds
+
+
+def read_shapes(path):
+    """Returns the `(nrows, ncols)` of each image of a TIFF, the full
+    resolution image first."""
+    with open(path, "rb") as f:
+        return [(int(tags[257][0]), int(tags[256][0]))
+                for tags in _read_ifds(f)]
+
+
+def read_image(path, index=0):
+    """Reads an image of a tiled TIFF written by `open_tiff`.
+
+    :param: path:   string; Path of the file.
+    :param: index:  int; Index of the image, 0 for full resolution, then
+                    the overviews.
+
+    :return:  numpy.ndarray; The stored cell values, with NoData cells of
+              float images set to NaN.
+    """
+    with open(path, "rb") as f:
+        tags = _read_ifds(f)[index]
+        if 322 not in tags:
+            raise ValueError(f"{path} is not tiled.")
+        compression = int(tags.get(259, [COMPRESSION_NONE])[0])
+        if compression not in (COMPRESSION_NONE, COMPRESSION_DEFLATE):
+            raise ValueError(f"{path} has compression {compression}.")
+        kind = {1: "u", 2: "i", 3: "f"}[int(tags.get(339, [1])[0])]
+        dtype = np.dtype(f"<{kind}{int(tags[258][0]) // 8}")
+        nrows, ncols = int(tags[257][0]), int(tags[256][0])
+        size = int(tags[322][0])
+        tiles_across = -(-ncols // size)
+        array = np.empty((-(-nrows // size) * size, tiles_across * size),
+                         dtype=dtype)
+        for index_, (offset, count) in enumerate(zip(tags[324], tags[325])):
+            f.seek(int(offset))
+            data = f.read(int(count))
+            if compression == COMPRESSION_DEFLATE:
+                data = zlib.decompress(data)
+            top = index_ // tiles_across * size
+            left = index_ % tiles_across * size
+            array[top:top + size, left:left + size] = np.frombuffer(
+                data, dtype=dtype).reshape(size, size)
+    array = array[:nrows, :ncols]
+    if kind == "f" and 42113 in tags:
+        array = array.astype(np.float64)
+        nodata = float(tags[42113].tobytes().rstrip(b"\0"))
+        array[array == np.float32(nodata)] = np.nan
+    return array
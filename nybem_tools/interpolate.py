@@ -0,0 +1,440 @@
+"""This module contains functions for interpolating AdH mesh node values to
+a raster grid with numpy and scipy.
+
+`utils.adh2raster` interpolates with `SplineWithBarriers_3d`, which needs an
+ArcGIS license. The functions here interpolate point columns read with
+`points.read_points` onto a `raster_io.Grid`, for code paths that run without
+arcpy.
+
+Predictors that do not need a spline fit (e.g. the salinity percentiles on
+dense AdH meshes) can be interpolated by inverse distance weighting instead
+(see `interpolate_points`): a KD-tree over the selected nodes is built once
+per point set and filter (the most recent trees are kept), and every mask
+cell is estimated from its nearest nodes in vectorized batches, with the tree
+queried on all cores. With barriers, nodes in another barrier region than the
+cell (see `barriers.label_regions`) or hidden from it behind a barrier (see
+`barriers.blocked`) are left out of its estimate, and cells whose nearest
+nodes are all across a barrier look further (see `idw`). For
+point sets in a mesh store, the nearest nodes and triangles of the mask cells
+are cached per mesh and reused by every alternative (see `mesh_estimates`). A
+solution on a coarser grid can seed the estimate, so only the cells where it
+is not smooth are solved (see `resample_seed`).
+"""
+import functools
+import math
+import os
+
+import numpy as np
+
+try:
+    from . import barriers as barriers_
+    from . import filters, mesh_store, points, raster_io
+except ImportError:
+    import barriers as barriers_
+    import filters
+    import mesh_store
+    import points
+    import raster_io
+
+
+# Interpolation methods of `interpolate_points`. scipy has no natural
+# neighbour interpolation; "linear" (triangulated) is the closest.
+METHODS = ("idw", "linear")
+# Nearest nodes of an inverse distance estimate, and how many times as many
+# are searched for cells whose nearest nodes are all across a barrier
+NEIGHBOURS = 12
+RETRY = 4
+
+
+def points_to_grid(xs, ys, values, grid, method="linear"):
+    """Interpolates point values to the cell centers of a grid.
+
+    :param: xs:      array; x coordinates of the points.
+    :param: ys:      array; y coordinates of the points.
+    :param: values:  array; Values at the points.
+    :param: grid:    Grid; The output grid.
+    :param: method:  string; "linear" (triangulated) or "nearest".
+
+    :return:  numpy.ndarray; A 2D float array of interpolated values, NaN
+              outside the convex hull of the points.
+    """
+    from scipy.interpolate import griddata
+
+    col_xs, row_ys = raster_io.cell_centers(grid)
+    grid_x, grid_y = np.meshgrid(col_xs, row_ys)
+    return griddata((xs, ys), values, (grid_x, grid_y), method=method)
+
+
+def _neighbourhood_range(array):
+    """Returns the range of the values in the 3 x 3 neighbourhood of every
+    cell, infinite where the neighbourhood holds NoData."""
+    from scipy import ndimage
+
+    nodata = np.isnan(array)
+    highest = ndimage.maximum_filter(np.where(nodata, -np.inf, array), 3)
+    lowest = ndimage.minimum_filter(np.where(nodata, np.inf, array), 3)
+    spread = highest - lowest
+    spread[ndimage.maximum_filter(nodata, 3)] = np.inf
+    return spread
+
+
+def resample_seed(seed_grid, seed, grid, rows, cols, tolerance=0.01,
+                  regions=None):
+    """Resamples a coarser solution to cells of a finer grid.
+
+    The seed is resampled bilinearly. A cell is left to be solved again where
+    the seed varies by more than the tolerance within the 3 x 3
+    neighbourhood of its coarse cell (or holds NoData there); elsewhere the
+    seed is nearly flat and its resampled value is kept.
+
+    :param: seed_grid:  Grid; The grid of the coarser solution.
+    :param: seed:       numpy.ndarray; The coarser solution.
+    :param: grid:       Grid; The finer grid.
+    :param: rows:       numpy.ndarray; Rows of the cells on the finer grid.
+    :param: cols:       numpy.ndarray; Columns of the cells.
+    :param: tolerance:  float; Largest neighbourhood range, in the units of
+                        the values, for which a cell is not solved again.
+    :param: regions:    numpy.ndarray; Optional barrier regions on the finer
+                        grid (see `barriers.label_regions`); cells within a
+                        coarse cell of another region are solved again.
+
+    :return:  tuple; The resampled values of the cells and a boolean array
+              of the cells to be solved again.
+    """
+    from scipy.interpolate import RegularGridInterpolator
+
+    col_xs, row_ys = raster_io.cell_centers(grid)
+    seed_xs, seed_ys = raster_io.cell_centers(seed_grid)
+    resample = RegularGridInterpolator(
+        (seed_ys[::-1], seed_xs), seed[::-1], bounds_error=False,
+        fill_value=np.nan)
+    values = resample((row_ys[rows], col_xs[cols]))
+
+    seed_top = seed_grid.y_min + seed_grid.nrows * seed_grid.cell_size
+    parent_rows = np.clip(
+        ((seed_top - row_ys[rows]) // seed_grid.cell_size).astype(int),
+        0, seed_grid.nrows - 1)
+    parent_cols = np.clip(
+        ((col_xs[cols] - seed_grid.x_min) // seed_grid.cell_size)
+        .astype(int), 0, seed_grid.ncols - 1)
+    rough = _neighbourhood_range(seed) > tolerance
+    solve = rough[parent_rows, parent_cols] | np.isnan(values)
+    if regions is not None:
+        from scipy import ndimage
+
+        size = 2 * int(math.ceil(seed_grid.cell_size / grid.cell_size)) + 1
+        mixed = ((ndimage.maximum_filter(regions, size) !=
+                  ndimage.minimum_filter(regions, size)) | (regions == 0))
+        solve |= mixed[rows, cols]
+    return values, solve
+
+
+def progressive(xs, ys, values, grid, factors=(8, 4, 2, 1), tolerance=0.01):
+    """Interpolates point values to a grid from coarse to fine resolution.
+
+    The points are triangulated once and linearly interpolated at each level.
+    The first level is solved at every cell. Each finer level starts from the
+    previous level, and only the cells `resample_seed` leaves to be solved
+    are solved again.
+
+    :param: xs:         array; x coordinates of the points.
+    :param: ys:         array; y coordinates of the points.
+    :param: values:     array; Values at the points.
+    :param: grid:       Grid; The full resolution output grid.
+    :param: factors:    tuple; Aggregation factors of the levels, coarse to
+                        fine. Use 1 for the full resolution.
+    :param: tolerance:  float; Largest neighbourhood range, in the units of
+                        the values, for which a cell is not solved again.
+
+    :return:  generator; `(level_grid, array)` for each level, in order.
+    """
+    from scipy.interpolate import LinearNDInterpolator
+    from scipy.spatial import Delaunay
+
+    interpolator = LinearNDInterpolator(
+        Delaunay(np.column_stack([xs, ys])), values)
+
+    previous = None
+    for factor in factors:
+        level = raster_io.coarsen_grid(grid, factor) if factor > 1 else grid
+        col_xs, row_ys = raster_io.cell_centers(level)
+        rows, cols = np.indices((level.nrows, level.ncols)).reshape(2, -1)
+        if previous is None:
+            flat = interpolator(col_xs[cols], row_ys[rows])
+        else:
+            flat, solve = resample_seed(previous[0], previous[1], level,
+                                        rows, cols, tolerance)
+            flat[solve] = interpolator(col_xs[cols[solve]],
+                                       row_ys[rows[solve]])
+        array = flat.reshape(level.nrows, level.ncols)
+        yield level, array
+        previous = (level, array)
+
+
+@functools.lru_cache(maxsize=4)
+def _node_tree(source, variable, sql_select):
+    from scipy.spatial import cKDTree
+
+    adh_points = source[0]
+    fields = sorted({variable} | {field for field, _, _ in
+                                  filters.parse(sql_select)})
+    columns = points.read_points(adh_points, fields)
+    selected = filters.filter_mask(adh_points, sql_select, columns)
+    nodes = {"x": columns["x"], "y": columns["y"],
+             "values": np.asarray(columns[variable], dtype=np.float64)}
+    if selected is not None:
+        nodes = {name: column[selected] for name, column in nodes.items()}
+    return cKDTree(np.column_stack([nodes["x"], nodes["y"]])), nodes
+
+
+def node_tree(adh_points, variable, sql_select):
+    """Returns a KD-tree over the nodes a where-clause selects, through a
+    cache of the most recent trees.
+
+    :param: adh_points:  string; Path to a point feature class or a `.npz`
+                         archive.
+    :param: variable:    string; The column to interpolate.
+    :param: sql_select:  string; A where-clause, see `filters.parse`.
+
+    :return:  tuple; The `scipy.spatial.cKDTree` of the selected nodes and
+              their coordinates and values as dict columns "x", "y" and
+              "values".
+    """
+    return _node_tree(filters.point_source(adh_points), variable,
+                      sql_select)
+
+
+def hidden(prepared, xy, node_xy, index, usable):
+    """Marks the nodes of locations that are hidden from them behind a
+    barrier.
+
+    :param: prepared:  dict; Barriers from `barriers.prepare`.
+    :param: xy:        numpy.ndarray; (n, 2) coordinates of the locations.
+    :param: node_xy:   numpy.ndarray; Coordinates of the nodes.
+    :param: index:     numpy.ndarray; (n, k) nodes of each location.
+    :param: usable:    numpy.ndarray; (n, k) nodes to test.
+
+    :return:  numpy.ndarray; An (n, k) boolean array, True on the tested
+              nodes whose line to the location passes through a barrier.
+    """
+    result = np.zeros(index.shape, dtype=bool)
+    cells, nodes = np.nonzero(usable)
+    result[cells, nodes] = barriers_.blocked(prepared, xy[cells],
+                                             node_xy[index[cells, nodes]])
+    return result
+
+
+def idw(tree, values, xy, power=2.0, neighbours=NEIGHBOURS,
+        cell_regions=None, node_regions=None, workers=-1, retry=RETRY,
+        candidates=None, prepared=None):
+    """Estimates values at locations by inverse distance weighting.
+
+    :param: tree:          cKDTree; Tree of the nodes.
+    :param: values:        numpy.ndarray; Values at the nodes.
+    :param: xy:            numpy.ndarray; (n, 2) coordinates to estimate at.
+    :param: power:         float; Power of the inverse distance.
+    :param: neighbours:    int; Number of nearest usable nodes used.
+    :param: cell_regions:  numpy.ndarray; Optional barrier region of each
+                           location; nodes in another region are left out.
+                           Locations in region 0 (on a barrier) use every
+                           node, nodes on a barrier only count there.
+    :param: node_regions:  numpy.ndarray; Barrier region of each node.
+    :param: workers:       int; Threads querying the tree, -1 for all cores.
+    :param: retry:         int; Locations whose nearest nodes are all in
+                           another region are estimated again from this many
+                           times as many nearest nodes.
+    :param: candidates:    int; Number of nearest nodes the usable ones are
+                           taken from. Defaults to `neighbours`.
+    :param: prepared:      dict; Optional barriers from `barriers.prepare`
+                           the regions are from; nodes hidden from a
+                           location off the barriers are left out (see
+                           `hidden`).
+
+    :return:  numpy.ndarray; The estimates, NaN where no node is usable.
+    """
+    k = min(candidates or neighbours, tree.n)
+    distance, index = tree.query(xy, k=k, workers=workers)
+    if k == 1:
+        distance, index = distance[:, None], index[:, None]
+    with np.errstate(divide="ignore"):
+        weight = distance ** -power
+    if cell_regions is not None:
+        usable = ((node_regions[index] == cell_regions[:, None]) |
+                  (cell_regions[:, None] == 0))
+        if prepared is not None:
+            usable &= ~hidden(prepared, xy, tree.data, index,
+                              usable & (cell_regions[:, None] != 0))
+        usable &= np.cumsum(usable, axis=1) <= neighbours
+        weight[~usable] = 0.0
+    # A usable node on the location is its estimate
+    exact = np.isinf(weight)
+    hits = exact.any(axis=1)
+    weight[hits] = exact[hits]
+    total = weight.sum(axis=1)
+    with np.errstate(invalid="ignore"):
+        estimates = (weight * values[index]).sum(axis=1) / total
+    empty = total == 0
+    if retry > 1 and k < tree.n and empty.any():
+        estimates[empty] = idw(tree, values, xy[empty], power, neighbours,
+                               None if cell_regions is None
+                               else cell_regions[empty],
+                               node_regions, workers, retry=1,
+                               candidates=k * retry, prepared=prepared)
+    return estimates
+
+
+def mesh_estimates(adh_points, variable, sql_select, mask, method,
+                   prepared=None, power=2.0, neighbours=NEIGHBOURS):
+    """Estimates the mask cells from the cached geometry of a stored mesh.
+
+    The nearest nodes and triangles of the mask cells are calculated once
+    per mesh and mask (see `mesh_store`), so an estimate is a gather of node
+    values. The k nearest nodes of all nodes are the k nearest selected
+    nodes, and a triangle of all nodes is a triangle of the selected nodes,
+    when all its nodes are selected; other cells are left to be solved from
+    the selected nodes.
+
+    :param: prepared:  dict; Optional barriers from `barriers.prepare`, used
+                       by "idw".
+
+    :return:  tuple; The estimates of the mask cells, in the order of
+              `numpy.nonzero` of the mask, and a boolean array of the cells
+              still to be solved.
+    """
+    fields = sorted({variable} | {field for field, _, _ in
+                                  filters.parse(sql_select)})
+    columns = points.read_points(adh_points, fields)
+    values = np.asarray(columns[variable], dtype=np.float64)
+    selected = filters.filter_mask(adh_points, sql_select, columns)
+    if method == "linear":
+        cached = mesh_store.cell_triangles(adh_points, mask)
+        nearest, weight = cached["vertices"], cached["weight"]
+        inside = nearest[:, 0] >= 0
+    else:
+        cached = mesh_store.cell_neighbours(adh_points, mask, neighbours,
+                                            power)
+        nearest, weight = cached["index"], cached["weight"]
+        inside = np.ones(len(nearest), dtype=bool)
+        if prepared is not None:
+            grid, _, rows, cols = mesh_store.mask_cells(mask)
+            cell_regions = barriers_.grid_regions(prepared,
+                                                  grid)[rows, cols][:, None]
+            regions = mesh_store.node_regions(adh_points, prepared)[nearest]
+            usable = (regions == cell_regions) | (cell_regions == 0)
+            col_xs, row_ys = raster_io.cell_centers(grid)
+            node_xy = mesh_store.node_tree(adh_points).data
+            for start in range(0, rows.size, 2 ** 18):
+                batch = slice(start, start + 2 ** 18)
+                usable[batch] &= ~hidden(
+                    prepared, np.column_stack([col_xs[cols[batch]],
+                                               row_ys[rows[batch]]]),
+                    node_xy, nearest[batch],
+                    usable[batch] & (cell_regions[batch] != 0))
+            weight = np.where(usable, weight, 0.0)
+    total = weight.sum(axis=1)
+    with np.errstate(invalid="ignore"):
+        estimates = (weight * values[nearest]).sum(axis=1) / total
+    estimates[~inside] = np.nan
+    # Cells whose cached nodes are all across a barrier are solved with more
+    # neighbours (see `idw`)
+    empty = inside & (total == 0)
+    if selected is None:
+        return estimates, empty
+    return estimates, (inside & ~selected[nearest].all(axis=1)) | empty
+
+
+def interpolate_points(output_folder, output_name, adh_points, variable,
+                       sql_select, barriers, mask, method="idw", power=2.0,
+                       neighbours=NEIGHBOURS, batch_size=2 ** 18, seed="",
+                       tolerance=0.01):
+    """Interpolates an AdH point variable to a raster without a spline fit.
+
+    The counterpart of `utils.adh2raster` for predictors that do not need
+    `SplineWithBarriers`. Only the cells of the mask are estimated, and the
+    result is multiplied by the mask as `adh2raster` does.
+
+    :param: output_folder:  string; Path to the output folder.
+    :param: output_name:    string; Name of the output raster.
+    :param: adh_points:     string; Path to a point feature class or a `.npz`
+                            archive.
+    :param: variable:       string; The column to interpolate.
+    :param: sql_select:     string; A where-clause selecting the nodes.
+    :param: barriers:       string; Path to the barriers, see
+                            `barriers.prepare`, or "" for none. Only "idw"
+                            uses them.
+    :param: mask:           string; Path to the mask raster. The output has
+                            its grid and its extension.
+    :param: method:         string; "idw" or "linear".
+    :param: power:          float; Power of the inverse distance.
+    :param: neighbours:     int; Number of nearest nodes of an estimate.
+    :param: batch_size:     int; Number of cells estimated at once.
+    :param: seed:           string; Optional path to a solution of the same
+                            variable on a coarser grid (e.g. a coarser
+                            preview). Cells where it is smooth are resampled
+                            from it instead of solved, see `resample_seed`.
+    :param: tolerance:      float; Tolerance of `resample_seed`.
+
+    :return:  string; Path of the raster written.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown interpolation method: {method}")
+    grid = raster_io.read_grid(mask)
+    mask_array = raster_io.read_array(mask)
+    rows, cols = np.nonzero(~np.isnan(mask_array))
+    prepared = None
+    if barriers and method == "idw":
+        prepared = barriers_.prepare(barriers, mask)
+
+    if mesh_store.mesh_of(adh_points) is not None:
+        estimates, solve = mesh_estimates(adh_points, variable, sql_select,
+                                          mask, method, prepared, power,
+                                          neighbours)
+        cells = np.flatnonzero(solve)
+    else:
+        estimates = np.full(rows.size, np.nan)
+        cells = np.arange(rows.size)
+    if seed and cells.size:
+        seeded, solve = resample_seed(
+            raster_io.read_grid(seed), raster_io.read_array(seed), grid,
+            rows, cols, tolerance,
+            None if prepared is None
+            else barriers_.grid_regions(prepared, grid))
+        kept = cells[~solve[cells]]
+        estimates[kept] = seeded[kept]
+        cells = cells[solve[cells]]
+
+    # Cells without a cached estimate are solved from the selected nodes
+    col_xs, row_ys = raster_io.cell_centers(grid)
+    if cells.size:
+        tree, nodes = node_tree(adh_points, variable, sql_select)
+    if cells.size and method == "linear":
+        from scipy.interpolate import LinearNDInterpolator
+
+        interpolator = LinearNDInterpolator(tree.data, nodes["values"])
+        for start in range(0, cells.size, batch_size):
+            batch = cells[start:start + batch_size]
+            estimates[batch] = interpolator(col_xs[cols[batch]],
+                                            row_ys[rows[batch]])
+    elif cells.size:
+        regions = node_regions = None
+        if prepared is not None:
+            regions = barriers_.grid_regions(prepared, grid)
+            node_regions = barriers_.point_regions(
+                prepared["regions"], prepared["grid"], nodes["x"],
+                nodes["y"])
+        for start in range(0, cells.size, batch_size):
+            batch = cells[start:start + batch_size]
+            xy = np.column_stack([col_xs[cols[batch]], row_ys[rows[batch]]])
+            estimates[batch] = idw(
+                tree, nodes["values"], xy, power, neighbours,
+                None if regions is None else regions[rows[batch],
+                                                     cols[batch]],
+                node_regions, prepared=prepared)
+
+    array = np.full((grid.nrows, grid.ncols), np.nan, dtype=np.float32)
+    array[rows, cols] = estimates * mask_array[rows, cols]
+    ext = ".npy" if raster_io.is_numpy_raster(mask) else ".tif"
+    output_path = os.path.join(output_folder, str(output_name) + ext)
+    raster_io.write_array(array, grid, output_path,
+                          profile=raster_io.storage_profile(output_name))
+    return output_path
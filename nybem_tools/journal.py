@@ -0,0 +1,166 @@
+"""This module contains functions for checkpointing the steps of a long run so
+that it can resume after a failure.
+
+Each completed step is appended to a journal file (one JSON record per line)
+together with a fingerprint of its function, arguments and input files and
+the list of outputs it wrote. When the run is restarted, a step is skipped if
+the journal holds a record with the same fingerprint and all of its outputs
+still exist. Because the fingerprint includes the size and modification time
+of the inputs, a step that is redone also invalidates the steps that read its
+outputs.
+
+Workers of a queue append to their own shard of the journal (see
+`utils.shard_path`), and the shards are merged when the journal is read.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+try:
+    from .utils import add_message, shard_path, shard_paths
+except ImportError:
+    from utils import add_message, shard_path, shard_paths
+
+
+JOURNAL_NAME = "nybem_journal.jsonl"
+# Files that hold part of a dataset next to its main file; a shapefile keeps
+# its attributes in the `.dbf`
+SIDECARS = {".shp": (".shx", ".dbf", ".prj")}
+
+
+def file_state(path):
+    """Returns the size and modification time of a file or folder.
+
+    Folders (e.g. file geodatabases) are summarized by the files directly
+    inside them, and files with `SIDECARS` by their sidecars as well. Paths
+    that do not exist on disk, like a feature class inside a geodatabase, are
+    represented by their nearest existing parent.
+    """
+    path = str(path)
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    if not path:
+        return None
+    if os.path.isdir(path):
+        entries = [entry.stat() for entry in os.scandir(path)
+                   if entry.is_file()]
+        return [path, sum(e.st_size for e in entries),
+                max([e.st_mtime_ns for e in entries] or [0])]
+    stem, ext = os.path.splitext(path)
+    entries = [os.stat(path)] + [
+        os.stat(stem + sidecar) for sidecar in SIDECARS.get(ext.lower(), ())
+        if os.path.exists(stem + sidecar)]
+    return [path, sum(e.st_size for e in entries),
+            max(e.st_mtime_ns for e in entries)]
+
+
+def fingerprint(function, args, inputs):
+    """Fingerprints a step.
+
+    :param: function:  string; Name of the function the step calls.
+    :param: args:      dict; Keyword arguments of the call.
+    :param: inputs:    list; Paths of the files the step reads.
+
+    :return:  string; A hex digest that changes whenever the function, its
+              arguments or the content of an input (by size and
+              modification time) change.
+    """
+    state = {"function": function,
+             "args": args,
+             "inputs": [file_state(path) for path in inputs]}
+    text = json.dumps(state, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def read_journal(journal_path):
+    """Reads the latest record of every step in a journal and its shards.
+
+    Lines that cannot be parsed, such as a line cut short by a crash, are
+    ignored.
+
+    :param: journal_path:  string; Path to the journal file.
+
+    :return:  dict; Step name to its latest record, by completion time.
+    """
+    lines = []
+    for path in shard_paths(journal_path):
+        with open(path) as f:
+            lines += f.readlines()
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    records.sort(key=lambda record: record.get("completed", ""))
+    return {record["step"]: record for record in records}
+
+
+def record_step(journal_path, step, step_fingerprint, outputs):
+    """Appends a completed step to a journal.
+
+    :param: journal_path:      string; Path to the journal file.
+    :param: step:              string; Name of the step.
+    :param: step_fingerprint:  string; Fingerprint of the step.
+    :param: outputs:           list; Paths of the files the step wrote.
+
+    :return:  None. Accomplishes the side effect of appending to the journal.
+    """
+    record = {"step": step,
+              "fingerprint": step_fingerprint,
+              "outputs": [str(output) for output in outputs],
+              "completed": datetime.now().isoformat(timespec="seconds")}
+    with open(journal_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def is_complete(records, step, step_fingerprint, outputs):
+    """Tests whether a step can be skipped.
+
+    :param: records:           dict; Records from `read_journal`.
+    :param: step:              string; Name of the step.
+    :param: step_fingerprint:  string; Current fingerprint of the step.
+    :param: outputs:           list; Paths of the files the step writes.
+
+    :return:  bool; True if the step completed with the same fingerprint and
+              all of its outputs exist.
+    """
+    record = records.get(step)
+    return (record is not None
+            and record["fingerprint"] == step_fingerprint
+            and all(os.path.exists(output) for output in outputs))
+
+
+def run_step(journal_path, step, func, args, inputs, outputs, resume=True,
+             shard=None):
+    """Runs a step unless the journal shows it is already complete.
+
+    :param: journal_path:  string; Path to the journal file.
+    :param: step:          string; Name of the step, unique within the
+                           journal.
+    :param: func:          callable; The function the step calls.
+    :param: args:          dict; Keyword arguments for the function.
+    :param: inputs:        list; Paths of the files the step reads.
+    :param: outputs:       list; Paths of the files the step writes.
+    :param: resume:        bool; If False the step is always run.
+    :param: shard:         string; Optional, name of the worker whose shard
+                           of the journal the step is recorded in.
+
+    :return:  bool; True if the step was run, False if it was skipped.
+    """
+    step_fingerprint = fingerprint(func.__name__, args, inputs)
+    if resume and is_complete(read_journal(journal_path), step,
+                              step_fingerprint, outputs):
+        add_message(f"Skipped {step}, already complete.")
+        return False
+
+    func(**args)
+    record_step(shard_path(journal_path, shard), step, step_fingerprint,
+                outputs)
+    return True
@@ -0,0 +1,92 @@
+"""This module contains numpy implementations of the derived predictor formulas.
+
+The functions in `utils` calculate derived predictors with arcpy map algebra.
+The functions here apply the same formulas to numpy arrays, so they can run on
+tiles, on stacked arrays or without an ArcGIS license. Arguments may be arrays
+of any (broadcastable) shape or scalars; NaN marks NoData. As in map algebra,
+a division by zero (or an overflow) gives NoData rather than an infinity.
+"""
+import numpy as np
+
+
+def nodata_if_not_finite(values):
+    """Sets the infinite and NaN values of a result to NaN (NoData)."""
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isfinite(values), values, np.nan)
+
+
+def rel_velocity(vel_alt, vel_fwop):
+    """Calculates relative velocity.
+
+    PercentIncrease = ((value_new − value_original) / value_original) ∗ 100
+
+    :param: vel_alt:   array; The velocity for the alternative being evaluated.
+    :param: vel_fwop:  array; The velocity for the baseline condition.
+
+    :return:  array; The percent increase in velocity.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return nodata_if_not_finite((vel_alt - vel_fwop) / vel_fwop * 100)
+
+
+def epi_sed_dep(wse_mhhw, wse_median, wse_max):
+    """Calculates episodic sediment deposition.
+
+    ESD = (Depth_max − Depth_median) / (Depth_MHHW − Depth_median)
+
+    :param: wse_mhhw:    array; The mean higher high water (MHHW) water
+                         surface elevation.
+    :param: wse_median:  array; The median water surface elevation.
+    :param: wse_max:     array; The maximum water surface elevation.
+
+    :return:  array; The episodic sediment deposition.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return nodata_if_not_finite((wse_max - wse_median) /
+                                    (wse_mhhw - wse_median))
+
+
+def depth(wse_mtl, bed_elevation):
+    """Calculates depth at mean water surface elevation.
+
+    depth = water_surface_mean - bed_elevation
+
+    :param: wse_mtl:        array; The mean water surface elevation.
+    :param: bed_elevation:  array; The bed elevation.
+
+    :return:  array; The mean water depth.
+    """
+    return wse_mtl - bed_elevation
+
+
+def per_light_available(depth_m, attenuation=1.39):
+    """Calculates the percent light available.
+
+    PLA = exp(−1.39 ∗ depth) ∗ 100
+
+    :param: depth_m:      array; The depth.
+    :param: attenuation:  float or array; The light attenuation coefficient.
+
+    :return:  array; The percent light available.
+    """
+    with np.errstate(over="ignore"):
+        return nodata_if_not_finite(np.exp(-attenuation * depth_m) * 100)
+
+
+def expo_dur(wse_100, wse_0, wse_mhhw, wse_mllw):
+    """Calculates exposure duration.
+
+    t_rel = (H_max − H_min) / (MHHW − MLLW)
+
+    :param: wse_100:   array; The maximum water surface elevation.
+    :param: wse_0:     array; The minimum water surface elevation.
+    :param: wse_mhhw:  array; The mean higher high water (MHHW) water surface
+                       elevation.
+    :param: wse_mllw:  array; The mean lower low water (MLLW) water surface
+                       elevation.
+
+    :return:  array; The exposure duration.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return nodata_if_not_finite((wse_100 - wse_0) /
+                                    (wse_mhhw - wse_mllw))
@@ -0,0 +1,288 @@
+"""Add AdH point exports to a mesh store shared by alternatives.
+
+Alternatives are usually run on the same AdH mesh, yet every velocity,
+salinity and water surface elevation export of every alternative holds its
+own copy of the node coordinates. A mesh store keeps the coordinates once per
+mesh, under a hash of the coordinates, and only the attribute columns per
+export. An export in the store is a `.npz` archive that reads like any other
+(see `points.read_points`), so it can be passed to the tools wherever AdH
+points are expected.
+
+Everything that depends only on the mesh and the mask grid is calculated once
+per mesh and kept in the `cache` folder of the store, for every alternative
+and variable to reuse (see `interpolate.interpolate_points`): the KD-tree of
+the nodes, the nearest nodes and inverse distances of every mask cell, the
+barrier region of every node, and the triangle and barycentric weights of
+every mask cell.
+
+:param: adh_points:  string; Semicolon separated paths to the AdH point
+                     exports (point feature classes or `.npz` archives).
+:param: store:       string; Path to the mesh store folder, created if it
+                     does not exist.
+
+:return:    The exports as `.npz` archives in the store, named like the
+            exports with the hash of their attributes appended.
+"""
+import functools
+import hashlib
+import os
+
+import numpy as np
+
+try:
+    from . import points, raster_io
+    from .journal import file_state
+    from .utils import add_message, commit_output, partial_path
+except ImportError:
+    import points
+    import raster_io
+    from journal import file_state
+    from utils import add_message, commit_output, partial_path
+
+
+CACHE_FOLDER = "cache"
+# arcpy field types read as attribute columns
+NUMERIC_FIELD_TYPES = ("Double", "Single", "Integer", "SmallInteger")
+
+
+def geometry_key(xs, ys):
+    """Hashes node coordinates."""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(xs, dtype=np.float64).tobytes())
+    digest.update(b"|")
+    digest.update(np.ascontiguousarray(ys, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def grid_key(grid, mask_array, *extra):
+    """Hashes a grid, the cells of its mask and further parameters."""
+    digest = hashlib.sha1()
+    digest.update(repr(tuple(grid)).encode("utf-8"))
+    digest.update(np.packbits(np.isnan(mask_array)).tobytes())
+    digest.update(repr(extra).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def attribute_fields(adh_points):
+    """Returns the names of the numeric attribute columns of a point set."""
+    if points.is_numpy_points(adh_points):
+        with np.load(str(adh_points)) as archive:
+            return [name for name in archive.files
+                    if name not in ("x", "y", "geometry")]
+
+    import arcpy
+
+    return [field.name for field in arcpy.ListFields(str(adh_points))
+            if field.type in NUMERIC_FIELD_TYPES]
+
+
+def store_points(adh_points, store):
+    """Adds a point export to a mesh store.
+
+    :param: adh_points:  string; Path to a point feature class or a `.npz`
+                         archive.
+    :param: store:       string; Path to the mesh store folder.
+
+    :return:  string; Path of the export in the store.
+    """
+    columns = points.read_points(adh_points, attribute_fields(adh_points))
+    key = geometry_key(columns["x"], columns["y"])
+    path = points.geometry_path(os.path.join(store, "points.npz"), key)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = partial_path(path)
+        np.save(partial, np.column_stack([columns["x"], columns["y"]]))
+        commit_output(partial, path)
+
+    attributes = {name: np.asarray(column)
+                  for name, column in columns.items()
+                  if name not in ("x", "y")}
+    digest = hashlib.sha1(key.encode("utf-8"))
+    for name in sorted(attributes):
+        digest.update(name.encode("utf-8"))
+        digest.update(np.ascontiguousarray(attributes[name]).tobytes())
+    name = os.path.splitext(os.path.basename(str(adh_points)))[0]
+    output_path = os.path.join(store,
+                               f"{name}_{digest.hexdigest()[:8]}.npz")
+    if not os.path.exists(output_path):
+        partial = partial_path(output_path)
+        np.savez(partial, geometry=np.array(key), **attributes)
+        commit_output(partial, output_path)
+    return output_path
+
+
+def mesh_of(adh_points):
+    """Returns the geometry key of a point set in a mesh store, or None for
+    other point sets."""
+    if not points.is_numpy_points(adh_points):
+        return None
+    with np.load(str(adh_points)) as archive:
+        if "geometry" not in archive.files:
+            return None
+        return str(archive["geometry"])
+
+
+def cache_path(adh_points, name):
+    """Returns the path of a cache file of the mesh of a stored point set."""
+    store = os.path.dirname(os.path.abspath(str(adh_points)))
+    return os.path.join(store, CACHE_FOLDER, name)
+
+
+def _cached(path, calculate):
+    """Loads a cached `.npz` of arrays, calculating and saving it first if
+    needed."""
+    if not os.path.exists(path):
+        arrays = calculate()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = partial_path(path)
+        np.savez(partial, **arrays)
+        commit_output(partial, path)
+        return arrays
+    with np.load(path) as archive:
+        return {name: archive[name] for name in archive.files}
+
+
+@functools.lru_cache(maxsize=4)
+def _node_tree(path, state):
+    from scipy.spatial import cKDTree
+
+    return cKDTree(np.load(path))
+
+
+def node_tree(adh_points):
+    """Returns the KD-tree of every node of the mesh of a stored point set,
+    built once per mesh."""
+    path = points.geometry_path(adh_points, mesh_of(adh_points))
+    return _node_tree(path, tuple(file_state(path) or ()))
+
+
+@functools.lru_cache(maxsize=8)
+def _mask_cells(mask, state):
+    mask_array = raster_io.read_array(mask)
+    rows, cols = np.nonzero(~np.isnan(mask_array))
+    return raster_io.read_grid(mask), mask_array, rows, cols
+
+
+def mask_cells(mask):
+    """Returns the grid of a mask, its values and the rows and columns of
+    its cells, through a cache."""
+    return _mask_cells(str(mask), tuple(file_state(str(mask)) or ()))
+
+
+def cell_neighbours(adh_points, mask, neighbours=12, power=2.0):
+    """Returns the nearest nodes of the mesh of every mask cell.
+
+    :param: adh_points:  string; Path to a stored point set.
+    :param: mask:        string; Path to the mask raster.
+    :param: neighbours:  int; Number of nearest nodes.
+    :param: power:       float; Power of the inverse distance.
+
+    :return:  dict; "index", the `(cells, neighbours)` nodes of the mask
+              cells in the order of `mask_cells`, and "weight", their
+              inverse distance weights (1 for a node on the cell center, 0
+              for the other nodes of the cell).
+    """
+    grid, mask_array, rows, cols = mask_cells(mask)
+    key = grid_key(grid, mask_array, neighbours, power)
+    path = cache_path(adh_points, f"{mesh_of(adh_points)}_idw_{key}.npz")
+
+    def calculate():
+        tree = node_tree(adh_points)
+        col_xs, row_ys = raster_io.cell_centers(grid)
+        k = min(neighbours, tree.n)
+        index = np.empty((rows.size, k), dtype=np.int64)
+        weight = np.empty((rows.size, k))
+        for start in range(0, rows.size, 2 ** 18):
+            batch = slice(start, start + 2 ** 18)
+            distance, nearest = tree.query(
+                np.column_stack([col_xs[cols[batch]], row_ys[rows[batch]]]),
+                k=k, workers=-1)
+            distance = distance.reshape(len(distance), k)
+            with np.errstate(divide="ignore"):
+                batch_weight = distance ** -power
+            exact = np.isinf(batch_weight)
+            hits = exact.any(axis=1)
+            batch_weight[hits] = exact[hits]
+            index[batch] = nearest.reshape(len(distance), k)
+            weight[batch] = batch_weight
+        return {"index": index, "weight": weight}
+
+    return _cached(path, calculate)
+
+
+def node_regions(adh_points, prepared):
+    """Returns the barrier region of every node of the mesh of a stored
+    point set.
+
+    :param: adh_points:  string; Path to a stored point set.
+    :param: prepared:    dict; Barriers from `barriers.prepare`.
+
+    :return:  numpy.ndarray; The region labels, see `barriers.point_regions`.
+    """
+    try:
+        from .barriers import point_regions
+    except ImportError:
+        from barriers import point_regions
+
+    path = cache_path(adh_points, f"{mesh_of(adh_points)}_regions_"
+                                  f"{prepared['key']}.npz")
+
+    def calculate():
+        xy = node_tree(adh_points).data
+        return {"regions": point_regions(prepared["regions"],
+                                         prepared["grid"], xy[:, 0],
+                                         xy[:, 1])}
+
+    return _cached(path, calculate)["regions"]
+
+
+def cell_triangles(adh_points, mask):
+    """Returns the triangle of the mesh holding every mask cell.
+
+    :param: adh_points:  string; Path to a stored point set.
+    :param: mask:        string; Path to the mask raster.
+
+    :return:  dict; "vertices", the `(cells, 3)` nodes of the Delaunay
+              triangle holding each mask cell center in the order of
+              `mask_cells` (-1 outside the mesh), and "weight", their
+              barycentric weights.
+    """
+    from scipy.spatial import Delaunay
+
+    grid, mask_array, rows, cols = mask_cells(mask)
+    key = grid_key(grid, mask_array)
+    path = cache_path(adh_points, f"{mesh_of(adh_points)}_tri_{key}.npz")
+
+    def calculate():
+        triangulation = Delaunay(node_tree(adh_points).data)
+        col_xs, row_ys = raster_io.cell_centers(grid)
+        xy = np.column_stack([col_xs[cols], row_ys[rows]])
+        simplex = triangulation.find_simplex(xy)
+        vertices = triangulation.simplices[simplex]
+        vertices[simplex < 0] = -1
+        # Barycentric coordinates from the affine transform of each simplex
+        transform = triangulation.transform[simplex]
+        partial = np.einsum("nij,nj->ni", transform[:, :2],
+                            xy - transform[:, 2])
+        weight = np.column_stack([partial, 1 - partial.sum(axis=1)])
+        weight[simplex < 0] = 0.0
+        return {"vertices": vertices, "weight": weight}
+
+    return _cached(path, calculate)
+
+
+def main(adh_points, store):
+    for path in [path.strip() for path in adh_points.split(";")
+                 if path.strip()]:
+        stored = store_points(path, store)
+        add_message(f"Stored {path} as {stored}.")
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    adh_points = arcpy.GetParameterAsText(0)
+    store = arcpy.GetParameterAsText(1)
+
+    main(adh_points, store)
@@ -0,0 +1,194 @@
+"""This module contains a pipelined executor for tiled raster calculations.
+
+A calculation over whole rasters runs in three stages that overlap:
+
+- read-ahead: a thread reads and decodes the windows of every input ahead of
+  the calculation,
+- compute: the calculation runs on the calling thread, one window at a time,
+- write-behind: threads encode the finished windows into the outputs. `.npy`
+  outputs are memory maps written in place; the tiles of GeoTIFF outputs are
+  compressed and appended to the file by these threads as each window
+  arrives (see `geotiff.write_block`).
+
+The stages are connected by bounded queues, so at most a few windows are in
+memory at once and a slow stage holds up the others instead of piling up
+work. While the calculation of one window runs, the next windows are read and
+the previous ones are written, so the time per raster approaches the slowest
+stage rather than the sum of the stages.
+
+The derived predictors of `utils` are calculated this way, for `.npy` and
+GeoTIFF rasters alike, with the formulas in `kernels` (see `derive`).
+GeoTIFF inputs are read through arcpy, one window at a time.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from . import align, kernels, raster_io
+except ImportError:
+    import align
+    import kernels
+    import raster_io
+
+
+# utils function: (kernel, names of its raster arguments in kernel order)
+DERIVED = {"rel_velocity": (kernels.rel_velocity, ["vel_alt", "vel_fwop"]),
+           "epi_sed_dep": (kernels.epi_sed_dep,
+                           ["wse_mhhw", "wse_median", "wse_max"]),
+           "depth": (kernels.depth, ["wse_mtl", "bed_elevation"]),
+           "per_light_available": (kernels.per_light_available, ["depth_m"]),
+           "expo_dur": (kernels.expo_dur,
+                        ["wse_100", "wse_0", "wse_mhhw", "wse_mllw"])}
+
+# Marks the end of the windows in a queue
+_END = None
+
+
+def run_tiles(function, inputs, outputs, grid=None, tile_size=1024,
+              read_ahead=2, write_behind=4, writers=2, profiles=None,
+              method="nearest"):
+    """Runs a calculation over rasters window by window, pipelining the reads,
+    the calculation and the writes.
+
+    :param: function:      callable; Called with the input tiles as keyword
+                           arguments (2D arrays, NaN for NoData); returns a
+                           dict of output name to the output tile, or the
+                           tile itself if there is one output.
+    :param: inputs:        dict; Input name to raster path.
+    :param: outputs:       dict; Output name to raster path, see
+                           `raster_io.write_array`.
+    :param: grid:          Grid; The grid of the calculation. Defaults to the
+                           grid of the first input; inputs on other grids are
+                           resampled onto it (see `align.read_aligned`).
+    :param: tile_size:     int; Edge length of the windows in cells.
+    :param: read_ahead:    int; Number of windows read ahead of the
+                           calculation.
+    :param: write_behind:  int; Number of finished windows waiting to be
+                           written before the calculation waits.
+    :param: writers:       int; Number of threads writing windows.
+    :param: profiles:      dict; Optional output name to storage profile,
+                           float32 for outputs not listed.
+    :param: method:        string; Resampling method of the inputs not on the
+                           grid, "nearest" or "bilinear".
+
+    :return:  None. Accomplishes the side effect of writing the outputs.
+    """
+    if grid is None:
+        grid = align.read_grid(next(iter(inputs.values())))
+    for path in inputs.values():
+        if not align.same_coordinate_system(grid, align.read_grid(path)):
+            raise ValueError(f"{path} is not in the coordinate system of the "
+                             f"calculation.")
+    profiles = profiles or {}
+    files = {name: raster_io.open_output(path, grid,
+                                         profiles.get(name, "float32"))
+             for name, path in outputs.items()}
+    read_queue = queue.Queue(read_ahead)
+    write_queue = queue.Queue(write_behind)
+    stop = threading.Event()
+    errors = []
+
+    def fail(error):
+        errors.append(error)
+        stop.set()
+
+    def put(target, item):
+        # Gives up once another stage failed, so no stage blocks forever
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for window in raster_io.windows(grid, tile_size):
+                tiles = {name: align.read_aligned(path, grid, window,
+                                                  method)
+                         for name, path in inputs.items()}
+                if not put(read_queue, (window, tiles)):
+                    return
+        except Exception as e:
+            fail(e)
+        put(read_queue, _END)
+
+    def write():
+        while True:
+            item = write_queue.get()
+            if item is _END:
+                return
+            if stop.is_set():
+                continue
+            window, results = item
+            try:
+                for name, values in results.items():
+                    raster_io.write_window(files[name], values, window)
+            except Exception as e:
+                fail(e)
+
+    threads = [threading.Thread(target=read, daemon=True)]
+    threads += [threading.Thread(target=write, daemon=True)
+                for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    try:
+        while not stop.is_set():
+            try:
+                item = read_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _END:
+                break
+            window, tiles = item
+            results = function(**tiles)
+            if not isinstance(results, dict):
+                results = {name: results for name in outputs}
+            put(write_queue, (window, results))
+    except Exception as e:
+        fail(e)
+    finally:
+        for _ in range(writers):
+            write_queue.put(_END)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+    # Outputs are finished (overviews, statistics) side by side
+    with ThreadPoolExecutor(max_workers=len(files) or 1) as executor:
+        list(executor.map(raster_io.close_output, files.values()))
+
+
+def derive(function, output_folder, output_name, tile_size=1024, grid=None,
+           **rasters):
+    """Calculates a derived predictor of `utils` from rasters.
+
+    :param: function:       string; Name of the `utils` function, a key of
+                            `DERIVED`.
+    :param: output_folder:  string; Path to the output folder.
+    :param: output_name:    string; Name of the output raster.
+    :param: tile_size:      int; Edge length of the windows in cells.
+    :param: grid:           Grid; The grid of the output. Defaults to the
+                            grid of the first input.
+    :param: rasters:        string; Paths of the input rasters, by the names
+                            of the `utils` function arguments.
+
+    :return:  string; Path of the raster written, `.npy` if every input is
+              a `.npy` raster and `.tif` otherwise.
+    """
+    kernel, names = DERIVED[function]
+    ext = (".npy" if all(raster_io.is_numpy_raster(rasters[name])
+                         for name in names) else ".tif")
+    output_path = os.path.join(output_folder, str(output_name) + ext)
+
+    def calculate(**tiles):
+        return kernel(*(tiles[name] for name in names))
+
+    run_tiles(calculate, {name: rasters[name] for name in names},
+              {output_name: output_path}, grid=grid, tile_size=tile_size,
+              profiles={output_name: raster_io.storage_profile(output_name)})
+    return output_path
@@ -0,0 +1,124 @@
+"""This module contains functions for reading AdH mesh node points as numpy
+columns.
+
+AdH mesh nodes are exported as point feature classes, which are read through
+arcpy. Points may also be stored as `.npz` archives of named columns, which is
+what the headless code paths and the benchmarks use. Either way the points are
+returned as a dict of 1D arrays with the node coordinates in the "x" and "y"
+columns.
+
+Archives in a mesh store (see `mesh_store`) hold only attribute columns and a
+"geometry" entry naming the node coordinates they share with every other
+export of the same mesh, in the `geometry` folder of the store.
+"""
+import functools
+import os
+
+import numpy as np
+
+try:
+    from .journal import file_state
+except ImportError:
+    from journal import file_state
+
+
+# Folder of a mesh store holding the shared node coordinates
+GEOMETRY_FOLDER = "geometry"
+
+
+def is_numpy_points(adh_points):
+    """Tests whether a point set uses the numpy (`.npz`) backend.
+
+    :param: adh_points:  string; Path to a point feature class or archive.
+
+    :return:  bool; True if the points are stored as a `.npz` archive.
+    """
+    return str(adh_points).lower().endswith(".npz")
+
+
+def read_points(adh_points, fields=None):
+    """Reads AdH mesh node coordinates and attributes.
+
+    :param: adh_points:  string; Path to a point feature class or a `.npz`
+                         archive.
+    :param: fields:      list; Names of the attribute columns to read. All
+                         columns of a `.npz` archive are read if omitted;
+                         feature classes require the fields to be named.
+
+    :return:  dict; Column name to 1D array, including "x" and "y".
+    """
+    if is_numpy_points(adh_points):
+        with np.load(str(adh_points)) as archive:
+            names = archive.files if fields is None else ["x", "y"] + [
+                field for field in fields if field not in ("x", "y")]
+            if "geometry" not in archive.files:
+                return {name: archive[name] for name in names}
+            path = geometry_path(adh_points, str(archive["geometry"]))
+            columns = {name: archive[name] for name in names
+                       if name not in ("x", "y", "geometry")}
+        xy = _read_geometry(path, tuple(file_state(path) or ()))
+        columns.update(x=xy[:, 0], y=xy[:, 1])
+        return columns
+
+    import arcpy
+
+    fields = [field for field in fields or [] if field not in ("x", "y")]
+    table = arcpy.da.FeatureClassToNumPyArray(
+        str(adh_points), ["SHAPE@X", "SHAPE@Y"] + fields)
+    columns = {"x": table["SHAPE@X"], "y": table["SHAPE@Y"]}
+    columns.update((field, table[field]) for field in fields)
+    return columns
+
+
+def geometry_path(adh_points, key):
+    """Returns the path of the node coordinates of a point set in a mesh
+    store."""
+    return os.path.join(os.path.dirname(os.path.abspath(str(adh_points))),
+                        GEOMETRY_FOLDER, key + ".npy")
+
+
+@functools.lru_cache(maxsize=8)
+def _read_geometry(path, state):
+    xy = np.load(path)
+    xy.flags.writeable = False
+    return xy
+
+
+def write_points(columns, output_path):
+    """Writes point columns to a `.npz` archive.
+
+    :param: columns:      dict; Column name to 1D array, including "x" and
+                          "y".
+    :param: output_path:  string; Path of the output archive.
+
+    :return:  None. Accomplishes the side effect of saving the archive.
+    """
+    np.savez(str(output_path), **columns)
+
+
+def write_feature_class(columns, output_path, spatial_reference):
+    """Writes point columns to a point feature class through arcpy.
+
+    :param: columns:            dict; Column name to 1D array, including "x"
+                                and "y".
+    :param: output_path:        string; Path of the feature class, e.g. in
+                                the "memory" workspace. An existing feature
+                                class is replaced.
+    :param: spatial_reference:  arcpy.SpatialReference; The coordinate
+                                system of "x" and "y".
+
+    :return:  string; The path of the feature class.
+    """
+    import arcpy
+
+    names = ["x", "y"] + [name for name in columns if name not in ("x", "y")]
+    table = np.empty(len(columns["x"]),
+                     dtype=[(name, np.float64) for name in names])
+    for name in names:
+        table[name] = columns[name]
+    # NumPyArrayToFeatureClass does not honour `overwriteOutput`
+    if arcpy.Exists(str(output_path)):
+        arcpy.Delete_management(str(output_path))
+    arcpy.da.NumPyArrayToFeatureClass(table, str(output_path), ("x", "y"),
+                                      spatial_reference)
+    return str(output_path)
@@ -0,0 +1,282 @@
+"""This module contains functions for checking the inputs of a scenario before
+any step runs.
+
+A bad input otherwise only shows up when the step reading it runs, which can
+be an hour into a scenario. The preflight checks every input the steps read
+that no step writes (see `update_AdH_predictors.scenario_steps`):
+
+- AdH point sets exist and hold the columns each step interpolates or
+  selects on,
+- rasters exist, have a NoData value, and are on the grid of the mask: same
+  coordinate system and cell size, snapped to the mask cells and covering
+  the mask extent,
+- barriers exist and are in the coordinate system of the mask.
+
+Only headers and metadata are read (the `.json` sidecar and array header of
+`.npy` rasters, the column names of `.npz` archives, `arcpy.Describe`
+otherwise), and the inputs are checked concurrently, so the preflight takes
+seconds. `.npz` archives carry no coordinate system and are not checked for
+one.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from . import filters, points, raster_io, utils
+    from .barriers import is_numpy_barriers
+except ImportError:
+    import filters
+    import points
+    import raster_io
+    import utils
+    from barriers import is_numpy_barriers
+
+
+# Relative tolerance of cell size and snap comparisons
+TOLERANCE = 1e-6
+
+
+def exists(path):
+    """Tests whether a file, or a dataset in a geodatabase, exists."""
+    path = str(path)
+    if os.path.exists(path):
+        return True
+    if raster_io.is_numpy_raster(path) or points.is_numpy_points(path):
+        return False
+
+    import arcpy
+
+    with raster_io._arcpy_lock:
+        return arcpy.Exists(path)
+
+
+def point_columns(adh_points):
+    """Reads the names of the attribute columns of a point set."""
+    if points.is_numpy_points(adh_points):
+        with np.load(str(adh_points)) as archive:
+            return list(archive.files)
+
+    import arcpy
+
+    with raster_io._arcpy_lock:
+        return [field.name for field in arcpy.ListFields(str(adh_points))]
+
+
+def dataset_spatial_reference(dataset):
+    """Reads the spatial reference of a feature class, None for `.npz`
+    archives."""
+    if points.is_numpy_points(dataset) or is_numpy_barriers(dataset):
+        return None
+
+    import arcpy
+
+    with raster_io._arcpy_lock:
+        return arcpy.Describe(str(dataset)).spatialReference.exportToString()
+
+
+def raster_nodata(raster):
+    """Reads the NoData value of a raster.
+
+    :return:  The NoData value; NaN for `.npy` rasters with a float dtype, or
+              None if the raster has none.
+    """
+    if raster_io.is_numpy_raster(raster):
+        with open(str(raster), "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        grid = raster_io.read_grid(raster)
+        if shape != (grid.nrows, grid.ncols):
+            raise ValueError(f"holds {shape} cells, its sidecar "
+                             f"{(grid.nrows, grid.ncols)}")
+        profile = raster_io.read_profile(raster)
+        if profile is not None:
+            return profile["nodata"]
+        return np.nan if dtype.kind == "f" else None
+
+    import arcpy
+
+    with raster_io._arcpy_lock:
+        return arcpy.Raster(str(raster)).noDataValue
+
+
+def check_points(adh_points, columns):
+    """Checks that a point set exists and holds columns.
+
+    :param: adh_points:  string; Path to a point feature class or a `.npz`
+                         archive.
+    :param: columns:     list; Names of the required columns.
+
+    :return:  list; Descriptions of the problems found.
+    """
+    if not exists(adh_points):
+        return [f"{adh_points} does not exist."]
+    # Geodatabase field names are not case sensitive
+    found = {name.lower() for name in point_columns(adh_points)}
+    return [f"{adh_points} has no column {column}."
+            for column in columns if column.lower() not in found]
+
+
+def check_grid(raster, grid, mask_grid):
+    """Compares the grid of a raster to the grid of the mask.
+
+    :return:  list; Descriptions of the problems found.
+    """
+    problems = []
+    if raster_io.coordinate_system(grid.spatial_reference) != \
+            raster_io.coordinate_system(mask_grid.spatial_reference):
+        problems.append(f"{raster} is not in the coordinate system of the "
+                        f"mask.")
+    cell_size = mask_grid.cell_size
+    if abs(grid.cell_size - cell_size) > TOLERANCE * cell_size:
+        problems.append(f"{raster} has cells of {grid.cell_size}, the mask "
+                        f"of {cell_size}.")
+        return problems
+    for name, value, origin in [("x", grid.x_min, mask_grid.x_min),
+                                ("y", grid.y_min, mask_grid.y_min)]:
+        offset = (value - origin) / cell_size
+        if abs(offset - round(offset)) > TOLERANCE:
+            problems.append(f"{raster} is not snapped to the mask cells "
+                            f"along {name}.")
+    x_max = grid.x_min + grid.ncols * grid.cell_size
+    y_max = grid.y_min + grid.nrows * grid.cell_size
+    mask_x_max = mask_grid.x_min + mask_grid.ncols * cell_size
+    mask_y_max = mask_grid.y_min + mask_grid.nrows * cell_size
+    margin = TOLERANCE * cell_size
+    if grid.x_min > mask_grid.x_min + margin or \
+            grid.y_min > mask_grid.y_min + margin or \
+            x_max < mask_x_max - margin or y_max < mask_y_max - margin:
+        problems.append(f"{raster} does not cover the extent of the mask.")
+    return problems
+
+
+def check_raster(raster, mask_grid):
+    """Checks that a raster exists, has a NoData value and is on the grid of
+    the mask.
+
+    :param: raster:     string; Path to the raster.
+    :param: mask_grid:  Grid; The grid of the mask.
+
+    :return:  list; Descriptions of the problems found.
+    """
+    if not exists(raster):
+        return [f"{raster} does not exist."]
+    try:
+        nodata = raster_nodata(raster)
+        grid = raster_io.read_grid(raster)
+    except (OSError, KeyError, ValueError) as e:
+        return [f"{raster} could not be read: {e}"]
+    problems = [] if nodata is not None else [
+        f"{raster} has no NoData value."]
+    return problems + check_grid(raster, grid, mask_grid)
+
+
+def check_barriers(barriers, mask_grid):
+    """Checks that barriers exist and are in the coordinate system of the
+    mask.
+
+    :return:  list; Descriptions of the problems found.
+    """
+    if not exists(barriers):
+        return [f"{barriers} does not exist."]
+    spatial_reference = dataset_spatial_reference(barriers)
+    if spatial_reference is not None and \
+            raster_io.coordinate_system(spatial_reference) != \
+            raster_io.coordinate_system(mask_grid.spatial_reference):
+        return [f"{barriers} is not in the coordinate system of the mask."]
+    return []
+
+
+def step_checks(steps, mask_grid):
+    """Lists the checks of the inputs of steps that no step writes.
+
+    :param: steps:      list; Steps from `scenario_steps`.
+    :param: mask_grid:  Grid; The grid of the mask.
+
+    :return:  list; `(function, args)` checks, one per input.
+    """
+    outputs = set()
+    for step in steps:
+        args = step["args"]
+        if "output_folder" in args:
+            outputs.add(os.path.normcase(os.path.abspath(os.path.join(
+                args["output_folder"], args["output_name"] + ".tif"))))
+    columns = {}
+    rasters = []
+    barriers = []
+    for step in steps:
+        args = step["args"]
+        if "adh_points" in args:
+            names = columns.setdefault(args["adh_points"], [])
+            try:
+                fields = [field for field, _, _ in
+                          filters.parse(args.get("sql_select"))]
+            except ValueError:
+                fields = []
+            for name in [args["variable"]] + fields:
+                if name not in names:
+                    names.append(name)
+        for name, value in args.items():
+            if name in ("output_folder", "output_name", "variable",
+                        "sql_select", "method", "adh_points", "mask"):
+                continue
+            if name == "barriers":
+                if value and value not in barriers:
+                    barriers.append(value)
+            elif os.path.normcase(os.path.abspath(value)) not in outputs \
+                    and value not in rasters:
+                rasters.append(value)
+    return ([(check_points, (path, names))
+             for path, names in columns.items()] +
+            [(check_raster, (path, mask_grid)) for path in rasters] +
+            [(check_barriers, (path, mask_grid)) for path in barriers])
+
+
+def check_steps(steps, mask, workers=8):
+    """Checks the inputs of steps concurrently.
+
+    :param: steps:    list; Steps from `scenario_steps`.
+    :param: mask:     string; Path to the mask raster.
+    :param: workers:  int; Number of inputs checked at once.
+
+    :return:  list; Descriptions of the problems found, empty if every input
+              passed.
+    """
+    if not exists(mask):
+        return [f"Mask {mask} does not exist."]
+    try:
+        mask_grid = raster_io.read_grid(mask)
+    except (OSError, KeyError, ValueError) as e:
+        return [f"Mask {mask} could not be read: {e}"]
+    checks = step_checks(steps, mask_grid)
+
+    def run(check):
+        function, args = check
+        try:
+            return function(*args)
+        except Exception as e:
+            return [f"{args[0]} could not be checked: {e}"]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [problem for problems in executor.map(run, checks)
+                for problem in problems]
+
+
+def require_valid(steps, mask, workers=8):
+    """Checks the inputs of steps, raising ValueError if any is bad.
+
+    Every problem is written to the geoprocessing messages before raising,
+    so a bad batch can be fixed in one go.
+
+    :return:  None.
+    """
+    problems = check_steps(steps, mask, workers)
+    for problem in problems:
+        utils.add_message(problem)
+    if problems:
+        raise ValueError(f"Preflight found {len(problems)} problems with "
+                         f"the inputs; see the messages.")
@@ -0,0 +1,196 @@
+"""Calculate a coarse preview of the AdH rasters for a scenario.
+
+Runs the same steps as `update_AdH_predictors`, but on a copy of the mask
+aggregated to a coarser cell size, so a new AdH run can be checked in a
+fraction of the time of the full resolution build. The preview is written to
+a `preview/<cell size>` subfolder of the alternative with the usual model
+folder structure. Inputs that the steps do not calculate themselves (e.g.
+`bed_elevation`) are read from the alternative and the FWOP at full resolution
+and resampled by the map algebra.
+
+Several cell sizes separated by semicolons (e.g. "100;50") are run from
+coarse to fine, so the coarsest preview is available first. Predictors
+interpolated with a fast method (see `update_AdH_predictors.FAST_METHODS`)
+are seeded with their solution at the previous cell size, so only the cells
+where it is not smooth are solved again (see `seed_steps`).
+`SplineWithBarriers` cannot be seeded and solves every cell at every size.
+
+:param: path_to_fwop:  string; Path to the parent folder of the existing
+                       condition scenario (aka, Future WithOut Project, FWOP).
+:param: path_to_alt:   string; Path to the parent folder of the alternative.
+:param: adh_velocity:  string; Path to the AdH folder holding the model
+                       velocity results for this alternative.
+:param: adh_salinity:  string; Path to the AdH folder holding the model
+                       salinity results for this alternative.
+:param: adh_wse:       string; Path to the AdH folder holding the model
+                       water surface elevation results for this alternative.
+:param: barriers:      line feature class; A line feature class
+                       representing barriers used during interpolation.
+:param: mask:          raster; The full resolution mask raster.
+:param: cell_size:     string; The preview cell size(s) in map units, e.g.
+                       "100" or "100;50".
+
+:return:    None. Preview AdH rasters written to the preview folder of the
+            alternative for each cell size.
+"""
+import os
+
+try:
+    from . import create_new_scenario, raster_io, utils
+    from .barriers import prepared_feature_class
+    from .update_AdH_predictors import (NON_INPUT_ARGS, run_steps,
+                                        scenario_steps, step_outputs)
+except ImportError:
+    import create_new_scenario
+    import raster_io
+    import utils
+    from barriers import prepared_feature_class
+    from update_AdH_predictors import (NON_INPUT_ARGS, run_steps,
+                                       scenario_steps, step_outputs)
+
+
+def preview_folder(path_to_alt, cell_size):
+    """Returns the folder of the preview of an alternative at a cell size."""
+    return os.path.join(path_to_alt, "preview", f"{float(cell_size):g}")
+
+
+def coarsen_mask(mask, cell_size, output_folder):
+    """Aggregates a mask raster to a coarser cell size.
+
+    A coarse cell is part of the mask if any of its fine cells is.
+
+    :param: mask:           string; Path to the full resolution mask.
+    :param: cell_size:      float; The preview cell size in map units. It is
+                            rounded to a whole multiple of the mask cell size.
+    :param: output_folder:  string; Folder the coarse mask is written to.
+
+    :return:  string; Path to the coarse mask.
+    """
+    if raster_io.is_numpy_raster(mask):
+        grid = raster_io.read_grid(mask)
+        factor = max(1, int(round(cell_size / grid.cell_size)))
+        output_path = os.path.join(output_folder, "mask.npy")
+        raster_io.write_array(
+            raster_io.aggregate(raster_io.read_array(mask), factor, "max"),
+            raster_io.coarsen_grid(grid, factor), output_path)
+        return output_path
+
+    import arcpy
+
+    mask_cell_size = float(arcpy.GetRasterProperties_management(
+        mask, "CELLSIZEX").getOutput(0))
+    factor = max(1, int(round(cell_size / mask_cell_size)))
+    output_path = os.path.join(output_folder, "mask.tif")
+    partial = utils.partial_path(output_path)
+    coarse = arcpy.sa.Aggregate(mask, factor, "MAXIMUM", "EXPAND", "DATA")
+    arcpy.CopyRaster_management(coarse, partial)
+    utils.commit_output(partial, output_path)
+    return output_path
+
+
+def preview_steps(steps, path_to_alt, path_to_preview):
+    """Points the inputs of preview steps at the full resolution alternative.
+
+    Inputs under the preview folder that no earlier step writes (static
+    predictors such as `bed_elevation`) are read from the same location in
+    the alternative instead. The mask and barriers are left as given, since
+    they are prepared for the preview.
+
+    :param: steps:            list; Steps from `scenario_steps` for the
+                              preview folder.
+    :param: path_to_alt:      string; Path to the alternative folder.
+    :param: path_to_preview:  string; Path to the preview folder.
+
+    :return:  list; The updated steps.
+    """
+    root = os.path.normpath(path_to_preview) + os.sep
+    written = set()
+    updated = []
+    for step in steps:
+        args = dict(step["args"])
+        for name, value in step["args"].items():
+            if name in NON_INPUT_ARGS + ("barriers", "mask") or \
+                    not isinstance(value, str):
+                continue
+            path = os.path.normpath(value)
+            if path.startswith(root) and path not in written:
+                args[name] = os.path.join(path_to_alt,
+                                          os.path.relpath(path, root))
+        updated.append(dict(step, args=args))
+        written.update(os.path.normpath(output)
+                       for output in step_outputs(step))
+    return updated
+
+
+def seed_steps(steps, path_to_preview, path_to_coarser):
+    """Seeds the fast interpolation steps of a preview with the coarser
+    preview.
+
+    :param: steps:            list; Steps of the preview.
+    :param: path_to_preview:  string; Path to the preview folder.
+    :param: path_to_coarser:  string; Path to the folder of the preview at
+                              the previous, coarser cell size.
+
+    :return:  list; The updated steps.
+    """
+    updated = []
+    for step in steps:
+        if step["function"] == "adh2raster" and \
+                step["args"].get("method", "spline") != "spline":
+            output = step_outputs(step)[0]
+            seed = os.path.join(path_to_coarser,
+                                os.path.relpath(output, path_to_preview))
+            if raster_io.is_numpy_raster(step["args"]["mask"]):
+                seed = os.path.splitext(seed)[0] + ".npy"
+            step = dict(step, args=dict(step["args"], seed=seed))
+        updated.append(step)
+    return updated
+
+
+def main(path_to_fwop, path_to_alt, adh_velocity, adh_salinity, adh_wse,
+         barriers, mask, cell_size, resume=True):
+    import arcpy
+
+    arcpy.env.compression = "LZW"
+    arcpy.env.overwriteOutput = True
+
+    cell_sizes = sorted((float(size) for size in str(cell_size).split(";")
+                         if size.strip()), reverse=True)
+    path_to_coarser = None
+    for size in cell_sizes:
+        path_to_preview = preview_folder(path_to_alt, size)
+        utils.add_message(f"# Preview at {size:g}")
+        create_new_scenario.main(path_to_preview)
+        preview_mask = coarsen_mask(mask, size, path_to_preview)
+
+        # The derived predictors are calculated on the coarse grid too
+        arcpy.env.cellSize = preview_mask
+        arcpy.env.extent = preview_mask
+        arcpy.env.snapRaster = preview_mask
+
+        steps = scenario_steps(path_to_fwop, path_to_preview, adh_velocity,
+                               adh_salinity, adh_wse,
+                               prepared_feature_class(barriers, preview_mask),
+                               preview_mask)
+        steps = preview_steps(steps, path_to_alt, path_to_preview)
+        if path_to_coarser is not None:
+            steps = seed_steps(steps, path_to_preview, path_to_coarser)
+        run_steps(steps, path_to_preview, resume)
+        path_to_coarser = path_to_preview
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    path_to_fwop = arcpy.GetParameterAsText(0)
+    path_to_alt = arcpy.GetParameterAsText(1)
+    adh_velocity = arcpy.GetParameterAsText(2)
+    adh_salinity = arcpy.GetParameterAsText(3)
+    adh_wse = arcpy.GetParameterAsText(4)
+    barriers = arcpy.GetParameterAsText(5)
+    mask = arcpy.GetParameterAsText(6)
+    cell_size = arcpy.GetParameterAsText(7)
+
+    main(path_to_fwop, path_to_alt, adh_velocity, adh_salinity, adh_wse,
+         barriers, mask, cell_size)
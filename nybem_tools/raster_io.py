@@ -0,0 +1,973 @@
+"""This module contains functions for reading and writing predictor rasters as
+numpy arrays.
+
+Two storage backends are supported. GeoTIFF (and any other format arcpy can
+read) is read through arcpy, which is only imported when such a raster is
+actually touched; GeoTIFFs are written with `geotiff`. Rasters with a `.npy` extension are plain numpy arrays with a
+`.json` sidecar describing their grid; these are used by the headless code
+paths that must run without an ArcGIS license.
+
+A raster's grid is described by a `Grid`: the lower left corner, the (square)
+cell size, the number of rows and columns and the spatial reference as a
+string. Windows into a grid are `(row_off, col_off, nrows, ncols)` tuples with
+row 0 at the top of the raster.
+
+Predictors can be stored with a compact storage profile (see `PROFILES`):
+32 bit floats, or integers with a scale and offset. The profile of a quantized
+raster is kept in its sidecar and values are decoded to floats on read.
+
+Statistics (valid cell count, minimum, maximum, mean, standard deviation and a
+histogram) and overviews are gathered while a raster is written, so no extra
+pass over the data is needed. Statistics are kept in the `.json` sidecar of
+`.npy` rasters and the `.aux.xml` of GeoTIFFs, where ArcGIS and GDAL read
+them. Overviews are the internal pyramids of a GeoTIFF and a
+`<name>.overviews.npz` sidecar of a `.npy` raster. Every raster written is
+recorded in the run manifest if one is open (see `manifest`).
+"""
+import contextlib
+import fnmatch
+import glob
+import json
+import math
+import os
+import struct
+import threading
+import warnings
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+try:
+    from . import geotiff, utils
+except ImportError:
+    import geotiff
+    import utils
+
+
+Grid = namedtuple("Grid", ["x_min", "y_min", "cell_size", "nrows", "ncols",
+                           "spatial_reference"])
+# A raster being written, see `open_output`
+Output = namedtuple("Output", ["path", "partial", "grid", "profile",
+                               "stored", "statistics", "overviews", "lock"])
+
+# Most bins of a histogram; bins are powers of 2 wide, see `histogram`
+HISTOGRAM_BINS = 256
+# Overviews are built down to about this many cells along the longer edge
+OVERVIEW_SIZE = 256
+MANIFEST_NAME = "nybem_manifest.jsonl"
+_manifest_path = None
+_manifest_lock = threading.Lock()
+
+# arcpy raster access is not thread safe
+_arcpy_lock = threading.RLock()
+
+# Storage profiles. Values are stored as `(value - offset) / scale` rounded to
+# the profile's cell type, with `nodata` marking NoData cells.
+PROFILES = {
+    "float32": {"dtype": "float32", "scale": 1.0, "offset": 0.0,
+                "nodata": None},
+    # 0 to 65.5 ppt in steps of 0.001 ppt
+    "salinity": {"dtype": "uint16", "scale": 0.001, "offset": 0.0,
+                 "nodata": 65535},
+    # -6.5 to 6.5 m in steps of 0.2 mm
+    "wse": {"dtype": "int16", "scale": 0.0002, "offset": 0.0,
+            "nodata": -32768},
+    # 0 to 6.5 m/s in steps of 0.1 mm/s
+    "velocity": {"dtype": "uint16", "scale": 0.0001, "offset": 0.0,
+                 "nodata": 65535},
+    # 0 to 655 % in steps of 0.01 %; light above 100 % occurs on cells above
+    # the water surface, which reach 400 % at a depth of -1 m
+    "percent": {"dtype": "uint16", "scale": 0.01, "offset": 0.0,
+                "nodata": 65535},
+}
+
+# Quantized profile of each predictor, by output name pattern. Predictors not
+# listed here (e.g. the ratios esd and exp_dur) are always stored as float32.
+PREDICTOR_PROFILES = [("sal_*", "salinity"),
+                      ("mhhw", "wse"),
+                      ("mllw", "wse"),
+                      ("mtl", "wse"),
+                      ("wse_*", "wse"),
+                      ("vel_[0-9]*", "velocity"),
+                      ("pla", "percent")]
+
+ARCPY_PIXEL_TYPES = {"float32": "32_BIT_FLOAT",
+                     "int16": "16_BIT_SIGNED",
+                     "uint16": "16_BIT_UNSIGNED"}
+
+
+def is_numpy_raster(raster):
+    """Tests whether a raster path uses the numpy (`.npy`) backend.
+
+    :param: raster:  string; Path to a raster.
+
+    :return:  bool; True if the raster is stored as a `.npy` array.
+    """
+    return str(raster).lower().endswith(".npy")
+
+
+def sidecar_path(raster):
+    """Returns the path of the `.json` sidecar of a raster.
+
+    `.npy` rasters always have a sidecar; other rasters only have one when
+    they are stored with a quantized profile.
+
+    :param: raster:  string; Path to a raster.
+
+    :return:  string; Path to the sidecar file.
+    """
+    return os.path.splitext(str(raster))[0] + ".json"
+
+
+def read_metadata(raster):
+    """Reads the sidecar metadata of a raster.
+
+    :param: raster:  string; Path to a raster.
+
+    :return:  dict; The sidecar contents.
+    """
+    with open(sidecar_path(raster)) as f:
+        return json.load(f)
+
+
+def storage_profile(output_name, quantize=None):
+    """Returns the storage profile for a predictor.
+
+    :param: output_name:  string; Name of the predictor raster, without
+                          extension.
+    :param: quantize:     bool; Whether to use quantized profiles. Defaults
+                          to True if the `NYBEM_QUANTIZE` environment
+                          variable is set. Quantized GeoTIFFs are only
+                          decoded by this package, so they are off by
+                          default.
+
+    :return:  dict; The storage profile.
+    """
+    if quantize is None:
+        quantize = bool(os.environ.get("NYBEM_QUANTIZE"))
+    if quantize:
+        for pattern, profile in PREDICTOR_PROFILES:
+            if fnmatch.fnmatchcase(str(output_name), pattern):
+                return dict(PROFILES[profile])
+    return dict(PROFILES["float32"])
+
+
+def value_range(profile):
+    """Returns the lowest and highest stored value of a quantized profile.
+
+    The NoData value is excluded from the range.
+    """
+    info = np.iinfo(profile["dtype"])
+    lowest, highest = int(info.min), int(info.max)
+    if profile["nodata"] == lowest:
+        lowest += 1
+    if profile["nodata"] == highest:
+        highest -= 1
+    return lowest, highest
+
+
+def encode(array, profile):
+    """Converts values to their stored representation.
+
+    :param: array:    numpy.ndarray; Values, NaN for NoData.
+    :param: profile:  dict; The storage profile.
+
+    :return:  numpy.ndarray; The stored values. Values outside the range of
+              a quantized profile are stored as NoData with a warning, as
+              clipping them would silently change them.
+    """
+    if profile["nodata"] is None:
+        return np.asarray(array, dtype=profile["dtype"])
+    lowest, highest = value_range(profile)
+    with np.errstate(invalid="ignore"):
+        stored = np.floor((array - profile["offset"]) / profile["scale"] +
+                          0.5)
+        outside = (stored < lowest) | (stored > highest)
+    if outside.any():
+        warnings.warn("{} values outside the range {:g} to {:g} of the storage "
+                      "profile were stored as NoData".format(
+                          int(outside.sum()),
+                          lowest * profile["scale"] + profile["offset"],
+                          highest * profile["scale"] + profile["offset"]),
+                      RuntimeWarning)
+        stored[outside] = np.nan
+    stored[np.isnan(stored)] = profile["nodata"]
+    return stored.astype(profile["dtype"])
+
+
+def decode(stored, profile):
+    """Converts stored values back to float values.
+
+    :param: stored:   numpy.ndarray; Stored values.
+    :param: profile:  dict; The storage profile, or None for plain values.
+
+    :return:  numpy.ndarray; A float64 array with NoData cells set to NaN.
+    """
+    array = np.array(stored, dtype=np.float64)
+    if profile is None:
+        return array
+    if profile.get("nodata") is not None:
+        array[stored == profile["nodata"]] = np.nan
+    if profile.get("scale", 1.0) != 1.0 or profile.get("offset", 0.0) != 0.0:
+        array *= profile["scale"]
+        array += profile["offset"]
+    return array
+
+
+def read_profile(raster):
+    """Reads the storage profile of a raster.
+
+    :param: raster:  string; Path to a raster.
+
+    :return:  dict; The storage profile, or None if the raster holds plain
+              values.
+    """
+    if not os.path.exists(sidecar_path(raster)):
+        return None
+    meta = read_metadata(raster)
+    if meta.get("nodata") is None and meta.get("scale", 1.0) == 1.0 and \
+            meta.get("offset", 0.0) == 0.0:
+        return None
+    return {key: meta.get(key) for key in ("dtype", "scale", "offset",
+                                           "nodata")}
+
+
+def write_profile(raster, profile, grid=None):
+    """Writes the sidecar of a raster recording its storage profile.
+
+    :param: raster:   string; Path to the raster.
+    :param: profile:  dict; The storage profile.
+    :param: grid:     Grid; The grid of the raster, required for `.npy`
+                      rasters.
+
+    :return:  None. Accomplishes the side effect of writing the sidecar.
+    """
+    meta = dict(grid._asdict()) if grid is not None else {}
+    meta.update(profile)
+    with open(sidecar_path(raster), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def read_grid(raster):
+    """Reads the grid of a raster without reading its cell values.
+
+    :param: raster:  string; Path to a raster.
+
+    :return:  Grid; The grid of the raster.
+    """
+    if is_numpy_raster(raster):
+        meta = read_metadata(raster)
+        return Grid(meta["x_min"], meta["y_min"], meta["cell_size"],
+                    meta["nrows"], meta["ncols"],
+                    meta.get("spatial_reference"))
+
+    import arcpy
+
+    with _arcpy_lock:
+        desc = arcpy.Describe(str(raster))
+        return Grid(desc.extent.XMin, desc.extent.YMin, desc.meanCellWidth,
+                    desc.height, desc.width,
+                    desc.spatialReference.exportToString())
+
+
+def same_grid(grid_a, grid_b, tolerance=1e-6):
+    """Tests whether two grids have the same geometry.
+
+    The spatial reference is not compared; only origin, cell size and
+    dimensions.
+
+    :param: grid_a:     Grid; The first grid.
+    :param: grid_b:     Grid; The second grid.
+    :param: tolerance:  float; Allowed difference in map units, as a fraction
+                        of the cell size.
+
+    :return:  bool; True if every cell of one grid coincides with a cell of
+              the other.
+    """
+    tol = tolerance * grid_a.cell_size
+    return (grid_a.nrows == grid_b.nrows and grid_a.ncols == grid_b.ncols
+            and abs(grid_a.cell_size - grid_b.cell_size) <= tol
+            and abs(grid_a.x_min - grid_b.x_min) <= tol
+            and abs(grid_a.y_min - grid_b.y_min) <= tol)
+
+
+def coordinate_system(spatial_reference):
+    """Returns the coordinate system part of a spatial reference string,
+    without the domains and tolerances that follow it."""
+    return (spatial_reference or "").split(";")[0].strip()
+
+
+def windows(grid, tile_size=1024):
+    """Splits a grid into square tiles.
+
+    :param: grid:       Grid; The grid to split.
+    :param: tile_size:  int; Edge length of a tile in cells. Tiles on the
+                        right and bottom edges may be smaller.
+
+    :return:  list; `(row_off, col_off, nrows, ncols)` windows covering the
+              grid, in row-major order.
+    """
+    return [(row, col, min(tile_size, grid.nrows - row),
+             min(tile_size, grid.ncols - col))
+            for row in range(0, grid.nrows, tile_size)
+            for col in range(0, grid.ncols, tile_size)]
+
+
+def window_grid(grid, window):
+    """Returns the grid covered by a window.
+
+    :param: grid:    Grid; The parent grid.
+    :param: window:  tuple; A `(row_off, col_off, nrows, ncols)` window.
+
+    :return:  Grid; The grid of the window.
+    """
+    row, col, nrows, ncols = window
+    return grid._replace(
+        x_min=grid.x_min + col * grid.cell_size,
+        y_min=grid.y_min + (grid.nrows - row - nrows) * grid.cell_size,
+        nrows=nrows, ncols=ncols)
+
+
+def coarsen_grid(grid, factor):
+    """Returns the grid of a raster aggregated by a factor.
+
+    The upper left corner is kept; the last row and column of the coarse
+    grid may extend past the original grid.
+
+    :param: grid:    Grid; The fine grid.
+    :param: factor:  int; Number of fine cells along each edge of a coarse
+                     cell.
+
+    :return:  Grid; The coarse grid.
+    """
+    nrows = -(-grid.nrows // factor)
+    ncols = -(-grid.ncols // factor)
+    cell_size = grid.cell_size * factor
+    y_max = grid.y_min + grid.nrows * grid.cell_size
+    return grid._replace(y_min=y_max - nrows * cell_size,
+                         cell_size=cell_size, nrows=nrows, ncols=ncols)
+
+
+def aggregate(array, factor, statistic="mean"):
+    """Aggregates an array to the coarse grid of `coarsen_grid`.
+
+    :param: array:      numpy.ndarray; A 2D array, NaN for NoData.
+    :param: factor:     int; Number of fine cells along each edge of a coarse
+                        cell.
+    :param: statistic:  string; "mean", "max" or "min" of the fine cells
+                        that are not NoData.
+
+    :return:  numpy.ndarray; The coarse array. Coarse cells without any data
+              are NaN.
+    """
+    nrows = -(-array.shape[0] // factor)
+    ncols = -(-array.shape[1] // factor)
+    padded = np.full((nrows * factor, ncols * factor), np.nan)
+    padded[:array.shape[0], :array.shape[1]] = array
+    blocks = padded.reshape(nrows, factor, ncols, factor)
+    functions = {"mean": np.nanmean, "max": np.nanmax, "min": np.nanmin}
+    with warnings.catch_warnings():
+        # Blocks without data are expected and come out as NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return functions[statistic](blocks, axis=(1, 3))
+
+
+def cell_centers(grid):
+    """Returns the coordinates of the cell centers of a grid.
+
+    :param: grid:  Grid; The grid.
+
+    :return:  tuple; 1D arrays of the x coordinates of the columns and the y
+              coordinates of the rows (top row first).
+    """
+    xs = grid.x_min + (np.arange(grid.ncols) + 0.5) * grid.cell_size
+    ys = grid.y_min + (grid.nrows - np.arange(grid.nrows) - 0.5) * \
+        grid.cell_size
+    return xs, ys
+
+
+def cell_index(grid, xs, ys):
+    """Returns the row and column of the cells containing coordinates.
+
+    Coordinates outside the grid get rows or columns outside its range.
+    """
+    y_max = grid.y_min + grid.nrows * grid.cell_size
+    rows = np.floor((y_max - np.asarray(ys)) / grid.cell_size).astype(int)
+    cols = np.floor((np.asarray(xs) - grid.x_min) /
+                    grid.cell_size).astype(int)
+    return rows, cols
+
+
+def read_array(raster, window=None):
+    """Reads raster cell values as a float array.
+
+    :param: raster:  string; Path to a raster.
+    :param: window:  tuple; Optional `(row_off, col_off, nrows, ncols)`
+                     window. The full raster is read if omitted.
+
+    :return:  numpy.ndarray; A 2D float array with NoData cells set to NaN.
+    """
+    profile = read_profile(raster)
+    if is_numpy_raster(raster):
+        data = np.load(str(raster), mmap_mode="r")
+        if window is not None:
+            row, col, nrows, ncols = window
+            data = data[row:row + nrows, col:col + ncols]
+        return decode(data, profile)
+
+    import arcpy
+
+    with _arcpy_lock:
+        in_raster = arcpy.Raster(str(raster))
+        if window is None:
+            array = arcpy.RasterToNumPyArray(in_raster)
+        else:
+            grid = read_grid(raster)
+            sub = window_grid(grid, window)
+            array = arcpy.RasterToNumPyArray(
+                in_raster, arcpy.Point(sub.x_min, sub.y_min),
+                sub.ncols, sub.nrows)
+        nodata = in_raster.noDataValue
+    if profile is not None:
+        return decode(array, profile)
+    array = array.astype(np.float64)
+    if nodata is not None:
+        array[array == nodata] = np.nan
+    return array
+
+
+def _fit_histogram(level, counts):
+    """Widens the bins of a histogram until it has at most
+    `HISTOGRAM_BINS` bins."""
+    while counts and max(counts) - min(counts) >= HISTOGRAM_BINS:
+        level += 1
+        merged = {}
+        for index, count in counts.items():
+            merged[index >> 1] = merged.get(index >> 1, 0) + count
+        counts = merged
+    return level, counts
+
+
+def histogram(values):
+    """Counts values in bins of a fixed lattice.
+
+    Bin `i` of level `k` holds the values in `[i * 2**k, (i + 1) * 2**k)`.
+    The level is the lowest that fits the values in `HISTOGRAM_BINS` bins, so
+    histograms of parts of a raster merge exactly (see `merge_statistics`)
+    and the result does not depend on the order of the parts.
+
+    :param: values:  numpy.ndarray; Finite values.
+
+    :return:  tuple; The level and a dict of bin index to count.
+    """
+    if not values.size:
+        return None, {}
+    lowest, highest = float(values.min()), float(values.max())
+    magnitude = max(abs(lowest), abs(highest))
+    # Bins finer than float64 resolves would only be merged again
+    level = math.floor(math.log2(magnitude)) - 52 if magnitude else 0
+    if highest > lowest:
+        level = max(level, math.floor(math.log2((highest - lowest) /
+                                                HISTOGRAM_BINS)))
+    index = np.floor(values * 2.0 ** -level).astype(np.int64)
+    first = int(index.min())
+    counts = np.bincount(index - first)
+    return _fit_histogram(level, {first + int(i): int(counts[i])
+                                  for i in np.flatnonzero(counts)})
+
+
+def tile_statistics(array):
+    """Returns the partial statistics of the finite values of an array.
+
+    :return:  dict; The "count", "mean", "m2" (sum of squared deviations),
+              "min", "max" and "histogram" (see `histogram`) of the values.
+    """
+    values = np.asarray(array, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if not values.size:
+        return {"count": 0, "mean": 0.0, "m2": 0.0, "min": math.inf,
+                "max": -math.inf, "histogram": (None, {})}
+    mean = float(values.mean())
+    return {"count": int(values.size), "mean": mean,
+            "m2": float(((values - mean) ** 2).sum()),
+            "min": float(values.min()), "max": float(values.max()),
+            "histogram": histogram(values)}
+
+
+def merge_statistics(stats_a, stats_b):
+    """Combines the partial statistics of two parts of a raster."""
+    count = stats_a["count"] + stats_b["count"]
+    if not stats_a["count"] or not stats_b["count"]:
+        return dict(stats_b if not stats_a["count"] else stats_a)
+    delta = stats_b["mean"] - stats_a["mean"]
+    (level_a, counts_a), (level_b, counts_b) = (stats_a["histogram"],
+                                                stats_b["histogram"])
+    level = max(level_a, level_b)
+    counts = {}
+    for part_level, part_counts in ((level_a, counts_a), (level_b, counts_b)):
+        for index, part_count in part_counts.items():
+            index >>= level - part_level
+            counts[index] = counts.get(index, 0) + part_count
+    return {"count": count,
+            "mean": stats_a["mean"] + delta * stats_b["count"] / count,
+            "m2": (stats_a["m2"] + stats_b["m2"] +
+                   delta ** 2 * stats_a["count"] * stats_b["count"] / count),
+            "min": min(stats_a["min"], stats_b["min"]),
+            "max": max(stats_a["max"], stats_b["max"]),
+            "histogram": _fit_histogram(level, counts)}
+
+
+def finish_statistics(stats):
+    """Turns partial statistics into the statistics of a raster.
+
+    :param: stats:  dict; Partial statistics, see `tile_statistics`.
+
+    :return:  dict; "valid_cells", "min", "max", "mean", "std" (population
+              standard deviation) and "histogram", a dict of the "min" and
+              "max" of the binned range and the "counts" of its equal bins.
+              Values are None for rasters without valid cells.
+    """
+    count = stats["count"]
+    if not count:
+        return {"valid_cells": 0, "min": None, "max": None, "mean": None,
+                "std": None, "histogram": None}
+    level, counts = stats["histogram"]
+    first, last = min(counts), max(counts)
+    return {"valid_cells": count, "min": stats["min"], "max": stats["max"],
+            "mean": stats["mean"], "std": math.sqrt(stats["m2"] / count),
+            "histogram": {"min": first * 2.0 ** level,
+                          "max": (last + 1) * 2.0 ** level,
+                          "counts": [counts.get(index, 0)
+                                     for index in range(first, last + 1)]}}
+
+
+def overview_factors(grid, size=OVERVIEW_SIZE):
+    """Returns the aggregation factors of the overviews of a grid: powers of
+    2, down to about `size` cells along the longer edge."""
+    factors = []
+    factor = 2
+    while max(grid.nrows, grid.ncols) // factor >= size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def _add_to_overviews(output, array, window):
+    """Adds the values of a window to the overview sums of an output."""
+    if not output.overviews:
+        return
+    largest = max(output.overviews)
+    row, col, nrows, ncols = window
+    top, left = row - row % largest, col - col % largest
+    bottom = -(-(row + nrows) // largest) * largest
+    right = -(-(col + ncols) // largest) * largest
+    # Pad the window to whole cells of the coarsest overview
+    sums = np.zeros((bottom - top, right - left), dtype=np.float64)
+    counts = np.zeros(sums.shape, dtype=np.uint32)
+    values = np.asarray(array, dtype=np.float64)
+    valid = np.isfinite(values)
+    sums[row - top:row - top + nrows, col - left:col - left + ncols] = \
+        np.where(valid, values, 0.0)
+    counts[row - top:row - top + nrows, col - left:col - left + ncols] = \
+        valid
+    for factor in sorted(output.overviews):
+        height, width = sums.shape[0] // 2, sums.shape[1] // 2
+        sums = sums.reshape(height, 2, width, 2).sum(axis=(1, 3))
+        counts = counts.reshape(height, 2, width, 2).sum(axis=(1, 3))
+        total, number = output.overviews[factor]
+        row_off, col_off = top // factor, left // factor
+        rows = min(height, total.shape[0] - row_off)
+        cols = min(width, total.shape[1] - col_off)
+        with output.lock:
+            total[row_off:row_off + rows, col_off:col_off + cols] += \
+                sums[:rows, :cols].astype(np.float32)
+            number[row_off:row_off + rows, col_off:col_off + cols] += \
+                counts[:rows, :cols].astype(np.uint32)
+
+
+def overviews_path(raster):
+    """Returns the path of the overviews sidecar of a `.npy` raster."""
+    stem, ext = os.path.splitext(str(raster))
+    return (stem if ext else str(raster)) + ".overviews.npz"
+
+
+def read_overview(raster, factor):
+    """Reads an overview written with a raster.
+
+    :param: raster:  string; Path to the raster.
+    :param: factor:  int; The aggregation factor, a power of 2.
+
+    :return:  numpy.ndarray; The mean of the cells of each coarse cell (see
+              `coarsen_grid`), NaN without data, or None if the raster has
+              no overview at this factor or its sidecar is older than it.
+    """
+    if not is_numpy_raster(raster):
+        try:
+            shapes = geotiff.read_shapes(str(raster))
+        except (OSError, ValueError, struct.error):
+            return None
+        nrows, ncols = shapes[0]
+        shape = (-(-nrows // factor), -(-ncols // factor))
+        if shape not in shapes[1:]:
+            return None
+        try:
+            stored = geotiff.read_image(str(raster),
+                                        shapes.index(shape, 1))
+        except ValueError:
+            # Pyramids in a compression this module does not read
+            return None
+        return decode(stored, read_profile(raster))
+    path = overviews_path(raster)
+    if not os.path.exists(path) or \
+            os.stat(path).st_mtime_ns < os.stat(str(raster)).st_mtime_ns:
+        return None
+    with np.load(path) as overviews:
+        key = str(factor)
+        return overviews[key] if key in overviews.files else None
+
+
+def read_statistics(raster):
+    """Reads the statistics written with a raster.
+
+    :param: raster:  string; Path to a raster.
+
+    :return:  dict; The statistics (see `finish_statistics`) from the
+              sidecar of a `.npy` or quantized raster, or the `.aux.xml` of
+              a plain raster, or None if there are none.
+    """
+    if os.path.exists(sidecar_path(raster)):
+        statistics = read_metadata(raster).get("statistics")
+        if statistics is not None:
+            return statistics
+    aux_path = str(raster) + ".aux.xml"
+    if not os.path.exists(aux_path):
+        return None
+    band = ElementTree.parse(aux_path).getroot().find("PAMRasterBand")
+    items = {item.get("key"): item.text
+             for item in band.iter("MDI")} if band is not None else {}
+    if "STATISTICS_MEAN" not in items:
+        return None
+    statistics = {"valid_cells": int(float(
+                      items.get("STATISTICS_VALID_CELLS", 0))),
+                  "min": float(items["STATISTICS_MINIMUM"]),
+                  "max": float(items["STATISTICS_MAXIMUM"]),
+                  "mean": float(items["STATISTICS_MEAN"]),
+                  "std": float(items["STATISTICS_STDDEV"]),
+                  "histogram": None}
+    hist = band.find("Histograms/HistItem")
+    if hist is not None:
+        statistics["histogram"] = {
+            "min": float(hist.findtext("HistMin")),
+            "max": float(hist.findtext("HistMax")),
+            "counts": [int(count) for count in
+                       hist.findtext("HistCounts").split("|")]}
+    return statistics
+
+
+def write_aux_xml(raster, statistics, wkt=""):
+    """Records statistics in the `.aux.xml` of a raster.
+
+    The statistics and histogram use the PAM format that ArcGIS and GDAL
+    read, so neither computes them again. Other contents of an existing
+    `.aux.xml` are kept.
+
+    :param: raster:      string; Path to the raster.
+    :param: statistics:  dict; Statistics of the stored values, see
+                         `finish_statistics`.
+    :param: wkt:         string; Optional well-known text of the coordinate
+                         system, recorded as the `SRS` of the raster for
+                         coordinate systems its GeoKeys cannot name by EPSG
+                         code (see `geotiff.geo_keys`).
+
+    :return:  None. Accomplishes the side effect of writing the file.
+    """
+    aux_path = str(raster) + ".aux.xml"
+    if os.path.exists(aux_path):
+        root = ElementTree.parse(aux_path).getroot()
+    else:
+        root = ElementTree.Element("PAMDataset")
+    if wkt:
+        for element in root.findall("SRS"):
+            root.remove(element)
+        # The SRS comes before the bands
+        srs = ElementTree.Element("SRS")
+        srs.text = wkt
+        root.insert(0, srs)
+    band = root.find("PAMRasterBand")
+    if band is None:
+        band = ElementTree.SubElement(root, "PAMRasterBand", band="1")
+    for name in ("Histograms", "Metadata"):
+        for element in band.findall(name):
+            if name == "Histograms" or element.get("domain") is None:
+                band.remove(element)
+    if statistics["valid_cells"]:
+        histograms = ElementTree.SubElement(band, "Histograms")
+        item = ElementTree.SubElement(histograms, "HistItem")
+        hist = statistics["histogram"]
+        for tag, text in [("HistMin", repr(hist["min"])),
+                          ("HistMax", repr(hist["max"])),
+                          ("BucketCount", str(len(hist["counts"]))),
+                          ("IncludeOutOfRange", "0"),
+                          ("Approximate", "0"),
+                          ("HistCounts",
+                           "|".join(str(count)
+                                    for count in hist["counts"]))]:
+            ElementTree.SubElement(item, tag).text = text
+        metadata = ElementTree.SubElement(band, "Metadata")
+        for key, value in [("MAXIMUM", statistics["max"]),
+                           ("MEAN", statistics["mean"]),
+                           ("MINIMUM", statistics["min"]),
+                           ("STDDEV", statistics["std"]),
+                           ("VALID_CELLS", statistics["valid_cells"])]:
+            ElementTree.SubElement(metadata, "MDI",
+                                   key="STATISTICS_" + key).text = repr(value)
+    ElementTree.ElementTree(root).write(aux_path)
+
+
+def stored_statistics(statistics, profile):
+    """Converts statistics of values to statistics of their stored
+    representation under a quantized profile."""
+    if profile["nodata"] is None or statistics["valid_cells"] == 0:
+        return statistics
+
+    def stored(value):
+        return (value - profile["offset"]) / profile["scale"]
+
+    result = dict(statistics, min=stored(statistics["min"]),
+                  max=stored(statistics["max"]),
+                  mean=stored(statistics["mean"]),
+                  std=statistics["std"] / profile["scale"])
+    result["histogram"] = dict(statistics["histogram"],
+                               min=stored(statistics["histogram"]["min"]),
+                               max=stored(statistics["histogram"]["max"]))
+    return result
+
+
+@contextlib.contextmanager
+def manifest(path, shard=None):
+    """Records every raster written in the block in a run manifest.
+
+    One JSON line per raster is appended to the manifest, holding its path,
+    grid, storage profile, statistics and overview factors.
+
+    :param: path:   string; Path to the manifest file, or a folder to hold a
+                    `MANIFEST_NAME` file.
+    :param: shard:  string; Optional, name of the worker whose shard of the
+                    manifest is appended to (see `utils.shard_path`).
+    """
+    global _manifest_path
+
+    path = str(path)
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST_NAME)
+    path = utils.shard_path(path, shard)
+    previous, _manifest_path = _manifest_path, path
+    try:
+        yield path
+    finally:
+        _manifest_path = previous
+
+
+def read_manifest(path):
+    """Reads the latest record of every raster in a run manifest and its
+    shards.
+
+    :return:  dict; Raster path to its latest record, by time written.
+    """
+    path = str(path)
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST_NAME)
+    records = []
+    for file_ in utils.shard_paths(path):
+        with open(file_) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    records.sort(key=lambda record: record.get("written", ""))
+    return {record["path"]: record for record in records}
+
+
+def _overview(output, factor):
+    """Returns the mean of the cells of each coarse cell of an overview of
+    an output, NaN without data."""
+    total, number = output.overviews[factor]
+    with warnings.catch_warnings():
+        # Coarse cells without data are expected and come out as NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return total / number
+
+
+def _write_overviews(output):
+    """Saves the overviews of a `.npy` output next to its partial file."""
+    if not output.overviews:
+        return
+    np.savez(overviews_path(output.partial), **{
+        str(factor): _overview(output, factor)
+        for factor in output.overviews})
+
+
+def _record_output(output, statistics):
+    """Appends a written raster to the open run manifest, if any."""
+    if _manifest_path is None:
+        return
+    record = {"path": os.path.abspath(output.path),
+              "grid": output.grid._asdict(),
+              "profile": output.profile,
+              "statistics": statistics,
+              "overviews": sorted(output.overviews),
+              "written": datetime.now().isoformat(timespec="seconds")}
+    with _manifest_lock:
+        with open(_manifest_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def open_output(output_path, grid, profile="float32"):
+    """Creates an output raster that is written window by window.
+
+    Windows are encoded into the stored representation of the raster as
+    they are written, and their statistics and overviews gathered (see
+    `write_window`); nothing reaches the output path until `close_output`.
+    `.npy` outputs are written straight to a memory map of the partial file.
+    The tiles of a GeoTIFF output are compressed and appended to the partial
+    file as soon as they are written (see `geotiff.write_block`), so only
+    tiles partly covered by the windows so far are held in memory.
+
+    :param: output_path:  string; Path of the output raster, see
+                          `write_array`.
+    :param: grid:         Grid; The grid of the raster.
+    :param: profile:      string or dict; The storage profile, a key of
+                          `PROFILES` or a profile dict.
+
+    :return:  Output; The open output.
+    """
+    output_path = str(output_path)
+    if not isinstance(profile, dict):
+        profile = PROFILES[profile]
+    partial = utils.partial_path(output_path)
+    shape = (grid.nrows, grid.ncols)
+    if is_numpy_raster(output_path):
+        stored = np.lib.format.open_memmap(partial, mode="w+",
+                                           dtype=profile["dtype"],
+                                           shape=shape)
+    else:
+        stored = geotiff.open_tiff(
+            partial, grid.nrows, grid.ncols, profile["dtype"],
+            profile["nodata"],
+            (grid.x_min, grid.y_min + grid.nrows * grid.cell_size,
+             grid.cell_size), wkt=coordinate_system(grid.spatial_reference))
+    overviews = {}
+    for factor in overview_factors(grid):
+        coarse = coarsen_grid(grid, factor)
+        overviews[factor] = (
+            np.zeros((coarse.nrows, coarse.ncols), dtype=np.float32),
+            np.zeros((coarse.nrows, coarse.ncols), dtype=np.uint32))
+    return Output(output_path, partial, grid, profile, stored, {}, overviews,
+                  threading.Lock())
+
+
+def write_window(output, array, window=None):
+    """Encodes values into a window of an open output.
+
+    Windows that do not overlap can be written from several threads at once.
+    Every cell of a GeoTIFF output is to be written once.
+
+    :param: output:  Output; The output from `open_output`.
+    :param: array:   numpy.ndarray; Cell values of the window, NaN for
+                     NoData.
+    :param: window:  tuple; A `(row_off, col_off, nrows, ncols)` window. The
+                     whole raster if omitted.
+
+    :return:  None.
+    """
+    if window is None:
+        window = (0, 0, output.grid.nrows, output.grid.ncols)
+    row, col, nrows, ncols = window
+    stored = encode(array, output.profile)
+    if is_numpy_raster(output.path):
+        output.stored[row:row + nrows, col:col + ncols] = stored
+    else:
+        geotiff.write_block(output.stored, stored, row, col)
+    # Statistics of the values as stored, after rounding and clipping
+    array = (stored if output.profile["nodata"] is None
+             else decode(stored, output.profile))
+    output.statistics[window] = tile_statistics(array)
+    _add_to_overviews(output, array, window)
+
+
+def close_output(output):
+    """Writes an open output with its statistics and overviews, and commits
+    it to its path.
+
+    A GeoTIFF gets its overviews as internal pyramids and its statistics in
+    its `.aux.xml`, so ArcGIS computes neither again. Its coordinate system
+    is defined through arcpy if the grid has one.
+
+    :param: output:  Output; The output from `open_output`, with every cell
+                     written.
+
+    :return:  None. Accomplishes the side effect of saving the raster.
+    """
+    output_path, partial, grid, profile, stored = output[:5]
+    stats = tile_statistics(np.empty(0))
+    for window in sorted(output.statistics):
+        stats = merge_statistics(stats, output.statistics[window])
+    statistics = finish_statistics(stats)
+
+    if is_numpy_raster(output_path):
+        stored.flush()
+        del stored
+        write_profile(partial, dict(profile, statistics=statistics), grid)
+        _write_overviews(output)
+        utils.commit_output(partial, output_path)
+        _record_output(output, statistics)
+        return
+
+    # The overviews are the pyramids of the GeoTIFF
+    for factor in sorted(output.overviews):
+        geotiff.add_overview(stored, encode(_overview(output, factor),
+                                            profile))
+    geotiff.close_tiff(stored)
+    write_aux_xml(partial, stored_statistics(statistics, profile),
+                  coordinate_system(grid.spatial_reference))
+    if profile["nodata"] is not None:
+        write_profile(partial, dict(profile, statistics=statistics))
+    utils.commit_output(partial, output_path)
+    _record_output(output, statistics)
+
+
+def delete_raster(raster):
+    """Deletes a raster and its sidecars."""
+    if is_numpy_raster(raster):
+        stem = os.path.splitext(str(raster))[0]
+        for file_ in glob.glob(glob.escape(stem) + ".*"):
+            os.remove(file_)
+        return
+
+    import arcpy
+
+    with _arcpy_lock:
+        arcpy.Delete_management(str(raster))
+
+
+def write_array(array, grid, output_path, profile="float32"):
+    """Writes a 2D array to a raster.
+
+    :param: array:        numpy.ndarray; Cell values, NaN for NoData.
+    :param: grid:         Grid; The grid of the array.
+    :param: output_path:  string; Path of the output raster. A `.npy`
+                          extension selects the numpy backend, anything else
+                          is written as a GeoTIFF (see `geotiff`). The
+                          raster is committed to this path once complete,
+                          see `utils.partial_path`.
+    :param: profile:      string or dict; The storage profile, a key of
+                          `PROFILES` or a profile dict.
+
+    :return:  None. Accomplishes the side effect of saving the raster.
+    """
+    output = open_output(output_path, grid, profile)
+    write_window(output, array)
+    close_output(output)
@@ -0,0 +1,174 @@
+"""Sample the predictor rasters of one or more scenarios at points.
+
+The points are located on the grid once. Every predictor raster of every
+scenario (the rasters in the scenario root folder and in each model's
+`predictors` folder) is then sampled by reading only the blocks of the raster
+that hold points, and blocks are kept in a cache so that points in the same
+block, and rasters read again, do not trigger another read.
+
+The result is a table with a row per scenario and point and a column per
+predictor, named like the bands of a predictor stack (e.g. `mhhw` or
+`est_int/wse_median`). Points outside a raster or on NoData get an empty
+value.
+
+:param: sample_points:  point feature class; The points to sample, or a
+                        `.npz` archive of point columns.
+:param: scenarios:      string; Semicolon separated paths to the scenario
+                        folders.
+:param: output_csv:     string; Path of the output table.
+
+:return:    A `.csv` table of the predictor values at the points.
+"""
+import csv
+import functools
+import os
+
+import numpy as np
+
+try:
+    from . import points, raster_io
+    from .journal import file_state
+    from .stack import scenario_rasters
+    from .utils import add_message
+except ImportError:
+    import points
+    import raster_io
+    from journal import file_state
+    from stack import scenario_rasters
+    from utils import add_message
+
+
+BLOCK_SIZE = 256
+
+
+@functools.lru_cache(maxsize=512)
+def read_block(raster, state, window):
+    """Reads one block of a raster, through a cache of recent blocks.
+
+    :param: raster:  string; Path to the raster.
+    :param: state:   tuple; The size and modification time of the raster, so
+                     that blocks of a changed raster are read again.
+    :param: window:  tuple; The `(row_off, col_off, nrows, ncols)` block.
+
+    :return:  numpy.ndarray; The block values. The array is shared with the
+              cache and must not be modified.
+    """
+    block = raster_io.read_array(raster, window)
+    block.flags.writeable = False
+    return block
+
+
+@functools.lru_cache(maxsize=64)
+def _grid(raster, state):
+    return raster_io.read_grid(raster)
+
+
+def sample_raster(raster, xs, ys, block_size=BLOCK_SIZE, cells=None):
+    """Samples a raster at points.
+
+    :param: raster:      string; Path to the raster.
+    :param: xs:          array; x coordinates of the points.
+    :param: ys:          array; y coordinates of the points.
+    :param: block_size:  int; Edge length of the blocks read.
+    :param: cells:       dict; Cache of `raster_io.cell_index` results by
+                         grid, shared between calls for rasters on the same
+                         grid.
+
+    :return:  numpy.ndarray; The value at each point, NaN outside the raster
+              or on NoData.
+    """
+    state = tuple(file_state(raster) or ())
+    grid = _grid(str(raster), state)
+    cells = {} if cells is None else cells
+    if grid not in cells:
+        cells[grid] = raster_io.cell_index(grid, xs, ys)
+    rows, cols = cells[grid]
+
+    values = np.full(len(rows), np.nan)
+    inside = np.flatnonzero((rows >= 0) & (rows < grid.nrows) &
+                            (cols >= 0) & (cols < grid.ncols))
+    block_rows = rows[inside] // block_size
+    block_cols = cols[inside] // block_size
+    block_ids = block_rows * (grid.ncols // block_size + 1) + block_cols
+    order = np.argsort(block_ids, kind="stable")
+    splits = np.flatnonzero(np.diff(block_ids[order])) + 1
+    for group in np.split(order, splits):
+        if not len(group):
+            continue
+        row = block_rows[group[0]] * block_size
+        col = block_cols[group[0]] * block_size
+        window = (int(row), int(col), int(min(block_size, grid.nrows - row)),
+                  int(min(block_size, grid.ncols - col)))
+        block = read_block(str(raster), state, window)
+        points_in_block = inside[group]
+        values[points_in_block] = block[rows[points_in_block] - row,
+                                        cols[points_in_block] - col]
+    return values
+
+
+def sample_scenarios(scenarios, xs, ys, block_size=BLOCK_SIZE):
+    """Samples every predictor raster of scenarios at points.
+
+    :param: scenarios:   list; Paths to the scenario folders.
+    :param: xs:          array; x coordinates of the points.
+    :param: ys:          array; y coordinates of the points.
+    :param: block_size:  int; Edge length of the blocks read.
+
+    :return:  dict; Scenario path to a dict of predictor name to the values
+              at the points.
+    """
+    cells = {}
+    samples = {}
+    for scenario in scenarios:
+        samples[scenario] = {
+            band: sample_raster(path, xs, ys, block_size, cells)
+            for band, path in scenario_rasters(scenario)}
+    return samples
+
+
+def write_samples(samples, xs, ys, output_csv):
+    """Writes samples as a table with a row per scenario and point.
+
+    :param: samples:     dict; Result of `sample_scenarios`.
+    :param: xs:          array; x coordinates of the points.
+    :param: ys:          array; y coordinates of the points.
+    :param: output_csv:  string; Path of the output table.
+
+    :return:  None. Accomplishes the side effect of writing the table.
+    """
+    bands = []
+    for values in samples.values():
+        bands += [band for band in values if band not in bands]
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["scenario", "point", "x", "y"] + bands)
+        for scenario, values in samples.items():
+            name = os.path.basename(os.path.normpath(scenario))
+            columns = [values.get(band, np.full(len(xs), np.nan))
+                       for band in bands]
+            for point in range(len(xs)):
+                writer.writerow(
+                    [name, point, xs[point], ys[point]] +
+                    ["" if np.isnan(column[point]) else column[point]
+                     for column in columns])
+
+
+def main(sample_points, scenarios, output_csv):
+    columns = points.read_points(sample_points, [])
+    scenarios = [path.strip() for path in scenarios.split(";")
+                 if path.strip()]
+    samples = sample_scenarios(scenarios, columns["x"], columns["y"])
+    write_samples(samples, columns["x"], columns["y"], output_csv)
+    add_message(f"Sampled {len(columns['x'])} points in "
+                f"{len(scenarios)} scenarios.")
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    sample_points = arcpy.GetParameterAsText(0)
+    scenarios = arcpy.GetParameterAsText(1)
+    output_csv = arcpy.GetParameterAsText(2)
+
+    main(sample_points, scenarios, output_csv)
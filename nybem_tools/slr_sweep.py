@@ -0,0 +1,188 @@
+"""Calculate the water level predictors of a scenario for a sweep of sea level
+rise offsets.
+
+Each offset (a constant in map units, or a raster of spatially varying
+offsets) is added to every water surface elevation of the base scenario: MHHW,
+MLLW, MTL and the median, maximum and minimum water surface elevations. The
+derived predictors that depend on the water level are then calculated for all
+offsets at once from the base rasters, which are read only once and are not
+interpolated again.
+
+An offset shifts every water level of a cell by the same amount, so it cancels
+out of episodic sediment deposition and exposure duration; these are
+calculated once and written for every horizon. Depth and percent light
+available change with the offset.
+
+Each horizon is written to a subfolder of the output folder with the usual
+model folder structure, holding the shifted water levels and the derived
+predictors. Predictors that do not depend on the water level (salinity,
+velocity, static predictors) are not repeated; use those of the base scenario.
+
+:param: path_to_alt:    string; Path to the parent folder of the base scenario.
+:param: offsets:        string; Semicolon separated water level offsets, each
+                        a number or the path to an offset raster on the grid
+                        of the base scenario, e.g. "0.3;0.6;1.0".
+:param: output_folder:  string; Path to the folder where a subfolder is
+                        written for every horizon.
+
+:return:    None. Water level predictors written to a subfolder of the output
+            folder for each offset.
+"""
+import os
+
+import numpy as np
+
+try:
+    from . import create_new_scenario, kernels, raster_io
+    from .utils import add_message
+except ImportError:
+    import create_new_scenario
+    import kernels
+    import raster_io
+    from utils import add_message
+
+
+# name: folder of the raster relative to the scenario
+WATER_LEVELS = {"mhhw": "",
+                "mllw": "",
+                "mtl": "",
+                "wse_median": os.path.join("est_int", "predictors"),
+                "wse_100": os.path.join("est_int", "predictors"),
+                "wse_0": os.path.join("mar_int", "predictors")}
+
+# name: folders the derived predictor is written to
+DERIVED = {"depth": [os.path.join("est_sub_soft_sav", "predictors")],
+           "pla": [os.path.join("est_sub_soft_sav", "predictors"),
+                   os.path.join("mar_deep", "predictors"),
+                   os.path.join("mar_sub", "predictors")],
+           "esd": [os.path.join("est_int", "predictors"),
+                   os.path.join("fresh_tid", "predictors")],
+           "exp_dur": [os.path.join("mar_int", "predictors")]}
+
+
+def find_raster(folder, name):
+    """Returns the path of a raster by name, as `.tif` or `.npy`."""
+    for ext in (".tif", ".npy"):
+        path = os.path.join(folder, name + ext)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No raster {name} in {folder}.")
+
+
+def parse_offsets(offsets):
+    """Parses the offsets of a sweep.
+
+    :param: offsets:  string or list; Semicolon separated offsets, or a list
+                      of numbers and raster paths.
+
+    :return:  list; `(horizon_name, offset)` tuples, where offset is a float
+              or a raster path.
+    """
+    if isinstance(offsets, str):
+        offsets = [item.strip() for item in offsets.split(";")
+                   if item.strip()]
+    parsed = []
+    for offset in offsets:
+        try:
+            value = float(offset)
+        except ValueError:
+            name = os.path.splitext(os.path.basename(str(offset)))[0]
+            parsed.append((name, str(offset)))
+        else:
+            parsed.append((f"slr_{value:g}", value))
+    return parsed
+
+
+def offset_stack(parsed, grid):
+    """Returns the offsets as a `(horizons, rows, cols)` broadcastable array.
+
+    Constant offsets are kept as `(1, 1)` planes unless a raster offset
+    requires full planes.
+    """
+    if all(not isinstance(offset, str) for _, offset in parsed):
+        return np.array([offset for _, offset in parsed],
+                        dtype=np.float32)[:, None, None]
+    planes = np.empty((len(parsed), grid.nrows, grid.ncols), dtype=np.float32)
+    for i, (_, offset) in enumerate(parsed):
+        planes[i] = (raster_io.read_array(offset) if isinstance(offset, str)
+                     else offset)
+    return planes
+
+
+def sweep(path_to_alt, offsets, output_folder, attenuation=1.39):
+    """Calculates the water level predictors for a sweep of offsets.
+
+    :param: path_to_alt:    string; Path to the base scenario folder.
+    :param: offsets:        string or list; See `parse_offsets`.
+    :param: output_folder:  string; Folder the horizons are written to.
+    :param: attenuation:    float; Light attenuation coefficient of `pla`.
+
+    :return:  list; The paths of the horizon folders. The rasters written
+              are recorded in the run manifest of the output folder.
+    """
+    parsed = parse_offsets(offsets)
+    paths = {name: find_raster(os.path.join(path_to_alt, folder), name)
+             for name, folder in WATER_LEVELS.items()}
+    paths["bed_elevation"] = find_raster(path_to_alt, "bed_elevation")
+    ext = os.path.splitext(paths["mtl"])[1]
+    grid = raster_io.read_grid(paths["mtl"])
+
+    add_message("Reading base rasters")
+    base = {name: raster_io.read_array(path).astype(np.float32)
+            for name, path in paths.items()}
+    shift = offset_stack(parsed, grid)
+
+    horizons = [os.path.join(output_folder, name) for name, _ in parsed]
+    for horizon in horizons:
+        create_new_scenario.main(horizon)
+    with raster_io.manifest(output_folder):
+        write_horizons(horizons, grid, ext, base, shift, attenuation)
+    return horizons
+
+
+def write_horizons(horizons, grid, ext, base, shift, attenuation):
+    """Writes the water level predictors of every horizon of a sweep."""
+
+    def write(name, folders, planes):
+        for i, horizon in enumerate(horizons):
+            plane = planes[i] if planes.ndim == 3 else planes
+            for folder in folders:
+                raster_io.write_array(
+                    plane, grid, os.path.join(horizon, folder, name + ext),
+                    profile=raster_io.storage_profile(name))
+
+    add_message("Shifting water levels")
+    for name, folder in WATER_LEVELS.items():
+        write(name, [folder], base[name][None] + shift)
+
+    # Offsets cancel out of the ratios, calculate them once
+    add_message("Calculating esd and exp_dur")
+    write("esd", DERIVED["esd"],
+          kernels.epi_sed_dep(base["mhhw"], base["wse_median"],
+                              base["wse_100"]))
+    write("exp_dur", DERIVED["exp_dur"],
+          kernels.expo_dur(base["wse_100"], base["wse_0"], base["mhhw"],
+                           base["mllw"]))
+
+    add_message("Calculating depth and pla")
+    depth_m = kernels.depth(base["mtl"][None] + shift,
+                            base["bed_elevation"][None])
+    write("depth", DERIVED["depth"], depth_m)
+    write("pla", DERIVED["pla"],
+          kernels.per_light_available(depth_m, attenuation))
+
+
+def main(path_to_alt, offsets, output_folder):
+    horizons = sweep(path_to_alt, offsets, output_folder)
+    add_message(f"Calculated {len(horizons)} horizons.")
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    path_to_alt = arcpy.GetParameterAsText(0)
+    offsets = arcpy.GetParameterAsText(1)
+    output_folder = arcpy.GetParameterAsText(2)
+
+    main(path_to_alt, offsets, output_folder)
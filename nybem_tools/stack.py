@@ -0,0 +1,158 @@
+"""Build a memory-mapped stack of the predictor rasters of a scenario.
+
+All predictor rasters of a scenario that lie on the same grid (the rasters in
+the scenario root folder and in each model's `predictors` folder) are written
+as the bands of a single uncompressed `.npy` array of shape
+`(bands, rows, cols)`, with a `.json` sidecar holding the grid and the band
+names. Band names are the raster paths relative to the scenario folder without
+extension, e.g. `mhhw` or `est_int/wse_median`.
+
+The stack is opened as a memory map, so any combination of bands, or a window
+of them, is a view onto the page cache; nothing is decoded or copied until the
+cells are used.
+
+:param: path_to_scenario:  string; Path to the parent folder of the scenario.
+
+:return:    `predictor_stack.npy` and `predictor_stack.json` written to the
+            scenario folder.
+"""
+import json
+import os
+
+import numpy as np
+
+try:
+    from . import raster_io
+    from .utils import MODEL_NAMES, add_message, commit_output, partial_path
+except ImportError:
+    import raster_io
+    from utils import MODEL_NAMES, add_message, commit_output, partial_path
+
+
+STACK_NAME = "predictor_stack.npy"
+RASTER_EXTENSIONS = (".tif", ".npy")
+
+
+def scenario_rasters(path_to_scenario):
+    """Lists the predictor rasters of a scenario.
+
+    Masks, the `fwop_*` copies made by earlier versions of
+    `update_AdH_predictors` and the stack itself are skipped.
+
+    :param: path_to_scenario:  string; Path to the scenario folder.
+
+    :return:  list; `(band_name, path)` tuples.
+    """
+    subfolders = [""] + [model_name + "/predictors"
+                         for model_name in MODEL_NAMES]
+    rasters = []
+    for subfolder in subfolders:
+        folder = os.path.join(path_to_scenario, subfolder)
+        if not os.path.isdir(folder):
+            continue
+        for file_name in sorted(os.listdir(folder)):
+            stem, ext = os.path.splitext(file_name)
+            if ext.lower() not in RASTER_EXTENSIONS:
+                continue
+            if (stem.startswith("fwop_") or stem.startswith("mask")
+                    or file_name == STACK_NAME):
+                continue
+            band = (subfolder.split("/")[0] + "/" + stem if subfolder
+                    else stem)
+            rasters.append((band, os.path.join(folder, file_name)))
+    return rasters
+
+
+def build_stack(rasters, stack_path, tile_size=1024):
+    """Writes rasters as the bands of a memory-mappable stack.
+
+    Rasters that are not on the grid of the first raster are skipped. Values
+    are stored as 32 bit floats with NaN for NoData.
+
+    :param: rasters:     list; `(band_name, path)` tuples.
+    :param: stack_path:  string; Path of the output `.npy` stack. The stack
+                         is committed to this path once complete, see
+                         `utils.partial_path`.
+    :param: tile_size:   int; Edge length of the tiles rasters are copied in.
+
+    :return:  list; The names of the bands written.
+    """
+    if not rasters:
+        raise ValueError("No rasters to stack.")
+    grid = raster_io.read_grid(rasters[0][1])
+    bands = []
+    for band, path in rasters:
+        if raster_io.same_grid(grid, raster_io.read_grid(path)):
+            bands.append((band, path))
+        else:
+            add_message(f"Skipped {path}, grid differs from the stack.")
+
+    partial = partial_path(stack_path)
+    stack = np.lib.format.open_memmap(
+        partial, mode="w+", dtype=np.float32,
+        shape=(len(bands), grid.nrows, grid.ncols))
+    for index, (band, path) in enumerate(bands):
+        for row, col, nrows, ncols in raster_io.windows(grid, tile_size):
+            stack[index, row:row + nrows, col:col + ncols] = \
+                raster_io.read_array(path, (row, col, nrows, ncols))
+    stack.flush()
+    del stack
+
+    meta = dict(grid._asdict())
+    meta.update({"dtype": "float32", "nodata": None,
+                 "bands": [band for band, _ in bands]})
+    with open(raster_io.sidecar_path(partial), "w") as f:
+        json.dump(meta, f, indent=2)
+    commit_output(partial, stack_path)
+    return [band for band, _ in bands]
+
+
+def open_stack(stack_path):
+    """Opens a stack read-only as a memory map.
+
+    :param: stack_path:  string; Path to a `.npy` stack.
+
+    :return:  tuple; The `(bands, rows, cols)` memory map, the list of band
+              names and the Grid of the stack.
+    """
+    meta = raster_io.read_metadata(stack_path)
+    return (np.load(str(stack_path), mmap_mode="r"), meta["bands"],
+            raster_io.read_grid(stack_path))
+
+
+def read_bands(stack_path, names, window=None):
+    """Reads bands of a stack without copying them.
+
+    :param: stack_path:  string; Path to a `.npy` stack.
+    :param: names:       list; Names of the bands to read.
+    :param: window:      tuple; Optional `(row_off, col_off, nrows, ncols)`
+                         window. The full bands are read if omitted.
+
+    :return:  dict; Band name to a read-only 2D view of its values.
+    """
+    stack, bands, _ = open_stack(stack_path)
+    views = {}
+    for name in names:
+        if name not in bands:
+            raise KeyError(f"Band {name} is not in {stack_path}.")
+        band = stack[bands.index(name)]
+        if window is not None:
+            row, col, nrows, ncols = window
+            band = band[row:row + nrows, col:col + ncols]
+        views[name] = band
+    return views
+
+
+def main(path_to_scenario):
+    rasters = scenario_rasters(path_to_scenario)
+    bands = build_stack(rasters, os.path.join(path_to_scenario, STACK_NAME))
+    add_message(f"Stacked {len(bands)} predictors.")
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    path_to_scenario = arcpy.GetParameterAsText(0)
+
+    main(path_to_scenario)
@@ -0,0 +1,429 @@
+"""This module contains functions for running scenario steps on local scratch.
+
+FWOP and alternative folders usually live on network shares, so every read
+of an input, every temporary raster (`adh2raster` uses the output folder as
+the arcpy scratch workspace) and every output crosses the network. When the
+`NYBEM_LOCAL_SCRATCH` environment variable names a local folder, the steps
+are run there instead (see `run_staged`):
+
+1. The files the steps read and do not write themselves are copied to the
+   scratch folder in parallel.
+2. The steps run on the local copies, writing their outputs, temporary
+   rasters and journal locally.
+3. As soon as a step completes, its outputs are copied back to the share in
+   the background while the next step runs. Each copy is checked against the
+   SHA-256 of the local file, and the output itself is moved into place after
+   its sidecars, so its presence on the share implies it is complete.
+
+Local copies are reused while their size and modification time match the
+source, and the local journal is kept, so running a scenario again only
+copies what changed and resumes at the first incomplete step. The steps
+whose outputs reached the share are also recorded in the journal and the run
+manifest of the alternative folder, even when a later step fails, so a run
+without the scratch folder (or on another machine) resumes after them.
+"""
+import glob
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from . import raster_io
+    from .utils import add_message, partial_path
+except ImportError:
+    import raster_io
+    from utils import add_message, partial_path
+
+
+SCRATCH_ENV = "NYBEM_LOCAL_SCRATCH"
+CHUNK_SIZE = 2 ** 22
+# Modification times are copied with the files, but some file systems store
+# them with less precision
+MTIME_TOLERANCE_NS = 10 ** 6
+
+
+def scratch_folder():
+    """Returns the local scratch folder set in the environment, or ""."""
+    return os.environ.get(SCRATCH_ENV, "")
+
+
+def dataset_path(path):
+    """Returns the nearest existing path of a dataset, e.g. the geodatabase
+    of a feature class, or None."""
+    path = os.path.abspath(str(path))
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    return path
+
+
+def local_root(scratch, folder):
+    """Returns the local copy of a folder in the scratch folder.
+
+    The copy is named by a hash of the full path, so folders of the same
+    name on different shares do not collide, and keeps the folder name, so
+    e.g. a `.gdb` stays a geodatabase.
+    """
+    folder = os.path.normpath(os.path.abspath(str(folder)))
+    digest = hashlib.sha1(os.path.normcase(folder).encode("utf-8"))
+    return os.path.join(scratch, digest.hexdigest()[:8],
+                        os.path.basename(folder))
+
+
+def local_path(scratch, path, roots=()):
+    """Maps a path to its location in the scratch folder.
+
+    :param: scratch:  string; Path to the local scratch folder.
+    :param: path:     string; The path to map.
+    :param: roots:    list; Folders mapped as a whole, e.g. the FWOP and
+                      alternative folders. Other paths are mapped with the
+                      folder holding their dataset.
+
+    :return:  string; The local path.
+    """
+    path = os.path.normpath(os.path.abspath(str(path)))
+    for root in sorted((os.path.normpath(os.path.abspath(str(root)))
+                        for root in roots), key=len, reverse=True):
+        if path == root or path.startswith(root + os.sep):
+            return os.path.join(local_root(scratch, root),
+                                os.path.relpath(path, root))
+    folder = os.path.dirname(dataset_path(path) or path)
+    return os.path.join(local_root(scratch, folder),
+                        os.path.relpath(path, folder))
+
+
+def dataset_files(path):
+    """Returns the files making up the dataset at a path.
+
+    A file comes with its sidecars (e.g. the `.dbf` of a shapefile or the
+    `.aux.xml` of a raster) and, for a point set in a mesh store, the node
+    coordinates of its mesh. A folder, like a file geodatabase, comes with
+    every file in it.
+    """
+    try:
+        from . import mesh_store, points
+    except ImportError:
+        import mesh_store
+        import points
+
+    dataset = dataset_path(path)
+    if dataset is None:
+        return []
+    if os.path.isdir(dataset):
+        return sorted(os.path.join(folder, name)
+                      for folder, _, names in os.walk(dataset)
+                      for name in names)
+    stem = os.path.splitext(dataset)[0]
+    files = sorted(set(glob.glob(glob.escape(stem) + ".*")) | {dataset})
+    key = mesh_store.mesh_of(dataset)
+    if key is not None:
+        files.append(points.geometry_path(dataset, key))
+    return files
+
+
+def up_to_date(source, target):
+    """Tests whether a copy has the size and modification time of its
+    source."""
+    if not os.path.exists(target):
+        return False
+    source_stat, target_stat = os.stat(source), os.stat(target)
+    return (source_stat.st_size == target_stat.st_size and
+            abs(source_stat.st_mtime_ns - target_stat.st_mtime_ns) <
+            MTIME_TOLERANCE_NS)
+
+
+def checksum(path):
+    """Returns the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_verified(source, target, attempts=3):
+    """Copies a file and checks the copy against the source.
+
+    The file is copied to the partial path of the target (see
+    `utils.partial_path`), hashing it on the way, read back and compared,
+    then moved into place.
+
+    :param: source:    string; Path to the file.
+    :param: target:    string; Path of the copy.
+    :param: attempts:  int; Number of times to copy before giving up.
+
+    :return:  None. Accomplishes the side effect of copying the file.
+    """
+    partial = partial_path(target)
+    for _ in range(attempts):
+        digest = hashlib.sha256()
+        with open(source, "rb") as reader, open(partial, "wb") as writer:
+            for chunk in iter(lambda: reader.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                writer.write(chunk)
+        shutil.copystat(source, partial)
+        if checksum(partial) == digest.hexdigest():
+            os.replace(partial, target)
+            return
+    os.remove(partial)
+    raise ValueError(f"The copy of {source} to {target} did not match the "
+                     f"source after {attempts} attempts.")
+
+
+def copy_dataset(source, target):
+    """Copies the files of a dataset to another location, skipping files
+    whose copy is up to date.
+
+    :param: source:  string; Path to the dataset, or to a feature class
+                     inside it.
+    :param: target:  string; Path of the copy. The other files of the
+                     dataset are placed relative to it as they are to the
+                     source.
+
+    :return:  list; The files copied.
+    """
+    dataset = dataset_path(source)
+    target_dataset = os.path.abspath(str(target))
+    # Up from a feature class to its geodatabase
+    inside = os.path.relpath(os.path.abspath(str(source)), dataset)
+    for _ in range(0 if inside == os.curdir else len(inside.split(os.sep))):
+        target_dataset = os.path.dirname(target_dataset)
+    folder, target_folder = (os.path.dirname(path)
+                             for path in (dataset, target_dataset))
+    copied = []
+    # The dataset itself last, so its presence implies its sidecars are in
+    # place
+    for file_ in sorted(dataset_files(source),
+                        key=lambda file_: file_ == dataset):
+        copy = os.path.join(target_folder, os.path.relpath(file_, folder))
+        if not up_to_date(file_, copy):
+            os.makedirs(os.path.dirname(copy), exist_ok=True)
+            copy_verified(file_, copy)
+            copied.append(file_)
+    return copied
+
+
+def step_paths(step):
+    """Returns the names of the arguments of a step that are paths."""
+    try:
+        from .update_AdH_predictors import NON_INPUT_ARGS
+    except ImportError:
+        from update_AdH_predictors import NON_INPUT_ARGS
+
+    return [name for name, value in step["args"].items()
+            if isinstance(value, str) and value and
+            (name == "output_folder" or name not in NON_INPUT_ARGS)]
+
+
+def local_steps(steps, scratch, roots=()):
+    """Points the paths of steps at the scratch folder, see `local_path`."""
+    updated = []
+    for step in steps:
+        args = dict(step["args"])
+        for name in step_paths(step):
+            args[name] = local_path(scratch, args[name], roots)
+        updated.append(dict(step, args=args))
+    return updated
+
+
+def staged_inputs(steps):
+    """Returns the files the steps read that no step writes."""
+    try:
+        from .update_AdH_predictors import step_inputs, step_outputs
+    except ImportError:
+        from update_AdH_predictors import step_inputs, step_outputs
+
+    def stem(path):
+        # `.tif` outputs of `.npy` inputs are written as `.npy`
+        return os.path.splitext(os.path.normpath(path))[0]
+
+    written = {stem(output) for step in steps
+               for output in step_outputs(step)}
+    inputs = []
+    for step in steps:
+        for path in step_inputs(step):
+            if isinstance(path, str) and path and \
+                    stem(path) not in written and path not in inputs:
+                inputs.append(path)
+    return inputs
+
+
+def stage_in(inputs, scratch, roots=(), workers=8):
+    """Copies input datasets to the scratch folder in parallel.
+
+    :return:  int; Number of files copied.
+    """
+    missing = [path for path in inputs if dataset_path(path) is None]
+    if missing:
+        raise ValueError(f"Inputs not found: {', '.join(missing)}")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        copied = pool.map(lambda path: copy_dataset(
+            path, local_path(scratch, path, roots)), inputs)
+        return sum(len(files) for files in copied)
+
+
+def sync_output(local, remote):
+    """Copies an output and its sidecars from scratch to its final place.
+
+    The output is moved into place after its sidecars, so its presence
+    implies it is complete. Files whose copy is up to date are skipped.
+
+    :param: local:   string; Path of the output in the scratch folder.
+    :param: remote:  string; Final path of the output.
+
+    :return:  list; The files copied.
+    """
+    if not os.path.exists(local):
+        # Predictors of `.npy` inputs are written as `.npy` rasters
+        local, remote = (os.path.splitext(path)[0] + ".npy"
+                         for path in (local, remote))
+        if not os.path.exists(local):
+            return []
+    return copy_dataset(local, remote)
+
+
+def sync_manifest(local_folder, remote_folder, remote_paths):
+    """Appends the records of the outputs in a local run manifest to the
+    manifest of the remote folder, with the paths of the remote outputs.
+
+    :param: local_folder:   string; Folder holding the local manifest.
+    :param: remote_folder:  string; Folder holding the remote manifest.
+    :param: remote_paths:   dict; Normalized local path of each output to
+                            its remote path.
+
+    :return:  None. The records appended are removed from the local
+              manifest; records of other outputs are kept for a later sync.
+    """
+    import json
+
+    local = os.path.join(local_folder, raster_io.MANIFEST_NAME)
+    if not os.path.exists(local):
+        return
+    with open(local) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    kept = [record for record in records
+            if os.path.normpath(record["path"]) not in remote_paths]
+    with open(os.path.join(remote_folder, raster_io.MANIFEST_NAME),
+              "a") as f:
+        for record in records:
+            path = os.path.normpath(record["path"])
+            if path in remote_paths:
+                f.write(json.dumps(dict(record,
+                                        path=remote_paths[path])) + "\n")
+    if kept:
+        with open(local, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in kept)
+    else:
+        os.remove(local)
+
+
+def sync_journal(steps, path_to_alt):
+    """Records steps whose outputs were synced in the journal of the remote
+    alternative folder.
+
+    The records hold the fingerprints of the remote steps, so a run on the
+    remote folder finds them complete (see `journal.is_complete`). Steps the
+    journal already holds with the same fingerprint are not recorded again.
+
+    :param: steps:        list; The remote steps, in the order they ran.
+    :param: path_to_alt:  string; Path to the alternative folder.
+
+    :return:  None. Accomplishes the side effect of appending to the journal.
+    """
+    try:
+        from . import journal, utils
+        from .update_AdH_predictors import step_inputs, step_name, \
+            step_outputs
+    except ImportError:
+        import journal
+        import utils
+        from update_AdH_predictors import step_inputs, step_name, \
+            step_outputs
+
+    journal_path = os.path.join(path_to_alt, journal.JOURNAL_NAME)
+    records = journal.read_journal(journal_path)
+    for step in steps:
+        name = step_name(step, path_to_alt)
+        step_fingerprint = journal.fingerprint(
+            getattr(utils, step["function"]).__name__, step["args"],
+            step_inputs(step))
+        if records.get(name, {}).get("fingerprint") != step_fingerprint:
+            journal.record_step(journal_path, name, step_fingerprint,
+                                step_outputs(step))
+
+
+def run_staged(steps, path_to_fwop, path_to_alt, scratch, resume=True,
+               workers=8):
+    """Runs steps on local scratch and copies their outputs back.
+
+    :param: steps:         list; Steps from `scenario_steps`.
+    :param: path_to_fwop:  string; Path to the FWOP folder.
+    :param: path_to_alt:   string; Path to the alternative folder.
+    :param: scratch:       string; Path to the local scratch folder.
+    :param: resume:        bool; If False every step is run.
+    :param: workers:       int; Number of files copied at the same time.
+
+    :return:  None. Accomplishes the side effect of writing the outputs of
+              the steps to the alternative folder. The journal is kept in
+              the scratch copy of the alternative folder, and the steps
+              whose outputs were synced are recorded in the journal and the
+              manifest of the alternative folder (see `sync_journal` and
+              `sync_manifest`), also when a step fails.
+    """
+    try:
+        from .update_AdH_predictors import run_steps, step_outputs
+    except ImportError:
+        from update_AdH_predictors import run_steps, step_outputs
+
+    roots = (path_to_fwop, path_to_alt)
+    copied = stage_in(staged_inputs(steps), scratch, roots, workers)
+    add_message(f"Staged {copied} input files in {scratch}.")
+
+    staged = local_steps(steps, scratch, roots)
+    # The remote step and the remote path of each local output of every
+    # staged step, by the id of the staged step
+    remote_steps = {}
+    for local_step, step in zip(staged, steps):
+        remote_paths = {}
+        for local, remote in zip(step_outputs(local_step),
+                                 step_outputs(step)):
+            for ext in ("", ".npy"):
+                if ext:
+                    local, remote = (os.path.splitext(path)[0] + ext
+                                     for path in (local, remote))
+                remote_paths[os.path.normpath(local)] = remote
+        remote_steps[id(local_step)] = step, remote_paths
+
+    local_alt = local_path(scratch, path_to_alt, roots)
+    os.makedirs(local_alt, exist_ok=True)
+    done = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+
+            def completed(local_step):
+                step, remote_paths = remote_steps[id(local_step)]
+                done.append((step, remote_paths, [pool.submit(
+                    sync_output, local, remote_paths[os.path.normpath(local)])
+                    for local in step_outputs(local_step)]))
+
+            run_steps(staged, local_alt, resume, completed)
+    finally:
+        # The steps synced so far are recorded, whether or not the run
+        # failed
+        synced, synced_steps, synced_paths, errors = 0, [], {}, []
+        for step, remote_paths, syncs in done:
+            try:
+                synced += sum(len(sync.result()) for sync in syncs)
+            except Exception as e:
+                errors.append(e)
+                continue
+            synced_steps.append(step)
+            synced_paths.update(remote_paths)
+        sync_manifest(local_alt, path_to_alt, synced_paths)
+        sync_journal(synced_steps, path_to_alt)
+    if errors:
+        raise errors[0]
+    add_message(f"Synced {synced} output files to {path_to_alt}.")
@@ -0,0 +1,592 @@
+"""Serve the predictor rasters of scenario folders as map tiles for QA.
+
+Starts a small local HTTP server over a folder of scenario folders (e.g. the
+FWOP and the alternatives). Open `http://localhost:<port>/` in a browser to
+pick a scenario and a predictor, pan and zoom, and flip between two scenarios
+with the F key; no GIS software is needed.
+
+Tiles are 256 pixel PNG images on a tile matrix aligned with the raster grid:
+zoom level 0 shows the whole raster in one tile and every level doubles the
+resolution, down to the raster cells at the last level. Rasters are shown in
+their own projection, they are not reprojected to Web Mercator. Tiles are
+rendered on demand, coarse levels from overviews that are built once per
+raster, and rendered tiles are kept in an in-memory cache until the raster
+changes. Requests are handled with asyncio; rendering runs in worker threads
+so slow reads do not hold up other requests.
+
+Predictors are colored with a ramp and value range by type (see
+`PREDICTOR_RAMPS`); other rasters are stretched over their own values. A
+tile URL may set the range with `?range=<min>,<max>`.
+
+:param: scenarios_folder:  string; Path to the folder holding the scenario
+                           folders.
+:param: port:              string; Port to listen on, 8000 if omitted.
+
+:return:    None. Serves tiles until interrupted.
+"""
+import asyncio
+import fnmatch
+import functools
+import json
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+try:
+    from . import raster_io
+    from .journal import file_state
+    from .stack import scenario_rasters
+    from .utils import add_message
+except ImportError:
+    import raster_io
+    from journal import file_state
+    from stack import scenario_rasters
+    from utils import add_message
+
+
+TILE_SIZE = 256
+# Tiles at least this many cells per pixel are cut from cached overviews
+OVERVIEW_FACTOR = 16
+
+# ramp: color stops from the low to the high end of the value range
+RAMPS = {
+    "salinity": [(68, 1, 84), (59, 82, 139), (33, 145, 140), (94, 201, 98),
+                 (253, 231, 37)],
+    "velocity": [(0, 0, 4), (81, 18, 124), (183, 55, 121), (252, 137, 97),
+                 (252, 253, 191)],
+    "depth": [(255, 255, 217), (127, 205, 187), (29, 145, 192),
+              (37, 52, 148), (8, 29, 88)],
+    "esd": [(255, 255, 229), (254, 227, 145), (254, 153, 41), (204, 76, 2),
+            (102, 37, 6)],
+    "diverging": [(5, 48, 97), (67, 147, 195), (247, 247, 247),
+                  (214, 96, 77), (103, 0, 31)],
+    "gray": [(0, 0, 0), (255, 255, 255)],
+}
+
+# Ramp and value range by predictor name pattern, first match wins. A range
+# of None stretches the ramp over the values of the raster.
+PREDICTOR_RAMPS = [("sal_*", "salinity", (0.0, 35.0)),
+                   ("vel_*", "velocity", (0.0, 2.0)),
+                   ("rel_vel*", "diverging", (-100.0, 100.0)),
+                   ("depth", "depth", (0.0, 15.0)),
+                   ("esd", "esd", (0.0, 5.0)),
+                   ("pla", "depth", (0.0, 100.0)),
+                   ("wse_*", "diverging", (-3.0, 3.0)),
+                   ("mhhw", "diverging", (-3.0, 3.0)),
+                   ("mllw", "diverging", (-3.0, 3.0)),
+                   ("mtl", "diverging", (-3.0, 3.0))]
+
+CONTENT_TYPES = {".png": "image/png", ".json": "application/json",
+                 ".html": "text/html; charset=utf-8"}
+
+
+def ramp_for(band):
+    """Returns the ramp and value range of a predictor.
+
+    :param: band:  string; The band name, e.g. `est_int/sal_median`.
+
+    :return:  tuple; The name of the ramp (see `RAMPS`) and the value range,
+              or None to stretch over the values of the raster.
+    """
+    name = band.split("/")[-1]
+    for pattern, ramp, value_range in PREDICTOR_RAMPS:
+        if fnmatch.fnmatch(name, pattern):
+            return ramp, value_range
+    return "gray", None
+
+
+@functools.lru_cache(maxsize=None)
+def color_table(ramp):
+    """Returns the 256 colors of a ramp as a `(256, 3)` uint8 array."""
+    stops = np.array(RAMPS[ramp], dtype=np.float64)
+    positions = np.linspace(0, 1, len(stops))
+    levels = np.linspace(0, 1, 256)
+    return np.stack([np.interp(levels, positions, stops[:, channel])
+                     for channel in range(3)], axis=1).round().astype(np.uint8)
+
+
+def colorize(values, ramp, value_range):
+    """Colors an array of values.
+
+    :param: values:       numpy.ndarray; A 2D array, NaN for NoData.
+    :param: ramp:         string; The name of the ramp.
+    :param: value_range:  tuple; The values at the ends of the ramp; values
+                          outside are clipped.
+
+    :return:  numpy.ndarray; A `(rows, cols, 4)` uint8 RGBA array, NoData
+              transparent.
+    """
+    low, high = value_range
+    valid = ~np.isnan(values)
+    scaled = np.zeros(values.shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scaled[valid] = (values[valid] - low) / (high - low if high > low
+                                                 else 1.0)
+    index = (np.clip(scaled, 0, 1) * 255).round().astype(np.uint8)
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = color_table(ramp)[index]
+    rgba[..., 3] = np.where(valid, 255, 0)
+    return rgba
+
+
+def encode_png(rgba):
+    """Encodes an RGBA array as a PNG image.
+
+    :param: rgba:  numpy.ndarray; A `(rows, cols, 4)` uint8 array.
+
+    :return:  bytes; The PNG file.
+    """
+    nrows, ncols = rgba.shape[:2]
+
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data +
+                struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    # Every scanline starts with filter type 0 (none)
+    scanlines = np.zeros((nrows, ncols * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = rgba.reshape(nrows, ncols * 4)
+    header = struct.pack(">IIBBBBB", ncols, nrows, 8, 6, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) +
+            chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)) +
+            chunk(b"IEND", b""))
+
+
+def max_zoom(grid, tile_size=TILE_SIZE):
+    """Returns the zoom level at which a tile pixel is a raster cell."""
+    zoom = 0
+    while tile_size * 2 ** zoom < max(grid.nrows, grid.ncols):
+        zoom += 1
+    return zoom
+
+
+@functools.lru_cache(maxsize=64)
+def overview(raster, state, factor):
+    """Returns a raster aggregated by a factor, through a cache.
+
+    Overviews written with the raster (see `raster_io.read_overview`) are
+    used as they are. Otherwise the first overview is built window by window
+    from the raster, every coarser one from the overview before it.
+
+    :param: raster:  string; Path to the raster.
+    :param: state:   tuple; The size and modification time of the raster, so
+                     that the overviews of a changed raster are built again.
+    :param: factor:  int; A power of 2 of at least `OVERVIEW_FACTOR`.
+
+    :return:  numpy.ndarray; The mean of the cells of each coarse cell, see
+              `raster_io.aggregate`. The array is shared with the cache and
+              must not be modified.
+    """
+    stored = raster_io.read_overview(raster, factor)
+    if stored is not None:
+        coarse = stored
+    elif factor > OVERVIEW_FACTOR:
+        coarse = raster_io.aggregate(overview(raster, state, factor // 2), 2)
+    else:
+        grid = raster_io.read_grid(raster)
+        coarse_grid = raster_io.coarsen_grid(grid, factor)
+        coarse = np.empty((coarse_grid.nrows, coarse_grid.ncols))
+        for row, col, nrows, ncols in raster_io.windows(grid, factor * 128):
+            block = raster_io.aggregate(
+                raster_io.read_array(raster, (row, col, nrows, ncols)),
+                factor)
+            coarse[row // factor:row // factor + block.shape[0],
+                   col // factor:col // factor + block.shape[1]] = block
+    coarse = coarse.astype(np.float32)
+    coarse.flags.writeable = False
+    return coarse
+
+
+def read_tile(raster, state, zoom, x, y, tile_size=TILE_SIZE):
+    """Reads the values of a tile.
+
+    :param: raster:     string; Path to the raster.
+    :param: state:      tuple; The size and modification time of the raster.
+    :param: zoom:       int; The zoom level, 0 for the whole raster.
+    :param: x:          int; The tile column, from the left.
+    :param: y:          int; The tile row, from the top.
+    :param: tile_size:  int; Edge length of the tile in pixels.
+
+    :return:  numpy.ndarray; A `(tile_size, tile_size)` array, NaN for
+              NoData and past the edges of the raster, or None if the tile
+              is outside the raster.
+    """
+    grid = raster_io.read_grid(raster)
+    levels = max_zoom(grid, tile_size)
+    if not 0 <= zoom <= levels or min(x, y) < 0:
+        return None
+    factor = 2 ** (levels - zoom)
+    row, col = y * tile_size * factor, x * tile_size * factor
+    if row >= grid.nrows or col >= grid.ncols:
+        return None
+
+    if factor >= OVERVIEW_FACTOR:
+        values = overview(raster, state, factor)[
+            y * tile_size:(y + 1) * tile_size,
+            x * tile_size:(x + 1) * tile_size]
+    else:
+        window = (row, col, min(tile_size * factor, grid.nrows - row),
+                  min(tile_size * factor, grid.ncols - col))
+        values = raster_io.read_array(raster, window)
+        if factor > 1:
+            values = raster_io.aggregate(values, factor)
+    tile = np.full((tile_size, tile_size), np.nan)
+    tile[:values.shape[0], :values.shape[1]] = values
+    return tile
+
+
+@functools.lru_cache(maxsize=32)
+def stretch_range(raster, state):
+    """Returns the 2nd and 98th percentile of the values of a raster."""
+    grid = raster_io.read_grid(raster)
+    values = read_tile(raster, state, 0, 0, 0)
+    if grid.nrows * grid.ncols == 0 or np.isnan(values).all():
+        return 0.0, 1.0
+    low, high = np.nanpercentile(values, [2, 98])
+    return float(low), float(high)
+
+
+@functools.lru_cache(maxsize=4096)
+def render_tile(raster, state, band, zoom, x, y, value_range=None):
+    """Renders a tile as a PNG image, through a cache of recent tiles.
+
+    :param: raster:       string; Path to the raster.
+    :param: state:        tuple; The size and modification time of the
+                          raster.
+    :param: band:         string; The band name, which selects the ramp.
+    :param: zoom:         int; The zoom level.
+    :param: x:            int; The tile column.
+    :param: y:            int; The tile row.
+    :param: value_range:  tuple; Optional values at the ends of the ramp.
+
+    :return:  bytes; The PNG image, or None if the tile is outside the
+              raster.
+    """
+    values = read_tile(raster, state, zoom, x, y)
+    if values is None:
+        return None
+    ramp, default_range = ramp_for(band)
+    value_range = (value_range or default_range or
+                   stretch_range(raster, state))
+    return encode_png(colorize(values, ramp, value_range))
+
+
+def find_layers(scenarios_folder):
+    """Lists the rasters that can be served.
+
+    :param: scenarios_folder:  string; Path to the folder holding the
+                               scenario folders.
+
+    :return:  OrderedDict; Scenario name to an OrderedDict of band name to
+              raster path.
+    """
+    layers = OrderedDict()
+    for name in sorted(os.listdir(scenarios_folder)):
+        folder = os.path.join(scenarios_folder, name)
+        if os.path.isdir(folder):
+            rasters = scenario_rasters(folder)
+            if rasters:
+                layers[name] = OrderedDict(rasters)
+    return layers
+
+
+def layer_info(scenarios_folder):
+    """Describes the layers for the viewer, see `find_layers`.
+
+    :return:  dict; Scenario name to a dict of band name to its "max_zoom",
+              "ramp" and "range".
+    """
+    info = OrderedDict()
+    for scenario, rasters in find_layers(scenarios_folder).items():
+        info[scenario] = OrderedDict()
+        for band, raster in rasters.items():
+            ramp, value_range = ramp_for(band)
+            info[scenario][band] = {
+                "max_zoom": max_zoom(raster_io.read_grid(raster)),
+                "ramp": ramp, "range": value_range}
+    return info
+
+
+def parse_range(query):
+    """Parses the `range` query parameter of a tile request."""
+    values = parse_qs(query).get("range")
+    if not values or not values[0].strip():
+        return None
+    low, high = (float(value) for value in values[0].split(","))
+    return low, high
+
+
+def tile_request(scenarios_folder, path, query):
+    """Renders the tile of a request path.
+
+    :param: scenarios_folder:  string; Path to the folder holding the
+                               scenario folders.
+    :param: path:              string; The request path,
+                               `/tiles/<scenario>/<band>/<z>/<x>/<y>.png`.
+    :param: query:             string; The query string of the request.
+
+    :return:  bytes; The PNG image, or None if there is no such tile.
+    """
+    parts = [unquote(part) for part in path.strip("/").split("/")]
+    if len(parts) < 6 or not parts[-1].endswith(".png"):
+        return None
+    scenario, band = parts[1], "/".join(parts[2:-3])
+    try:
+        zoom, x, y = int(parts[-3]), int(parts[-2]), int(parts[-1][:-4])
+        value_range = parse_range(query)
+    except ValueError:
+        return None
+    # Only rasters listed for a scenario folder are served
+    folder = os.path.join(scenarios_folder, scenario)
+    if scenario in ("", ".", "..") or os.sep in scenario or \
+            not os.path.isdir(folder):
+        return None
+    raster = dict(scenario_rasters(folder)).get(band)
+    if raster is None:
+        return None
+    state = tuple(file_state(raster) or ())
+    return render_tile(raster, state, band, zoom, x, y, value_range)
+
+
+async def read_request(reader):
+    """Reads the request line and headers of an HTTP request.
+
+    :return:  tuple; The method, the target and a dict of the headers with
+              lower case names, or None at the end of the connection.
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, target = line.decode("latin-1").split()[:2]
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def response(status, body=b"", content_type="text/plain", keep_alive=True):
+    """Returns the bytes of an HTTP response."""
+    reasons = {200: "OK", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 500: "Internal Server Error"}
+    header = (f"HTTP/1.1 {status} {reasons[status]}\r\n"
+              f"Content-Type: {content_type}\r\n"
+              f"Content-Length: {len(body)}\r\n"
+              "Cache-Control: no-cache\r\n"
+              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+              "\r\n")
+    return header.encode("latin-1") + body
+
+
+async def start(scenarios_folder, host="127.0.0.1", port=8000, workers=4):
+    """Starts serving tiles.
+
+    :param: scenarios_folder:  string; Path to the folder holding the
+                               scenario folders.
+    :param: host:              string; Address to listen on.
+    :param: port:              int; Port to listen on, 0 for any free port.
+    :param: workers:           int; Number of threads rendering tiles.
+
+    :return:  asyncio.AbstractServer; The running server.
+    """
+    loop = asyncio.get_event_loop()
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def route(target):
+        url = urlsplit(target)
+        if url.path in ("/", "/index.html"):
+            return 200, VIEWER.encode("utf-8"), CONTENT_TYPES[".html"]
+        if url.path == "/layers.json":
+            info = await loop.run_in_executor(executor, layer_info,
+                                              scenarios_folder)
+            return 200, json.dumps(info).encode(), CONTENT_TYPES[".json"]
+        if url.path.startswith("/tiles/"):
+            png = await loop.run_in_executor(executor, tile_request,
+                                             scenarios_folder, url.path,
+                                             url.query)
+            if png is not None:
+                return 200, png, CONTENT_TYPES[".png"]
+        return 404, b"Not found", "text/plain"
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if method != "GET":
+                    status, body, content_type = 405, b"", "text/plain"
+                else:
+                    try:
+                        status, body, content_type = await route(target)
+                    except Exception as e:
+                        status, body, content_type = (
+                            500, f"{type(e).__name__}: {e}".encode(),
+                            "text/plain")
+                writer.write(response(status, body, content_type,
+                                      keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def serve(scenarios_folder, host="127.0.0.1", port=8000):
+    """Serves tiles until the task is cancelled."""
+    server = await start(scenarios_folder, host, port)
+    port = server.sockets[0].getsockname()[1]
+    add_message(f"Serving {scenarios_folder} at http://{host}:{port}/")
+    async with server:
+        await server.serve_forever()
+
+
+VIEWER = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>NYBEM tiles</title>
+<style>
+body {margin: 0; font: 13px sans-serif}
+#bar {height: 24px; padding: 5px; background: #eee}
+#map {position: absolute; top: 34px; bottom: 0; left: 0; right: 0;
+      overflow: hidden; background: #bbb; cursor: move}
+#map img {position: absolute; width: 256px; height: 256px;
+          image-rendering: pixelated}
+</style></head>
+<body>
+<div id="bar">
+<select id="scenario"></select> <select id="band"></select>
+range <input id="range" size="12" placeholder="min,max">
+<button id="flip" title="Flip to the previous scenario (F)">flip</button>
+<button id="out">-</button><button id="in">+</button>
+<span id="info"></span>
+</div>
+<div id="map"></div>
+<script>
+var $ = function (id) { return document.getElementById(id); };
+var map = $("map"), layers = {}, zoom = 0, cx = 128, cy = 128;
+var current = null, previous = null, drag = null;
+
+function layer() {
+  return (layers[$("scenario").value] || {})[$("band").value];
+}
+
+function draw() {
+  map.innerHTML = "";
+  var info = layer();
+  $("info").textContent = info ? "zoom " + zoom + "/" + info.max_zoom +
+    ", " + info.ramp + " " + ($("range").value || info.range || "stretch") :
+    "not in this scenario";
+  if (!info) { return; }
+  var left = cx - map.clientWidth / 2, top = cy - map.clientHeight / 2;
+  var query = $("range").value ? "?range=" + $("range").value : "";
+  for (var y = Math.max(0, Math.floor(top / 256));
+       y <= Math.floor((top + map.clientHeight) / 256); y++) {
+    for (var x = Math.max(0, Math.floor(left / 256));
+         x <= Math.floor((left + map.clientWidth) / 256); x++) {
+      var img = document.createElement("img");
+      img.style.left = (x * 256 - left) + "px";
+      img.style.top = (y * 256 - top) + "px";
+      img.onerror = function () { this.remove(); };
+      img.src = "tiles/" + encodeURIComponent($("scenario").value) + "/" +
+        $("band").value + "/" + zoom + "/" + x + "/" + y + ".png" + query;
+      map.appendChild(img);
+    }
+  }
+}
+
+function setZoom(level) {
+  var info = layer();
+  level = Math.max(0, Math.min(level, info ? info.max_zoom : 0));
+  cx *= Math.pow(2, level - zoom);
+  cy *= Math.pow(2, level - zoom);
+  zoom = level;
+  draw();
+}
+
+function selectScenario() {
+  previous = current;
+  current = $("scenario").value;
+  draw();
+}
+
+function flip() {
+  if (previous === null) { return; }
+  $("scenario").value = previous;
+  selectScenario();
+}
+
+fetch("layers.json").then(function (r) { return r.json(); }).then(
+  function (data) {
+    layers = data;
+    var bands = [];
+    Object.keys(data).forEach(function (scenario) {
+      $("scenario").add(new Option(scenario));
+      Object.keys(data[scenario]).forEach(function (band) {
+        if (bands.indexOf(band) < 0) { bands.push(band); }
+      });
+    });
+    bands.sort().forEach(function (band) {
+      $("band").add(new Option(band));
+    });
+    current = $("scenario").value;
+    draw();
+  });
+
+$("scenario").onchange = selectScenario;
+$("band").onchange = draw;
+$("range").onchange = draw;
+$("flip").onclick = flip;
+$("in").onclick = function () { setZoom(zoom + 1); };
+$("out").onclick = function () { setZoom(zoom - 1); };
+document.onkeydown = function (e) {
+  if (e.target.tagName === "INPUT") { return; }
+  if (e.key === "f" || e.key === "F") { flip(); }
+  if (e.key === "+" || e.key === "=") { setZoom(zoom + 1); }
+  if (e.key === "-") { setZoom(zoom - 1); }
+};
+map.onwheel = function (e) {
+  e.preventDefault();
+  setZoom(zoom + (e.deltaY < 0 ? 1 : -1));
+};
+map.onmousedown = function (e) { drag = [e.clientX, e.clientY]; };
+window.onmouseup = function () { drag = null; };
+window.onmousemove = function (e) {
+  if (!drag) { return; }
+  cx -= e.clientX - drag[0];
+  cy -= e.clientY - drag[1];
+  drag = [e.clientX, e.clientY];
+  draw();
+};
+window.onresize = draw;
+</script>
+</body></html>
+"""
+
+
+def main(scenarios_folder, port=""):
+    try:
+        asyncio.run(serve(scenarios_folder, port=int(port or 8000)))
+    except KeyboardInterrupt:
+        add_message("Stopped serving tiles.")
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    scenarios_folder = arcpy.GetParameterAsText(0)
+    port = arcpy.GetParameterAsText(1)
+
+    main(scenarios_folder, port)
@@ -4,6 +4,14 @@ Calculates the AdH rasters for the required NYBEM variables into the
 appropriate model subfolder. These raster predictors are required to calculate
 the NYBEM ecological models.
 
+Each raster is calculated by one step. Completed steps are recorded in a
+journal in the alternative folder, so if a run fails partway through, running
+the tool again resumes at the first incomplete step. Before the first step,
+the inputs are checked for problems that would make a step fail (see
+`preflight`). When the `NYBEM_LOCAL_SCRATCH` environment variable is set, the
+steps run on a local copy of their inputs and the outputs are copied back to
+the alternative folder as they complete (see `staging`).
+
 :param: path_to_fwop:  string; Path to the parent folder of the existing
                        condition scenario (aka, Future WithOut Project, FWOP).
 :param: path_to_alt:   string; Path to the parent folder of the alternative
@@ -15,7 +23,10 @@ the NYBEM ecological models.
 :param: adh_wse:       string; Path to the AdH folder holding the model
                        water surface elevation results for this alternative.
 :param: barriers:       line feature class; A line feature class
-                       representing barriers used during interpolation.
+                       representing barriers used during interpolation. With
+                       `NYBEM_SIMPLIFY_BARRIERS` set, the barriers are
+                       simplified and snapped to a fraction of the mask cell
+                       size once per run (see `barriers`).
 :param: mask:           raster; A raster used to determine the
                        characteristics (dimensions, extent, cell size,
                        coordinate system, mask, snap) of the output raster.
@@ -24,240 +35,326 @@ the NYBEM ecological models.
            appropriate subfolder for each model.
 """
 import os
-import arcpy
-import utils
-import importlib
-
-# Ensure changes are reloaded during interactive development session
-importlib.reload(arcpy)
-importlib.reload(utils)
-
-arcpy.env.compression = "LZW"
-arcpy.env.overwriteOutput = True
-
-
-def main():
-
-    arcpy.AddMessage("# ALT")  # -----------------------------------------------
-    arcpy.AddMessage("## 10 Percentile Salinity")
-    utils.adh2raster(output_folder=path_to_alt,
-                     output_name="sal_10",
-                     adh_points=adh_salinity,
-                     variable="sal_10",
-                     sql_select="sal_10 > -1",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## MHHW")
-    utils.adh2raster(output_folder=path_to_alt,
-                     output_name="mhhw",
-                     adh_points=adh_wse,
-                     variable="MHHW",
-                     sql_select="MHHW > -3 AND MHHW < 3",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## MLLW")
-    utils.adh2raster(output_folder=path_to_alt,
-                     output_name="mllw",
-                     adh_points=adh_wse,
-                     variable="MLLW",
-                     sql_select="MLLW > -3 AND MLLW < 3",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## MTL")
-    utils.adh2raster(output_folder=path_to_alt,
-                     output_name="mtl",
-                     adh_points=adh_wse,
-                     variable="Mean_WSE",
-                     sql_select="Mean_WSE > -3 AND Mean_WSE < 3",
-                     barriers=barriers,
-                     mask=mask)
-
-    arcpy.AddMessage("# EST_INT")  # -------------------------------------------
-    est_int_path = os.path.join(path_to_alt, "est_int", "predictors")
 
-    arcpy.AddMessage("## Mean Salinity")
-    utils.adh2raster(output_folder=est_int_path,
-                     output_name="sal_mean_ann",
-                     adh_points=adh_salinity,
-                     variable="Mean_Depth",
-                     sql_select="Mean_Depth > -1",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## High Velocity")
-    utils.adh2raster(output_folder=est_int_path,
-                     output_name="vel_90",
-                     adh_points=adh_velocity,
-                     variable="vel_90",
-                     sql_select="vel_90 > -1",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## High Velocity, FWOP")
-    fwop_est_int_path = os.path.join(path_to_fwop, "est_int", "predictors")
-    arcpy.CopyRaster_management(os.path.join(fwop_est_int_path,
-                                             "vel_90.tif"),
-                                os.path.join(est_int_path,
-                                             "fwop_vel_90.tif"))
-    arcpy.AddMessage("## Edge Erosion")
-    utils.rel_velocity(output_folder=est_int_path,
-                       output_name="edge_erosion",
-                       vel_alt=os.path.join(est_int_path,
-                                            "vel_90.tif"),
-                       vel_fwop=os.path.join(est_int_path,
-                                             "fwop_vel_90.tif"))
-    arcpy.AddMessage("## Depth Median")
-    utils.adh2raster(output_folder=est_int_path,
-                     output_name="wse_median",
-                     adh_points=adh_wse,
-                     variable="wse_50",
-                     sql_select="wse_50 > -3 AND wse_50 < 3",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## Depth Maximum")
-    utils.adh2raster(output_folder=est_int_path,
-                     output_name="wse_100",
-                     adh_points=adh_wse,
-                     variable="wse_100",
-                     sql_select="wse_100 > -3 AND wse_100 < 3",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## Episodic Sediment Deposition (aka Relative Depth)")
-    utils.epi_sed_dep(output_folder=est_int_path,
-                      output_name="esd",
-                      wse_mhhw=os.path.join(path_to_alt, "mhhw.tif"),
-                      wse_median=os.path.join(est_int_path, "wse_median.tif"),
-                      wse_max=os.path.join(est_int_path, "wse_100.tif"))
-
-    arcpy.AddMessage("# EST_SUB_HARD")  # --------------------------------------
-    est_sub_hard_path = os.path.join(path_to_alt, "est_sub_hard", "predictors")
-
-    arcpy.AddMessage("## Minimum Salinity")
-    utils.adh2raster(output_folder=est_sub_hard_path,
-                     output_name="sal_min_ann",
-                     adh_points=adh_salinity,
-                     variable="sal_0",
-                     sql_select="sal_0 > -1",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## Mean Salinity")
-    utils.adh2raster(output_folder=est_sub_hard_path,
-                     output_name="sal_mean_ann",
-                     adh_points=adh_salinity,
-                     variable="Mean_Depth",
-                     sql_select="Mean_Depth > -1",
-                     barriers=barriers,
-                     mask=mask)
-
-    arcpy.AddMessage("# EST_SUB_SOFT_CLAM")  # ---------------------------------
-    est_sub_soft_clam_path = os.path.join(path_to_alt, "est_sub_soft_clam",
-                                          "predictors")
+try:
+    from . import journal, preflight, raster_io, staging, utils
+    from .barriers import prepared_feature_class
+except ImportError:
+    import journal
+    import preflight
+    import raster_io
+    import staging
+    import utils
+    from barriers import prepared_feature_class
+
+# Set NYBEM_DEV_RELOAD to pick up changes during interactive development
+utils.dev_reload(utils)
+
+# Arguments of the `utils` functions that are not input files
+NON_INPUT_ARGS = ("output_folder", "output_name", "variable", "sql_select",
+                  "method", "function")
+
+# Predictors interpolated without a spline fit when fast interpolation is on
+# (see `interpolation_method`), by output name
+FAST_METHODS = {"sal_10": "idw", "sal_mean_ann": "idw", "sal_min_ann": "idw"}
+
+
+def interpolation_method(output_name, fast=None):
+    """Returns the interpolation method of a predictor.
+
+    :param: output_name:  string; Name of the predictor raster.
+    :param: fast:         bool; Whether to use the fast methods of
+                          `FAST_METHODS`. Defaults to True if the
+                          `NYBEM_FAST_INTERPOLATION` environment variable is
+                          set.
+
+    :return:  string; "spline", or a method of `interpolate.METHODS`.
+    """
+    if fast is None:
+        fast = bool(os.environ.get("NYBEM_FAST_INTERPOLATION"))
+    return FAST_METHODS.get(output_name, "spline") if fast else "spline"
+
 
-    arcpy.AddMessage("## Minimum Salinity")
-    arcpy.CopyRaster_management(os.path.join(est_sub_hard_path,
-                                             "sal_min_ann.tif"),
-                                os.path.join(est_sub_soft_clam_path,
-                                             "sal_min_ann.tif"))
+def scenario_steps(path_to_fwop, path_to_alt, adh_velocity, adh_salinity,
+                   adh_wse, barriers, mask):
+    """Lists the steps that calculate the AdH rasters for a scenario.
 
-    arcpy.AddMessage("# EST_SUB_SOFT_SAV")  # ----------------------------------
+    Each step is a dict with the keys "section" and "message" (written to the
+    geoprocessing messages), "function" (the name of the `utils` function to
+    call) and "args" (its keyword arguments). Steps are listed in an order
+    that satisfies their dependencies.
+
+    :return:  list; The steps.
+    """
+    est_int_path = os.path.join(path_to_alt, "est_int", "predictors")
+    est_sub_hard_path = os.path.join(path_to_alt, "est_sub_hard",
+                                     "predictors")
+    est_sub_soft_clam_path = os.path.join(path_to_alt, "est_sub_soft_clam",
+                                          "predictors")
     est_sub_soft_sav_path = os.path.join(path_to_alt, "est_sub_soft_sav",
                                          "predictors")
-
-    arcpy.AddMessage("## Depth Meters")
-    utils.depth(output_folder=est_sub_soft_sav_path,
-                output_name="depth",
-                wse_mtl=os.path.join(path_to_alt, "mtl.tif"),
-                bed_elevation=os.path.join(path_to_alt, "bed_elevation.tif"))
-    arcpy.AddMessage("## Percent Light Available")
-    utils.per_light_available(output_folder=est_sub_soft_sav_path,
-                              output_name="pla",
-                              depth_m=os.path.join(est_sub_soft_sav_path, 
-                                                   "depth.tif"))
-    
-    arcpy.AddMessage("# FRESH_TID")  # -----------------------------------------
     fresh_tid_path = os.path.join(path_to_alt, "fresh_tid", "predictors")
-
-    arcpy.AddMessage("## 10 Percent Salinity")
-    arcpy.CopyRaster_management(os.path.join(path_to_alt, "sal_10.tif"),
-                                os.path.join(fresh_tid_path, "sal_10.tif"))
-    arcpy.AddMessage("## Episodic Sediment Deposition")
-    utils.epi_sed_dep(output_folder=fresh_tid_path,
-                      output_name="esd",
-                      wse_mhhw=os.path.join(path_to_alt, "mhhw.tif"),
-                      wse_median=os.path.join(est_int_path, "wse_median.tif"),
-                      wse_max=os.path.join(est_int_path, "wse_100.tif"))
-
-    arcpy.AddMessage("# MAR_DEEP")  # ------------------------------------------
     mar_deep_path = os.path.join(path_to_alt, "mar_deep", "predictors")
-
-    arcpy.AddMessage("## Mean Salinity")
-    arcpy.CopyRaster_management(os.path.join(est_sub_hard_path,
-                                             "sal_mean_ann.tif"),
-                                os.path.join(mar_deep_path,
-                                             "sal_mean_ann.tif"))
-    arcpy.AddMessage("## 10 Percentile Velocity")
-    utils.adh2raster(output_folder=mar_deep_path,
-                     output_name="vel_10",
-                     adh_points=adh_velocity,
-                     variable="vel_10",
-                     sql_select="vel_10 > -1",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## Low Velocity, FWOP")
-    fwop_mar_deep_path = os.path.join(path_to_fwop, "mar_deep", "predictors")
-    arcpy.CopyRaster_management(os.path.join(fwop_mar_deep_path,
-                                             "vel_10.tif"),
-                                os.path.join(mar_deep_path,
-                                             "fwop_vel_10.tif"))
-    arcpy.AddMessage("## Low Velocity Change")
-    utils.rel_velocity(output_folder=mar_deep_path,
-                       output_name="vel_change",
-                       vel_alt=os.path.join(mar_deep_path,
-                                            "vel_10.tif"),
-                       vel_fwop=os.path.join(mar_deep_path,
-                                             "fwop_vel_10.tif"))
-    arcpy.AddMessage("## Percent Light Available")
-    arcpy.CopyRaster_management(os.path.join(est_sub_soft_sav_path,
-                                             "pla.tif"),
-                                os.path.join(mar_deep_path,
-                                             "pla.tif"))
-    
-    arcpy.AddMessage("# MAR_INT")  # -------------------------------------------
     mar_int_path = os.path.join(path_to_alt, "mar_int", "predictors")
-    
-    arcpy.AddMessage("## Minimum Depth")
-    utils.adh2raster(output_folder=mar_int_path,
-                     output_name="wse_0",
-                     adh_points=adh_wse,
-                     variable="wse_0",
-                     sql_select="wse_0 > -3 AND wse_0 < 3",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## Exposure Duration (aka t_rel)")
-    utils.expo_dur(output_folder=mar_int_path,
-                   output_name="exp_dur",
-                   wse_100=os.path.join(est_int_path, "wse_100.tif"),
-                   wse_0=os.path.join(mar_int_path, "wse_0.tif"),
-                   wse_mhhw=os.path.join(path_to_alt, "mhhw.tif"),
-                   wse_mllw=os.path.join(path_to_alt, "mllw.tif"))
-
-    arcpy.AddMessage("# MAR_SUB")  # -------------------------------------------
     mar_sub_path = os.path.join(path_to_alt, "mar_sub", "predictors")
+    fwop_est_int_path = os.path.join(path_to_fwop, "est_int", "predictors")
+    fwop_mar_deep_path = os.path.join(path_to_fwop, "mar_deep", "predictors")
+
+    steps = []
+
+    def step(section, message, function, **args):
+        steps.append({"section": section, "message": message,
+                      "function": function, "args": args})
+
+    def adh2raster(section, message, output_folder, output_name, adh_points,
+                   variable, sql_select):
+        step(section, message, "adh2raster",
+             output_folder=output_folder,
+             output_name=output_name,
+             adh_points=adh_points,
+             variable=variable,
+             sql_select=sql_select,
+             barriers=barriers,
+             mask=mask)
+        method = interpolation_method(output_name)
+        if method != "spline":
+            steps[-1]["args"]["method"] = method
 
-    arcpy.AddMessage("## Median Velocity")
-    utils.adh2raster(output_folder=mar_sub_path,
-                     output_name="vel_50",
-                     adh_points=adh_velocity,
-                     variable="vel_50",
-                     sql_select="vel_50 > -1",
-                     barriers=barriers,
-                     mask=mask)
-    arcpy.AddMessage("## Percent Light Available")
-    arcpy.CopyRaster_management(os.path.join(est_sub_soft_sav_path,
-                                             "pla.tif"),
-                                os.path.join(mar_sub_path,
-                                             "pla.tif"))
+    section = "# ALT"  # -------------------------------------------------------
+    adh2raster(section, "## 10 Percentile Salinity",
+               output_folder=path_to_alt,
+               output_name="sal_10",
+               adh_points=adh_salinity,
+               variable="sal_10",
+               sql_select="sal_10 > -1")
+    adh2raster(section, "## MHHW",
+               output_folder=path_to_alt,
+               output_name="mhhw",
+               adh_points=adh_wse,
+               variable="MHHW",
+               sql_select="MHHW > -3 AND MHHW < 3")
+    adh2raster(section, "## MLLW",
+               output_folder=path_to_alt,
+               output_name="mllw",
+               adh_points=adh_wse,
+               variable="MLLW",
+               sql_select="MLLW > -3 AND MLLW < 3")
+    adh2raster(section, "## MTL",
+               output_folder=path_to_alt,
+               output_name="mtl",
+               adh_points=adh_wse,
+               variable="Mean_WSE",
+               sql_select="Mean_WSE > -3 AND Mean_WSE < 3")
+
+    section = "# EST_INT"  # ---------------------------------------------------
+    adh2raster(section, "## Mean Salinity",
+               output_folder=est_int_path,
+               output_name="sal_mean_ann",
+               adh_points=adh_salinity,
+               variable="Mean_Depth",
+               sql_select="Mean_Depth > -1")
+    adh2raster(section, "## High Velocity",
+               output_folder=est_int_path,
+               output_name="vel_90",
+               adh_points=adh_velocity,
+               variable="vel_90",
+               sql_select="vel_90 > -1")
+    step(section, "## Edge Erosion", "rel_velocity",
+         output_folder=est_int_path,
+         output_name="edge_erosion",
+         vel_alt=os.path.join(est_int_path, "vel_90.tif"),
+         vel_fwop=os.path.join(fwop_est_int_path, "vel_90.tif"))
+    adh2raster(section, "## Depth Median",
+               output_folder=est_int_path,
+               output_name="wse_median",
+               adh_points=adh_wse,
+               variable="wse_50",
+               sql_select="wse_50 > -3 AND wse_50 < 3")
+    adh2raster(section, "## Depth Maximum",
+               output_folder=est_int_path,
+               output_name="wse_100",
+               adh_points=adh_wse,
+               variable="wse_100",
+               sql_select="wse_100 > -3 AND wse_100 < 3")
+    step(section, "## Episodic Sediment Deposition (aka Relative Depth)",
+         "epi_sed_dep",
+         output_folder=est_int_path,
+         output_name="esd",
+         wse_mhhw=os.path.join(path_to_alt, "mhhw.tif"),
+         wse_median=os.path.join(est_int_path, "wse_median.tif"),
+         wse_max=os.path.join(est_int_path, "wse_100.tif"))
+
+    section = "# EST_SUB_HARD"  # ----------------------------------------------
+    adh2raster(section, "## Minimum Salinity",
+               output_folder=est_sub_hard_path,
+               output_name="sal_min_ann",
+               adh_points=adh_salinity,
+               variable="sal_0",
+               sql_select="sal_0 > -1")
+    adh2raster(section, "## Mean Salinity",
+               output_folder=est_sub_hard_path,
+               output_name="sal_mean_ann",
+               adh_points=adh_salinity,
+               variable="Mean_Depth",
+               sql_select="Mean_Depth > -1")
+
+    section = "# EST_SUB_SOFT_CLAM"  # -----------------------------------------
+    step(section, "## Minimum Salinity", "copy_raster",
+         output_folder=est_sub_soft_clam_path,
+         output_name="sal_min_ann",
+         in_raster=os.path.join(est_sub_hard_path, "sal_min_ann.tif"))
+
+    section = "# EST_SUB_SOFT_SAV"  # ------------------------------------------
+    step(section, "## Depth Meters", "depth",
+         output_folder=est_sub_soft_sav_path,
+         output_name="depth",
+         wse_mtl=os.path.join(path_to_alt, "mtl.tif"),
+         bed_elevation=os.path.join(path_to_alt, "bed_elevation.tif"))
+    step(section, "## Percent Light Available", "per_light_available",
+         output_folder=est_sub_soft_sav_path,
+         output_name="pla",
+         depth_m=os.path.join(est_sub_soft_sav_path, "depth.tif"))
+
+    section = "# FRESH_TID"  # -------------------------------------------------
+    step(section, "## 10 Percent Salinity", "copy_raster",
+         output_folder=fresh_tid_path,
+         output_name="sal_10",
+         in_raster=os.path.join(path_to_alt, "sal_10.tif"))
+    step(section, "## Episodic Sediment Deposition", "epi_sed_dep",
+         output_folder=fresh_tid_path,
+         output_name="esd",
+         wse_mhhw=os.path.join(path_to_alt, "mhhw.tif"),
+         wse_median=os.path.join(est_int_path, "wse_median.tif"),
+         wse_max=os.path.join(est_int_path, "wse_100.tif"))
+
+    section = "# MAR_DEEP"  # --------------------------------------------------
+    step(section, "## Mean Salinity", "copy_raster",
+         output_folder=mar_deep_path,
+         output_name="sal_mean_ann",
+         in_raster=os.path.join(est_sub_hard_path, "sal_mean_ann.tif"))
+    adh2raster(section, "## 10 Percentile Velocity",
+               output_folder=mar_deep_path,
+               output_name="vel_10",
+               adh_points=adh_velocity,
+               variable="vel_10",
+               sql_select="vel_10 > -1")
+    step(section, "## Low Velocity Change", "rel_velocity",
+         output_folder=mar_deep_path,
+         output_name="vel_change",
+         vel_alt=os.path.join(mar_deep_path, "vel_10.tif"),
+         vel_fwop=os.path.join(fwop_mar_deep_path, "vel_10.tif"))
+    step(section, "## Percent Light Available", "copy_raster",
+         output_folder=mar_deep_path,
+         output_name="pla",
+         in_raster=os.path.join(est_sub_soft_sav_path, "pla.tif"))
+
+    section = "# MAR_INT"  # ---------------------------------------------------
+    adh2raster(section, "## Minimum Depth",
+               output_folder=mar_int_path,
+               output_name="wse_0",
+               adh_points=adh_wse,
+               variable="wse_0",
+               sql_select="wse_0 > -3 AND wse_0 < 3")
+    step(section, "## Exposure Duration (aka t_rel)", "expo_dur",
+         output_folder=mar_int_path,
+         output_name="exp_dur",
+         wse_100=os.path.join(est_int_path, "wse_100.tif"),
+         wse_0=os.path.join(mar_int_path, "wse_0.tif"),
+         wse_mhhw=os.path.join(path_to_alt, "mhhw.tif"),
+         wse_mllw=os.path.join(path_to_alt, "mllw.tif"))
+
+    section = "# MAR_SUB"  # ---------------------------------------------------
+    adh2raster(section, "## Median Velocity",
+               output_folder=mar_sub_path,
+               output_name="vel_50",
+               adh_points=adh_velocity,
+               variable="vel_50",
+               sql_select="vel_50 > -1")
+    step(section, "## Percent Light Available", "copy_raster",
+         output_folder=mar_sub_path,
+         output_name="pla",
+         in_raster=os.path.join(est_sub_soft_sav_path, "pla.tif"))
+
+    return steps
+
+
+def step_inputs(step):
+    """Returns the paths of the files a step reads."""
+    return [value for name, value in step["args"].items()
+            if name not in NON_INPUT_ARGS]
+
+
+def step_outputs(step):
+    """Returns the paths of the files a step writes."""
+    return [os.path.join(step["args"]["output_folder"],
+                         step["args"]["output_name"] + ".tif")]
+
+
+def step_name(step, path_to_alt):
+    """Returns the name of a step: its output relative to the alternative."""
+    return os.path.relpath(step_outputs(step)[0], path_to_alt)
+
+
+def run_steps(steps, path_to_alt, resume=True, completed=None, shard=None):
+    """Runs steps in order, skipping those the journal shows are complete.
+
+    :param: steps:        list; Steps from `scenario_steps`.
+    :param: path_to_alt:  string; Path to the alternative folder, which holds
+                          the journal.
+    :param: resume:       bool; If False every step is run.
+    :param: completed:    callable; Optional, called with each step once its
+                          outputs are in place, whether it was run or
+                          skipped.
+    :param: shard:        string; Optional, name of the worker whose shards
+                          of the journal and the run manifest are written,
+                          see `utils.shard_path`.
+
+    :return:  None. Rasters written by the steps are recorded in the run
+              manifest of the alternative folder, see `raster_io.manifest`.
+    """
+    journal_path = os.path.join(path_to_alt, journal.JOURNAL_NAME)
+    section = None
+    with raster_io.manifest(path_to_alt, shard):
+        for step in steps:
+            if step["section"] != section:
+                section = step["section"]
+                utils.add_message(section)
+            utils.add_message(step["message"])
+            journal.run_step(journal_path, step_name(step, path_to_alt),
+                             getattr(utils, step["function"]), step["args"],
+                             step_inputs(step), step_outputs(step), resume,
+                             shard)
+            if completed is not None:
+                completed(step)
+
+
+def main(path_to_fwop, path_to_alt, adh_velocity, adh_salinity, adh_wse,
+         barriers, mask, resume=True):
+    import arcpy
+
+    arcpy.env.compression = "LZW"
+    arcpy.env.overwriteOutput = True
+
+    # Fail on bad inputs before any interpolation starts
+    preflight.require_valid(
+        scenario_steps(path_to_fwop, path_to_alt, adh_velocity, adh_salinity,
+                       adh_wse, barriers, mask), mask)
+
+    # Barriers simplified once for every interpolation, if opted in
+    barriers = prepared_feature_class(barriers, mask)
+
+    steps = scenario_steps(path_to_fwop, path_to_alt, adh_velocity,
+                           adh_salinity, adh_wse, barriers, mask)
+    scratch = staging.scratch_folder()
+    if scratch:
+        staging.run_staged(steps, path_to_fwop, path_to_alt, scratch, resume)
+    else:
+        run_steps(steps, path_to_alt, resume)
 
 
 if __name__ == "__main__":
+    import arcpy
+
     # Get input parameters
     path_to_fwop = arcpy.GetParameterAsText(0)
     path_to_alt = arcpy.GetParameterAsText(1)
@@ -267,4 +364,5 @@ if __name__ == "__main__":
     barriers = arcpy.GetParameterAsText(5)
     mask = arcpy.GetParameterAsText(6)
 
-    main()
+    main(path_to_fwop, path_to_alt, adh_velocity, adh_salinity, adh_wse,
+         barriers, mask)
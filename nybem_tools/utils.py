@@ -2,6 +2,238 @@
 """
 
 
+# Models making up a scenario, each with its own folder of predictors
+MODEL_NAMES = ["est_int", "est_sub", "est_sub_hard",
+               "est_sub_soft_clam", "est_sub_soft_sav",
+               "fresh_tid", "mar_deep", "mar_int", "mar_sub"]
+
+
+def add_message(message):
+    """Writes a message to the geoprocessing messages.
+
+    Messages go through `arcpy.AddMessage` once arcpy has been loaded and are
+    printed otherwise, so code paths that do not need arcpy never import it.
+
+    :param: message:  string; The message to write.
+
+    :return:  None.
+    """
+    import sys
+
+    if "arcpy" in sys.modules:
+        sys.modules["arcpy"].AddMessage(message)
+    else:
+        print(message)
+
+
+def dev_reload(*modules):
+    """Reloads modules when running in development mode.
+
+    ArcGIS Pro keeps imported modules loaded between tool runs, so changes to
+    this package are only picked up after a restart. When the
+    `NYBEM_DEV_RELOAD` environment variable is set, the given modules are
+    reloaded every time a tool starts instead. Reloading is off by default
+    because it adds to the startup time of every tool invocation.
+
+    :param: modules:  module; The modules to reload.
+
+    :return:  None.
+    """
+    import importlib
+    import os
+
+    if os.environ.get("NYBEM_DEV_RELOAD"):
+        for module in modules:
+            importlib.reload(module)
+
+
+_extensions_checked_out = False
+
+
+def check_out_extensions():
+    """Checks out the ArcGIS extensions used by the arcpy-backed tools.
+
+    Tools run from the ArcGIS toolbox get their licenses from the
+    application; headless runs have to check them out explicitly. This is
+    done once per process.
+
+    :return:  None.
+    """
+    import arcpy
+
+    global _extensions_checked_out
+    if not _extensions_checked_out:
+        arcpy.CheckOutExtension("3D")
+        arcpy.CheckOutExtension("Spatial")
+        _extensions_checked_out = True
+
+
+def partial_path(output_path):
+    """Returns the temporary path an output is written to before it is
+    committed.
+
+    Outputs are written to a `.partial` subfolder of their output folder and
+    moved into place by `commit_output` once complete, so an interrupted run
+    never leaves a truncated raster under the final name.
+
+    :param: output_path:  string; Final path of the output.
+
+    :return:  string; The temporary path. Its folder is created if needed.
+    """
+    import os
+
+    folder = os.path.join(os.path.dirname(output_path), ".partial")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, os.path.basename(output_path))
+
+
+def commit_output(partial, output_path):
+    """Moves a completed output from its temporary path into place.
+
+    Sidecar files (e.g. `.tfw`, `.tif.aux.xml`, `.tif.ovr`) are moved first
+    and the output itself last, so the presence of the output implies that
+    it is complete.
+
+    :param: partial:      string; Temporary path returned by `partial_path`.
+    :param: output_path:  string; Final path of the output.
+
+    :return:  None. Accomplishes the side effect of moving the files.
+    """
+    import glob
+    import os
+
+    folder = os.path.dirname(partial)
+    output_folder = os.path.dirname(output_path)
+    stem = os.path.splitext(os.path.basename(partial))[0]
+    for file_ in glob.glob(os.path.join(folder, glob.escape(stem) + ".*")):
+        if file_ != partial:
+            os.replace(file_, os.path.join(output_folder,
+                                           os.path.basename(file_)))
+    os.replace(partial, output_path)
+
+
+def shard_path(path, shard=None):
+    """Returns the path of the shard of a log written by one worker.
+
+    Appending to a file shared by several machines is not atomic on network
+    filesystems (NFS, SMB), so workers of a queue each append to their own
+    shard of the journal and run manifest, which are merged on read (see
+    `shard_paths`).
+
+    :param: path:   string; Path to the log, e.g. a journal.
+    :param: shard:  string; Name of the worker, or None for the log itself.
+
+    :return:  string; `<stem>.<shard><ext>` next to the log, with characters
+              that are not allowed in file names replaced.
+    """
+    import os
+    import re
+
+    if not shard:
+        return path
+    stem, ext = os.path.splitext(path)
+    shard = re.sub(r"[^\w.-]", "_", str(shard))
+    return f"{stem}.{shard}{ext}"
+
+
+def shard_paths(path):
+    """Returns the paths of a log and of all its shards that exist.
+
+    :param: path:  string; Path to the log.
+
+    :return:  list; The log first, then its shards by name.
+    """
+    import glob
+    import os
+
+    stem, ext = os.path.splitext(path)
+    shards = sorted(glob.glob(glob.escape(stem) + ".*" + glob.escape(ext)))
+    return [file_ for file_ in [path] + shards if os.path.isfile(file_)]
+
+
+def open_raster(raster):
+    """Opens a raster for map algebra.
+
+    Rasters saved with a quantized storage profile hold scaled integers; these
+    are decoded to their float values.
+
+    :param: raster:  string; Path to a raster.
+
+    :return:  arcpy.sa.Raster; The raster's values.
+    """
+    from arcpy.sa import Raster
+    try:
+        from . import raster_io
+    except ImportError:
+        import raster_io
+
+    profile = raster_io.read_profile(raster)
+    if profile is None:
+        return Raster(raster)
+    return Raster(raster) * profile["scale"] + profile["offset"]
+
+
+def save_raster(raster, output_folder, output_name):
+    """Saves a raster to the output folder in .tif format.
+
+    Values are stored as 32 bit floats, or as scaled integers when quantized
+    storage is enabled and the predictor has a quantized profile (see
+    `raster_io.storage_profile`). The raster is read and written window by
+    window in one pass that also gathers its statistics and pyramids (see
+    `raster_io.open_output`), so ArcGIS does not compute them again. It is
+    written to a temporary path first and committed once complete, see
+    `partial_path`.
+
+    :param: raster:         raster; The raster to save.
+    :param: output_folder:  string; Path to the output folder where the
+                            raster will be written.
+    :param: output_name:    string; Name of the output raster.
+
+    :return:  None. Accomplishes the side effect of saving the raster.
+    """
+    import os
+    import arcpy
+    from timeit import default_timer as timer
+    from datetime import timedelta
+    try:
+        from . import raster_io
+    except ImportError:
+        import raster_io
+
+    start = timer()
+    output_raster_path = os.path.join(output_folder,
+                                      str(output_name) + ".tif")
+    grid = raster_io.read_grid(raster)
+    output = raster_io.open_output(output_raster_path, grid,
+                                   raster_io.storage_profile(output_name))
+    for window in raster_io.windows(grid):
+        raster_io.write_window(output, raster_io.read_array(raster, window),
+                               window)
+    raster_io.close_output(output)
+    end = timer()
+    arcpy.AddMessage(f"Raster saved. {timedelta(seconds=end - start)}")
+
+
+def copy_raster(output_folder, output_name, in_raster):
+    """Copies a raster to the output folder in .tif format.
+
+    :param: output_folder:  string; Path to the output folder where the
+                            raster will be written.
+    :param: output_name:    string; Name of the output raster.
+    :param: in_raster:      raster; The raster to copy.
+
+    :return:  None. Accomplishes the side effect of saving a copy of the
+              raster to the output_folder.
+    """
+    import arcpy
+
+    arcpy.env.compression = "LZW"
+    arcpy.env.overwriteOutput = True
+
+    arcpy.AddMessage(in_raster)
+    save_raster(open_raster(in_raster), output_folder, output_name)
+
+
 def copy_tif(from_path, to_path, name_pattern):
     """Copies files matching a pattern from one folder to another.
 
@@ -14,15 +246,14 @@ def copy_tif(from_path, to_path, name_pattern):
     import glob
     import os
     import shutil
-    import arcpy
 
     for file_ in glob.glob(os.path.join(from_path, name_pattern)):
         shutil.copy(file_, to_path)
-    arcpy.AddMessage(name_pattern)
+    add_message(name_pattern)
 
 
 def adh2raster(output_folder, output_name, adh_points, variable, sql_select,
-               barriers, mask):
+               barriers, mask, method="spline", processes=None, seed=""):
     """Converts an AdH model point variable to a raster.
 
     AdH mesh nodes are often exported as points with an attribute table. This
@@ -43,15 +274,57 @@ def adh2raster(output_folder, output_name, adh_points, variable, sql_select,
     :param: mask:          raster; A raster used to determine the
                            characteristics (dimensions, extent, cell size,
                            coordinate system, mask, snap) of the output raster.
+    :param: method:        string; "spline" for `SplineWithBarriers`, or a
+                           fast method of `interpolate.interpolate_points`
+                           ("idw" or "linear").
+    :param: processes:     int; Number of processes interpolating subdomains
+                           of the mask in parallel (see `decompose`), for
+                           the spline and "idw". Defaults to
+                           `decompose.process_count`; 1 interpolates the
+                           whole mask at once.
+    :param: seed:          string; Optional path to a solution of the
+                           variable on a coarser grid, used by the fast
+                           methods to solve only the cells where it is not
+                           smooth (see `interpolate.resample_seed`).
+                           `SplineWithBarriers` cannot be seeded.
 
     :return:  None. Accomplishes the side effect of saving a raster to the
               output_folder of the specified AdH variable interpolated across
               the extent of the mask raster in .tif format.
     """
     import os
-    import arcpy
     from timeit import default_timer as timer
     from datetime import timedelta
+    try:
+        from . import decompose, filters, interpolate, points
+    except ImportError:
+        import decompose
+        import filters
+        import interpolate
+        import points
+
+    processes = processes or decompose.process_count()
+    if processes > 1 and decompose.halo_cells(method) is not None:
+        start = timer()
+        decompose.interpolate(output_folder, output_name, adh_points,
+                              variable, sql_select, barriers, mask, method,
+                              processes)
+        end = timer()
+        add_message(f"Raster interpolated over subdomains in {processes} "
+                    f"processes. {timedelta(seconds=end - start)}")
+        return
+
+    if method and method != "spline":
+        start = timer()
+        interpolate.interpolate_points(output_folder, output_name, adh_points,
+                                       variable, sql_select, barriers, mask,
+                                       method, seed=seed)
+        end = timer()
+        add_message(f"Raster interpolated ({method}). "
+                    f"{timedelta(seconds=end - start)}")
+        return
+
+    import arcpy
 
     arcpy.env.workspace = output_folder
     arcpy.env.scratchWorkspace = output_folder
@@ -70,44 +343,120 @@ def adh2raster(output_folder, output_name, adh_points, variable, sql_select,
     # arcpy.AddMessage(barriers)
     # arcpy.AddMessage(mask)
 
-    # Filter AdH points
+    # Filter AdH points, unless the filter selects every point. The
+    # vectorized selection is written to memory; clauses `filters` cannot
+    # evaluate are left to a feature layer.
     start = timer()
-    arcpy.MakeFeatureLayer_management(adh_points, "filtered_points",
-                                      sql_select)
+    if filters.selects_all(adh_points, sql_select) and \
+            not points.is_numpy_points(adh_points):
+        filtered_points = adh_points
+    else:
+        # A unique name, so a run that failed before its cleanup does not
+        # stand in the way of the next
+        filtered_points = arcpy.CreateUniqueName("filtered_points", "memory")
+        try:
+            filters.write_selection(
+                adh_points, variable, sql_select, filtered_points,
+                arcpy.Describe(mask if points.is_numpy_points(adh_points)
+                               else adh_points).spatialReference)
+        except (KeyError, ValueError):
+            filtered_points = os.path.basename(filtered_points)
+            arcpy.MakeFeatureLayer_management(adh_points, filtered_points,
+                                              sql_select)
     end = timer()
     arcpy.AddMessage(f"AdH points filtered. {timedelta(seconds=end - start)}")
 
-    # Interpolate points to raster
-    start = timer()
     interp_raster_name = str(output_name) + "_nomask.tif"
     interp_raster_path = os.path.join(output_folder, interp_raster_name)
-    cellsize = arcpy.GetRasterProperties_management(mask, "CELLSIZEX")
-
-    # Do not use `arcpy.sa.SplineWithBarriers()`; way too slow.
-    arcpy.SplineWithBarriers_3d("filtered_points",
-                                variable,
-                                barriers,
-                                cellsize.getOutput(0),
-                                interp_raster_path, 0)
-    end = timer()
-    arcpy.AddMessage(f"Raster interpolated. {timedelta(seconds=end-start)}")
-
-    # Remove nodata areas from interpolated raster
-    start = timer()
-    raster_masked = arcpy.sa.Times(interp_raster_path, mask)
-    end = timer()
-    arcpy.AddMessage(f"Raster masked. {timedelta(seconds=end - start)}")
-
-    # Save output
-    start = timer()
-    output_raster_name = str(output_name) + ".tif"
-    output_raster_path = os.path.join(output_folder, output_raster_name)
-    arcpy.CopyRaster_management(raster_masked, output_raster_path)
-    end = timer()
-    arcpy.AddMessage(f"Raster saved. {timedelta(seconds=end - start)}")
+    try:
+        # Interpolate points to raster
+        start = timer()
+        cellsize = arcpy.GetRasterProperties_management(mask, "CELLSIZEX")
+
+        # Do not use `arcpy.sa.SplineWithBarriers()`; way too slow.
+        arcpy.SplineWithBarriers_3d(filtered_points,
+                                    variable,
+                                    barriers,
+                                    cellsize.getOutput(0),
+                                    interp_raster_path, 0)
+        end = timer()
+        arcpy.AddMessage(f"Raster interpolated. "
+                         f"{timedelta(seconds=end - start)}")
+
+        # Remove nodata areas from interpolated raster
+        start = timer()
+        raster_masked = arcpy.sa.Times(interp_raster_path, mask)
+        end = timer()
+        arcpy.AddMessage(f"Raster masked. {timedelta(seconds=end - start)}")
+
+        # Save output
+        save_raster(raster_masked, output_folder, output_name)
+    finally:
+        # Cleanup, also after a failure
+        if arcpy.Exists(interp_raster_path):
+            arcpy.Delete_management(interp_raster_path)
+        if filtered_points != adh_points and arcpy.Exists(filtered_points):
+            arcpy.Delete_management(filtered_points)
+
+
+def derive_numpy(function, output_folder, output_name, **rasters):
+    """Calculates a derived predictor with numpy.
+
+    The rasters are processed in tiles with reads, calculation and writes
+    overlapping (see `pipeline.run_tiles`). `.npy` inputs give a
+    `<output_name>.npy` output. Inputs in other formats are read through
+    arcpy and give a `<output_name>.tif` output on the grid of the arcpy
+    snap raster, which `adh2raster` and the preview set to the mask; inputs
+    on other grids are resampled onto it as map algebra would.
+
+    :param: function:       string; Name of the derived predictor function.
+    :param: output_folder:  string; Path to the output folder.
+    :param: output_name:    string; Name of the output raster.
+    :param: rasters:        string; Paths of the input rasters, by argument
+                            name.
+
+    :return:  bool; True if the predictor was calculated, False if an input
+              is not a raster file (e.g. a map algebra raster object) and
+              map algebra has to be used.
+    """
+    import os
+    try:
+        from . import pipeline, raster_io
+    except ImportError:
+        import pipeline
+        import raster_io
+
+    if not all(isinstance(raster, str) and os.path.exists(raster)
+               for raster in rasters.values()):
+        return False
+    grid = None
+    if not all(raster_io.is_numpy_raster(raster)
+               for raster in rasters.values()):
+        import arcpy
+
+        if arcpy.env.snapRaster:
+            grid = raster_io.read_grid(arcpy.env.snapRaster)
+    pipeline.derive(function, output_folder, output_name, grid=grid,
+                    **rasters)
+    return True
+
+
+def aligned_inputs(output_folder, *rasters):
+    """Resamples rasters onto the grid of the first where their grids differ,
+    so map algebra does not resample them implicitly.
+
+    :param: output_folder:  string; Path to the output folder, which keeps
+                            the aligned copies (see `align.aligned`).
+    :param: rasters:        string; Paths to the rasters.
+
+    :return:  list; The paths of the rasters on the grid of the first.
+    """
+    try:
+        from . import align
+    except ImportError:
+        import align
 
-    # Cleanup
-    arcpy.Delete_management(interp_raster_path)
+    return align.aligned_inputs(output_folder, *rasters)
 
 
 def rel_velocity(output_folder, output_name, vel_alt, vel_fwop):
@@ -121,6 +470,8 @@ def rel_velocity(output_folder, output_name, vel_alt, vel_fwop):
     Edge Erosion is based on the concept of relative current velocity, using
     high velocity as input.
 
+    Raster file inputs are calculated with numpy, see `derive_numpy`.
+
     :param: output_folder: string; Path to the output folder where the raster
                            will be written.
     :param: output_name:   string; Name of the output raster.
@@ -132,9 +483,11 @@ def rel_velocity(output_folder, output_name, vel_alt, vel_fwop):
               output_folder of the calculated percent increase in the velocity
               from the baseline condition in .tif format.
     """
-    import os
+    if derive_numpy("rel_velocity", output_folder, output_name,
+                    vel_alt=vel_alt, vel_fwop=vel_fwop):
+        return
+
     import arcpy
-    from arcpy.sa import Raster
     from timeit import default_timer as timer
     from datetime import timedelta
 
@@ -143,19 +496,17 @@ def rel_velocity(output_folder, output_name, vel_alt, vel_fwop):
 
     arcpy.AddMessage(vel_alt)
     arcpy.AddMessage(vel_fwop)
+    vel_alt, vel_fwop = aligned_inputs(output_folder, vel_alt, vel_fwop)
 
     start = timer()
-    rel_vel = ((Raster(vel_alt) - Raster(vel_fwop)) / Raster(vel_fwop)) * 100
+    alt = open_raster(vel_alt)
+    fwop = open_raster(vel_fwop)
+    rel_vel = ((alt - fwop) / fwop) * 100
     end = timer()
     arcpy.AddMessage(f"Calculated raster. {timedelta(seconds=end - start)}")
 
     # Save output
-    start = timer()
-    output_raster_name = str(output_name) + ".tif"
-    output_raster_path = os.path.join(output_folder, output_raster_name)
-    arcpy.CopyRaster_management(rel_vel, output_raster_path)
-    end = timer()
-    arcpy.AddMessage(f"Raster saved. {timedelta(seconds=end - start)}")
+    save_raster(rel_vel, output_folder, output_name)
 
 
 def epi_sed_dep(output_folder, output_name, wse_mhhw, wse_median, wse_max):
@@ -166,6 +517,8 @@ def epi_sed_dep(output_folder, output_name, wse_mhhw, wse_median, wse_max):
 
     ESD = (Depth_max − Depth_median) / (Depth_MHHW − Depth_median)
 
+    Raster file inputs are calculated with numpy, see `derive_numpy`.
+
     :param: output_folder: string; Path to the output folder where the raster
                            will be written.
     :param: output_name:   string; Name of the output raster.
@@ -178,9 +531,12 @@ def epi_sed_dep(output_folder, output_name, wse_mhhw, wse_median, wse_max):
               output_folder of the calculated percent increase in the velocity
               from the baseline condition in .tif format.
     """
-    import os
+    if derive_numpy("epi_sed_dep", output_folder, output_name,
+                    wse_mhhw=wse_mhhw, wse_median=wse_median,
+                    wse_max=wse_max):
+        return
+
     import arcpy
-    from arcpy.sa import Raster
     from timeit import default_timer as timer
     from datetime import timedelta
 
@@ -190,20 +546,17 @@ def epi_sed_dep(output_folder, output_name, wse_mhhw, wse_median, wse_max):
     arcpy.AddMessage(wse_mhhw)
     arcpy.AddMessage(wse_median)
     arcpy.AddMessage(wse_max)
+    wse_mhhw, wse_median, wse_max = aligned_inputs(
+        output_folder, wse_mhhw, wse_median, wse_max)
 
     start = timer()
-    esd = (Raster(wse_max) - Raster(wse_median)) / (Raster(wse_mhhw) -
-                                                    Raster(wse_median))
+    median = open_raster(wse_median)
+    esd = (open_raster(wse_max) - median) / (open_raster(wse_mhhw) - median)
     end = timer()
     arcpy.AddMessage(f"Calculated raster. {timedelta(seconds=end - start)}")
 
     # Save output
-    start = timer()
-    output_raster_name = str(output_name) + ".tif"
-    output_raster_path = os.path.join(output_folder, output_raster_name)
-    arcpy.CopyRaster_management(esd, output_raster_path)
-    end = timer()
-    arcpy.AddMessage(f"Raster saved. {timedelta(seconds=end - start)}")
+    save_raster(esd, output_folder, output_name)
 
 
 def depth(output_folder, output_name, wse_mtl, bed_elevation):
@@ -214,6 +567,8 @@ def depth(output_folder, output_name, wse_mtl, bed_elevation):
 
     depth = water_surface_mean - bed_elevation
 
+    Raster file inputs are calculated with numpy, see `derive_numpy`.
+
     :param: output_folder: string; Path to the output folder where the raster
                            will be written.
     :param: output_name:   string; Name of the output raster.
@@ -223,9 +578,11 @@ def depth(output_folder, output_name, wse_mtl, bed_elevation):
     :return:  None. Accomplishes the side effect of saving a raster to the
               output_folder of the calculated mean water depth in .tif format.
     """
-    import os
+    if derive_numpy("depth", output_folder, output_name,
+                    wse_mtl=wse_mtl, bed_elevation=bed_elevation):
+        return
+
     import arcpy
-    from arcpy.sa import Raster
     from timeit import default_timer as timer
     from datetime import timedelta
 
@@ -234,19 +591,16 @@ def depth(output_folder, output_name, wse_mtl, bed_elevation):
 
     arcpy.AddMessage(wse_mtl)
     arcpy.AddMessage(bed_elevation)
+    wse_mtl, bed_elevation = aligned_inputs(output_folder, wse_mtl,
+                                            bed_elevation)
 
     start = timer()
-    depth_m = Raster(wse_mtl) - Raster(bed_elevation)
+    depth_m = open_raster(wse_mtl) - open_raster(bed_elevation)
     end = timer()
     arcpy.AddMessage(f"Calculated raster. {timedelta(seconds=end - start)}")
 
     # Save output
-    start = timer()
-    output_raster_name = str(output_name) + ".tif"
-    output_raster_path = os.path.join(output_folder, output_raster_name)
-    arcpy.CopyRaster_management(depth_m, output_raster_path)
-    end = timer()
-    arcpy.AddMessage(f"Raster saved. {timedelta(seconds=end - start)}")
+    save_raster(depth_m, output_folder, output_name)
 
 
 def per_light_available(output_folder, output_name, depth_m):
@@ -257,6 +611,8 @@ def per_light_available(output_folder, output_name, depth_m):
 
     PLA = exp(−1.39 ∗ depth) ∗ 100
 
+    Raster file inputs are calculated with numpy, see `derive_numpy`.
+
     :param: output_folder: string; Path to the output folder where the raster
                            will be written.
     :param: output_name:   string; Name of the output raster.
@@ -266,9 +622,11 @@ def per_light_available(output_folder, output_name, depth_m):
               output_folder of the calculated percent light available in
               .tif format.
     """
-    import os
+    if derive_numpy("per_light_available", output_folder, output_name,
+                    depth_m=depth_m):
+        return
+
     import arcpy
-    from arcpy.sa import Raster
     from timeit import default_timer as timer
     from datetime import timedelta
 
@@ -278,17 +636,12 @@ def per_light_available(output_folder, output_name, depth_m):
     arcpy.AddMessage(depth_m)
 
     start = timer()
-    pla = arcpy.sa.Exp(-1.39 * Raster(depth_m)) * 100
+    pla = arcpy.sa.Exp(-1.39 * open_raster(depth_m)) * 100
     end = timer()
     arcpy.AddMessage(f"Calculated raster. {timedelta(seconds=end - start)}")
 
     # Save output
-    start = timer()
-    output_raster_name = str(output_name) + ".tif"
-    output_raster_path = os.path.join(output_folder, output_raster_name)
-    arcpy.CopyRaster_management(pla, output_raster_path)
-    end = timer()
-    arcpy.AddMessage(f"Raster saved. {timedelta(seconds=end - start)}")
+    save_raster(pla, output_folder, output_name)
 
 
 def expo_dur(output_folder, output_name, wse_100, wse_0, wse_mhhw,
@@ -299,6 +652,8 @@ def expo_dur(output_folder, output_name, wse_100, wse_0, wse_mhhw,
 
     t_rel = (H_max − H_min) / (MHHW − MLLW)
 
+    Raster file inputs are calculated with numpy, see `derive_numpy`.
+
     :param: output_folder: string; Path to the output folder where the raster
                            will be written.
     :param: output_name:   string; Name of the output raster.
@@ -312,9 +667,12 @@ def expo_dur(output_folder, output_name, wse_100, wse_0, wse_mhhw,
     :return:  None. Accomplishes the side effect of saving a raster to the
               output_folder of the calculated exposure duration in .tif format.
     """
-    import os
+    if derive_numpy("expo_dur", output_folder, output_name,
+                    wse_100=wse_100, wse_0=wse_0, wse_mhhw=wse_mhhw,
+                    wse_mllw=wse_mllw):
+        return
+
     import arcpy
-    from arcpy.sa import Raster
     from timeit import default_timer as timer
     from datetime import timedelta
 
@@ -325,17 +683,43 @@ def expo_dur(output_folder, output_name, wse_100, wse_0, wse_mhhw,
     arcpy.AddMessage(wse_0)
     arcpy.AddMessage(wse_mhhw)
     arcpy.AddMessage(wse_mllw)
+    wse_100, wse_0, wse_mhhw, wse_mllw = aligned_inputs(
+        output_folder, wse_100, wse_0, wse_mhhw, wse_mllw)
 
     start = timer()
-    exposure_duration = (Raster(wse_100) - Raster(wse_0)) / (Raster(wse_mhhw) -
-                                                             Raster(wse_mllw))
+    exposure_duration = ((open_raster(wse_100) - open_raster(wse_0)) /
+                         (open_raster(wse_mhhw) - open_raster(wse_mllw)))
     end = timer()
     arcpy.AddMessage(f"Calculated raster. {timedelta(seconds=end - start)}")
 
     # Save output
-    start = timer()
-    output_raster_name = str(output_name) + ".tif"
-    output_raster_path = os.path.join(output_folder, output_raster_name)
-    arcpy.CopyRaster_management(exposure_duration, output_raster_path)
-    end = timer()
-    arcpy.AddMessage(f"Raster saved. {timedelta(seconds=end - start)}")
+    save_raster(exposure_duration, output_folder, output_name)
+
+
+def footprint_raster(function, region_mask, fwop_raster, output_folder,
+                     output_name, **args):
+    """Calculates a predictor of an alternative on its region of influence.
+
+    The cells of the region mask are calculated with `function`; every other
+    cell is taken from the FWOP raster of the predictor (see `footprint`).
+
+    :param: function:      string; Name of the function calculating the
+                           predictor, e.g. "adh2raster" or "depth".
+    :param: region_mask:   raster; The mask cells of the region of
+                           influence, or "" if no AdH node changed.
+    :param: fwop_raster:   raster; The FWOP raster of the predictor.
+    :param: output_folder: string; Path to the output folder where the raster
+                           will be written.
+    :param: output_name:   string; Name of the output raster.
+    :param: args:          Further arguments of `function`.
+
+    :return:  None. Accomplishes the side effect of saving a raster to the
+              output_folder.
+    """
+    try:
+        from . import footprint
+    except ImportError:
+        import footprint
+
+    footprint.recompute(function, region_mask, fwop_raster, output_folder,
+                        output_name, **args)
@@ -0,0 +1,405 @@
+"""Queue the steps of a scenario for workers on several machines.
+
+The queue is a SQLite database on a filesystem shared by the machines. Jobs
+are added to it with `submit` (tool jobs, as run by `cli`) or by this tool,
+which queues the steps of `update_AdH_predictors` for a scenario, one job per
+raster. Any number of workers, started on each machine with
+
+    python -m nybem_tools queue-worker --queue //server/runs/queue.sqlite
+
+take jobs from the queue until every job is done or failed.
+
+A worker leases a job for a limited time and renews the lease with a
+heartbeat while the job runs. If a worker dies, its lease runs out and the job
+is handed to another worker, up to `max_attempts` runs in all; a job that
+fails is retried the same way. A job is only started once the jobs it depends
+on are done, and fails if one of them failed. Outputs are written to a
+partial path and moved into place once complete (see `utils.partial_path`),
+so a job that dies partway never leaves a truncated raster in the scenario
+folder. Completed steps and their rasters are recorded in the worker's own
+shards of the scenario journal and run manifest (see `utils.shard_path`),
+since appending to a shared file is not atomic on network filesystems; the
+shards are merged whenever the journal or manifest is read.
+
+Every change to the queue is a short transaction under the database lock,
+which SQLite takes with file locks, so the shared filesystem must support
+them. The clocks of the machines should agree to well within a lease.
+
+:param: queue_path:    string; Path to the queue database, created if it does
+                       not exist.
+:param: path_to_fwop:  string; Path to the parent folder of the existing
+                       condition scenario (aka, Future WithOut Project, FWOP).
+:param: path_to_alt:   string; Path to the parent folder of the alternative.
+:param: adh_velocity:  string; Path to the AdH folder holding the model
+                       velocity results for this alternative.
+:param: adh_salinity:  string; Path to the AdH folder holding the model
+                       salinity results for this alternative.
+:param: adh_wse:       string; Path to the AdH folder holding the model
+                       water surface elevation results for this alternative.
+:param: barriers:      line feature class; A line feature class
+                       representing barriers used during interpolation.
+:param: mask:          raster; A raster used to determine the
+                       characteristics of the output raster.
+
+:return:    None. The steps of the scenario added to the queue.
+"""
+import contextlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import uuid
+from timeit import default_timer as timer
+
+try:
+    from . import preflight, utils
+    from .barriers import prepared_feature_class
+    from .update_AdH_predictors import (run_steps, scenario_steps,
+                                        step_inputs, step_name, step_outputs)
+except ImportError:
+    import preflight
+    import utils
+    from barriers import prepared_feature_class
+    from update_AdH_predictors import (run_steps, scenario_steps,
+                                       step_inputs, step_name, step_outputs)
+
+
+# Tool name of the jobs that run one step of `update_AdH_predictors`
+STEP_TOOL = "step"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    tool TEXT NOT NULL,
+    args TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker TEXT,
+    lease_expires REAL,
+    error TEXT,
+    seconds REAL,
+    submitted REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS dependencies (
+    job TEXT NOT NULL,
+    depends_on TEXT NOT NULL,
+    PRIMARY KEY (job, depends_on)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+
+def connect(queue_path):
+    """Opens a queue, creating it if needed.
+
+    :param: queue_path:  string; Path to the queue database.
+
+    :return:  sqlite3.Connection; The connection, in autocommit mode; use
+              `transaction` to change the queue.
+    """
+    connection = sqlite3.connect(str(queue_path), timeout=60,
+                                 isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    # Write-ahead logging needs shared memory, which network filesystems lack
+    connection.execute("PRAGMA journal_mode=DELETE")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+@contextlib.contextmanager
+def transaction(connection):
+    """Runs a block as a transaction holding the write lock of the queue."""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+def submit(queue_path, jobs, max_attempts=3):
+    """Adds jobs to a queue.
+
+    Jobs whose id is already in the queue are left as they are, so a batch
+    can be submitted again after some of it has run.
+
+    :param: queue_path:    string; Path to the queue database.
+    :param: jobs:          list; Jobs with the keys "tool", "args" and
+                           optionally "id", "depends_on" (ids of jobs in
+                           the queue or in the batch) and "max_attempts".
+    :param: max_attempts:  int; Number of runs of a job before it fails, if
+                           the job does not set it.
+
+    :return:  list; The ids of the jobs added.
+    """
+    connection = connect(queue_path)
+    added = []
+    with transaction(connection):
+        for job in jobs:
+            job_id = str(job.get("id") or uuid.uuid4().hex)
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO jobs (id, tool, args, max_attempts, "
+                "submitted) VALUES (?, ?, ?, ?, ?)",
+                (job_id, job["tool"], json.dumps(job.get("args", {})),
+                 int(job.get("max_attempts", max_attempts)), time.time()))
+            if not cursor.rowcount:
+                continue
+            connection.executemany(
+                "INSERT OR IGNORE INTO dependencies VALUES (?, ?)",
+                [(job_id, str(other)) for other in job.get("depends_on", [])])
+            added.append(job_id)
+    connection.close()
+    return added
+
+
+def scenario_jobs(steps, path_to_alt):
+    """Turns the steps of a scenario into jobs.
+
+    A job depends on the jobs whose outputs it reads.
+
+    :param: steps:        list; Steps from `scenario_steps`.
+    :param: path_to_alt:  string; Path to the alternative folder.
+
+    :return:  list; The jobs, with ids `<alternative>/<step name>`.
+    """
+    alternative = os.path.basename(os.path.normpath(path_to_alt))
+    writers = {}
+    jobs = []
+    for step in steps:
+        job_id = f"{alternative}/{step_name(step, path_to_alt)}"
+        depends_on = sorted({writers[os.path.normpath(path)]
+                             for path in step_inputs(step)
+                             if os.path.normpath(path) in writers})
+        jobs.append({"id": job_id, "tool": STEP_TOOL,
+                     "args": {"path_to_alt": path_to_alt, "step": step},
+                     "depends_on": depends_on})
+        for output in step_outputs(step):
+            writers[os.path.normpath(output)] = job_id
+    return jobs
+
+
+def claim(connection, worker, lease=60.0):
+    """Leases the next job that is ready to run.
+
+    Jobs whose lease ran out are returned to the queue first, or failed if
+    they have used up their attempts, and jobs depending on a failed job are
+    failed.
+
+    :param: connection:  sqlite3.Connection; The queue.
+    :param: worker:      string; Name of the worker.
+    :param: lease:       float; Seconds the lease lasts without a heartbeat.
+
+    :return:  dict; The job with the keys "id", "tool", "args" and
+              "attempts", or None if no job is ready.
+    """
+    now = time.time()
+    with transaction(connection):
+        connection.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < max_attempts "
+            "THEN 'pending' ELSE 'failed' END, worker = NULL, "
+            "error = 'Lease expired, worker ' || worker || ' stopped "
+            "responding.' WHERE status = 'running' AND lease_expires < ?",
+            (now,))
+        blocked = True
+        while blocked:
+            blocked = connection.execute(
+                "UPDATE jobs SET status = 'failed', finished = ?, "
+                "error = 'A job it depends on failed or is missing.' "
+                "WHERE status = 'pending' AND id IN ("
+                "SELECT d.job FROM dependencies d LEFT JOIN jobs j "
+                "ON j.id = d.depends_on "
+                "WHERE j.id IS NULL OR j.status = 'failed')",
+                (now,)).rowcount
+        row = connection.execute(
+            "SELECT id, tool, args, attempts FROM jobs WHERE "
+            "status = 'pending' AND NOT EXISTS ("
+            "SELECT 1 FROM dependencies d LEFT JOIN jobs j "
+            "ON j.id = d.depends_on WHERE d.job = jobs.id "
+            "AND (j.status IS NULL OR j.status != 'done')) "
+            "ORDER BY submitted, rowid LIMIT 1").fetchone()
+        if row is None:
+            return None
+        connection.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, "
+            "lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+            (worker, now + lease, row["id"]))
+    return {"id": row["id"], "tool": row["tool"],
+            "args": json.loads(row["args"]), "attempts": row["attempts"] + 1}
+
+
+def heartbeat(connection, job_id, worker, lease=60.0):
+    """Renews the lease of a job.
+
+    :return:  bool; False if the worker no longer holds the lease.
+    """
+    with transaction(connection):
+        return bool(connection.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? "
+            "AND status = 'running'",
+            (time.time() + lease, job_id, worker)).rowcount)
+
+
+def finish(connection, job_id, worker, result):
+    """Records the result of a job.
+
+    A failed job is returned to the queue until it has used up its
+    attempts. Results of a worker that lost its lease are ignored.
+
+    :param: connection:  sqlite3.Connection; The queue.
+    :param: job_id:      string; The id of the job.
+    :param: worker:      string; Name of the worker.
+    :param: result:      dict; The result from `run_job`.
+
+    :return:  None.
+    """
+    with transaction(connection):
+        if result["status"] == "ok":
+            connection.execute(
+                "UPDATE jobs SET status = 'done', error = NULL, seconds = ?, "
+                "finished = ? WHERE id = ? AND worker = ?",
+                (result["seconds"], time.time(), job_id, worker))
+        else:
+            connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < max_attempts "
+                "THEN 'pending' ELSE 'failed' END, worker = NULL, "
+                "error = ?, seconds = ?, finished = ? "
+                "WHERE id = ? AND worker = ?",
+                (result.get("error"), result["seconds"], time.time(), job_id,
+                 worker))
+
+
+def status(queue_path):
+    """Counts the jobs of a queue by status.
+
+    :return:  dict; Status ("pending", "running", "done" or "failed") to the
+              number of jobs.
+    """
+    connection = connect(queue_path)
+    counts = {name: 0 for name in ("pending", "running", "done", "failed")}
+    counts.update(connection.execute(
+        "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    connection.close()
+    return counts
+
+
+def run_job(job, worker=None):
+    """Runs a job, see `cli.run_job`. Step jobs run one scenario step, and
+    record it in the shards of the journal and run manifest of `worker`."""
+    if job["tool"] != STEP_TOOL:
+        from . import cli
+
+        return cli.run_job(job)
+
+    result = {"id": job.get("id"), "tool": STEP_TOOL}
+    start = timer()
+    try:
+        import arcpy
+
+        utils.check_out_extensions()
+        arcpy.env.compression = "LZW"
+        arcpy.env.overwriteOutput = True
+        run_steps([job["args"]["step"]], job["args"]["path_to_alt"],
+                  shard=worker)
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        traceback.print_exc(file=sys.stderr)
+    result["seconds"] = round(timer() - start, 3)
+    return result
+
+
+def work(queue_path, worker=None, lease=60.0, poll=5.0, output=None):
+    """Runs jobs from a queue until none are pending or running.
+
+    :param: queue_path:  string; Path to the queue database.
+    :param: worker:      string; Name of the worker. Defaults to the host
+                         name and process id.
+    :param: lease:       float; Seconds a lease lasts; heartbeats are sent
+                         three times per lease.
+    :param: poll:        float; Seconds to wait when no job is ready but
+                         other workers are still running jobs.
+    :param: output:      file; Where a JSON result line is written for every
+                         job. Defaults to standard output.
+
+    :return:  int; The number of jobs this worker ran that failed.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    output = output or sys.stdout
+    connection = connect(queue_path)
+    failures = 0
+    while True:
+        job = claim(connection, worker, lease)
+        if job is None:
+            counts = status(queue_path)
+            if not counts["pending"] and not counts["running"]:
+                break
+            time.sleep(poll)
+            continue
+
+        # Heartbeats use their own connection, in their own thread
+        stopped = threading.Event()
+
+        def beat(job_id=job["id"]):
+            beat_connection = connect(queue_path)
+            while not stopped.wait(lease / 3):
+                if not heartbeat(beat_connection, job_id, worker, lease):
+                    utils.add_message(f"Lost the lease of {job_id}.")
+                    break
+            beat_connection.close()
+
+        beating = threading.Thread(target=beat, daemon=True)
+        beating.start()
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                result = run_job(job, worker)
+        finally:
+            stopped.set()
+            beating.join()
+        finish(connection, job["id"], worker, result)
+        failures += result["status"] != "ok"
+        result.update(worker=worker, attempt=job["attempts"])
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+    connection.close()
+    return failures
+
+
+def main(queue_path, path_to_fwop, path_to_alt, adh_velocity, adh_salinity,
+         adh_wse, barriers, mask):
+    # A scenario with bad inputs is never queued
+    preflight.require_valid(
+        scenario_steps(path_to_fwop, path_to_alt, adh_velocity, adh_salinity,
+                       adh_wse, barriers, mask), mask)
+
+    # Barriers simplified once for every job, if opted in
+    barriers = prepared_feature_class(barriers, mask)
+
+    steps = scenario_steps(path_to_fwop, path_to_alt, adh_velocity,
+                           adh_salinity, adh_wse, barriers, mask)
+    added = submit(queue_path, scenario_jobs(steps, path_to_alt))
+    utils.add_message(f"Queued {len(added)} of {len(steps)} steps.")
+
+
+if __name__ == "__main__":
+    import arcpy
+
+    # Get input parameters
+    queue_path = arcpy.GetParameterAsText(0)
+    path_to_fwop = arcpy.GetParameterAsText(1)
+    path_to_alt = arcpy.GetParameterAsText(2)
+    adh_velocity = arcpy.GetParameterAsText(3)
+    adh_salinity = arcpy.GetParameterAsText(4)
+    adh_wse = arcpy.GetParameterAsText(5)
+    barriers = arcpy.GetParameterAsText(6)
+    mask = arcpy.GetParameterAsText(7)
+
+    main(queue_path, path_to_fwop, path_to_alt, adh_velocity, adh_salinity,
+         adh_wse, barriers, mask)
@@ -1,7 +1,11 @@
 import pytest
 import os
 import arcpy
+import numpy as np
 import test_data
+import nybem_tools.decompose
+import nybem_tools.footprint
+import nybem_tools.raster_io
 import nybem_tools.utils
 
 
@@ -138,6 +142,38 @@ def output_raster_8():
     return os.path.join(output_folder, "wse_0.tif")
 
 
+@pytest.fixture(scope="module")
+def output_raster_2_split():
+    # mhhw interpolated over 4 spline subdomains blended over their halos
+    output_folder = os.path.join(test_data.data_folder(), "outputs")
+    adh_points = os.path.join(test_data.data_folder(), "adh", "wse.shp")
+    barriers = os.path.join(test_data.data_folder(), "example_data.gdb",
+                            "barriers")
+    mask = os.path.join(test_data.data_folder(), "mask_10m.tif")
+
+    return nybem_tools.decompose.interpolate(
+        output_folder, "mhhw_split", adh_points, "MHHW", "", barriers, mask,
+        "spline", processes=4)
+
+
+@pytest.fixture(scope="module")
+def output_raster_2_region():
+    # mhhw on a block of tiles, fitted to the nodes within the spline halo
+    output_folder = os.path.join(test_data.data_folder(), "outputs")
+    mask = os.path.join(test_data.data_folder(), "mask_10m.tif")
+    folder = os.path.join(output_folder,
+                          nybem_tools.footprint.FOOTPRINT_FOLDER)
+    region_mask = nybem_tools.footprint.write_region_mask(
+        mask, [(128, 128, 128, 128)], folder)
+    return region_mask, nybem_tools.footprint.calculate_region(
+        "adh2raster", region_mask, folder, "mhhw_region",
+        adh_points=os.path.join(test_data.data_folder(), "adh", "wse.shp"),
+        variable="MHHW", sql_select="",
+        barriers=os.path.join(test_data.data_folder(), "example_data.gdb",
+                              "barriers"),
+        method="spline")
+
+
 # Assert
 def test_adh_raster_1_exists(output_raster_1):
     assert os.path.exists(output_raster_1)
@@ -178,3 +214,23 @@ def test_adh_raster_1_dims(output_raster_1):
                        output_raster_1, "ROWCOUNT").getOutput(0) == "428"
     assert arcpy.GetRasterProperties_management(
                        output_raster_1, "CELLSIZEX").getOutput(0) == "10"
+
+
+def test_spline_subdomains_match_single_solve(output_raster_2,
+                                              output_raster_2_split):
+    single = nybem_tools.raster_io.read_array(output_raster_2)
+    split = nybem_tools.raster_io.read_array(output_raster_2_split)
+    assert np.array_equal(np.isnan(split), np.isnan(single))
+    # Within 1 cm of the single solve
+    assert np.nanmax(np.abs(split - single)) < 0.01
+
+
+def test_spline_region_matches_single_solve(output_raster_2,
+                                            output_raster_2_region):
+    region_mask, region = output_raster_2_region
+    values = nybem_tools.raster_io.read_array(region)
+    single = nybem_tools.raster_io.read_array(output_raster_2,
+                                              (128, 128, 128, 128))
+    assert np.array_equal(np.isnan(values), np.isnan(single))
+    # Within 1 cm of the single solve
+    assert np.nanmax(np.abs(values - single)) < 0.01
@@ -0,0 +1,102 @@
+import os
+import pytest
+import numpy as np
+import nybem_tools.align
+import nybem_tools.pipeline
+import nybem_tools.raster_io
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def target():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 60, 80, None)
+
+
+@pytest.fixture(scope="module")
+def source():
+    # Coarser, offset by half a target cell and covering part of the target
+    return nybem_tools.raster_io.Grid(-5.0, 95.0, 20.0, 20, 30, None)
+
+
+@pytest.fixture(scope="module")
+def plane(source):
+    xs, ys = nybem_tools.raster_io.cell_centers(source)
+    return 2.0 * xs[None] - 0.5 * ys[:, None]
+
+
+@pytest.fixture(scope="module")
+def rasters(tmp_path_factory, source, target, plane):
+    folder = str(tmp_path_factory.mktemp("align"))
+    paths = {"source": os.path.join(folder, "bed_elevation.npy"),
+             "target": os.path.join(folder, "mtl.npy")}
+    nybem_tools.raster_io.write_array(plane, source, paths["source"])
+    nybem_tools.raster_io.write_array(
+        np.ones((target.nrows, target.ncols)), target, paths["target"])
+    return paths
+
+
+# Act / Assert
+def test_nearest_picks_containing_cell(rasters, source, target, plane):
+    aligned = nybem_tools.align.read_aligned(rasters["source"], target)
+    xs, ys = nybem_tools.raster_io.cell_centers(target)
+    rows, cols = nybem_tools.raster_io.cell_index(
+        source, *np.meshgrid(xs, ys))
+    inside = (rows >= 0) & (rows < source.nrows) & (cols >= 0) & \
+        (cols < source.ncols)
+    assert np.isnan(aligned[~inside]).all()
+    assert np.allclose(aligned[inside], plane[rows[inside], cols[inside]])
+
+
+def test_bilinear_reproduces_plane(rasters, source, target):
+    aligned = nybem_tools.align.read_aligned(rasters["source"], target,
+                                             method="bilinear")
+    xs, ys = nybem_tools.raster_io.cell_centers(target)
+    expected = 2.0 * xs[None] - 0.5 * ys[:, None]
+    # Away from the edge cells, bilinear resampling of a plane is exact
+    source_xs, source_ys = nybem_tools.raster_io.cell_centers(source)
+    interior = ((ys[:, None] <= source_ys.max()) &
+                (ys[:, None] >= source_ys.min()) &
+                (xs[None] >= source_xs.min()) &
+                (xs[None] <= source_xs.max()))
+    assert interior.sum() > 100
+    assert np.allclose(aligned[interior], expected[interior])
+
+
+def test_windows_match_whole_grid(rasters, target):
+    whole = nybem_tools.align.read_aligned(rasters["source"], target,
+                                           method="bilinear")
+    for row, col, nrows, ncols in nybem_tools.raster_io.windows(target, 16):
+        window = nybem_tools.align.read_aligned(
+            rasters["source"], target, (row, col, nrows, ncols), "bilinear")
+        assert np.array_equal(window, whole[row:row + nrows, col:col + ncols],
+                              equal_nan=True)
+
+
+def test_index_maps_cached(source, target):
+    maps = nybem_tools.align.index_maps(source, target, "nearest")
+    assert nybem_tools.align.index_maps(source, target, "nearest") is maps
+
+
+def test_aligned_copy_reused(rasters, target, tmp_path):
+    path = nybem_tools.align.aligned(rasters["source"], target,
+                                     str(tmp_path))
+    assert os.path.dirname(path).endswith(nybem_tools.align.ALIGNED_FOLDER)
+    assert nybem_tools.raster_io.read_grid(path) == target
+    modified = os.stat(path).st_mtime_ns
+    again = nybem_tools.align.aligned(rasters["source"], target,
+                                      str(tmp_path))
+    assert again == path and os.stat(path).st_mtime_ns == modified
+    assert nybem_tools.align.aligned(rasters["target"], target,
+                                     str(tmp_path)) == rasters["target"]
+
+
+def test_pipeline_aligns_inputs(rasters, target, tmp_path):
+    output = os.path.join(str(tmp_path), "depth.npy")
+    nybem_tools.pipeline.run_tiles(
+        lambda mtl, bed: mtl - bed,
+        {"mtl": rasters["target"], "bed": rasters["source"]},
+        {"depth": output}, tile_size=32)
+    expected = 1.0 - nybem_tools.align.read_aligned(rasters["source"],
+                                                    target)
+    assert np.allclose(nybem_tools.raster_io.read_array(output), expected,
+                       equal_nan=True)
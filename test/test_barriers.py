@@ -0,0 +1,96 @@
+import pytest
+import os
+import numpy as np
+import nybem_tools.raster_io
+import nybem_tools.barriers
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 40, 40, None)
+
+
+@pytest.fixture(scope="module")
+def files(tmp_path_factory, grid):
+    folder = str(tmp_path_factory.mktemp("barriers"))
+    mask_path = os.path.join(folder, "mask.npy")
+    nybem_tools.raster_io.write_array(
+        np.ones((grid.nrows, grid.ncols)), grid, mask_path)
+    # A wall across the grid at x = 200 with a wiggle well below the cell size
+    wall = np.array([[200.0, -5.0], [201.0, 100.0], [199.5, 250.0],
+                     [200.0, 405.0]])
+    # A short spur that does not split the grid
+    spur = np.array([[50.0, 50.0], [50.0, 100.0]])
+    barriers_path = os.path.join(folder, "barriers.npz")
+    nybem_tools.barriers.write_barriers([wall, spur], barriers_path)
+    return barriers_path, mask_path, os.path.join(folder, "cache")
+
+
+# Act
+@pytest.fixture(scope="module")
+def prepared(files):
+    return nybem_tools.barriers.prepare(*files)
+
+
+# Assert
+def test_simplify():
+    line = np.array([[0.0, 0.0], [1.0, 0.1], [2.0, 0.0], [3.0, 5.0]])
+    simplified = nybem_tools.barriers.simplify(line, 0.5)
+    assert simplified.tolist() == [[0.0, 0.0], [2.0, 0.0], [3.0, 5.0]]
+
+
+def test_simplified_segments(prepared):
+    # The wall is reduced to a single segment, the spur is kept
+    assert len(prepared["segments"]) == 2
+
+
+def test_regions_split_by_wall(prepared, grid):
+    labels = nybem_tools.barriers.point_regions(
+        prepared["regions"], grid, np.array([100.0, 300.0, 80.0]),
+        np.array([200.0, 200.0, 75.0]))
+    assert labels[0] != labels[1]
+    assert labels[0] == labels[2]
+    assert (labels > 0).all()
+
+
+def test_crosses(prepared):
+    index, segs = prepared["index"], prepared["segments"]
+    assert nybem_tools.barriers.crosses(index, segs, (100, 200), (300, 200))
+    assert not nybem_tools.barriers.crosses(index, segs, (100, 200),
+                                            (150, 300))
+
+
+def test_open_barrier_blocks_line_of_sight(prepared, grid):
+    # The spur does not split its region, but hides what lies behind it
+    labels = nybem_tools.barriers.point_regions(
+        prepared["regions"], grid, np.array([30.0, 70.0]),
+        np.array([75.0, 75.0]))
+    assert labels[0] == labels[1]
+    blocked = nybem_tools.barriers.blocked(
+        prepared, np.array([[30.0, 75.0], [30.0, 75.0], [30.0, 125.0]]),
+        np.array([[70.0, 75.0], [30.0, 150.0], [70.0, 125.0]]))
+    assert blocked.tolist() == [True, False, False]
+
+
+def test_cache_reused(files, prepared):
+    cached = os.listdir(files[2])
+    assert f"barriers_{prepared['key']}.npz" in cached
+    again = nybem_tools.barriers.prepare(*files)
+    assert again["key"] == prepared["key"]
+    assert np.array_equal(again["regions"], prepared["regions"])
+
+
+def test_prepared_barriers_reuse_cache(files, prepared):
+    # The cached feature class of `prepared_feature_class` is not read again
+    feature_class = os.path.join(
+        files[2], nybem_tools.barriers.CACHE_PREFIX + prepared["key"] + ".shp")
+    again = nybem_tools.barriers.prepare(feature_class, files[1])
+    assert again["key"] == prepared["key"]
+    assert np.array_equal(again["regions"], prepared["regions"])
+
+
+def test_spline_barriers_unchanged_by_default(files, monkeypatch):
+    monkeypatch.delenv(nybem_tools.barriers.SIMPLIFY_ENV, raising=False)
+    assert nybem_tools.barriers.prepared_feature_class(
+        files[0], files[1], files[2]) == files[0]
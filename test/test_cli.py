@@ -0,0 +1,80 @@
+import pytest
+import os
+import io
+import json
+import subprocess
+import sys
+import nybem_tools.cli
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def work_folder(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("cli"))
+
+
+@pytest.fixture(scope="module")
+def job_file(work_folder):
+    path = os.path.join(work_folder, "jobs.jsonl")
+    with open(path, "w") as f:
+        for name in ["alt_1", "alt_2"]:
+            f.write(json.dumps({"id": name, "tool": "create-scenario",
+                                "args": {"path_to_alt": os.path.join(
+                                    work_folder, name)}}) + "\n")
+        f.write(json.dumps({"id": "bad", "tool": "no-such-tool"}) + "\n")
+    return path
+
+
+# Act
+@pytest.fixture(scope="module")
+def worker_results(job_file):
+    repo_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(job_file) as f:
+        process = subprocess.run(
+            [sys.executable, "-m", "nybem_tools", "worker"], stdin=f,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=repo_folder)
+    return [json.loads(line) for line in process.stdout.decode().splitlines()]
+
+
+# Assert
+def test_cli_create_scenario(work_folder):
+    path_to_alt = os.path.join(work_folder, "alt_0")
+    assert nybem_tools.cli.main(["create-scenario",
+                                 "--path-to-alt", path_to_alt]) == 0
+    assert os.path.isdir(os.path.join(path_to_alt, "mar_sub", "predictors"))
+
+
+def test_cli_missing_argument():
+    with pytest.raises(SystemExit):
+        nybem_tools.cli.main(["copy-static", "--path-to-fwop", "fwop"])
+
+
+def test_worker_runs_every_job(worker_results, work_folder):
+    assert [result["status"] for result in worker_results] == \
+        ["ok", "ok", "error"]
+    assert os.path.isdir(os.path.join(work_folder, "alt_2", "est_int",
+                                      "hsi"))
+
+
+def test_parser_imports_no_tool():
+    repo_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, nybem_tools.cli; nybem_tools.cli.build_parser(); "
+         "print(sorted(set(module for module, _, _ in "
+         "nybem_tools.cli.TOOLS.values()) & {name.split('.')[-1] for name "
+         "in sys.modules if name.startswith('nybem_tools.')}))"],
+        stdout=subprocess.PIPE, cwd=repo_folder)
+    assert process.stdout.decode().strip() == "[]"
+
+
+def test_run_jobs_counts_failures(job_file):
+    assert nybem_tools.cli.main(["run-jobs", job_file]) == 1
+
+
+def test_run_jobs_reports_parse_error():
+    output = io.StringIO()
+    assert nybem_tools.cli.run_jobs(["{not json"], output) == 1
+    result = json.loads(output.getvalue())
+    assert result["status"] == "error"
+    assert result["error"].startswith("JSONDecodeError")
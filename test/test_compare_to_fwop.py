@@ -0,0 +1,66 @@
+import pytest
+import os
+import csv
+import numpy as np
+import nybem_tools.raster_io
+import nybem_tools.compare_to_fwop
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 30, 40, None)
+
+
+@pytest.fixture(scope="module")
+def scenarios(tmp_path_factory, grid):
+    root = tmp_path_factory.mktemp("scenarios")
+    path_to_fwop = os.path.join(str(root), "fwop")
+    path_to_alt = os.path.join(str(root), "alt")
+    vel_fwop = np.full((grid.nrows, grid.ncols), 2.0)
+    vel_alt = vel_fwop.copy()
+    vel_alt[:10, :10] = 3.0
+    for path, vel in [(path_to_fwop, vel_fwop), (path_to_alt, vel_alt)]:
+        folder = os.path.join(path, "est_int", "predictors")
+        os.makedirs(folder)
+        nybem_tools.raster_io.write_array(
+            vel, grid, os.path.join(folder, "vel_90.npy"))
+        nybem_tools.raster_io.write_array(
+            vel, grid, os.path.join(path, "mhhw.npy"))
+    return path_to_fwop, path_to_alt
+
+
+# Act
+@pytest.fixture(scope="module")
+def comparison(tmp_path_factory, scenarios):
+    output_folder = str(tmp_path_factory.mktemp("comparison"))
+    rows = nybem_tools.compare_to_fwop.compare_scenarios(
+        scenarios[0], scenarios[1], output_folder, tile_size=16, workers=4)
+    return output_folder, rows
+
+
+# Assert
+def test_compare_outputs_exist(comparison):
+    output_folder = comparison[0]
+    assert os.path.exists(os.path.join(output_folder, "est_int",
+                                       "vel_90_diff.npy"))
+    assert os.path.exists(os.path.join(output_folder, "est_int",
+                                       "vel_90_pct.npy"))
+    assert os.path.exists(os.path.join(output_folder, "mhhw_diff.npy"))
+    assert os.path.exists(os.path.join(output_folder, "fwop_comparison.csv"))
+
+
+def test_compare_pct_values(comparison):
+    pct = nybem_tools.raster_io.read_array(
+        os.path.join(comparison[0], "est_int", "vel_90_pct.npy"))
+    assert np.allclose(pct[:10, :10], 50.0)
+    assert np.allclose(pct[10:, :], 0.0)
+
+
+def test_compare_summary(comparison):
+    rows = {(row["model"], row["predictor"]): row for row in comparison[1]}
+    assert rows[("est_int", "vel_90")]["changed_cells"] == 100
+    assert rows[("est_int", "vel_90")]["max_delta"] == 1.0
+    assert rows[("est_int", "*")]["valid_cells"] == 1200
+    with open(os.path.join(comparison[0], "fwop_comparison.csv")) as f:
+        assert len(list(csv.DictReader(f))) == len(comparison[1])
@@ -0,0 +1,88 @@
+import pytest
+import os
+import numpy as np
+import nybem_tools.raster_io
+import nybem_tools.datacube
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 30, 40, None)
+
+
+@pytest.fixture(scope="module")
+def scenarios(tmp_path_factory, grid):
+    root = str(tmp_path_factory.mktemp("scenarios"))
+    paths = []
+    for i in range(5):
+        path = os.path.join(root, f"alt_{i}")
+        folder = os.path.join(path, "est_int", "predictors")
+        os.makedirs(folder)
+        salinity = np.full((grid.nrows, grid.ncols), float(i))
+        salinity[:10, :10] = 10.0 - i
+        nybem_tools.raster_io.write_array(
+            salinity, grid, os.path.join(folder, "sal_mean_ann.npy"))
+        nybem_tools.raster_io.write_array(
+            np.full((grid.nrows, grid.ncols), 1.0), grid,
+            os.path.join(path, "mhhw.npy"))
+        paths.append(path)
+    return paths
+
+
+# Act
+@pytest.fixture(scope="module")
+def cube(tmp_path_factory, scenarios):
+    path_to_cube = os.path.join(str(tmp_path_factory.mktemp("cube")), "cube")
+    for path in scenarios:
+        nybem_tools.datacube.add_scenario(path_to_cube, path, tile_size=16,
+                                          capacity=2)
+    return path_to_cube
+
+
+# Assert
+def test_datacube_index(cube):
+    index = nybem_tools.datacube.read_index(cube)
+    assert index["scenarios"] == [f"alt_{i}" for i in range(5)]
+    assert index["bands"] == ["mhhw", "est_int/sal_mean_ann"]
+    assert index["capacity"] == 8
+
+
+def test_read_map(cube):
+    array = nybem_tools.datacube.read_map(cube, "alt_3",
+                                          "est_int/sal_mean_ann")
+    assert array.shape == (30, 40)
+    assert np.allclose(array[:10, :10], 7.0)
+    assert np.allclose(array[10:, :], 3.0)
+    window = nybem_tools.datacube.read_map(cube, "alt_3",
+                                           "est_int/sal_mean_ann",
+                                           (5, 5, 10, 20))
+    assert np.array_equal(window, array[5:15, 5:25])
+
+
+def test_read_cell(cube):
+    values = nybem_tools.datacube.read_cell(cube, "est_int/sal_mean_ann",
+                                            20, 20)
+    assert values == {f"alt_{i}": float(i) for i in range(5)}
+
+
+def test_rank_in_zone(cube, grid):
+    zone = np.zeros((grid.nrows, grid.ncols), dtype=bool)
+    zone[:10, :10] = True
+    ranking = nybem_tools.datacube.rank(cube, "est_int/sal_mean_ann",
+                                        zone=zone)
+    assert [name for name, _ in ranking] == [f"alt_{i}" for i in range(5)]
+    assert ranking[0][1] == pytest.approx(10.0)
+
+
+def test_summarize(cube, grid):
+    summary = nybem_tools.datacube.summarize(cube, "est_int/sal_mean_ann")
+    assert summary["alt_0"]["count"] == grid.nrows * grid.ncols
+    assert summary["alt_0"]["max"] == pytest.approx(10.0)
+    assert summary["alt_4"]["min"] == pytest.approx(4.0)
+
+
+def test_replace_scenario(cube, scenarios):
+    nybem_tools.datacube.add_scenario(cube, scenarios[1])
+    index = nybem_tools.datacube.read_index(cube)
+    assert index["scenarios"].count("alt_1") == 1
@@ -0,0 +1,190 @@
+import os
+import time
+import pytest
+import numpy as np
+import nybem_tools.barriers
+import nybem_tools.decompose
+import nybem_tools.interpolate
+import nybem_tools.points
+import nybem_tools.raster_io
+import nybem_tools.utils
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 57, 83, None)
+
+
+@pytest.fixture(scope="module")
+def folder(grid, tmp_path_factory):
+    folder = str(tmp_path_factory.mktemp("decompose"))
+    rng = np.random.default_rng(13)
+    xs = rng.uniform(-10, 840, 3000)
+    ys = rng.uniform(-10, 580, 3000)
+    nybem_tools.points.write_points(
+        {"x": xs, "y": ys, "MTL": np.sin(xs / 100) + np.cos(ys / 70)},
+        os.path.join(folder, "wse.npz"))
+    # A wall closing off the south west corner and an open-ended jetty
+    nybem_tools.barriers.write_barriers(
+        [np.array([[-10.0, 150.0], [200.0, 150.0], [200.0, -10.0]]),
+         np.array([[500.0, 580.0], [500.0, 200.0]])],
+        os.path.join(folder, "barriers.npz"))
+    mask = np.ones((grid.nrows, grid.ncols))
+    mask[40:, :10] = np.nan
+    nybem_tools.raster_io.write_array(mask, grid,
+                                      os.path.join(folder, "mask.npy"))
+    return folder
+
+
+def interpolate(folder, name, method, processes, barriers=""):
+    nybem_tools.utils.adh2raster(
+        folder, name, os.path.join(folder, "wse.npz"), "MTL", "MTL > -99",
+        barriers, os.path.join(folder, "mask.npy"), method, processes)
+    return nybem_tools.raster_io.read_array(os.path.join(folder,
+                                                         name + ".npy"))
+
+
+# Act / Assert
+def test_cores_tile_grid(grid):
+    domains = nybem_tools.decompose.subdomains(grid, 6, halo=5)
+    assert len(domains) >= 6
+    covered = np.zeros((grid.nrows, grid.ncols), dtype=int)
+    for domain in domains:
+        row, col, nrows, ncols = domain.core
+        covered[row:row + nrows, col:col + ncols] += 1
+        assert nybem_tools.decompose.overlap(domain.core,
+                                             domain.window) == domain.core
+        window_row, window_col, window_nrows, window_ncols = domain.window
+        assert window_row >= 0 and window_col >= 0
+        assert window_row + window_nrows <= grid.nrows
+        assert window_col + window_ncols <= grid.ncols
+    assert (covered == 1).all()
+
+
+def test_weights_ramp_over_halo(grid):
+    domain = nybem_tools.decompose.subdomains(grid, 4, halo=3)[0]
+    weights = nybem_tools.decompose.weights(domain, halo=3)
+    row, col, nrows, ncols = domain.core
+    assert (weights[:nrows, :ncols] == 1.0).all()
+    assert np.allclose(weights[0, ncols:], [0.75, 0.5, 0.25])
+    assert weights.min() > 0
+
+
+@pytest.mark.parametrize("halo, barriers", [(0, ""), (8, ""),
+                                             (0, "barriers.npz"),
+                                             (8, "barriers.npz")])
+def test_matches_single_solve(folder, halo, barriers):
+    barriers = barriers and os.path.join(folder, barriers)
+    single = interpolate(folder, "single_idw", "idw", 1, barriers)
+    nybem_tools.decompose.interpolate(
+        folder, f"parallel_{halo}", os.path.join(folder, "wse.npz"), "MTL",
+        "MTL > -99", barriers, os.path.join(folder, "mask.npy"), "idw", 3,
+        halo)
+    parallel = nybem_tools.raster_io.read_array(
+        os.path.join(folder, f"parallel_{halo}.npy"))
+    assert np.allclose(parallel, single, equal_nan=True, atol=1e-6)
+    assert not os.path.exists(os.path.join(
+        folder, nybem_tools.decompose.SUBDOMAIN_FOLDER, f"parallel_{halo}"))
+
+
+def test_barriers_prepared_on_whole_mask(folder, grid):
+    # A subdomain looks up the regions of the whole mask by position
+    prepared = nybem_tools.barriers.prepare(
+        os.path.join(folder, "barriers.npz"), os.path.join(folder,
+                                                           "mask.npy"))
+    window = (30, 10, 20, 30)
+    sub_mask = os.path.join(folder, "sub_mask.npy")
+    nybem_tools.raster_io.write_array(
+        np.ones(window[2:]), nybem_tools.raster_io.window_grid(grid, window),
+        sub_mask)
+    entry = nybem_tools.barriers.prepare(prepared["path"], sub_mask)
+    assert entry["grid"] == prepared["grid"]
+    assert np.array_equal(
+        nybem_tools.barriers.grid_regions(
+            entry, nybem_tools.raster_io.read_grid(sub_mask)),
+        prepared["regions"][30:50, 10:40])
+
+
+def test_other_methods_solved_in_one_piece(folder, monkeypatch):
+    assert nybem_tools.decompose.halo_cells("idw") == 0
+    assert nybem_tools.decompose.halo_cells("spline") == \
+        nybem_tools.decompose.SPLINE_HALO_CELLS
+    assert nybem_tools.decompose.halo_cells("linear") is None
+
+    def split(*args, **kwargs):
+        raise AssertionError("split into subdomains")
+
+    monkeypatch.setattr(nybem_tools.decompose, "subdomains", split)
+    single = interpolate(folder, "single_linear", "linear", 1)
+    parallel = interpolate(folder, "parallel_linear", "linear", 3)
+    assert np.array_equal(parallel, single, equal_nan=True)
+
+
+def test_crop_points_keeps_nearest_nodes(folder, grid):
+    window = (20, 30, 20, 25)
+    path = os.path.join(folder, "cropped.npz")
+    kept = nybem_tools.decompose.crop_points(
+        os.path.join(folder, "wse.npz"), "MTL", "MTL > -99", grid, window,
+        path)
+    assert kept < 3000
+    tree, nodes = nybem_tools.interpolate.node_tree(
+        os.path.join(folder, "wse.npz"), "MTL", "MTL > -99")
+    cropped_tree, cropped = nybem_tools.interpolate.node_tree(path, "MTL",
+                                                              "")
+    col_xs, row_ys = nybem_tools.raster_io.cell_centers(
+        nybem_tools.raster_io.window_grid(grid, window))
+    xy = np.column_stack([np.tile(col_xs, window[2]),
+                          np.repeat(row_ys, window[3])])
+    assert np.array_equal(
+        nybem_tools.interpolate.idw(tree, nodes["values"], xy),
+        nybem_tools.interpolate.idw(cropped_tree, cropped["values"], xy))
+
+
+def test_subdomains_solve_faster(tmp_path):
+    # The longest subdomain solve bounds the time of a parallel run
+    folder = str(tmp_path)
+    grid = nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 400, 400, None)
+    rng = np.random.default_rng(3)
+    xs = rng.uniform(-10, 4010, 40000)
+    ys = rng.uniform(-10, 4010, 40000)
+    adh_points = os.path.join(folder, "wse.npz")
+    nybem_tools.points.write_points({"x": xs, "y": ys,
+                                     "MTL": np.sin(xs / 300)}, adh_points)
+    mask = os.path.join(folder, "mask.npy")
+    nybem_tools.raster_io.write_array(np.ones((400, 400)), grid, mask)
+
+    def single():
+        nybem_tools.decompose.solve(folder, "single", adh_points, "MTL",
+                                    "MTL > -99", "", mask, "idw")
+
+    def subdomain(index, domain):
+        path = os.path.join(folder, f"mask_{index}.npy")
+        nybem_tools.raster_io.write_array(
+            nybem_tools.raster_io.read_array(mask, domain.window),
+            nybem_tools.raster_io.window_grid(grid, domain.window), path)
+        nodes = os.path.join(folder, f"points_{index}.npz")
+        nybem_tools.decompose.crop_points(adh_points, "MTL", "MTL > -99",
+                                          grid, domain.window, nodes)
+        nybem_tools.decompose.solve(folder, f"part_{index}", nodes, "MTL",
+                                    "", "", path, "idw")
+
+    def seconds(function, *args):
+        start = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - start
+
+    single()
+    domains = nybem_tools.decompose.subdomains(grid, 4)
+    single_time = min(seconds(single) for _ in range(3))
+    part_time = min(max(seconds(subdomain, index, domain)
+                        for index, domain in enumerate(domains))
+                    for _ in range(3))
+    assert part_time < 0.6 * single_time
+def test_process_count(monkeypatch):
+    monkeypatch.delenv(nybem_tools.decompose.PROCESSES_ENV, raising=False)
+    assert nybem_tools.decompose.process_count() == 1
+    monkeypatch.setenv(nybem_tools.decompose.PROCESSES_ENV, "4")
+    assert nybem_tools.decompose.process_count() == 4
+    monkeypatch.setenv(nybem_tools.decompose.PROCESSES_ENV, "auto")
+    assert nybem_tools.decompose.process_count() == (os.cpu_count() or 1)
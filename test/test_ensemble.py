@@ -0,0 +1,86 @@
+import pytest
+import os
+import numpy as np
+import nybem_tools.raster_io
+import nybem_tools.kernels
+import nybem_tools.slr_sweep
+import nybem_tools.ensemble
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 20, 30, None)
+
+
+@pytest.fixture(scope="module")
+def scenario(tmp_path_factory, grid):
+    path_to_alt = str(tmp_path_factory.mktemp("alt"))
+    rng = np.random.default_rng(0)
+    shape = (grid.nrows, grid.ncols)
+    mtl = rng.uniform(-0.2, 0.2, shape)
+    levels = {"mhhw": mtl + 1.0, "mllw": mtl - 1.0, "mtl": mtl,
+              "wse_median": mtl + 0.1, "wse_100": mtl + 1.5,
+              "wse_0": mtl - 1.4}
+    for name, folder in nybem_tools.slr_sweep.WATER_LEVELS.items():
+        os.makedirs(os.path.join(path_to_alt, folder), exist_ok=True)
+        nybem_tools.raster_io.write_array(
+            levels[name], grid, os.path.join(path_to_alt, folder,
+                                             name + ".npy"))
+    bed = rng.uniform(-3.0, 0.0, shape)
+    bed[0, 0] = np.nan
+    nybem_tools.raster_io.write_array(
+        bed, grid, os.path.join(path_to_alt, "bed_elevation.npy"))
+    return path_to_alt, mtl, bed
+
+
+# Act
+@pytest.fixture(scope="module")
+def output_folder(tmp_path_factory, scenario):
+    output_folder = str(tmp_path_factory.mktemp("ensemble"))
+    nybem_tools.ensemble.ensemble(
+        scenario[0], output_folder, n_members=50, attenuation=(1.39, 0.2),
+        errors={"mtl": 0.1}, hsi=lambda p: np.clip(p["pla"] / 100, 0, 1),
+        memory_budget=50 * 5 * 8 * 16 * 16, batch_size=16)
+    return output_folder
+
+
+def read(output_folder, name):
+    return nybem_tools.raster_io.read_array(
+        os.path.join(output_folder, name + ".npy"))
+
+
+# Assert
+def test_pla_statistics(output_folder, scenario):
+    _, mtl, bed = scenario
+    draws = nybem_tools.ensemble.member_draws(50, (1.39, 0.2),
+                                              {"mtl": 0.1})
+    depth = (mtl[None] + draws["mtl"][:, None, None]) - bed[None]
+    pla = np.exp(-draws["attenuation"][:, None, None] * depth) * 100
+    assert np.allclose(read(output_folder, "pla_mean"), pla.mean(axis=0),
+                       rtol=1e-4, equal_nan=True)
+    assert np.allclose(read(output_folder, "pla_std"), pla.std(axis=0),
+                       rtol=1e-4, equal_nan=True)
+    assert np.allclose(read(output_folder, "pla_q95"),
+                       np.quantile(pla, 0.95, axis=0), rtol=1e-4,
+                       equal_nan=True)
+
+
+def test_nodata_cell(output_folder):
+    assert np.isnan(read(output_folder, "depth_mean")[0, 0])
+
+
+def test_unperturbed_predictor_has_no_spread(output_folder):
+    assert np.allclose(read(output_folder, "esd_std"), 0.0)
+
+
+def test_hsi_written(output_folder):
+    assert np.nanmax(read(output_folder, "hsi_q50")) <= 1.0
+
+
+def test_nan_quantiles():
+    samples = np.array([[1.0, np.nan], [2.0, np.nan], [np.nan, np.nan],
+                        [4.0, np.nan]])
+    result = nybem_tools.ensemble.nan_quantiles(samples, [0.0, 0.5, 1.0])
+    assert np.allclose(result[:, 0], [1.0, 2.0, 4.0])
+    assert np.isnan(result[:, 1]).all()
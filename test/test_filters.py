@@ -0,0 +1,72 @@
+import pytest
+import os
+import numpy as np
+import nybem_tools.points
+import nybem_tools.filters
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def adh_points(tmp_path_factory):
+    path = os.path.join(str(tmp_path_factory.mktemp("points")), "wse.npz")
+    nybem_tools.points.write_points(
+        {"x": np.arange(5.0), "y": np.arange(5.0),
+         "MHHW": np.array([-4.0, -1.0, 0.0, 1.0, 4.0]),
+         "vel_90": np.array([0.1, 0.2, 0.3, 0.4, np.nan])}, path)
+    return path
+
+
+# Act / Assert
+def test_parse():
+    assert nybem_tools.filters.parse("MHHW > -3 AND MHHW < 3") == (
+        ("MHHW", "<", 3.0), ("MHHW", ">", -3.0))
+    assert nybem_tools.filters.parse("-1 < vel_90") == (
+        ("vel_90", ">", -1.0),)
+    assert nybem_tools.filters.parse("") == ()
+
+
+def test_parse_unsupported():
+    with pytest.raises(ValueError):
+        nybem_tools.filters.parse("MHHW > -3 OR MHHW IS NULL")
+
+
+def test_filter_mask(adh_points):
+    mask = nybem_tools.filters.filter_mask(adh_points,
+                                           "MHHW > -3 AND MHHW < 3")
+    assert mask.tolist() == [False, True, True, True, False]
+
+
+def test_filter_mask_nulls_fail(adh_points):
+    mask = nybem_tools.filters.filter_mask(adh_points, "vel_90 > -1")
+    assert mask.tolist() == [True, True, True, True, False]
+
+
+def test_filter_mask_cached(adh_points):
+    first = nybem_tools.filters.filter_mask(adh_points, "MHHW < 3")
+    second = nybem_tools.filters.filter_mask(adh_points, " MHHW<3 ")
+    assert first is second
+
+
+def test_selects_all(adh_points):
+    assert nybem_tools.filters.selects_all(adh_points,
+                                           "MHHW > -5 AND MHHW < 5")
+    assert nybem_tools.filters.filter_mask(adh_points, "MHHW > -5") is None
+    assert not nybem_tools.filters.selects_all(adh_points, "MHHW > -3")
+    assert not nybem_tools.filters.selects_all(adh_points, "vel_90 > -1")
+    assert not nybem_tools.filters.selects_all(adh_points, "depth > 0")
+
+
+def test_write_selection_writes_selected_points(adh_points, monkeypatch):
+    written = {}
+
+    def write_feature_class(columns, output_path, spatial_reference):
+        written.update(columns)
+        return output_path
+
+    monkeypatch.setattr(nybem_tools.points, "write_feature_class",
+                        write_feature_class)
+    assert nybem_tools.filters.write_selection(
+        adh_points, "vel_90", "MHHW > -3 AND MHHW < 3",
+        "memory/filtered_points", None) == "memory/filtered_points"
+    assert sorted(written) == ["vel_90", "x", "y"]
+    assert written["x"].tolist() == [1.0, 2.0, 3.0]
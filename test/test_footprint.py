@@ -0,0 +1,194 @@
+import os
+import pytest
+import numpy as np
+import nybem_tools.footprint
+import nybem_tools.interpolate
+import nybem_tools.points
+import nybem_tools.raster_io
+import nybem_tools.update_AdH_predictors as update_AdH_predictors
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 60, 80, None)
+
+
+def write_inputs(folder, grid, nodes, radius, seed):
+    rng = np.random.default_rng(seed)
+    xs = rng.uniform(-10, 810, nodes)
+    ys = rng.uniform(-10, 610, nodes)
+    mtl = 0.5 + xs / 1000
+    # The project raises the water level within `radius` of (200, 300)
+    project = np.hypot(xs - 200, ys - 300) < radius
+    for name, change in [("fwop", 0.0), ("alt", 0.3)]:
+        nybem_tools.points.write_points(
+            {"x": xs, "y": ys, "MTL": mtl + change * project,
+             "sal_10": ys / 40},
+            os.path.join(folder, f"{name}_wse.npz"))
+    mask = np.ones((grid.nrows, grid.ncols))
+    mask[:5, :5] = np.nan
+    nybem_tools.raster_io.write_array(mask, grid,
+                                      os.path.join(folder, "mask.npy"))
+    nybem_tools.raster_io.write_array(
+        np.full((grid.nrows, grid.ncols), -2.0), grid,
+        os.path.join(folder, "bed_elevation.npy"))
+    return folder
+
+
+@pytest.fixture(scope="module")
+def folder(grid, tmp_path_factory):
+    return write_inputs(str(tmp_path_factory.mktemp("footprint")), grid,
+                        4000, 60, 11)
+
+
+@pytest.fixture(scope="module")
+def sparse_folder(grid, tmp_path_factory):
+    # About 150 m between a cell and its 12th nearest node
+    return write_inputs(str(tmp_path_factory.mktemp("sparse")), grid, 80,
+                        120, 12)
+
+
+def steps(folder, scenario, adh_points, method="idw"):
+    path = os.path.join(folder, scenario)
+    os.makedirs(path, exist_ok=True)
+
+    def adh2raster(output_name, variable, method):
+        return {"section": "# ALT", "message": f"## {output_name}",
+                "function": "adh2raster",
+                "args": {"output_folder": path, "output_name": output_name,
+                         "adh_points": adh_points, "variable": variable,
+                         "sql_select": f"{variable} > -99", "barriers": "",
+                         "mask": os.path.join(folder, "mask.npy"),
+                         "method": method}}
+
+    return [adh2raster("mtl", "MTL", method),
+            adh2raster("sal_10", "sal_10", "idw"),
+            {"section": "# ALT", "message": "## Depth", "function": "depth",
+             "args": {"output_folder": path, "output_name": "depth",
+                      "wse_mtl": os.path.join(path, "mtl.npy"),
+                      "bed_elevation": os.path.join(folder,
+                                                    "bed_elevation.npy")}}]
+
+
+def run_scenarios(folder):
+    fwop_wse = os.path.join(folder, "fwop_wse.npz")
+    alt_wse = os.path.join(folder, "alt_wse.npz")
+    for scenario, adh_points in [("fwop", fwop_wse), ("alt_full", alt_wse)]:
+        update_AdH_predictors.run_steps(
+            steps(folder, scenario, adh_points),
+            os.path.join(folder, scenario))
+    return {alt_wse: fwop_wse}
+
+
+@pytest.fixture(scope="module")
+def scenarios(folder):
+    return run_scenarios(folder)
+
+
+@pytest.fixture(scope="module")
+def sparse_scenarios(sparse_folder):
+    return run_scenarios(sparse_folder)
+
+
+def run_footprint(folder, scenario, adh_points, fwop_exports, halo=100.0):
+    path_to_alt = os.path.join(folder, scenario)
+    alt_steps = steps(folder, scenario, adh_points)
+    region_mask = nybem_tools.footprint.find_region(
+        alt_steps, fwop_exports, os.path.join(folder, "mask.npy"),
+        os.path.join(path_to_alt, nybem_tools.footprint.FOOTPRINT_FOLDER),
+        halo=halo, tile_size=16)
+    update_AdH_predictors.run_steps(
+        nybem_tools.footprint.footprint_steps(
+            alt_steps, os.path.join(folder, "fwop"), path_to_alt,
+            region_mask),
+        path_to_alt)
+    return region_mask
+
+
+def read(folder, scenario, name):
+    return nybem_tools.raster_io.read_array(
+        os.path.join(folder, scenario, name + ".npy"))
+
+
+# Act / Assert
+def test_region_windows_reach(grid):
+    windows = nybem_tools.footprint.region_windows(
+        grid, np.array([205.0]), np.array([395.0]), 0.0, tile_size=16)
+    assert windows == [(16, 16, 16, 16)]
+    # 50 m reaches the tiles above and to the left
+    windows = nybem_tools.footprint.region_windows(
+        grid, np.array([205.0]), np.array([395.0]), 50.0, tile_size=16)
+    assert windows == [(0, 0, 16, 16), (0, 16, 16, 16),
+                       (16, 0, 16, 16), (16, 16, 16, 16)]
+    assert nybem_tools.footprint.region_windows(
+        grid, np.array([-500.0]), np.array([0.0]), 50.0) == []
+
+
+def test_footprint_matches_full_run(folder, grid, scenarios):
+    alt_wse = next(iter(scenarios))
+    region_mask = run_footprint(folder, "alt", alt_wse, scenarios)
+    region = nybem_tools.raster_io.read_grid(region_mask)
+    assert region.nrows * region.ncols < grid.nrows * grid.ncols / 2
+    for name in ("mtl", "sal_10", "depth"):
+        assert np.allclose(read(folder, "alt", name),
+                           read(folder, "alt_full", name), equal_nan=True)
+    assert not np.allclose(read(folder, "alt", "mtl"),
+                           read(folder, "fwop", "mtl"), equal_nan=True)
+    # Only the region mask is left of the region rasters
+    assert {name.split("_")[0] for name in os.listdir(os.path.join(
+        folder, "alt", nybem_tools.footprint.FOOTPRINT_FOLDER))
+        if not name.startswith(".")} == {"region"}
+
+
+def test_default_halo_matches_full_run_on_sparse_mesh(sparse_folder,
+                                                     sparse_scenarios):
+    alt_wse = next(iter(sparse_scenarios))
+    region_mask = run_footprint(sparse_folder, "alt", alt_wse,
+                                sparse_scenarios, halo=None)
+    assert region_mask
+    for name in ("mtl", "depth"):
+        assert np.allclose(read(sparse_folder, "alt", name),
+                           read(sparse_folder, "alt_full", name),
+                           equal_nan=True)
+    # The nearest nodes reach farther than the 16 cells assumed before
+    changed = nybem_tools.footprint.changed_nodes(
+        alt_wse, sparse_scenarios[alt_wse], ["MTL"])
+    tree, _ = nybem_tools.interpolate.node_tree(alt_wse, "MTL", "MTL > -99")
+    assert nybem_tools.footprint.cell_reach(
+        tree, os.path.join(sparse_folder, "mask.npy"), *changed,
+        nybem_tools.interpolate.NEIGHBOURS) > 160.0
+
+
+def test_spline_steps_take_fixed_halo(folder, grid, scenarios):
+    path_to_alt = os.path.join(folder, "alt_spline")
+    alt_wse = next(iter(scenarios))
+    alt_steps = steps(folder, "alt_spline", alt_wse, method="spline")
+    updated = nybem_tools.footprint.footprint_steps(
+        alt_steps, os.path.join(folder, "fwop"), path_to_alt, "region.npy")
+    assert [step["function"] for step in updated] == \
+        ["footprint_raster"] * 3
+    changed = {alt_wse: nybem_tools.footprint.changed_nodes(
+        alt_wse, scenarios[alt_wse], ["MTL"])}
+    assert nybem_tools.footprint.interpolation_reach(
+        alt_steps[:1], scenarios, os.path.join(folder, "mask.npy"),
+        changed) == nybem_tools.footprint.SPLINE_HALO_CELLS * grid.cell_size
+
+
+def test_unchanged_alternative_copies_fwop(folder, scenarios):
+    fwop_wse = next(iter(scenarios.values()))
+    assert run_footprint(folder, "alt_same", fwop_wse,
+                         {fwop_wse: fwop_wse}) == ""
+    for name in ("mtl", "depth"):
+        assert np.array_equal(read(folder, "alt_same", name),
+                              read(folder, "fwop", name), equal_nan=True)
+
+
+def test_other_mesh_rejected(folder, tmp_path):
+    other = os.path.join(str(tmp_path), "other_wse.npz")
+    nybem_tools.points.write_points(
+        {"x": np.arange(10.0), "y": np.arange(10.0),
+         "MTL": np.zeros(10)}, other)
+    with pytest.raises(ValueError):
+        nybem_tools.footprint.changed_nodes(
+            other, os.path.join(folder, "fwop_wse.npz"), ["MTL"])
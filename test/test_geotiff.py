@@ -0,0 +1,111 @@
+import os
+import pytest
+import numpy as np
+import xml.etree.ElementTree as ElementTree
+import nybem_tools.geotiff
+import nybem_tools.raster_io
+
+
+# NAD 1983 UTM zone 18N as arcpy exports it, with its domains
+UTM_18N = ("PROJCS['NAD_1983_UTM_Zone_18N',GEOGCS['GCS_North_American_1983',"
+           "DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,"
+           "298.257222101]],PRIMEM['Greenwich',0.0],"
+           "UNIT['Degree',0.0174532925199433]],"
+           "PROJECTION['Transverse_Mercator'],"
+           "PARAMETER['False_Easting',500000.0],"
+           "PARAMETER['False_Northing',0.0],"
+           "PARAMETER['Central_Meridian',-75.0],"
+           "PARAMETER['Scale_Factor',0.9996],"
+           "PARAMETER['Latitude_Of_Origin',0.0],UNIT['Meter',1.0],"
+           "AUTHORITY['EPSG',26918]];-5120900 -9998100 10000;"
+           "-100000 10000;-100000 10000;0.001;0.001;0.001;IsHighPrecision")
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(583000.0, 4505000.0, 2.0, 600, 530,
+                                      UTM_18N)
+
+
+@pytest.fixture(scope="module")
+def wse(grid):
+    rng = np.random.default_rng(2)
+    array = np.clip(rng.normal(0.5, 2.0, (grid.nrows, grid.ncols)), -6, 6)
+    array[:40, :] = np.nan
+    return array
+
+
+# Act
+@pytest.fixture(scope="module", params=["float32", "wse"])
+def written(request, grid, wse, tmp_path_factory):
+    path = os.path.join(str(tmp_path_factory.mktemp("geotiff")), "mtl.tif")
+    nybem_tools.raster_io.write_array(wse, grid, path, request.param)
+    return path, nybem_tools.raster_io.PROFILES[request.param]
+
+
+# Assert
+def test_geo_keys_name_coordinate_system():
+    directory, citation = nybem_tools.geotiff.geo_keys(
+        nybem_tools.raster_io.coordinate_system(UTM_18N))
+    keys = {directory[i]: directory[i + 3]
+            for i in range(4, len(directory), 4)}
+    assert keys == {1024: 1, 1025: 1, 1026: 0, 3072: 26918}
+    assert citation == "NAD_1983_UTM_Zone_18N|"
+    directory, _ = nybem_tools.geotiff.geo_keys(
+        "GEOGCS['GCS_Local',DATUM['D_Local']]")
+    assert 2048 not in directory[4::4] and directory[7] == 2
+
+
+def test_aux_xml_holds_coordinate_system(written):
+    path, _ = written
+    root = ElementTree.parse(path + ".aux.xml").getroot()
+    assert root[0].tag == "SRS"
+    assert root[0].text == nybem_tools.raster_io.coordinate_system(UTM_18N)
+    assert root.find("PAMRasterBand/Metadata") is not None
+
+
+def test_tifffile_reads_geotiff(grid, wse, written):
+    tifffile = pytest.importorskip("tifffile")
+    path, profile = written
+    with tifffile.TiffFile(path) as tif:
+        page = tif.pages[0]
+        stored = page.asarray()
+        geo = tif.geotiff_metadata
+        nodata = page.tags["GDAL_NODATA"].value
+        shapes = [level.shape for level in tif.series[0].levels]
+    expected = nybem_tools.raster_io.encode(wse, profile)
+    if profile["nodata"] is None:
+        expected = np.where(np.isnan(expected),
+                            nybem_tools.geotiff.FLOAT_NODATA, expected)
+    assert np.array_equal(stored, expected)
+    assert float(nodata) == (profile["nodata"] if profile["nodata"]
+                             is not None else
+                             nybem_tools.geotiff.FLOAT_NODATA)
+    assert shapes == [(600, 530), (300, 265)]
+    assert list(geo["ModelPixelScale"][:2]) == [grid.cell_size] * 2
+    assert list(geo["ModelTiepoint"][3:5]) == [
+        grid.x_min, grid.y_min + grid.nrows * grid.cell_size]
+    assert int(geo["GTModelTypeGeoKey"]) == 1
+    assert int(geo["GTRasterTypeGeoKey"]) == 1
+    assert int(geo["ProjectedCSTypeGeoKey"]) == 26918
+
+
+def test_gdal_reads_geotiff(grid, written):
+    gdal = pytest.importorskip("osgeo.gdal")
+    osr = pytest.importorskip("osgeo.osr")
+    path, profile = written
+    dataset = gdal.Open(path)
+    band = dataset.GetRasterBand(1)
+    stored = band.ReadAsArray()
+    if profile["nodata"] is None:
+        stored = np.where(stored == band.GetNoDataValue(), np.nan, stored)
+    assert np.array_equal(stored, nybem_tools.geotiff.read_image(path),
+                          equal_nan=True)
+    assert dataset.GetGeoTransform() == (
+        grid.x_min, grid.cell_size, 0.0,
+        grid.y_min + grid.nrows * grid.cell_size, 0.0, -grid.cell_size)
+    assert band.GetOverviewCount() == 1
+    srs = osr.SpatialReference(wkt=dataset.GetProjection())
+    srs.AutoIdentifyEPSG()
+    assert srs.GetAuthorityCode(None) == "26918"
@@ -0,0 +1,134 @@
+import os
+import pytest
+import numpy as np
+import nybem_tools.barriers
+import nybem_tools.interpolate
+import nybem_tools.points
+import nybem_tools.raster_io
+import nybem_tools.update_AdH_predictors as update_AdH_predictors
+import nybem_tools.utils
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 40, 60, None)
+
+
+@pytest.fixture(scope="module")
+def inputs(grid, tmp_path_factory):
+    folder = str(tmp_path_factory.mktemp("interpolate"))
+    rng = np.random.default_rng(3)
+    xs = rng.uniform(0, 600, 2000)
+    ys = rng.uniform(0, 400, 2000)
+    # Fresh water west of the barrier at x = 300, salt water east of it
+    salinity = np.where(xs < 300, 1.0, 30.0)
+    salinity[:10] = -5.0
+    nybem_tools.points.write_points(
+        {"x": xs, "y": ys, "sal_10": salinity},
+        os.path.join(folder, "salinity.npz"))
+    nybem_tools.barriers.write_barriers(
+        [np.array([[300.0, -10.0], [300.0, 410.0]])],
+        os.path.join(folder, "barriers.npz"))
+    # A jetty along the same line that stops short of the top of the grid
+    nybem_tools.barriers.write_barriers(
+        [np.array([[300.0, -10.0], [300.0, 300.0]])],
+        os.path.join(folder, "jetty.npz"))
+    mask = np.ones((grid.nrows, grid.ncols))
+    mask[:, :3] = np.nan
+    nybem_tools.raster_io.write_array(mask, grid,
+                                      os.path.join(folder, "mask.npy"))
+    return folder
+
+
+def interpolate(folder, name, barriers, method="idw"):
+    nybem_tools.utils.adh2raster(
+        folder, name, os.path.join(folder, "salinity.npz"), "sal_10",
+        "sal_10 > -1", barriers, os.path.join(folder, "mask.npy"), method)
+    return nybem_tools.raster_io.read_array(os.path.join(folder,
+                                                         name + ".npy"))
+
+
+# Act / Assert
+def test_idw_is_exact_at_nodes():
+    from scipy.spatial import cKDTree
+
+    nodes = np.array([[0.0, 0.0], [10.0, 0.0], [0.0, 10.0]])
+    values = np.array([1.0, 2.0, 3.0])
+    estimates = nybem_tools.interpolate.idw(
+        cKDTree(nodes), values, np.array([[10.0, 0.0], [5.0, 0.0]]))
+    assert estimates[0] == 2.0
+    assert 1.0 < estimates[1] < 2.0
+
+
+def test_idw_looks_past_nodes_across_barrier():
+    from scipy.spatial import cKDTree
+
+    # The nearest nodes, one on the first location, are across a barrier
+    nodes = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0],
+                      [20.0, 0.0], [0.0, 20.0]])
+    values = np.array([9.0, 9.0, 9.0, 1.0, 3.0])
+    estimates = nybem_tools.interpolate.idw(
+        cKDTree(nodes), values, np.array([[0.0, 0.0], [0.5, 0.5]]),
+        neighbours=2, cell_regions=np.array([1, 1]),
+        node_regions=np.array([2, 2, 2, 1, 1]))
+    assert np.allclose(estimates, 2.0)
+    assert np.isnan(nybem_tools.interpolate.idw(
+        cKDTree(nodes), values, np.array([[0.0, 0.0]]), neighbours=2,
+        cell_regions=np.array([1]), node_regions=np.array([2, 2, 2, 1, 1]),
+        retry=1))
+
+
+def test_barriers_keep_regions_apart(inputs):
+    with_barriers = interpolate(inputs, "sal_10",
+                                os.path.join(inputs, "barriers.npz"))
+    # The barrier rasterizes to the cells along x = 300
+    assert np.allclose(with_barriers[:, 3:29], 1.0)
+    assert np.allclose(with_barriers[:, 31:], 30.0)
+    assert np.isnan(with_barriers[:, :3]).all()
+
+    without = interpolate(inputs, "sal_10_open", "")
+    assert not np.allclose(without[:, 25:29], 1.0)
+
+
+def test_open_barrier_hides_nodes(inputs):
+    with_jetty = interpolate(inputs, "sal_10_jetty",
+                             os.path.join(inputs, "jetty.npz"))
+    # Cells well below the end of the jetty only see their own side
+    assert np.allclose(with_jetty[20:, 3:29], 1.0)
+    assert np.allclose(with_jetty[20:, 31:], 30.0)
+    # Water flows around the end of the jetty
+    assert not np.allclose(with_jetty[:5, 25:29], 1.0)
+
+
+def test_filter_drops_nodes(inputs):
+    linear = interpolate(inputs, "sal_10_linear", "", method="linear")
+    valid = linear[~np.isnan(linear)]
+    assert valid.size and valid.min() >= 1.0
+
+
+def test_tree_built_once(inputs):
+    path = os.path.join(inputs, "salinity.npz")
+    tree, nodes = nybem_tools.interpolate.node_tree(path, "sal_10",
+                                                    "sal_10 > -1")
+    assert nybem_tools.interpolate.node_tree(
+        path, "sal_10", "sal_10 > -1")[0] is tree
+    assert tree.n == len(nodes["values"]) == 1990
+    # Trees are not kept for every export a long-lived worker sees
+    assert nybem_tools.interpolate._node_tree.cache_info().maxsize
+
+
+def test_fast_methods_per_predictor(monkeypatch):
+    assert update_AdH_predictors.interpolation_method("sal_10", fast=True) \
+        == "idw"
+    assert update_AdH_predictors.interpolation_method("mhhw", fast=True) \
+        == "spline"
+    monkeypatch.setenv("NYBEM_FAST_INTERPOLATION", "1")
+    steps = update_AdH_predictors.scenario_steps(
+        "fwop", "alt", "adh/velocity.shp", "adh/salinity.shp", "adh/wse.shp",
+        "example_data.gdb/barriers", "mask_10m.tif")
+    methods = {step["args"]["output_name"]: step["args"].get("method")
+               for step in steps if step["function"] == "adh2raster"}
+    assert methods["sal_10"] == "idw" and methods["mhhw"] is None
+    assert all("idw" not in update_AdH_predictors.step_inputs(step)
+               for step in steps)
@@ -0,0 +1,120 @@
+import pytest
+import os
+import nybem_tools.journal
+import nybem_tools.utils
+
+
+# Arrange
+@pytest.fixture
+def work_folder(tmp_path):
+    with open(os.path.join(str(tmp_path), "input.txt"), "w") as f:
+        f.write("1")
+    return str(tmp_path)
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def write_output(calls):
+    def write_output(input_path, output_path):
+        calls.append(output_path)
+        partial = nybem_tools.utils.partial_path(output_path)
+        with open(input_path) as f_in, open(partial, "w") as f_out:
+            f_out.write(f_in.read())
+        nybem_tools.utils.commit_output(partial, output_path)
+    return write_output
+
+
+# Act
+def run(work_folder, write_output):
+    input_path = os.path.join(work_folder, "input.txt")
+    output_path = os.path.join(work_folder, "output.txt")
+    return nybem_tools.journal.run_step(
+        os.path.join(work_folder, nybem_tools.journal.JOURNAL_NAME),
+        "output", write_output,
+        {"input_path": input_path, "output_path": output_path},
+        [input_path], [output_path])
+
+
+# Assert
+def test_completed_step_is_skipped(work_folder, write_output, calls):
+    assert run(work_folder, write_output)
+    assert not run(work_folder, write_output)
+    assert len(calls) == 1
+
+
+def test_changed_input_reruns_step(work_folder, write_output, calls):
+    run(work_folder, write_output)
+    with open(os.path.join(work_folder, "input.txt"), "w") as f:
+        f.write("22")
+    assert run(work_folder, write_output)
+    assert len(calls) == 2
+
+
+def test_missing_output_reruns_step(work_folder, write_output, calls):
+    run(work_folder, write_output)
+    os.remove(os.path.join(work_folder, "output.txt"))
+    assert run(work_folder, write_output)
+
+
+def test_failed_step_is_not_recorded(work_folder):
+    def fail(output_path):
+        raise RuntimeError("disk full")
+
+    journal_path = os.path.join(work_folder, "journal.jsonl")
+    with pytest.raises(RuntimeError):
+        nybem_tools.journal.run_step(journal_path, "output", fail,
+                                     {"output_path": "x"}, [], ["x"])
+    assert nybem_tools.journal.read_journal(journal_path) == {}
+
+
+def test_worker_shards_merged_on_read(work_folder, write_output, calls):
+    journal_path = os.path.join(work_folder,
+                                nybem_tools.journal.JOURNAL_NAME)
+    input_path = os.path.join(work_folder, "input.txt")
+    for worker, name in (("host-a:101", "a"), ("host-b:202", "b")):
+        output_path = os.path.join(work_folder, name + ".txt")
+        nybem_tools.journal.run_step(
+            journal_path, name, write_output,
+            {"input_path": input_path, "output_path": output_path},
+            [input_path], [output_path], shard=worker)
+    assert not os.path.exists(journal_path)
+    assert sorted(os.path.basename(path) for path in
+                  nybem_tools.utils.shard_paths(journal_path)) == [
+        "nybem_journal.host-a_101.jsonl", "nybem_journal.host-b_202.jsonl"]
+    assert sorted(nybem_tools.journal.read_journal(journal_path)) == \
+        ["a", "b"]
+    # A run without a worker finds the steps of the workers complete
+    assert not nybem_tools.journal.run_step(
+        journal_path, "a", write_output,
+        {"input_path": input_path,
+         "output_path": os.path.join(work_folder, "a.txt")},
+        [input_path], [os.path.join(work_folder, "a.txt")])
+    assert len(calls) == 2
+
+
+def test_commit_output_moves_sidecars(work_folder):
+    output_path = os.path.join(work_folder, "depth.tif")
+    partial = nybem_tools.utils.partial_path(output_path)
+    for path in [partial, partial + ".aux.xml",
+                 os.path.splitext(partial)[0] + ".tfw"]:
+        open(path, "w").close()
+    nybem_tools.utils.commit_output(partial, output_path)
+    assert os.path.exists(output_path)
+    assert os.path.exists(output_path + ".aux.xml")
+    assert os.path.exists(os.path.join(work_folder, "depth.tfw"))
+
+
+def test_shapefile_attributes_change_state(work_folder):
+    shapefile = os.path.join(work_folder, "adh.shp")
+    for ext, content in [(".shp", "geometry"), (".dbf", "MTL=1")]:
+        with open(os.path.join(work_folder, "adh" + ext), "w") as f:
+            f.write(content)
+    before = nybem_tools.journal.file_state(shapefile)
+    # An attribute edited in place, with the `.shp` untouched
+    with open(os.path.join(work_folder, "adh.dbf"), "w") as f:
+        f.write("MTL=22")
+    assert nybem_tools.journal.file_state(shapefile) != before
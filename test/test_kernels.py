@@ -0,0 +1,57 @@
+import pytest
+import numpy as np
+import nybem_tools.kernels
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def wse():
+    return {"mhhw": np.array([1.0, 1.0]),
+            "mllw": np.array([-1.0, -1.0]),
+            "median": np.array([0.0, 0.0]),
+            "max": np.array([1.5, 2.0]),
+            "min": np.array([-1.5, -1.0])}
+
+
+# Act / Assert
+def test_rel_velocity():
+    assert np.allclose(nybem_tools.kernels.rel_velocity(
+        np.array([3.0]), np.array([2.0])), [50.0])
+
+
+def test_epi_sed_dep(wse):
+    assert np.allclose(nybem_tools.kernels.epi_sed_dep(
+        wse["mhhw"], wse["median"], wse["max"]), [1.5, 2.0])
+
+
+def test_depth():
+    assert np.allclose(nybem_tools.kernels.depth(
+        np.array([0.5]), np.array([-2.0])), [2.5])
+
+
+def test_per_light_available():
+    assert np.allclose(nybem_tools.kernels.per_light_available(
+        np.array([0.0, 1.0])), [100.0, np.exp(-1.39) * 100])
+
+
+def test_expo_dur(wse):
+    assert np.allclose(nybem_tools.kernels.expo_dur(
+        wse["max"], wse["min"], wse["mhhw"], wse["mllw"]), [1.5, 1.5])
+
+
+def test_nodata_propagates():
+    assert np.isnan(nybem_tools.kernels.depth(np.nan, 1.0))
+
+
+def test_zero_denominators_are_nodata():
+    zero = np.array([0.0, 0.0, 1.0, np.nan])
+    assert np.array_equal(nybem_tools.kernels.rel_velocity(
+        np.array([1.0, 0.0, 1.0, 1.0]), zero),
+        [np.nan, np.nan, 0.0, np.nan], equal_nan=True)
+    same = np.array([1.0, 1.0])
+    assert np.isnan(nybem_tools.kernels.epi_sed_dep(
+        same, same, np.array([2.0, 1.0]))).all()
+    assert np.isnan(nybem_tools.kernels.expo_dur(
+        np.array([1.0, 0.0]), np.array([0.0, 0.0]), same, same)).all()
+    assert np.isnan(nybem_tools.kernels.per_light_available(
+        np.array([-1000.0])))
@@ -0,0 +1,96 @@
+import glob
+import os
+import pytest
+import numpy as np
+import nybem_tools.barriers
+import nybem_tools.interpolate
+import nybem_tools.mesh_store
+import nybem_tools.points
+import nybem_tools.raster_io
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 30, 40, None)
+
+
+@pytest.fixture(scope="module")
+def folder(grid, tmp_path_factory):
+    folder = str(tmp_path_factory.mktemp("mesh_store"))
+    rng = np.random.default_rng(5)
+    xs = rng.uniform(-10, 410, 1500)
+    ys = rng.uniform(-10, 310, 1500)
+    salinity = xs / 20 + rng.normal(0, 0.5, xs.size)
+    salinity[::7] = -1.0
+    for name, offset in [("alt_1", 0.0), ("alt_2", 5.0)]:
+        nybem_tools.points.write_points(
+            {"x": xs, "y": ys, "sal_10": salinity + offset,
+             "sal_0": salinity - 1},
+            os.path.join(folder, f"{name}_salinity.npz"))
+    nybem_tools.barriers.write_barriers(
+        [np.array([[200.0, -20.0], [200.0, 320.0]])],
+        os.path.join(folder, "barriers.npz"))
+    nybem_tools.raster_io.write_array(np.ones((grid.nrows, grid.ncols)),
+                                      grid, os.path.join(folder, "mask.npy"))
+    return folder
+
+
+@pytest.fixture(scope="module")
+def stored(folder):
+    store = os.path.join(folder, "store")
+    return [nybem_tools.mesh_store.store_points(
+        os.path.join(folder, f"{name}_salinity.npz"), store)
+        for name in ("alt_1", "alt_2")]
+
+
+def interpolate(folder, adh_points, name, method, barriers=""):
+    path = nybem_tools.interpolate.interpolate_points(
+        folder, name, adh_points, "sal_10", "sal_0 > -2", barriers,
+        os.path.join(folder, "mask.npy"), method)
+    return nybem_tools.raster_io.read_array(path)
+
+
+# Act / Assert
+def test_geometry_stored_once(folder, stored):
+    store = os.path.dirname(stored[0])
+    assert len(glob.glob(os.path.join(store, "geometry", "*.npy"))) == 1
+    original = nybem_tools.points.read_points(
+        os.path.join(folder, "alt_2_salinity.npz"))
+    columns = nybem_tools.points.read_points(stored[1])
+    assert sorted(columns) == sorted(original)
+    for name in original:
+        assert np.array_equal(columns[name], original[name])
+
+
+def test_store_is_idempotent(folder, stored):
+    again = nybem_tools.mesh_store.store_points(
+        os.path.join(folder, "alt_1_salinity.npz"),
+        os.path.dirname(stored[0]))
+    assert again == stored[0]
+
+
+@pytest.mark.parametrize("method, barriers", [("idw", ""),
+                                              ("idw", "barriers.npz"),
+                                              ("linear", "")])
+def test_cached_estimates_match(folder, stored, method, barriers):
+    barriers = barriers and os.path.join(folder, barriers)
+    expected = interpolate(folder, os.path.join(folder,
+                                                "alt_2_salinity.npz"),
+                           "expected", method, barriers)
+    actual = interpolate(folder, stored[1], "actual", method, barriers)
+    assert np.allclose(actual, expected, equal_nan=True, atol=1e-5)
+
+
+def test_geometry_cache_shared_by_alternatives(folder, stored):
+    interpolate(folder, stored[0], "first", "idw")
+    cache = os.path.join(os.path.dirname(stored[0]), "cache")
+    files = {name: os.stat(os.path.join(cache, name)).st_mtime_ns
+             for name in os.listdir(cache) if name.endswith(".npz")}
+    assert files
+    second = interpolate(folder, stored[1], "second", "idw")
+    assert {name: os.stat(os.path.join(cache, name)).st_mtime_ns
+            for name in os.listdir(cache) if name.endswith(".npz")} == files
+    first = nybem_tools.raster_io.read_array(os.path.join(folder,
+                                                          "first.npy"))
+    assert np.allclose(second - first, 5.0, atol=1e-4)
@@ -0,0 +1,145 @@
+import pytest
+import os
+import time
+import numpy as np
+import nybem_tools.geotiff
+import nybem_tools.kernels
+import nybem_tools.pipeline
+import nybem_tools.raster_io
+import nybem_tools.utils
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 70, 90, None)
+
+
+@pytest.fixture(scope="module")
+def rasters(tmp_path_factory, grid):
+    folder = str(tmp_path_factory.mktemp("rasters"))
+    rng = np.random.RandomState(0)
+    paths = {}
+    for name in ["mtl", "bed_elevation"]:
+        values = rng.uniform(-3, 3, (grid.nrows, grid.ncols))
+        values[5, :] = np.nan
+        paths[name] = os.path.join(folder, name + ".npy")
+        nybem_tools.raster_io.write_array(values, grid, paths[name])
+    return paths
+
+
+# Act
+@pytest.fixture(scope="module")
+def depth_raster(tmp_path_factory, rasters):
+    output_folder = str(tmp_path_factory.mktemp("outputs"))
+    nybem_tools.utils.depth(output_folder, "depth", rasters["mtl"],
+                            rasters["bed_elevation"])
+    return os.path.join(output_folder, "depth.npy")
+
+
+# Assert
+def test_utils_derive_numpy(depth_raster, rasters):
+    expected = nybem_tools.kernels.depth(
+        nybem_tools.raster_io.read_array(rasters["mtl"]),
+        nybem_tools.raster_io.read_array(rasters["bed_elevation"]))
+    np.testing.assert_allclose(
+        nybem_tools.raster_io.read_array(depth_raster), expected, rtol=1e-6)
+    assert not os.listdir(os.path.join(os.path.dirname(depth_raster),
+                                       ".partial"))
+
+
+def test_run_tiles_outputs(tmp_path, rasters, grid):
+    outputs = {"sum": str(tmp_path / "sum.npy"),
+               "wse": str(tmp_path / "wse.npy")}
+
+    def calculate(mtl, bed_elevation):
+        return {"sum": mtl + bed_elevation, "wse": mtl}
+
+    nybem_tools.pipeline.run_tiles(
+        calculate, rasters, outputs, tile_size=32, writers=3,
+        profiles={"wse": "wse"})
+    mtl = nybem_tools.raster_io.read_array(rasters["mtl"])
+    np.testing.assert_allclose(
+        nybem_tools.raster_io.read_array(outputs["sum"]),
+        mtl + nybem_tools.raster_io.read_array(rasters["bed_elevation"]),
+        rtol=1e-6)
+    np.testing.assert_allclose(
+        nybem_tools.raster_io.read_array(outputs["wse"]), mtl, atol=1e-4)
+    assert nybem_tools.raster_io.read_profile(outputs["wse"])["dtype"] == \
+        "int16"
+
+
+def test_geotiff_output_written_behind(tmp_path):
+    grid = nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 768, 600, None)
+    values = np.random.RandomState(1).uniform(-3, 3, (grid.nrows,
+                                                      grid.ncols))
+    source = str(tmp_path / "mtl.npy")
+    nybem_tools.raster_io.write_array(values, grid, source)
+    output = str(tmp_path / "out.tif")
+    partial = nybem_tools.utils.partial_path(output)
+    sizes = []
+
+    def calculate(mtl):
+        time.sleep(0.05)
+        sizes.append(os.path.getsize(partial))
+        return mtl
+
+    nybem_tools.pipeline.run_tiles(calculate, {"mtl": source},
+                                   {"out": output}, tile_size=256, writers=2)
+    # Tiles reach the file while later windows are still being calculated
+    assert sizes[-1] > sizes[0]
+    assert np.array_equal(nybem_tools.geotiff.read_image(output),
+                          values.astype(np.float32))
+
+
+def test_reads_ahead_of_calculation(tmp_path, rasters, monkeypatch):
+    reads = []
+    read_array = nybem_tools.raster_io.read_array
+
+    def counting_read(raster, window=None):
+        reads.append(window)
+        return read_array(raster, window)
+
+    ahead = []
+
+    def calculate(mtl):
+        time.sleep(0.05)
+        ahead.append(len(reads))
+        return mtl
+
+    monkeypatch.setattr(nybem_tools.raster_io, "read_array", counting_read)
+    nybem_tools.pipeline.run_tiles(
+        calculate, {"mtl": rasters["mtl"]},
+        {"out": str(tmp_path / "out.npy")}, tile_size=16, read_ahead=2)
+    # While the first window is calculated, the next ones are read
+    assert ahead[0] >= 3
+    assert len(reads) == len(ahead) == 30
+
+
+def test_failure_stops_pipeline(tmp_path, rasters):
+    def calculate(mtl):
+        raise RuntimeError("calculation failed")
+
+    output = str(tmp_path / "out.npy")
+    with pytest.raises(RuntimeError):
+        nybem_tools.pipeline.run_tiles(calculate, {"mtl": rasters["mtl"]},
+                                       {"out": output}, tile_size=16)
+    assert not os.path.exists(output)
+
+
+def test_derive_zero_denominator_is_nodata(tmp_path, grid):
+    vel_alt = str(tmp_path / "vel_alt.npy")
+    vel_fwop = str(tmp_path / "vel_fwop.npy")
+    fwop = np.ones((grid.nrows, grid.ncols))
+    fwop[:, :3] = 0.0
+    nybem_tools.raster_io.write_array(fwop * 2, grid, vel_alt)
+    nybem_tools.raster_io.write_array(fwop, grid, vel_fwop)
+    path = nybem_tools.pipeline.derive("rel_velocity", str(tmp_path),
+                                       "rel_vel", vel_alt=vel_alt,
+                                       vel_fwop=vel_fwop)
+    values = nybem_tools.raster_io.read_array(path)
+    assert np.isnan(values[:, :3]).all()
+    assert np.isfinite(values[:, 3:]).all()
+    statistics = nybem_tools.raster_io.read_statistics(path)
+    assert statistics["valid_cells"] == grid.nrows * (grid.ncols - 3)
+    assert statistics["max"] == 100.0
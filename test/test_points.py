@@ -0,0 +1,31 @@
+import pytest
+import os
+import numpy as np
+import nybem_tools.points
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def points_path(tmp_path_factory):
+    path = os.path.join(str(tmp_path_factory.mktemp("points")), "wse.npz")
+    nybem_tools.points.write_points({"x": np.arange(5.0),
+                                     "y": np.arange(5.0) * 2,
+                                     "MHHW": np.full(5, 1.2),
+                                     "MLLW": np.full(5, -1.1)}, path)
+    return path
+
+
+# Act
+@pytest.fixture(scope="module")
+def columns(points_path):
+    return nybem_tools.points.read_points(points_path, ["MHHW"])
+
+
+# Assert
+def test_read_points_columns(columns):
+    assert sorted(columns) == ["MHHW", "x", "y"]
+
+
+def test_read_points_values(columns):
+    assert np.allclose(columns["y"], [0, 2, 4, 6, 8])
+    assert np.allclose(columns["MHHW"], 1.2)
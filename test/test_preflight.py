@@ -0,0 +1,102 @@
+import os
+import pytest
+import numpy as np
+import nybem_tools.points
+import nybem_tools.preflight
+import nybem_tools.raster_io
+import nybem_tools.update_AdH_predictors as update_AdH_predictors
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def mask_grid():
+    return nybem_tools.raster_io.Grid(100.0, 200.0, 10.0, 20, 30, "PROJ;1 2")
+
+
+@pytest.fixture(scope="module")
+def folder(mask_grid, tmp_path_factory):
+    folder = str(tmp_path_factory.mktemp("preflight"))
+    values = np.zeros((mask_grid.nrows, mask_grid.ncols))
+    nybem_tools.raster_io.write_array(
+        values, mask_grid, os.path.join(folder, "mask.npy"))
+    nybem_tools.raster_io.write_array(
+        values, mask_grid, os.path.join(folder, "vel_fwop.npy"))
+    shifted = mask_grid._replace(x_min=93.0, ncols=31)
+    nybem_tools.raster_io.write_array(
+        np.zeros((20, 31)), shifted, os.path.join(folder, "shifted.npy"))
+    small = mask_grid._replace(nrows=10)
+    nybem_tools.raster_io.write_array(
+        np.zeros((10, 30)), small, os.path.join(folder, "small.npy"))
+    nybem_tools.points.write_points(
+        {"x": np.zeros(3), "y": np.zeros(3), "vel_90": np.zeros(3)},
+        os.path.join(folder, "velocity.npz"))
+    return folder
+
+
+def steps(folder, vel_fwop, variable="vel_90"):
+    return [{"section": "# EST_INT", "message": "## High Velocity",
+             "function": "adh2raster",
+             "args": {"output_folder": folder, "output_name": "vel_90",
+                      "adh_points": os.path.join(folder, "velocity.npz"),
+                      "variable": variable,
+                      "sql_select": f"{variable} > -1",
+                      "barriers": "", "mask": os.path.join(folder,
+                                                           "mask.npy")}},
+            {"section": "# EST_INT", "message": "## Edge Erosion",
+             "function": "rel_velocity",
+             "args": {"output_folder": folder, "output_name": "edge_erosion",
+                      "vel_alt": os.path.join(folder, "vel_90.tif"),
+                      "vel_fwop": os.path.join(folder, vel_fwop)}}]
+
+
+# Act / Assert
+def test_valid_inputs_pass(folder):
+    problems = nybem_tools.preflight.check_steps(
+        steps(folder, "vel_fwop.npy"), os.path.join(folder, "mask.npy"))
+    assert problems == []
+
+
+def test_missing_raster_and_column(folder):
+    problems = nybem_tools.preflight.check_steps(
+        steps(folder, "missing.npy", variable="wse_50"),
+        os.path.join(folder, "mask.npy"))
+    assert len(problems) == 2
+    assert "has no column wse_50" in problems[0]
+    assert "missing.npy does not exist" in problems[1]
+
+
+def test_misaligned_rasters(folder, mask_grid):
+    check_raster = nybem_tools.preflight.check_raster
+    shifted = check_raster(os.path.join(folder, "shifted.npy"), mask_grid)
+    assert shifted == [os.path.join(folder, "shifted.npy") +
+                       " is not snapped to the mask cells along x."]
+    small = check_raster(os.path.join(folder, "small.npy"), mask_grid)
+    assert small == [os.path.join(folder, "small.npy") +
+                     " does not cover the extent of the mask."]
+    other_crs = nybem_tools.preflight.check_grid(
+        "other", mask_grid._replace(spatial_reference="OTHER;1 2"),
+        mask_grid._replace(spatial_reference="PROJ;3 4"))
+    assert other_crs == ["other is not in the coordinate system of the mask."]
+
+
+def test_require_valid_raises(folder):
+    with pytest.raises(ValueError):
+        nybem_tools.preflight.require_valid(
+            steps(folder, "missing.npy"), os.path.join(folder, "mask.npy"))
+
+
+def test_scenario_checks_external_inputs_only(mask_grid):
+    scenario = update_AdH_predictors.scenario_steps(
+        "fwop", "alt", "adh/velocity.shp", "adh/salinity.shp", "adh/wse.shp",
+        "example_data.gdb/barriers", "mask_10m.tif")
+    checks = nybem_tools.preflight.step_checks(scenario, mask_grid)
+    rasters = sorted(args[0] for function, args in checks
+                     if function is nybem_tools.preflight.check_raster)
+    assert rasters == sorted([
+        os.path.join("alt", "bed_elevation.tif"),
+        os.path.join("fwop", "est_int", "predictors", "vel_90.tif"),
+        os.path.join("fwop", "mar_deep", "predictors", "vel_10.tif")])
+    columns = {args[0]: args[1] for function, args in checks
+               if function is nybem_tools.preflight.check_points}
+    assert columns["adh/wse.shp"] == ["MHHW", "MLLW", "Mean_WSE", "wse_50",
+                                      "wse_100", "wse_0"]
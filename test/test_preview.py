@@ -0,0 +1,131 @@
+import pytest
+import os
+import numpy as np
+import nybem_tools.raster_io
+import nybem_tools.interpolate
+import nybem_tools.points
+import nybem_tools.preview
+import nybem_tools.update_AdH_predictors as update_AdH_predictors
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 95, 120, None)
+
+
+@pytest.fixture(scope="module")
+def adh_points(grid):
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(-20, grid.ncols * grid.cell_size + 20, 20000)
+    ys = rng.uniform(-20, grid.nrows * grid.cell_size + 20, 20000)
+    return xs, ys, np.sin(xs / 300.0) + np.cos(ys / 200.0)
+
+
+@pytest.fixture(scope="module")
+def preview_path():
+    return os.path.join("alt", "preview", "100")
+
+
+# Act
+@pytest.fixture(scope="module")
+def steps(preview_path):
+    steps = update_AdH_predictors.scenario_steps(
+        "fwop", preview_path, "adh/velocity.shp", "adh/salinity.shp",
+        "adh/wse.shp", "example_data.gdb/barriers",
+        os.path.join(preview_path, "mask.tif"))
+    return nybem_tools.preview.preview_steps(steps, "alt", preview_path)
+
+
+# Assert
+def test_preview_static_inputs_from_alt(steps):
+    depth = [step for step in steps if step["function"] == "depth"][0]
+    assert depth["args"]["bed_elevation"] == os.path.join(
+        "alt", "bed_elevation.tif")
+
+
+def test_preview_calculated_inputs_from_preview(steps, preview_path):
+    esd = [step for step in steps if step["function"] == "epi_sed_dep"][0]
+    assert esd["args"]["wse_mhhw"] == os.path.join(preview_path, "mhhw.tif")
+    assert esd["args"]["output_folder"].startswith(preview_path)
+
+
+def test_preview_mask_not_redirected(steps, preview_path):
+    adh2raster = [step for step in steps
+                  if step["function"] == "adh2raster"][0]
+    assert adh2raster["args"]["mask"] == os.path.join(preview_path,
+                                                      "mask.tif")
+
+
+def test_coarsen_mask(tmp_path, grid):
+    mask = np.full((grid.nrows, grid.ncols), np.nan)
+    mask[:12, :12] = 1.0
+    mask_path = os.path.join(str(tmp_path), "mask_10m.npy")
+    nybem_tools.raster_io.write_array(mask, grid, mask_path)
+    coarse_path = nybem_tools.preview.coarsen_mask(mask_path, 100.0,
+                                                   str(tmp_path))
+    coarse_grid = nybem_tools.raster_io.read_grid(coarse_path)
+    coarse = nybem_tools.raster_io.read_array(coarse_path)
+    assert coarse_grid.cell_size == 100.0
+    assert (coarse_grid.nrows, coarse_grid.ncols) == (10, 12)
+    assert np.array_equal(coarse[:2, :2], np.ones((2, 2)))
+    assert np.isnan(coarse[2:, :]).all()
+
+
+def test_progressive_matches_full_solve(grid, adh_points):
+    levels = list(nybem_tools.interpolate.progressive(
+        *adh_points, grid, factors=(4, 2, 1), tolerance=0.001))
+    full = nybem_tools.interpolate.points_to_grid(*adh_points, grid)
+    assert [level.cell_size for level, _ in levels] == [40.0, 20.0, 10.0]
+    assert levels[-1][1].shape == full.shape
+    assert np.nanmax(np.abs(levels[-1][1] - full)) < 0.001
+
+
+def test_seed_steps_point_at_coarser_preview(steps, preview_path):
+    coarser = os.path.join("alt", "preview", "200")
+    seeded = nybem_tools.preview.seed_steps(
+        [dict(step, args=dict(step["args"], method="idw"))
+         if step["args"].get("output_name") == "sal_10" else step
+         for step in steps], preview_path, coarser)
+    sal_10 = [step for step in seeded
+              if step["args"].get("output_name") == "sal_10"][0]
+    assert sal_10["args"]["seed"] == os.path.join(coarser, "sal_10.tif")
+    assert all("seed" not in step["args"] for step in seeded
+               if step["args"].get("method", "spline") == "spline")
+
+
+def test_seeded_interpolation_solves_rough_cells(tmp_path, grid, adh_points,
+                                                 monkeypatch):
+    folder = str(tmp_path)
+    xs, ys, _ = adh_points
+    # Flat but for a mound around (300, 400)
+    values = 1.0 + np.exp(-np.hypot(xs - 300, ys - 400) ** 2 / 80 ** 2)
+    nybem_tools.points.write_points({"x": xs, "y": ys, "MTL": values},
+                                    os.path.join(folder, "wse.npz"))
+    nybem_tools.raster_io.write_array(
+        np.ones((grid.nrows, grid.ncols)), grid,
+        os.path.join(folder, "mask.npy"))
+    coarse = nybem_tools.preview.coarsen_mask(
+        os.path.join(folder, "mask.npy"), 20.0,
+        os.path.join(folder, "mask_20"))
+
+    def run(name, mask, seed=""):
+        return nybem_tools.interpolate.interpolate_points(
+            folder, name, os.path.join(folder, "wse.npz"), "MTL",
+            "MTL > -99", "", mask, "idw", seed=seed, tolerance=0.05)
+
+    solved = []
+    idw = nybem_tools.interpolate.idw
+    monkeypatch.setattr(nybem_tools.interpolate, "idw",
+                        lambda tree, values, xy, *args, **kwargs:
+                        solved.append(len(xy)) or idw(tree, values, xy,
+                                                      *args, **kwargs))
+    full = nybem_tools.raster_io.read_array(
+        run("full", os.path.join(folder, "mask.npy")))
+    solved.clear()
+    seed = run("coarse", coarse)
+    solved.clear()
+    refined = nybem_tools.raster_io.read_array(
+        run("refined", os.path.join(folder, "mask.npy"), seed))
+    assert sum(solved) < grid.nrows * grid.ncols / 2
+    assert np.nanmax(np.abs(refined - full)) < 0.05
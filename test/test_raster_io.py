@@ -0,0 +1,99 @@
+import os
+import pytest
+import numpy as np
+import nybem_tools.raster_io
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 50, 40, None)
+
+
+@pytest.fixture(scope="module")
+def wse(grid):
+    rng = np.random.default_rng(0)
+    array = rng.uniform(-3, 3, (grid.nrows, grid.ncols))
+    array[0, :5] = np.nan
+    return array
+
+
+# Act / Assert
+def test_storage_profile():
+    storage_profile = nybem_tools.raster_io.storage_profile
+    assert storage_profile("sal_50", quantize=True)["dtype"] == "uint16"
+    assert storage_profile("mhhw", quantize=True)["dtype"] == "int16"
+    assert storage_profile("vel_90", quantize=True)["dtype"] == "uint16"
+    assert storage_profile("pla", quantize=True)["dtype"] == "uint16"
+    assert storage_profile("esd", quantize=True)["dtype"] == "float32"
+    assert storage_profile("mhhw", quantize=False)["dtype"] == "float32"
+
+
+def test_encode_out_of_range_is_nodata():
+    profile = nybem_tools.raster_io.PROFILES["salinity"]
+    with pytest.warns(RuntimeWarning, match="2 values outside the range"):
+        stored = nybem_tools.raster_io.encode(
+            np.array([-1.0, 70.0, 65.534, np.nan]), profile)
+    assert stored.tolist() == [65535, 65535, 65534, 65535]
+
+
+def test_percent_profile_limit():
+    profile = nybem_tools.raster_io.PROFILES["percent"]
+    # light available on a cell 1 m above the water surface
+    values = np.array([0.0, 100.0, 100 * np.exp(1.39), 655.34])
+    stored = nybem_tools.raster_io.encode(values, profile)
+    decoded = nybem_tools.raster_io.decode(stored, profile)
+    assert np.allclose(decoded, values, atol=0.005)
+    with pytest.warns(RuntimeWarning):
+        stored = nybem_tools.raster_io.encode(np.array([655.36]), profile)
+    assert stored.tolist() == [65535]
+
+
+def test_float32_round_trip(grid, wse, tmp_path):
+    path = os.path.join(str(tmp_path), "depth.npy")
+    nybem_tools.raster_io.write_array(wse, grid, path)
+    array = nybem_tools.raster_io.read_array(path)
+    assert np.allclose(array, wse, equal_nan=True, atol=1e-6)
+    assert nybem_tools.raster_io.read_profile(path) is None
+
+
+def test_quantized_round_trip(grid, wse, tmp_path):
+    profile = nybem_tools.raster_io.PROFILES["wse"]
+    path = os.path.join(str(tmp_path), "mhhw.npy")
+    nybem_tools.raster_io.write_array(wse, grid, path, profile="wse")
+    array = nybem_tools.raster_io.read_array(path)
+    assert np.array_equal(np.isnan(array), np.isnan(wse))
+    assert np.nanmax(np.abs(array - wse)) <= profile["scale"] / 2 + 1e-12
+    assert nybem_tools.raster_io.read_grid(path) == grid
+
+
+def test_quantized_window(grid, wse, tmp_path):
+    path = os.path.join(str(tmp_path), "mllw.npy")
+    nybem_tools.raster_io.write_array(wse, grid, path, profile="wse")
+    array = nybem_tools.raster_io.read_array(path, (0, 0, 10, 10))
+    assert np.allclose(array, wse[:10, :10], equal_nan=True, atol=1e-4)
+
+
+def test_quantized_is_smaller(grid, wse, tmp_path):
+    float_path = os.path.join(str(tmp_path), "float.npy")
+    int_path = os.path.join(str(tmp_path), "int.npy")
+    nybem_tools.raster_io.write_array(wse, grid, float_path)
+    nybem_tools.raster_io.write_array(wse, grid, int_path, profile="wse")
+    assert os.path.getsize(int_path) < os.path.getsize(float_path)
+
+
+def test_coarsen_grid_keeps_upper_left(grid):
+    coarse = nybem_tools.raster_io.coarsen_grid(grid, 3)
+    assert (coarse.nrows, coarse.ncols, coarse.cell_size) == (17, 14, 30.0)
+    assert coarse.x_min == grid.x_min
+    assert coarse.y_min + coarse.nrows * coarse.cell_size == \
+        grid.y_min + grid.nrows * grid.cell_size
+
+
+def test_aggregate():
+    array = np.array([[1.0, 3.0, 5.0],
+                      [np.nan, 2.0, np.nan]])
+    assert np.allclose(nybem_tools.raster_io.aggregate(array, 2, "mean"),
+                       [[2.0, 5.0]])
+    assert np.allclose(nybem_tools.raster_io.aggregate(array, 2, "max"),
+                       [[3.0, 5.0]])
@@ -0,0 +1,83 @@
+import pytest
+import os
+import csv
+import numpy as np
+import nybem_tools.raster_io
+import nybem_tools.points
+import nybem_tools.sampling
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 50, 60, None)
+
+
+@pytest.fixture(scope="module")
+def scenarios(tmp_path_factory, grid):
+    root = str(tmp_path_factory.mktemp("scenarios"))
+    rows, cols = np.mgrid[0:grid.nrows, 0:grid.ncols]
+    paths = []
+    for i in range(2):
+        path = os.path.join(root, f"alt_{i}")
+        folder = os.path.join(path, "est_int", "predictors")
+        os.makedirs(folder)
+        nybem_tools.raster_io.write_array(
+            rows * 1000.0 + cols + i, grid,
+            os.path.join(folder, "vel_90.npy"))
+        mhhw = np.full((grid.nrows, grid.ncols), 1.0 + i)
+        mhhw[0, 0] = np.nan
+        nybem_tools.raster_io.write_array(
+            mhhw, grid, os.path.join(path, "mhhw.npy"))
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture(scope="module")
+def sample_points(tmp_path_factory):
+    path = os.path.join(str(tmp_path_factory.mktemp("points")), "pts.npz")
+    # Cell (row 2, col 3), the NoData cell (0, 0) and a point off the grid
+    nybem_tools.points.write_points({"x": np.array([35.0, 5.0, -50.0]),
+                                     "y": np.array([475.0, 495.0, 100.0])},
+                                    path)
+    return path
+
+
+# Act
+@pytest.fixture(scope="module")
+def output_csv(tmp_path_factory, scenarios, sample_points):
+    output_csv = os.path.join(str(tmp_path_factory.mktemp("out")),
+                              "samples.csv")
+    nybem_tools.sampling.main(sample_points, ";".join(scenarios), output_csv)
+    return output_csv
+
+
+# Assert
+def test_sample_raster_blocks(scenarios, grid):
+    xs = np.array([35.0, 595.0, 5.0])
+    ys = np.array([475.0, 5.0, 5.0])
+    values = nybem_tools.sampling.sample_raster(
+        os.path.join(scenarios[0], "est_int", "predictors", "vel_90.npy"),
+        xs, ys, block_size=16)
+    assert values.tolist() == [2003.0, 49059.0, 49000.0]
+
+
+def test_samples_table(output_csv):
+    with open(output_csv) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 6
+    assert rows[0]["scenario"] == "alt_0"
+    assert float(rows[0]["est_int/vel_90"]) == 2003.0
+    assert float(rows[3]["est_int/vel_90"]) == 2004.0
+    assert rows[1]["mhhw"] == ""
+    assert rows[2]["est_int/vel_90"] == ""
+
+
+def test_block_cache_reused(scenarios):
+    raster = os.path.join(scenarios[1], "mhhw.npy")
+    nybem_tools.sampling.read_block.cache_clear()
+    for _ in range(2):
+        nybem_tools.sampling.sample_raster(raster, np.array([35.0]),
+                                           np.array([475.0]))
+    info = nybem_tools.sampling.read_block.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
@@ -0,0 +1,35 @@
+import pytest
+import os
+import nybem_tools.update_AdH_predictors as update_AdH_predictors
+
+
+# Act
+@pytest.fixture(scope="module")
+def steps():
+    return update_AdH_predictors.scenario_steps(
+        "fwop", "alt", "adh/velocity.shp", "adh/salinity.shp", "adh/wse.shp",
+        "example_data.gdb/barriers", "mask_10m.tif")
+
+
+# Assert
+def test_step_names_unique(steps):
+    names = [update_AdH_predictors.step_name(step, "alt") for step in steps]
+    assert len(names) == len(set(names)) == 25
+
+
+def test_steps_ordered_by_dependency(steps):
+    written = set()
+    all_outputs = {output for step in steps
+                   for output in update_AdH_predictors.step_outputs(step)}
+    for step in steps:
+        for path in update_AdH_predictors.step_inputs(step):
+            if path in all_outputs:
+                assert path in written
+        written.update(update_AdH_predictors.step_outputs(step))
+
+
+def test_velocity_change_reads_fwop(steps):
+    edge_erosion = [step for step in steps
+                    if step["args"]["output_name"] == "edge_erosion"][0]
+    assert edge_erosion["args"]["vel_fwop"] == os.path.join(
+        "fwop", "est_int", "predictors", "vel_90.tif")
@@ -0,0 +1,78 @@
+import pytest
+import os
+import numpy as np
+import nybem_tools.raster_io
+import nybem_tools.kernels
+import nybem_tools.slr_sweep
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 20, 30, None)
+
+
+@pytest.fixture(scope="module")
+def base(tmp_path_factory, grid):
+    path_to_alt = str(tmp_path_factory.mktemp("base"))
+    rng = np.random.default_rng(0)
+    shape = (grid.nrows, grid.ncols)
+    mtl = rng.uniform(-0.2, 0.2, shape)
+    levels = {"mhhw": mtl + 1.0, "mllw": mtl - 1.0, "mtl": mtl,
+              "wse_median": mtl + 0.1, "wse_100": mtl + 1.5,
+              "wse_0": mtl - 1.4}
+    for name, folder in nybem_tools.slr_sweep.WATER_LEVELS.items():
+        os.makedirs(os.path.join(path_to_alt, folder), exist_ok=True)
+        nybem_tools.raster_io.write_array(
+            levels[name], grid, os.path.join(path_to_alt, folder,
+                                             name + ".npy"))
+    bed = rng.uniform(-5.0, 0.0, shape)
+    nybem_tools.raster_io.write_array(
+        bed, grid, os.path.join(path_to_alt, "bed_elevation.npy"))
+    offset = np.full(shape, 0.25)
+    nybem_tools.raster_io.write_array(
+        offset, grid, os.path.join(path_to_alt, "offset_map.npy"))
+    return path_to_alt, levels, bed
+
+
+# Act
+@pytest.fixture(scope="module")
+def horizons(tmp_path_factory, base):
+    output_folder = str(tmp_path_factory.mktemp("sweep"))
+    offsets = "0;0.5;" + os.path.join(base[0], "offset_map.npy")
+    return nybem_tools.slr_sweep.sweep(base[0], offsets, output_folder)
+
+
+# Assert
+def test_horizon_names(horizons):
+    assert [os.path.basename(path) for path in horizons] == [
+        "slr_0", "slr_0.5", "offset_map"]
+
+
+def test_depth_shifted(horizons, base):
+    _, levels, bed = base
+    for horizon, offset in zip(horizons, [0.0, 0.5, 0.25]):
+        depth = nybem_tools.raster_io.read_array(os.path.join(
+            horizon, "est_sub_soft_sav", "predictors", "depth.npy"))
+        assert np.allclose(depth, levels["mtl"] + offset - bed, atol=1e-5)
+
+
+def test_pla_written_to_every_model(horizons):
+    for folder in nybem_tools.slr_sweep.DERIVED["pla"]:
+        assert os.path.exists(os.path.join(horizons[1], folder, "pla.npy"))
+
+
+def test_esd_matches_shifted_levels(horizons, base):
+    _, levels, _ = base
+    shifted = {name: value + 0.5 for name, value in levels.items()}
+    esd = nybem_tools.raster_io.read_array(os.path.join(
+        horizons[1], "est_int", "predictors", "esd.npy"))
+    assert np.allclose(esd, nybem_tools.kernels.epi_sed_dep(
+        shifted["mhhw"], shifted["wse_median"], shifted["wse_100"]),
+        atol=1e-4)
+
+
+def test_water_levels_shifted(horizons, base):
+    mhhw = nybem_tools.raster_io.read_array(os.path.join(horizons[2],
+                                                         "mhhw.npy"))
+    assert np.allclose(mhhw, base[1]["mhhw"] + 0.25, atol=1e-5)
@@ -0,0 +1,67 @@
+import pytest
+import os
+import numpy as np
+import nybem_tools.raster_io
+import nybem_tools.stack
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 30, 40, None)
+
+
+@pytest.fixture(scope="module")
+def scenario(tmp_path_factory, grid):
+    path_to_scenario = str(tmp_path_factory.mktemp("scenario"))
+    folder = os.path.join(path_to_scenario, "est_int", "predictors")
+    os.makedirs(folder)
+    mhhw = np.full((grid.nrows, grid.ncols), 1.0)
+    mhhw[0, 0] = np.nan
+    nybem_tools.raster_io.write_array(
+        mhhw, grid, os.path.join(path_to_scenario, "mhhw.npy"))
+    nybem_tools.raster_io.write_array(
+        np.full((grid.nrows, grid.ncols), 0.5), grid,
+        os.path.join(folder, "wse_median.npy"), profile="wse")
+    nybem_tools.raster_io.write_array(
+        np.ones((5, 5)), grid._replace(nrows=5, ncols=5),
+        os.path.join(folder, "other_grid.npy"))
+    nybem_tools.raster_io.write_array(
+        np.ones((grid.nrows, grid.ncols)), grid,
+        os.path.join(path_to_scenario, "mask.npy"))
+    return path_to_scenario
+
+
+# Act
+@pytest.fixture(scope="module")
+def stack_path(scenario):
+    nybem_tools.stack.main(scenario)
+    return os.path.join(scenario, nybem_tools.stack.STACK_NAME)
+
+
+# Assert
+def test_stack_bands(stack_path, grid):
+    stack, bands, stack_grid = nybem_tools.stack.open_stack(stack_path)
+    assert bands == ["mhhw", "est_int/wse_median"]
+    assert stack.shape == (2, grid.nrows, grid.ncols)
+    assert stack_grid == grid
+
+
+def test_read_bands_values(stack_path):
+    views = nybem_tools.stack.read_bands(stack_path,
+                                         ["est_int/wse_median", "mhhw"])
+    assert np.isnan(views["mhhw"][0, 0])
+    assert np.allclose(views["est_int/wse_median"], 0.5)
+
+
+def test_read_bands_are_views(stack_path):
+    views = nybem_tools.stack.read_bands(stack_path, ["mhhw"],
+                                         (10, 10, 5, 5))
+    assert views["mhhw"].shape == (5, 5)
+    assert isinstance(views["mhhw"].base, np.memmap)
+    assert not views["mhhw"].flags.writeable
+
+
+def test_stack_is_not_restacked(scenario, stack_path):
+    rasters = nybem_tools.stack.scenario_rasters(scenario)
+    assert stack_path not in [path for _, path in rasters]
@@ -0,0 +1,157 @@
+import json
+import os
+import pytest
+import numpy as np
+import nybem_tools.journal
+import nybem_tools.points
+import nybem_tools.raster_io
+import nybem_tools.staging
+import nybem_tools.utils
+import nybem_tools.update_AdH_predictors as update_AdH_predictors
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 30, 40, None)
+
+
+@pytest.fixture(scope="module")
+def share(grid, tmp_path_factory):
+    # A local folder stands in for the network share
+    share = str(tmp_path_factory.mktemp("share"))
+    rng = np.random.default_rng(7)
+    xs = rng.uniform(-10, 410, 1000)
+    ys = rng.uniform(-10, 310, 1000)
+    os.makedirs(os.path.join(share, "adh"))
+    nybem_tools.points.write_points(
+        {"x": xs, "y": ys, "MTL": 0.5 + xs / 1000},
+        os.path.join(share, "adh", "wse.npz"))
+    os.makedirs(os.path.join(share, "fwop"))
+    nybem_tools.raster_io.write_array(
+        np.full((grid.nrows, grid.ncols), -2.0), grid,
+        os.path.join(share, "fwop", "bed_elevation.npy"))
+    nybem_tools.raster_io.write_array(np.ones((grid.nrows, grid.ncols)),
+                                      grid, os.path.join(share, "mask.npy"))
+    return share
+
+
+def steps(share, alt):
+    path_to_alt = os.path.join(share, alt)
+    os.makedirs(path_to_alt, exist_ok=True)
+    return [{"section": "# ALT", "message": "## MTL",
+             "function": "adh2raster",
+             "args": {"output_folder": path_to_alt, "output_name": "mtl",
+                      "adh_points": os.path.join(share, "adh", "wse.npz"),
+                      "variable": "MTL", "sql_select": "MTL > -99",
+                      "barriers": "",
+                      "mask": os.path.join(share, "mask.npy"),
+                      "method": "idw"}},
+            {"section": "# ALT", "message": "## Depth",
+             "function": "depth",
+             "args": {"output_folder": path_to_alt, "output_name": "depth",
+                      "wse_mtl": os.path.join(path_to_alt, "mtl.npy"),
+                      "bed_elevation": os.path.join(share, "fwop",
+                                                    "bed_elevation.npy")}}]
+
+
+@pytest.fixture(scope="module")
+def staged(share, tmp_path_factory):
+    scratch = str(tmp_path_factory.mktemp("scratch"))
+    nybem_tools.staging.run_staged(steps(share, "alt"),
+                                   os.path.join(share, "fwop"),
+                                   os.path.join(share, "alt"), scratch)
+    return scratch
+
+
+# Act / Assert
+def test_outputs_match_direct_run(share, staged):
+    update_AdH_predictors.run_steps(steps(share, "direct"),
+                                    os.path.join(share, "direct"))
+    for name in ("mtl", "depth"):
+        assert np.array_equal(
+            nybem_tools.raster_io.read_array(
+                os.path.join(share, "alt", name + ".npy")),
+            nybem_tools.raster_io.read_array(
+                os.path.join(share, "direct", name + ".npy")),
+            equal_nan=True)
+
+
+def test_run_stays_local(share, staged):
+    path_to_alt = os.path.join(share, "alt")
+    local_alt = nybem_tools.staging.local_path(staged, path_to_alt,
+                                               (path_to_alt,))
+    assert os.path.exists(os.path.join(local_alt,
+                                       nybem_tools.journal.JOURNAL_NAME))
+    with open(os.path.join(share, "alt",
+                           nybem_tools.raster_io.MANIFEST_NAME)) as f:
+        paths = [json.loads(line)["path"] for line in f]
+    assert sorted(paths) == [os.path.join(share, "alt", "depth.npy"),
+                             os.path.join(share, "alt", "mtl.npy")]
+
+
+def test_journal_synced_with_remote_fingerprints(share, staged):
+    path_to_alt = os.path.join(share, "alt")
+    records = nybem_tools.journal.read_journal(
+        os.path.join(path_to_alt, nybem_tools.journal.JOURNAL_NAME))
+    alt_steps = steps(share, "alt")
+    assert sorted(records) == sorted(
+        update_AdH_predictors.step_name(step, path_to_alt)
+        for step in alt_steps)
+    for step in alt_steps:
+        record = records[update_AdH_predictors.step_name(step, path_to_alt)]
+        assert record["fingerprint"] == nybem_tools.journal.fingerprint(
+            step["function"], step["args"],
+            update_AdH_predictors.step_inputs(step))
+
+
+def test_failed_run_syncs_completed_steps(share, tmp_path, monkeypatch):
+    def depth(**kwargs):
+        raise RuntimeError("depth failed")
+
+    monkeypatch.setattr(nybem_tools.utils, "depth", depth)
+    path_to_alt = os.path.join(share, "failed")
+    with pytest.raises(RuntimeError):
+        nybem_tools.staging.run_staged(steps(share, "failed"),
+                                       os.path.join(share, "fwop"),
+                                       path_to_alt, str(tmp_path))
+    assert os.path.exists(os.path.join(path_to_alt, "mtl.npy"))
+    with open(os.path.join(path_to_alt,
+                           nybem_tools.raster_io.MANIFEST_NAME)) as f:
+        paths = [json.loads(line)["path"] for line in f]
+    assert paths == [os.path.join(path_to_alt, "mtl.npy")]
+    records = nybem_tools.journal.read_journal(
+        os.path.join(path_to_alt, nybem_tools.journal.JOURNAL_NAME))
+    assert list(records) == [update_AdH_predictors.step_name(
+        steps(share, "failed")[0], path_to_alt)]
+
+
+def test_rerun_copies_nothing(share, staged):
+    output = os.path.join(share, "alt", "depth.npy")
+    modified = os.stat(output).st_mtime_ns
+    inputs = nybem_tools.staging.staged_inputs(steps(share, "alt"))
+    assert os.path.join(share, "alt", "mtl.npy") not in inputs
+    assert nybem_tools.staging.stage_in(
+        inputs, staged, (os.path.join(share, "fwop"),
+                         os.path.join(share, "alt"))) == 0
+    assert nybem_tools.staging.sync_output(
+        nybem_tools.staging.local_path(staged, output,
+                                       (os.path.join(share, "alt"),)),
+        output) == []
+    assert os.stat(output).st_mtime_ns == modified
+
+
+def test_feature_class_copies_geodatabase(share, tmp_path):
+    gdb = os.path.join(share, "example_data.gdb")
+    os.makedirs(gdb, exist_ok=True)
+    for name in ("a00000001.gdbtable", "gdb"):
+        with open(os.path.join(gdb, name), "wb") as f:
+            f.write(os.urandom(1000))
+    feature_class = os.path.join(gdb, "barriers")
+    local = nybem_tools.staging.local_path(str(tmp_path), feature_class)
+    assert os.path.basename(os.path.dirname(local)) == "example_data.gdb"
+    assert len(nybem_tools.staging.copy_dataset(feature_class, local)) == 2
+    for name in ("a00000001.gdbtable", "gdb"):
+        assert nybem_tools.staging.checksum(
+            os.path.join(os.path.dirname(local), name)) == \
+            nybem_tools.staging.checksum(os.path.join(gdb, name))
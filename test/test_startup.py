@@ -0,0 +1,45 @@
+import pytest
+import os
+import subprocess
+import sys
+import nybem_tools.utils
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def repo_folder():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Act
+@pytest.fixture(scope="module")
+def loaded_modules(repo_folder):
+    code = ("import sys\n"
+            "import nybem_tools.utils, nybem_tools.raster_io\n"
+            "import nybem_tools.points, nybem_tools.compare_to_fwop\n"
+            "print(' '.join(sys.modules))")
+    output = subprocess.check_output([sys.executable, "-c", code],
+                                     cwd=repo_folder)
+    return output.decode().split()
+
+
+# Assert
+def test_import_does_not_load_arcpy(loaded_modules):
+    assert "arcpy" not in loaded_modules
+
+
+def test_dev_reload_off_by_default(monkeypatch):
+    monkeypatch.delenv("NYBEM_DEV_RELOAD", raising=False)
+    nybem_tools.utils.MODEL_NAMES.append("scratch")
+    try:
+        nybem_tools.utils.dev_reload(nybem_tools.utils)
+        assert "scratch" in nybem_tools.utils.MODEL_NAMES
+    finally:
+        nybem_tools.utils.MODEL_NAMES.remove("scratch")
+
+
+def test_dev_reload_opt_in(monkeypatch):
+    monkeypatch.setenv("NYBEM_DEV_RELOAD", "1")
+    nybem_tools.utils.MODEL_NAMES.append("scratch")
+    nybem_tools.utils.dev_reload(nybem_tools.utils)
+    assert "scratch" not in nybem_tools.utils.MODEL_NAMES
@@ -0,0 +1,151 @@
+import os
+import pytest
+import numpy as np
+import nybem_tools.geotiff
+import nybem_tools.raster_io
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def grid():
+    return nybem_tools.raster_io.Grid(0.0, 0.0, 1.0, 600, 530, None)
+
+
+@pytest.fixture(scope="module")
+def wse(grid):
+    rng = np.random.default_rng(1)
+    # kept within the range of the wse profile
+    array = np.clip(rng.normal(0.5, 2.0, (grid.nrows, grid.ncols)), -6, 6)
+    array[:40, :] = np.nan
+    array[100:140, 200:260] = np.nan
+    return array
+
+
+def write_tiled(array, grid, path, tile_size, profile="float32"):
+    output = nybem_tools.raster_io.open_output(path, grid, profile)
+    for row, col, nrows, ncols in nybem_tools.raster_io.windows(grid,
+                                                                tile_size):
+        nybem_tools.raster_io.write_window(
+            output, array[row:row + nrows, col:col + ncols],
+            (row, col, nrows, ncols))
+    nybem_tools.raster_io.close_output(output)
+
+
+@pytest.fixture(scope="module")
+def written(grid, wse, tmp_path_factory):
+    folder = str(tmp_path_factory.mktemp("statistics"))
+    with nybem_tools.raster_io.manifest(folder):
+        write_tiled(wse, grid, os.path.join(folder, "mhhw.npy"), 128)
+        write_tiled(wse, grid, os.path.join(folder, "mllw.npy"), 200)
+        write_tiled(wse, grid, os.path.join(folder, "mtl.npy"), 128,
+                    profile="wse")
+    return folder
+
+
+# Act / Assert
+def test_statistics_match_numpy(wse, written):
+    statistics = nybem_tools.raster_io.read_statistics(
+        os.path.join(written, "mhhw.npy"))
+    values = wse[np.isfinite(wse)].astype(np.float32).astype(np.float64)
+    assert statistics["valid_cells"] == values.size
+    assert statistics["min"] == values.min()
+    assert statistics["max"] == values.max()
+    assert np.isclose(statistics["mean"], values.mean(), rtol=1e-12)
+    assert np.isclose(statistics["std"], values.std(), rtol=1e-12)
+
+
+def test_histogram_counts_every_valid_cell(wse, written):
+    statistics = nybem_tools.raster_io.read_statistics(
+        os.path.join(written, "mhhw.npy"))
+    histogram = statistics["histogram"]
+    assert sum(histogram["counts"]) == statistics["valid_cells"]
+    assert len(histogram["counts"]) <= nybem_tools.raster_io.HISTOGRAM_BINS
+    assert histogram["min"] <= statistics["min"]
+    assert histogram["max"] > statistics["max"]
+    edges = np.linspace(histogram["min"], histogram["max"],
+                        len(histogram["counts"]) + 1)
+    counts, _ = np.histogram(wse[np.isfinite(wse)].astype(np.float32), edges)
+    assert counts.tolist() == histogram["counts"]
+
+
+def test_statistics_do_not_depend_on_tiles(written):
+    by_128 = nybem_tools.raster_io.read_statistics(
+        os.path.join(written, "mhhw.npy"))
+    by_200 = nybem_tools.raster_io.read_statistics(
+        os.path.join(written, "mllw.npy"))
+    assert by_128["histogram"] == by_200["histogram"]
+    assert (by_128["min"], by_128["max"]) == (by_200["min"], by_200["max"])
+    assert np.isclose(by_128["std"], by_200["std"], rtol=1e-12)
+
+
+def test_quantized_statistics_are_of_stored_values(written):
+    path = os.path.join(written, "mtl.npy")
+    statistics = nybem_tools.raster_io.read_statistics(path)
+    array = nybem_tools.raster_io.read_array(path)
+    assert statistics["max"] == np.nanmax(array)
+    assert np.isclose(statistics["mean"], np.nanmean(array), rtol=1e-12)
+
+
+def test_overviews_match_aggregate(grid, written):
+    path = os.path.join(written, "mhhw.npy")
+    assert nybem_tools.raster_io.overview_factors(grid) == [2]
+    array = nybem_tools.raster_io.read_array(path)
+    overview = nybem_tools.raster_io.read_overview(path, 2)
+    expected = nybem_tools.raster_io.aggregate(array, 2)
+    assert overview.shape == expected.shape
+    assert np.allclose(overview, expected, equal_nan=True, atol=1e-5)
+    assert nybem_tools.raster_io.read_overview(path, 4) is None
+
+
+def test_manifest_records_every_raster(grid, written):
+    records = nybem_tools.raster_io.read_manifest(written)
+    assert sorted(os.path.basename(path) for path in records) == \
+        ["mhhw.npy", "mllw.npy", "mtl.npy"]
+    record = records[os.path.abspath(os.path.join(written, "mtl.npy"))]
+    assert record["grid"]["nrows"] == grid.nrows
+    assert record["profile"]["dtype"] == "int16"
+    assert record["overviews"] == [2]
+    assert record["statistics"]["valid_cells"] > 0
+
+
+def test_manifest_shards_merged_on_read(grid, wse, tmp_path):
+    folder = str(tmp_path)
+    for worker, name in (("host-a:101", "mhhw"), ("host-b:202", "mllw")):
+        with nybem_tools.raster_io.manifest(folder, worker) as path:
+            write_tiled(wse, grid, os.path.join(folder, name + ".npy"), 200)
+        assert os.path.basename(path).startswith("nybem_manifest.host-")
+    assert not os.path.exists(
+        os.path.join(folder, nybem_tools.raster_io.MANIFEST_NAME))
+    records = nybem_tools.raster_io.read_manifest(folder)
+    assert sorted(os.path.basename(path) for path in records) == \
+        ["mhhw.npy", "mllw.npy"]
+
+
+def test_aux_xml_round_trip(tmp_path):
+    path = os.path.join(str(tmp_path), "depth.tif")
+    statistics = nybem_tools.raster_io.finish_statistics(
+        nybem_tools.raster_io.tile_statistics(np.arange(10.0)))
+    nybem_tools.raster_io.write_aux_xml(path, statistics)
+    nybem_tools.raster_io.write_aux_xml(path, statistics)
+    assert nybem_tools.raster_io.read_statistics(path) == statistics
+
+
+@pytest.mark.parametrize("profile", ["float32", "wse"])
+def test_geotiff_has_pyramids_and_statistics(grid, wse, profile, tmp_path):
+    path = os.path.join(str(tmp_path), "mhhw.tif")
+    write_tiled(wse, grid, path, 200, profile)
+    stored = nybem_tools.geotiff.read_image(path)
+    expected = nybem_tools.raster_io.encode(wse, nybem_tools.raster_io
+                                            .PROFILES[profile])
+    assert np.array_equal(stored, expected, equal_nan=True)
+    values = nybem_tools.raster_io.decode(
+        stored, nybem_tools.raster_io.read_profile(path))
+    assert nybem_tools.geotiff.read_shapes(path) == [(600, 530), (300, 265)]
+    assert np.allclose(nybem_tools.raster_io.read_overview(path, 2),
+                       nybem_tools.raster_io.aggregate(values, 2),
+                       equal_nan=True, atol=2e-4)
+    assert nybem_tools.raster_io.read_overview(path, 4) is None
+    statistics = nybem_tools.raster_io.read_statistics(path)
+    assert statistics["valid_cells"] == np.isfinite(values).sum()
+    assert not os.path.exists(
+        nybem_tools.raster_io.overviews_path(path))
@@ -0,0 +1,121 @@
+import pytest
+import os
+import asyncio
+import json
+import struct
+import zlib
+import numpy as np
+import nybem_tools.raster_io
+import nybem_tools.tiles
+
+
+def decode_png(png):
+    width, height = struct.unpack(">II", png[16:24])
+    data, offset = b"", 8
+    while offset < len(png):
+        length = struct.unpack(">I", png[offset:offset + 4])[0]
+        if png[offset + 4:offset + 8] == b"IDAT":
+            data += png[offset + 8:offset + 8 + length]
+        offset += length + 12
+    rows = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    return rows.reshape(height, width * 4 + 1)[:, 1:].reshape(
+        height, width, 4)
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def scenarios_folder(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("scenarios"))
+    grid = nybem_tools.raster_io.Grid(0.0, 0.0, 10.0, 300, 600, None)
+    for name, salinity in [("alt_1", 30.0), ("fwop", 5.0)]:
+        folder = os.path.join(root, name, "est_int", "predictors")
+        os.makedirs(folder)
+        values = np.full((grid.nrows, grid.ncols), salinity)
+        values[:, :100] = np.nan
+        nybem_tools.raster_io.write_array(
+            values, grid, os.path.join(folder, "sal_median.npy"))
+    return root
+
+
+async def get(port, target):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {target} HTTP/1.1\r\nConnection: close\r\n\r\n"
+                 .encode())
+    data = await reader.read()
+    writer.close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body
+
+
+# Act
+@pytest.fixture(scope="module")
+def responses(scenarios_folder):
+    targets = ["/", "/layers.json",
+               "/tiles/alt_1/est_int/sal_median/0/0/0.png",
+               "/tiles/fwop/est_int/sal_median/2/2/1.png",
+               "/tiles/fwop/est_int/sal_median/1/5/0.png",
+               "/tiles/../est_int/sal_median/0/0/0.png"]
+
+    async def run():
+        server = await nybem_tools.tiles.start(scenarios_folder, port=0)
+        port = server.sockets[0].getsockname()[1]
+        results = [await get(port, target) for target in targets]
+        server.close()
+        await server.wait_closed()
+        return results
+
+    return dict(zip(targets, asyncio.run(run())))
+
+
+# Assert
+def test_colorize():
+    values = np.array([[np.nan, 0.0, 35.0, 100.0]])
+    rgba = nybem_tools.tiles.colorize(values, "salinity", (0.0, 35.0))
+    assert rgba[0, :, 3].tolist() == [0, 255, 255, 255]
+    assert rgba[0, 1, :3].tolist() == [68, 1, 84]
+    assert rgba[0, 2, :3].tolist() == rgba[0, 3, :3].tolist() == \
+        [253, 231, 37]
+
+
+def test_read_tile_levels(scenarios_folder):
+    raster = os.path.join(scenarios_folder, "fwop", "est_int", "predictors",
+                          "sal_median.npy")
+    coarse = nybem_tools.tiles.read_tile(raster, (), 0, 0, 0)
+    fine = nybem_tools.tiles.read_tile(raster, (), 2, 0, 1)
+    assert coarse.shape == fine.shape == (256, 256)
+    # 600 columns at 4 cells per pixel, 100 of them NoData
+    assert np.isnan(coarse[0, :25]).all() and coarse[0, 25] == 5.0
+    assert np.isnan(coarse[0, 150:]).all() and np.isnan(coarse[75:]).all()
+    assert np.isnan(fine[:44, :100]).all() and (fine[:44, 100:] == 5.0).all()
+    assert np.isnan(fine[44:]).all()
+    assert nybem_tools.tiles.read_tile(raster, (), 3, 0, 0) is None
+
+
+def test_overview_matches_direct(scenarios_folder, monkeypatch):
+    raster = os.path.join(scenarios_folder, "alt_1", "est_int",
+                          "predictors", "sal_median.npy")
+    direct = nybem_tools.tiles.read_tile(raster, (), 0, 0, 0)
+    monkeypatch.setattr(nybem_tools.tiles, "OVERVIEW_FACTOR", 2)
+    cut = nybem_tools.tiles.read_tile(raster, ("overview",), 0, 0, 0)
+    np.testing.assert_allclose(cut, direct)
+
+
+def test_viewer_and_layers(responses):
+    assert responses["/"][0] == 200
+    assert b"layers.json" in responses["/"][1]
+    layers = json.loads(responses["/layers.json"][1])
+    assert list(layers) == ["alt_1", "fwop"]
+    assert layers["fwop"]["est_int/sal_median"] == {
+        "max_zoom": 2, "ramp": "salinity", "range": [0.0, 35.0]}
+
+
+def test_tiles(responses):
+    status, png = responses["/tiles/alt_1/est_int/sal_median/0/0/0.png"]
+    assert status == 200
+    tile = decode_png(png)
+    assert tile.shape == (256, 256, 4)
+    assert tile[0, 0, 3] == 0
+    assert tile[0, 100].tolist() == tile[70, 140].tolist()
+    assert responses["/tiles/fwop/est_int/sal_median/2/2/1.png"][0] == 200
+    assert responses["/tiles/fwop/est_int/sal_median/1/5/0.png"][0] == 404
+    assert responses["/tiles/../est_int/sal_median/0/0/0.png"][0] == 404
@@ -0,0 +1,108 @@
+import pytest
+import os
+import io
+import json
+import subprocess
+import sys
+import time
+import nybem_tools.update_AdH_predictors
+import nybem_tools.work_queue
+
+
+# Arrange
+@pytest.fixture(scope="module")
+def work_folder(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("queue"))
+
+
+@pytest.fixture(scope="module")
+def job_file(work_folder):
+    path = os.path.join(work_folder, "jobs.jsonl")
+    with open(path, "w") as f:
+        for i in range(6):
+            f.write(json.dumps({
+                "id": f"alt_{i}", "tool": "create-scenario",
+                "args": {"path_to_alt": os.path.join(work_folder,
+                                                     f"alt_{i}")},
+                "depends_on": ["alt_0"] if i else []}) + "\n")
+    return path
+
+
+# Act
+@pytest.fixture(scope="module")
+def worker_results(work_folder, job_file):
+    queue = os.path.join(work_folder, "queue.sqlite")
+    repo_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, "-m", "nybem_tools"]
+    subprocess.run(command + ["queue-submit", "--queue", queue, job_file],
+                   check=True, cwd=repo_folder, stdout=subprocess.PIPE)
+    workers = [subprocess.Popen(command + ["queue-worker", "--queue", queue],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, cwd=repo_folder)
+               for _ in range(3)]
+    results = []
+    for worker in workers:
+        stdout, _ = worker.communicate(timeout=120)
+        results += [json.loads(line)
+                    for line in stdout.decode().splitlines()]
+    return queue, results
+
+
+# Assert
+def test_workers_share_queue(work_folder, worker_results):
+    queue, results = worker_results
+    assert sorted(result["id"] for result in results) == \
+        [f"alt_{i}" for i in range(6)]
+    assert all(result["status"] == "ok" for result in results)
+    assert nybem_tools.work_queue.status(queue) == {
+        "pending": 0, "running": 0, "done": 6, "failed": 0}
+    for i in range(6):
+        assert os.path.isdir(os.path.join(work_folder, f"alt_{i}",
+                                          "mar_sub", "predictors"))
+
+
+def test_expired_lease_is_retried(tmp_path):
+    queue = str(tmp_path / "queue.sqlite")
+    nybem_tools.work_queue.submit(queue, [
+        {"id": "a", "tool": "create-scenario",
+         "args": {"path_to_alt": str(tmp_path / "alt")}}])
+    connection = nybem_tools.work_queue.connect(queue)
+    # A worker that takes the job and dies
+    assert nybem_tools.work_queue.claim(connection, "dead", lease=0.1)
+    assert nybem_tools.work_queue.claim(connection, "other") is None
+    time.sleep(0.2)
+
+    output = io.StringIO()
+    failures = nybem_tools.work_queue.work(queue, "alive", output=output)
+    result = json.loads(output.getvalue())
+    assert failures == 0
+    assert (result["worker"], result["attempt"]) == ("alive", 2)
+    assert not nybem_tools.work_queue.heartbeat(connection, "a", "dead")
+    assert os.path.isdir(str(tmp_path / "alt"))
+
+
+def test_failed_job_fails_dependents(tmp_path):
+    queue = str(tmp_path / "queue.sqlite")
+    nybem_tools.work_queue.submit(queue, [
+        {"id": "bad", "tool": "no-such-tool", "max_attempts": 2},
+        {"id": "after", "tool": "create-scenario",
+         "args": {"path_to_alt": str(tmp_path / "alt")},
+         "depends_on": ["bad"]}])
+    output = io.StringIO()
+    failures = nybem_tools.work_queue.work(queue, "w", poll=0.01,
+                                           output=output)
+    assert failures == 2
+    assert nybem_tools.work_queue.status(queue)["failed"] == 2
+    assert not os.path.exists(str(tmp_path / "alt"))
+
+
+def test_scenario_jobs_dependencies():
+    steps = nybem_tools.update_AdH_predictors.scenario_steps(
+        "fwop", "alt_1", "vel", "sal", "wse", "barriers", "mask")
+    jobs = {job["id"]: job for job in
+            nybem_tools.work_queue.scenario_jobs(steps, "alt_1")}
+    depth = jobs["alt_1/" + os.path.join("est_sub_soft_sav", "predictors",
+                                         "depth.tif")]
+    assert "alt_1/mtl.tif" in depth["depends_on"]
+    assert jobs["alt_1/mtl.tif"]["depends_on"] == []
+    assert len(jobs) == len(steps)